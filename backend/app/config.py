@@ -41,6 +41,19 @@ class Settings(BaseSettings):
     usage_batch_size: int = 10
     usage_batch_interval_seconds: float = 5.0
 
+    # Network mapper
+    mapper_engine: str = "auto"  # auto (python, script on failure), python, or script
+    mapper_concurrency: int = 32  # Hosts enriched at once by the python engine
+    mapper_timeout_seconds: float = 300.0
+    mapper_cache_max_age_seconds: float = 86400.0  # Incremental scans re-probe cached hosts older than this
+    mapper_interfaces: str = ""  # Comma-separated interfaces to sweep, or "all" (default: one, like the script)
+    mapper_subnets: str = ""  # Comma-separated extra subnets (CIDR) to sweep
+    mapper_packets_per_second: int = 1000  # Probe budget shared by all sweeps
+    mapper_sweep_chunk_size: int = 256  # Addresses per sweep chunk
+    mapper_sweep_parallel: int = 4  # Chunks swept at once
+    mapper_oui_file: str = ""  # IEEE OUI registry (oui.txt or oui.csv); default: bundled subset
+    mapper_rules_file: str = ""  # JSON classification rules checked before the defaults
+
     @property
     def resolved_frontend_dist(self) -> Path:
         """Resolve frontend dist path, auto-detecting if not set."""
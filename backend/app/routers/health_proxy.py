@@ -7,14 +7,20 @@ Performance optimizations:
 - Circuit breaker prevents cascade failures
 - Connections are pre-warmed on startup
 """
+from urllib.parse import urlencode
+
 from fastapi import APIRouter, HTTPException, Request, Query, Depends
 
+from ..config import get_settings
 from ..dependencies import (
     AuthenticatedUser,
     require_auth,
     require_write_access
 )
 from ..services.proxy_service import proxy_health_request
+from ..services.streaming_service import proxy_streaming_request
+
+settings = get_settings()
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -24,14 +30,16 @@ async def check_device(
     ip: str,
     include_ports: bool = Query(False),
     include_dns: bool = Query(True),
+    history: str = Query("full"),
+    bucket: str = Query("5m"),
+    max_age_seconds: float | None = Query(None, ge=0),
     user: AuthenticatedUser = Depends(require_auth)
 ):
     """Proxy health check for a single device. Requires authentication."""
-    return await proxy_health_request(
-        "GET",
-        f"/check/{ip}",
-        params={"include_ports": include_ports, "include_dns": include_dns}
-    )
+    params = {"include_ports": include_ports, "include_dns": include_dns, "history": history, "bucket": bucket}
+    if max_age_seconds is not None:
+        params["max_age_seconds"] = max_age_seconds
+    return await proxy_health_request("GET", f"/check/{ip}", params=params)
 
 
 @router.post("/check/batch")
@@ -41,16 +49,66 @@ async def check_batch(request: Request, user: AuthenticatedUser = Depends(requir
     return await proxy_health_request("POST", "/check/batch", json_body=body)
 
 
+@router.post("/check/stream")
+async def stream_batch_check(
+    request: Request,
+    format: str = Query("ndjson"),
+    user: AuthenticatedUser = Depends(require_auth)
+):
+    """
+    Proxy a streaming batch health check (NDJSON, or SSE with format=sse).
+    Requires authentication.
+    """
+    body = await request.json()
+    return await proxy_streaming_request(
+        url=f"{settings.health_service_url}/api/health/check/stream?{urlencode({'format': format})}",
+        method="POST",
+        json_body=body,
+        timeout=600.0,
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+    )
+
+
 @router.get("/cached/{ip}")
-async def get_cached(ip: str, user: AuthenticatedUser = Depends(require_auth)):
+async def get_cached(
+    ip: str,
+    history: str = Query("full"),
+    bucket: str = Query("5m"),
+    user: AuthenticatedUser = Depends(require_auth)
+):
     """Proxy get cached metrics. Requires authentication."""
-    return await proxy_health_request("GET", f"/cached/{ip}")
+    return await proxy_health_request("GET", f"/cached/{ip}", params={"history": history, "bucket": bucket})
 
 
 @router.get("/cached")
-async def get_all_cached(user: AuthenticatedUser = Depends(require_auth)):
-    """Proxy get all cached metrics. Requires authentication."""
-    return await proxy_health_request("GET", "/cached")
+async def get_all_cached(
+    history: str = Query("full"),
+    bucket: str = Query("5m"),
+    since: str | None = Query(None),
+    user: AuthenticatedUser = Depends(require_auth)
+):
+    """Proxy get all cached metrics, or a delta since a cursor. Requires authentication."""
+    params = {"history": history, "bucket": bucket}
+    if since is not None:
+        params["since"] = since
+    return await proxy_health_request("GET", "/cached", params=params)
+
+
+@router.get("/changes")
+async def stream_changes(
+    request: Request,
+    since: str | None = Query(None),
+    user: AuthenticatedUser = Depends(require_auth)
+):
+    """
+    Proxy the SSE stream of device state changes. Requires authentication.
+    Resumes from `since` or the browser's Last-Event-ID header.
+    """
+    cursor = since or request.headers.get("last-event-id")
+    url = f"{settings.health_service_url}/api/health/changes"
+    if cursor:
+        url = f"{url}?{urlencode({'since': cursor})}"
+    return await proxy_streaming_request(url=url, method="GET", timeout=60.0)
 
 
 @router.delete("/cache")
@@ -66,9 +124,17 @@ async def ping(ip: str, count: int = Query(3, ge=1, le=10), user: AuthenticatedU
 
 
 @router.get("/ports/{ip}")
-async def scan_ports(ip: str, user: AuthenticatedUser = Depends(require_auth)):
+async def scan_ports(
+    ip: str,
+    ports: str | None = Query(None),
+    refresh: bool = Query(False),
+    user: AuthenticatedUser = Depends(require_auth)
+):
     """Proxy port scan. Requires authentication."""
-    return await proxy_health_request("GET", f"/ports/{ip}")
+    params = {"refresh": refresh}
+    if ports:
+        params["ports"] = ports
+    return await proxy_health_request("GET", f"/ports/{ip}", params=params)
 
 
 @router.get("/dns/{ip}")
@@ -107,6 +173,33 @@ async def clear_monitored_devices(user: AuthenticatedUser = Depends(require_writ
     return await proxy_health_request("DELETE", "/monitoring/devices")
 
 
+@router.get("/monitoring/networks/{network_id}/devices")
+async def get_network_devices(network_id: str, user: AuthenticatedUser = Depends(require_auth)):
+    """Proxy get one network's monitored devices. Requires authentication."""
+    return await proxy_health_request("GET", f"/monitoring/networks/{network_id}/devices")
+
+
+@router.api_route("/monitoring/networks/{network_id}/devices", methods=["POST", "PUT", "PATCH"])
+async def update_network_devices(
+    network_id: str,
+    request: Request,
+    user: AuthenticatedUser = Depends(require_write_access)
+):
+    """
+    Proxy incremental device registration for one network. Requires write access.
+    
+    POST adds `ips`, PUT replaces the set with `ips`, PATCH applies `add`/`remove`.
+    """
+    body = await request.json()
+    return await proxy_health_request(request.method, f"/monitoring/networks/{network_id}/devices", json_body=body)
+
+
+@router.delete("/monitoring/networks/{network_id}/devices")
+async def clear_network_devices(network_id: str, user: AuthenticatedUser = Depends(require_write_access)):
+    """Proxy stop monitoring one network's devices. Requires write access."""
+    return await proxy_health_request("DELETE", f"/monitoring/networks/{network_id}/devices")
+
+
 @router.get("/monitoring/config")
 async def get_monitoring_config(user: AuthenticatedUser = Depends(require_auth)):
     """Proxy get monitoring config. Requires authentication."""
@@ -192,6 +285,37 @@ async def run_speed_test(user: AuthenticatedUser = Depends(require_write_access)
     return await proxy_health_request("POST", "/speedtest", timeout=120.0)  # 2 minute timeout for speed test
 
 
+@router.post("/speedtest/jobs")
+async def start_speed_test_job(
+    gateway_ip: str | None = Query(None),
+    user: AuthenticatedUser = Depends(require_write_access)
+):
+    """Proxy starting (or joining) a background speed test job. Requires write access."""
+    return await proxy_health_request("POST", "/speedtest/jobs", json_body={"gateway_ip": gateway_ip})
+
+
+@router.get("/speedtest/jobs")
+async def list_speed_test_jobs(user: AuthenticatedUser = Depends(require_auth)):
+    """Proxy list of recent speed test jobs. Requires authentication."""
+    return await proxy_health_request("GET", "/speedtest/jobs")
+
+
+@router.get("/speedtest/jobs/{job_id}")
+async def get_speed_test_job(job_id: str, user: AuthenticatedUser = Depends(require_auth)):
+    """Proxy speed test job status. Requires authentication."""
+    return await proxy_health_request("GET", f"/speedtest/jobs/{job_id}")
+
+
+@router.get("/speedtest/jobs/{job_id}/events")
+async def stream_speed_test_job(job_id: str, user: AuthenticatedUser = Depends(require_auth)):
+    """Proxy the SSE progress stream of a speed test job. Requires authentication."""
+    return await proxy_streaming_request(
+        url=f"{settings.health_service_url}/api/health/speedtest/jobs/{job_id}/events",
+        method="GET",
+        timeout=120.0,
+    )
+
+
 @router.get("/speedtest/all")
 async def get_all_speed_tests(user: AuthenticatedUser = Depends(require_auth)):
     """Proxy get all stored speed test results. Requires authentication."""
@@ -3,6 +3,7 @@ Mapper router - Network mapping and embed management endpoints.
 """
 
 import json
+from typing import Literal
 
 import httpx
 from fastapi import APIRouter, HTTPException, Depends, Query
@@ -22,6 +23,8 @@ from ..dependencies import (
 from ..models.network import Network
 from ..services import embed_service
 from ..services import mapper_runner_service
+from ..services.mapper_jobs import DEFAULT_NETWORK, MapperJob, mapper_jobs
+from ..services.network_service import get_network_with_access, is_service_token
 from ..services import health_proxy_service
 
 settings = get_settings()
@@ -34,6 +37,9 @@ class MapperResponse(BaseModel):
     content: str
     script_exit_code: int
     network_map_path: str | None = None
+    engine: str = "script"
+    diff: dict | None = None
+    job_id: str | None = None
 
 
 # ==================== Config Endpoint ====================
@@ -48,37 +54,167 @@ def get_config():
 # ==================== Mapper Script Endpoints ====================
 
 
+def _job_error(error: BaseException) -> HTTPException:
+    if isinstance(error, FileNotFoundError):
+        return HTTPException(status_code=404, detail=str(error))
+    if isinstance(error, TimeoutError):
+        return HTTPException(status_code=504, detail=str(error))
+    return HTTPException(status_code=500, detail=str(error))
+
+
+async def _check_network_access(
+    network_id: str | None, user: AuthenticatedUser, db: AsyncSession, require_write: bool = True
+) -> None:
+    """Raise 404/403 unless the user can use the network a scan is for (None is the legacy map)."""
+    if network_id is None or network_id == DEFAULT_NETWORK:
+        return
+    await get_network_with_access(
+        network_id,
+        user.user_id,
+        db,
+        require_write=require_write,
+        is_service=is_service_token(user.user_id),
+    )
+
+
+async def _start_job(
+    network_id: str | None, incremental: bool, user: AuthenticatedUser, db: AsyncSession
+) -> MapperJob:
+    """Start a scan, or join the running one if the user may also see its network's results."""
+    job, created = mapper_jobs.start(network_id, incremental)
+    if not created and job.network_id != (network_id or DEFAULT_NETWORK):
+        try:
+            await _check_network_access(job.network_id, user, db)
+        except HTTPException:
+            raise HTTPException(
+                status_code=409,
+                detail="A scan for another network is running; try again when it finishes",
+            )
+    return job
+
+
+def _mapper_response(job: MapperJob) -> MapperResponse:
+    result = job.result
+    return MapperResponse(
+        content=result.content,
+        script_exit_code=result.exit_code,
+        network_map_path=result.map_path,
+        engine=result.engine,
+        diff=result.diff,
+        job_id=job.id,
+    )
+
+
 @router.post("/run-mapper", response_model=MapperResponse)
-def run_mapper(user: AuthenticatedUser = Depends(require_write_access)) -> MapperResponse:
-    """Run the network mapper script. Requires write access."""
-    try:
-        result = mapper_runner_service.run_mapper_sync()
-        return MapperResponse(
-            content=result.content,
-            script_exit_code=result.exit_code,
-            network_map_path=result.map_path,
-        )
-    except FileNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except TimeoutError as e:
-        raise HTTPException(status_code=504, detail=str(e))
-    except RuntimeError as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def run_mapper(
+    user: AuthenticatedUser = Depends(require_write_access),
+    incremental: bool = False,
+    network_id: str | None = None,
+    max_age_seconds: float | None = None,
+    db: AsyncSession = Depends(get_db),
+) -> MapperResponse:
+    """Map the network (python engine or lan_mapper.sh). Requires write access.
+
+    Only one scan runs at a time, so this joins the running scan if there is
+    one; `network_id` labels the job and needs write access to that network.
+    With `incremental=true` only new or changed hosts are deep-probed and the
+    response includes a diff against the saved layout. With `max_age_seconds`,
+    a scan that finished within that many seconds is returned instead of
+    scanning again.
+    """
+    await _check_network_access(network_id, user, db)
+    if max_age_seconds is not None:
+        recent = mapper_jobs.recent_result(network_id, max_age_seconds)
+        if recent is not None:
+            return _mapper_response(recent)
+
+    job = await _start_job(network_id, incremental, user, db)
+    await mapper_jobs.wait(job)
+    if job.error is not None:
+        raise _job_error(job.error)
+    if job.result is None:
+        raise HTTPException(status_code=500, detail="Mapper job was cancelled")
+    return _mapper_response(job)
 
 
 @router.get("/run-mapper/stream")
-def run_mapper_stream(user: AuthenticatedUser = Depends(require_write_access)):
-    """Stream the mapper script output. Requires write access."""
-    script = mapper_runner_service.script_path()
-    if not script.exists():
-        raise HTTPException(status_code=404, detail=f"lan_mapper.sh not found at {script}")
+async def run_mapper_stream(
+    user: AuthenticatedUser = Depends(require_write_access),
+    incremental: bool = False,
+    network_id: str | None = None,
+    job_id: str | None = None,
+    format: Literal["sse", "ndjson"] = "sse",
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream the mapper output. Requires write access.
+
+    Starts a scan, or attaches to the one already running (only one scan runs
+    at a time; `network_id` labels the job and needs write access to that
+    network). With `job_id`, attaches to that job (running or recently
+    finished), which needs access to the job's network. Output so far
+    is replayed first, starting with a "job" event carrying the job ID. Each
+    discovered host is sent as a "host" event (a JSON record) as soon as it is
+    known; a "reset" event means the scan fell back to lan_mapper.sh and the
+    host records so far are replaced by the ones that follow. With
+    `incremental=true` a "diff" event against the saved layout is sent
+    before "done". `format=ndjson` streams the same events as
+    newline-delimited JSON objects ({"type": ..., "data": ...}) instead of SSE.
+    """
+    if job_id is not None:
+        job = mapper_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Mapper job not found")
+        await _check_network_access(job.network_id, user, db)
+    else:
+        await _check_network_access(network_id, user, db)
+        script = mapper_runner_service.script_path()
+        if mapper_runner_service.mapper_engine() == "script" and not script.exists():
+            raise HTTPException(status_code=404, detail=f"lan_mapper.sh not found at {script}")
+        job = await _start_job(network_id, incremental, user, db)
 
     return StreamingResponse(
-        mapper_runner_service.run_mapper_streaming(),
-        media_type="text/event-stream"
+        mapper_jobs.stream(job, format),
+        media_type="application/x-ndjson" if format == "ndjson" else "text/event-stream",
+        headers={"X-Mapper-Job-Id": job.id},
     )
 
 
+@router.get("/run-mapper/jobs")
+async def list_mapper_jobs(
+    user: AuthenticatedUser = Depends(require_auth),
+    db: AsyncSession = Depends(get_db),
+):
+    """List running and recently finished mapper jobs for the networks the user can access."""
+    allowed: dict[str, bool] = {}
+    jobs = []
+    for job in mapper_jobs.list_jobs():
+        if job.network_id not in allowed:
+            try:
+                await _check_network_access(job.network_id, user, db, require_write=False)
+                allowed[job.network_id] = True
+            except HTTPException:
+                allowed[job.network_id] = False
+        if allowed[job.network_id]:
+            jobs.append(job.summary())
+    return JSONResponse({"jobs": jobs})
+
+
+@router.get("/run-mapper/jobs/{job_id}")
+async def get_mapper_job(
+    job_id: str,
+    user: AuthenticatedUser = Depends(require_auth),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get a mapper job's status, and its result once finished. Requires access to the job's network."""
+    job = mapper_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Mapper job not found")
+    await _check_network_access(job.network_id, user, db, require_write=False)
+    payload = job.summary()
+    payload["result"] = _mapper_response(job).model_dump() if job.result is not None else None
+    return JSONResponse(payload)
+
+
 @router.get("/download-map")
 def download_map(user: AuthenticatedUser = Depends(require_auth)):
     """Download the network map file. Requires authentication."""
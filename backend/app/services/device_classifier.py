@@ -0,0 +1,324 @@
+"""
+Device role classification for the network mapper.
+
+lan_mapper.sh classifies each host with a chain of `[[ $lname == *pattern* ]]`
+tests and a grep of arp.txt for its MAC, so the cost grows with hosts x
+rules. Here the vendor index and the rules are built once and reused:
+
+- OuiIndex maps MAC prefixes to vendors, loaded from an IEEE registry file
+  (a subset is bundled in app/data/oui.txt; MAPPER_OUI_FILE can point at the
+  full oui.txt or oui.csv)
+- Every rule's patterns for a field are compiled into one regex per field, so
+  classifying a host is a handful of regex matches and dict lookups
+
+Rules are checked field by field, most specific first: hostname, SNMP
+sysDescr, vendor, then MAC prefix; within a field the first matching rule
+wins. Generic rules (e.g. "linux" in a sysDescr, which Synology and UniFi
+units report too) are only checked after every other rule missed. Extra
+rules can be loaded from a JSON file (MAPPER_RULES_FILE) and take precedence
+over the defaults, which mirror lan_mapper.sh:
+
+    [
+        {"role": "nas", "hostname": ["^truenas"], "sysdescr": ["TrueNAS"]},
+        {"role": "switch/ap", "vendor": ["MikroTik", "Routerboard"]},
+        {"role": "service", "mac": ["52:54:00"]},
+        {"role": "server", "sysdescr": ["illumos"], "generic": true}
+    ]
+
+Patterns are case-insensitive regular expressions.
+"""
+
+import csv
+import json
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_OUI_FILE = Path(__file__).resolve().parent.parent / "data" / "oui.txt"
+
+# Roles the frontend knows how to place
+ROLES = ("gateway/router", "switch/ap", "firewall", "nas", "service", "server", "client", "unknown")
+
+# Fields a rule can match, in the order they are checked
+RULE_FIELDS = ("hostname", "sysdescr", "vendor", "mac")
+
+# "00-11-32   (hex)  Vendor", "001132     (base 16)  Vendor" (IEEE oui.txt) or "001132<TAB>Vendor" (arp-scan/nmap)
+_OUI_LINE = re.compile(
+    r"^([0-9A-Fa-f]{6,9}|[0-9A-Fa-f]{2}(?:[-:][0-9A-Fa-f]{2}){2})\s+(?:\((?:hex|base 16)\)\s+)?(\S.*?)\s*$"
+)
+# IEEE oui.csv / mam.csv / oui36.csv rows start with the registry name
+_CSV_REGISTRIES = ("MA-L,", "MA-M,", "MA-S,")
+
+# Vendors arp-scan prints when it has no match
+_UNKNOWN_VENDOR = re.compile(r"^\(unknown", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class ClassificationRule:
+    """Patterns that give a host a role when any of them matches."""
+    role: str
+    hostname: tuple[str, ...] = ()  # Regexes matched against the hostname
+    sysdescr: tuple[str, ...] = ()  # Regexes matched against the SNMP sysDescr
+    vendor: tuple[str, ...] = ()  # Regexes matched against the MAC vendor
+    mac: tuple[str, ...] = ()  # MAC prefixes, e.g. "02:42:ac"
+    generic: bool = False  # Only checked when no other rule matches any field
+
+
+def _substrings(*words: str) -> tuple[str, ...]:
+    return tuple(re.escape(word) for word in words)
+
+
+# Hostname rules are lan_mapper.sh's, in its order; the other fields extend it
+DEFAULT_RULES: tuple[ClassificationRule, ...] = (
+    ClassificationRule("gateway/router", hostname=_substrings("routerboard")),
+    ClassificationRule(
+        "switch/ap",
+        hostname=_substrings("tl-sg", "tp-link", "tplink", "unifi", "cisco", "netgear"),
+        sysdescr=(r"cisco ios", r"edgeswitch", r"unifi", r"procurve", r"junos", r"arubaos"),
+        vendor=(r"ubiquiti", r"tp-link", r"netgear", r"cisco", r"aruba", r"juniper"),
+    ),
+    ClassificationRule(
+        "firewall",
+        hostname=_substrings("firewalla"),
+        sysdescr=(r"pfsense", r"opnsense", r"fortigate", r"firewalla"),
+        vendor=(r"fortinet",),
+    ),
+    ClassificationRule(
+        "nas",
+        hostname=_substrings("nas", "ugreen", "synology", "qnap"),
+        sysdescr=(r"synology", r"qnap", r"truenas", r"freenas"),
+        vendor=(r"synology", r"qnap"),
+    ),
+    ClassificationRule(
+        "service",
+        hostname=_substrings("jellyfin", "wizarr", "b2backup", "postgres", "onyx", "n8n", "grafana", "prometheus"),
+        # Docker, VMware, Xen, Hyper-V, Parallels, QEMU/KVM and Proxmox guests
+        mac=("02:42:ac", "00:50:56", "00:0c:29", "00:05:69", "00:16:3e", "00:15:5d", "00:1c:42", "00:03:ff",
+             "52:54:00", "bc:24:11"),
+    ),
+    ClassificationRule(
+        "server",
+        hostname=_substrings("server", "debian", "ubuntu", "centos", "redhat", "fedora", "arch", "manjaro", "linux"),
+        sysdescr=(r"windows server", r"vmware esxi"),
+        vendor=(r"super micro",),
+    ),
+    ClassificationRule(
+        "client",
+        hostname=_substrings("desktop", "g-pro", "laptop", "iphone", "android"),
+        vendor=(r"apple",),
+    ),
+    # NAS and network gear run Linux or FreeBSD too, so their vendor has to win
+    ClassificationRule("server", sysdescr=(r"linux", r"freebsd"), generic=True),
+)
+
+
+def _normalize_mac(mac: str) -> str:
+    return re.sub(r"[^0-9A-Fa-f]", "", mac).upper()
+
+
+class OuiIndex:
+    """MAC prefix -> vendor, for MA-L (24-bit), MA-M (28-bit) and MA-S (36-bit) assignments."""
+
+    def __init__(self, prefixes: dict[str, str] | None = None):
+        self._prefixes: dict[str, str] = {}
+        self._lengths: tuple[int, ...] = ()
+        for prefix, vendor in (prefixes or {}).items():
+            self.add(prefix, vendor)
+
+    @classmethod
+    def load(cls, path: Path) -> "OuiIndex":
+        """Load an IEEE registry file (oui.txt or CSV) or an arp-scan/nmap style prefix list.
+
+        Args:
+            path: Registry file
+
+        Returns:
+            OuiIndex instance (empty if the file cannot be read)
+        """
+        index = cls()
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if line.startswith(_CSV_REGISTRIES):
+                        row = next(csv.reader([line]))
+                        if len(row) >= 3:
+                            index.add(row[1], row[2])
+                        continue
+                    match = _OUI_LINE.match(line)
+                    if match:
+                        index.add(match.group(1), match.group(2))
+        except OSError as exc:
+            logger.warning(f"Cannot read OUI file {path}: {exc}")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    def add(self, prefix: str, vendor: str) -> None:
+        prefix = _normalize_mac(prefix)
+        vendor = vendor.strip()
+        if len(prefix) in (6, 7, 9) and vendor:
+            self._prefixes.setdefault(prefix, vendor)
+            self._lengths = tuple(sorted({*self._lengths, len(prefix)}, reverse=True))
+
+    def lookup(self, mac: str | None) -> str | None:
+        """Vendor of the most specific assignment containing `mac`."""
+        if not mac:
+            return None
+        mac = _normalize_mac(mac)
+        for length in self._lengths:
+            vendor = self._prefixes.get(mac[:length])
+            if vendor is not None:
+                return vendor
+        return None
+
+
+def _compile_field(rules: list[ClassificationRule], field: str) -> re.Pattern | None:
+    # One alternative per rule, tried in rule order; each is a lookahead so the
+    # first rule with any matching pattern wins, wherever in the text it matches
+    alternatives = [
+        f"(?=.*?(?:{'|'.join(patterns)}))(?P<r{i}>)"
+        for i, rule in enumerate(rules)
+        if (patterns := getattr(rule, field))
+    ]
+    if not alternatives:
+        return None
+    return re.compile("|".join(alternatives), re.IGNORECASE | re.DOTALL)
+
+
+class _CompiledRules:
+    """One regex per field and the MAC prefixes of a group of rules."""
+
+    def __init__(self, rules: list[ClassificationRule]):
+        self._roles = [rule.role for rule in rules]
+        self._patterns = {field: _compile_field(rules, field) for field in RULE_FIELDS if field != "mac"}
+        self._mac_prefixes = [
+            (tuple(_normalize_mac(prefix) for prefix in rule.mac), rule.role) for rule in rules if rule.mac
+        ]
+
+    def _match(self, field: str, text: str | None) -> str | None:
+        pattern = self._patterns[field]
+        if pattern is None or not text:
+            return None
+        match = pattern.match(text)
+        return self._roles[int(match.lastgroup[1:])] if match else None
+
+    def role(self, hostname: str | None, mac: str | None, vendor: str | None, sysdescr: str | None) -> str | None:
+        role = self._match("hostname", hostname) or self._match("sysdescr", sysdescr) or self._match("vendor", vendor)
+        if role is not None or not mac:
+            return role
+        normalized = _normalize_mac(mac)
+        for prefixes, rule_role in self._mac_prefixes:
+            if normalized.startswith(prefixes):
+                return rule_role
+        return None
+
+
+class DeviceClassifier:
+    """Classifies hosts with a compiled rule set and an OUI vendor index."""
+
+    def __init__(self, rules: list[ClassificationRule] | None = None, oui_index: OuiIndex | None = None):
+        """
+        Args:
+            rules: Rules in priority order (default: DEFAULT_RULES)
+            oui_index: Vendor lookup for hosts with a MAC but no vendor (default: empty)
+        """
+        self._rules = list(DEFAULT_RULES if rules is None else rules)
+        self._oui = oui_index or OuiIndex()
+        self._specific = _CompiledRules([rule for rule in self._rules if not rule.generic])
+        self._generic = _CompiledRules([rule for rule in self._rules if rule.generic])
+
+    @property
+    def rules(self) -> list[ClassificationRule]:
+        return list(self._rules)
+
+    def vendor(self, mac: str | None, vendor: str | None = None) -> str | None:
+        """The known vendor, or the OUI index's when unknown (arp-scan prints "(Unknown)")."""
+        if vendor and not _UNKNOWN_VENDOR.match(vendor):
+            return vendor
+        return self._oui.lookup(mac) or vendor
+
+    def classify(
+        self,
+        ip: str,
+        hostname: str | None,
+        mac: str | None,
+        gateway: str | None,
+        vendor: str | None = None,
+        sysdescr: str | None = None,
+    ) -> str:
+        """Role of a host: the gateway, else the first rule matching its hostname,
+        sysDescr, vendor or MAC prefix, else the first generic rule matching, else "unknown".
+        """
+        if ip == gateway:
+            return "gateway/router"
+        vendor = self.vendor(mac, vendor)
+        return (
+            self._specific.role(hostname, mac, vendor, sysdescr)
+            or self._generic.role(hostname, mac, vendor, sysdescr)
+            or "unknown"
+        )
+
+
+def load_rules(path: Path) -> list[ClassificationRule]:
+    """Load classification rules from a JSON file.
+
+    Args:
+        path: JSON list of {"role", "hostname", "sysdescr", "vendor", "mac", "generic"} objects
+
+    Returns:
+        Rules in file order
+
+    Raises:
+        ValueError: If the file is unreadable, a role is unknown or a pattern is invalid
+    """
+    try:
+        entries = json.loads(path.read_text())
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"Cannot read classification rules {path}: {exc}")
+    if not isinstance(entries, list):
+        raise ValueError(f"Classification rules {path} must be a JSON list")
+
+    rules = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or entry.get("role") not in ROLES:
+            raise ValueError(f"Rule {position} in {path} needs a role, one of: {', '.join(ROLES)}")
+        patterns = {}
+        for field in RULE_FIELDS:
+            values = entry.get(field, [])
+            values = [values] if isinstance(values, str) else values
+            if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                raise ValueError(f"Rule {position} in {path}: {field} must be a list of strings")
+            for value in values if field != "mac" else ():
+                try:
+                    re.compile(value)
+                except re.error as exc:
+                    raise ValueError(f"Rule {position} in {path}: invalid {field} pattern {value!r}: {exc}")
+            patterns[field] = tuple(values)
+        generic = entry.get("generic", False)
+        if not isinstance(generic, bool):
+            raise ValueError(f"Rule {position} in {path}: generic must be true or false")
+        rules.append(ClassificationRule(role=entry["role"], generic=generic, **patterns))
+    return rules
+
+
+@lru_cache
+def get_classifier() -> DeviceClassifier:
+    """Classifier for the configured OUI file and rules, built once.
+
+    Raises:
+        ValueError: If MAPPER_RULES_FILE cannot be loaded
+    """
+    settings = get_settings()
+    oui_index = OuiIndex.load(Path(settings.mapper_oui_file) if settings.mapper_oui_file else BUNDLED_OUI_FILE)
+    rules = list(DEFAULT_RULES)
+    if settings.mapper_rules_file:
+        rules = load_rules(Path(settings.mapper_rules_file)) + rules
+    logger.info(f"Device classifier: {len(rules)} rules, {len(oui_index)} OUI prefixes")
+    return DeviceClassifier(rules, oui_index)
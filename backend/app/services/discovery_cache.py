@@ -0,0 +1,123 @@
+"""
+Persistent discovery cache for incremental network mapping.
+
+Hostname and SNMP lookups are the slow part of a scan, and they give the same
+answers for hosts that have not changed since the last run. The cache keeps
+what was learned about each host, keyed by MAC address, so an incremental
+scan only deep-probes hosts that are new, have moved to another IP, or were
+last probed too long ago. Hosts without a MAC (nothing answered ARP for them)
+are always probed.
+"""
+
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+
+from .lan_discovery import DiscoveredHost
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+@dataclass
+class CachedHost:
+    """What the last deep probe learned about a MAC address."""
+    mac: str
+    ip: str
+    hostname: str | None = None
+    hostname_source: str | None = None
+    role: str = "unknown"
+    snmp_sysname: str | None = None
+    snmp_sysdescr: str | None = None
+    vendor: str | None = None
+    probed_at: float = 0.0  # When hostname/SNMP were last looked up
+    last_seen: float = 0.0  # When the host last answered a sweep
+
+
+class DiscoveryCache:
+    """MAC -> CachedHost, loaded from and saved to a JSON file."""
+
+    def __init__(self, path: Path, max_age_seconds: float = 86400.0):
+        self._path = path
+        self._max_age_seconds = max_age_seconds
+        self._hosts: dict[str, CachedHost] = {}
+
+    @classmethod
+    def load(cls, path: Path, max_age_seconds: float = 86400.0) -> "DiscoveryCache":
+        """Load the cache from `path`; a missing or unreadable file gives an empty cache.
+
+        Args:
+            path: JSON file backing the cache
+            max_age_seconds: How long cached enrichment is reused before re-probing
+
+        Returns:
+            DiscoveryCache instance
+        """
+        cache = cls(path, max_age_seconds)
+        if not path.exists():
+            return cache
+        try:
+            data = json.loads(path.read_text())
+            known = {f.name for f in fields(CachedHost)}
+            for entry in data.get("hosts", []):
+                host = CachedHost(**{k: v for k, v in entry.items() if k in known})
+                cache._hosts[host.mac] = host
+        except (OSError, ValueError, TypeError) as exc:
+            logger.warning(f"Ignoring unreadable discovery cache {path}: {exc}")
+            cache._hosts.clear()
+        return cache
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def get(self, mac: str) -> CachedHost | None:
+        return self._hosts.get(mac.lower())
+
+    def reusable(self, host: DiscoveredHost, now: float | None = None) -> CachedHost | None:
+        """Cached enrichment for `host` if its MAC is known, on the same IP, and probed recently."""
+        if host.mac is None:
+            return None
+        cached = self.get(host.mac)
+        if cached is None or cached.ip != host.ip:
+            return None
+        if (now or time.time()) - cached.probed_at > self._max_age_seconds:
+            return None
+        return cached
+
+    def update(self, hosts: list[DiscoveredHost], probed: set[str], now: float | None = None) -> None:
+        """Record a scan's hosts.
+
+        Args:
+            hosts: Every host the scan found
+            probed: IPs whose hostname and SNMP were looked up in this scan
+            now: Scan time (default: current time)
+        """
+        now = now or time.time()
+        for host in hosts:
+            if host.mac is None:
+                continue
+            previous = self.get(host.mac)
+            probed_at = now if host.ip in probed or previous is None else previous.probed_at
+            self._hosts[host.mac.lower()] = CachedHost(
+                mac=host.mac.lower(),
+                ip=host.ip,
+                hostname=host.hostname,
+                hostname_source=host.hostname_source,
+                role=host.role,
+                snmp_sysname=host.snmp_sysname,
+                snmp_sysdescr=host.snmp_sysdescr,
+                vendor=host.vendor,
+                probed_at=probed_at,
+                last_seen=now,
+            )
+
+    def save(self) -> None:
+        """Write the cache atomically (temp file then rename)."""
+        payload = {"version": CACHE_VERSION, "hosts": [asdict(host) for host in self._hosts.values()]}
+        tmp = self._path.with_suffix(self._path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, indent=2))
+        os.replace(tmp, self._path)
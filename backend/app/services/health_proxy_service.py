@@ -8,12 +8,18 @@ import httpx
 
 from ..config import get_settings
 
+# Mirror of the health service's cached metrics, refreshed with cursor deltas
+# so embed polls only download devices that changed since the last one
+_cached_metrics: dict = {}
+_cached_metrics_cursor: str | None = None
+
 
 async def health_service_request(
     method: str,
     path: str,
     json_body: dict | None = None,
     timeout: float = 30.0,
+    params: dict | None = None,
 ) -> httpx.Response:
     """Make a request to the health service.
     
@@ -22,6 +28,7 @@ async def health_service_request(
         path: Path relative to /api/health
         json_body: Optional JSON body for POST requests
         timeout: Request timeout in seconds
+        params: Optional query parameters for GET requests
         
     Returns:
         httpx.Response from the health service
@@ -36,7 +43,7 @@ async def health_service_request(
     
     async with httpx.AsyncClient(timeout=timeout) as client:
         if method == "GET":
-            response = await client.get(url)
+            response = await client.get(url, params=params)
         elif method == "POST":
             response = await client.post(url, json=json_body)
         else:
@@ -82,6 +89,11 @@ async def trigger_health_check(timeout: float = 30.0) -> httpx.Response:
 async def get_cached_metrics(timeout: float = 10.0) -> dict:
     """Get cached health metrics for all monitored devices.
     
+    Only devices whose state changed since the previous call, or that are
+    due their periodic refresh (at least once a minute), are fetched with
+    downsampled history and merged into a local mirror, which is returned
+    as a copy.
+    
     Args:
         timeout: Request timeout in seconds
         
@@ -92,11 +104,26 @@ async def get_cached_metrics(timeout: float = 10.0) -> dict:
         httpx.ConnectError: If health service is unavailable
         httpx.HTTPStatusError: If request fails
     """
+    global _cached_metrics, _cached_metrics_cursor
+    
     response = await health_service_request(
         "GET",
         "/cached",
-        timeout=timeout
+        timeout=timeout,
+        params={"since": _cached_metrics_cursor or "0", "history": "downsampled"},
     )
     response.raise_for_status()
-    return response.json()
+    data = response.json()
+    
+    if "cursor" not in data:
+        # Health service without delta support returned the full map
+        _cached_metrics, _cached_metrics_cursor = dict(data), None
+    elif data.get("full"):
+        _cached_metrics, _cached_metrics_cursor = dict(data.get("devices", {})), data["cursor"]
+    else:
+        _cached_metrics.update(data.get("devices", {}))
+        for ip in data.get("removed", []):
+            _cached_metrics.pop(ip, None)
+        _cached_metrics_cursor = data["cursor"]
+    return dict(_cached_metrics)
 
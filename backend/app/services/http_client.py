@@ -30,6 +30,19 @@ except ImportError:
     logger.warning("h2 package not installed - HTTP/2 disabled. Install with: pip install httpx[http2]")
 
 
+# Upstream response headers passed through to the client (cache freshness of health results)
+FORWARDED_RESPONSE_HEADERS = ("age", "cache-control")
+
+
+def _forwarded_headers(response: httpx.Response) -> dict[str, str]:
+    forwarded = {}
+    for name in FORWARDED_RESPONSE_HEADERS:
+        value = response.headers.get(name)
+        if isinstance(value, str):
+            forwarded[name] = value
+    return forwarded
+
+
 class CircuitState(Enum):
     """Circuit breaker states"""
     CLOSED = "closed"      # Normal operation - requests flow through
@@ -317,7 +330,8 @@ class HTTPClientPool:
             
             return JSONResponse(
                 content=content,
-                status_code=response.status_code
+                status_code=response.status_code,
+                headers=_forwarded_headers(response),
             )
             
         except httpx.ConnectError as e:
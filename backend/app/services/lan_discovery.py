@@ -0,0 +1,903 @@
+"""
+Concurrent LAN discovery engine.
+
+Python counterpart of lan_mapper.sh. The script resolves every host one
+after another (dig, avahi, nmblookup) and then walks SNMP in a second
+sequential loop, so a /24 with many silent hosts takes minutes. This engine:
+
+- Runs the fping, nmap and arp-scan sweeps at the same time, over one or
+  more interfaces/subnets, in chunks paced by a packets-per-second budget
+- Enriches hosts in parallel, bounded by a semaphore: reverse DNS, then
+  mDNS, then NetBIOS for the hostname, and SNMP sysName alongside
+  (sysDescr too for hosts that answer SNMP)
+- Classifies roles with the compiled rules in device_classifier
+- Collects LLDP while hosts are being enriched
+
+It writes the same network_map.txt as the script, so the frontend parser
+is unchanged. Missing optional tools only disable the source that needs
+them; DiscoveryUnavailable is raised when no LAN interface can be found, and
+the caller falls back to the script.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import re
+import shutil
+import socket
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+from .device_classifier import DeviceClassifier, get_classifier
+
+if TYPE_CHECKING:
+    from .discovery_cache import DiscoveryCache
+
+logger = logging.getLogger(__name__)
+
+# Interfaces never used for mapping (loopback, VPNs, container and Proxmox firewall plumbing)
+EXCLUDED_INTERFACES = re.compile(r"^(lo|tailscale0|wg[0-9]|veth|fwbr|fwpr|fwln|docker[0-9]*)")
+
+# Per-command timeouts (seconds)
+SWEEP_TIMEOUT = 120.0
+LOOKUP_TIMEOUT = 3.0
+SNMP_TIMEOUT = 4.0
+LLDP_TIMEOUT = 10.0
+
+# Sweep pacing: packets per second across all sweeps, addresses per chunk, chunks swept at once
+DEFAULT_PACKETS_PER_SECOND = 1000
+DEFAULT_SWEEP_CHUNK_SIZE = 256
+DEFAULT_SWEEP_PARALLEL = 4
+
+# Largest subnet swept (a /12); bigger ones are skipped rather than swept for hours
+MAX_SUBNET_ADDRESSES = 2 ** 20
+
+# Tools sharing a chunk's packet budget (fping, nmap, arp-scan)
+_SWEEP_TOOLS = 3
+
+# Probes each tool sends a silent address (fping -r 1 and arp-scan --retry=2 try twice)
+_PROBES_PER_ADDRESS = 2
+
+# Share of a scan's time budget the sweep may use; the rest is for hostname and SNMP lookups
+SWEEP_TIME_SHARE = 0.6
+
+SNMP_COMMUNITY = "public"
+SNMP_SYSNAME_OID = "1.3.6.1.2.1.1.5.0"
+SNMP_SYSDESCR_OID = "1.3.6.1.2.1.1.1.0"
+
+_ARP_SCAN_LINE = re.compile(r"^(\d+\.\d+\.\d+\.\d+)\s+([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s*(.*)$")
+_NMAP_UP_LINE = re.compile(r"^Host:\s+(\d+\.\d+\.\d+\.\d+)\s.*Status:\s+Up")
+_IPV4 = re.compile(r"^\d+\.\d+\.\d+\.\d+$")
+# A "=== Devices Found ===" line of network_map.txt (same pattern as the frontend parser)
+_DEVICE_LINE = re.compile(r"^\s*([0-9.]+)\s*\|\s*([^|]+?)\s*\|\s*role=([a-z/-]+)\s*\|\s*depth=(\d+)", re.IGNORECASE)
+
+
+class DiscoveryUnavailable(RuntimeError):
+    """Raised when the engine cannot map this host (no usable interface or `ip` tool)"""
+
+
+@dataclass
+class CommandResult:
+    """Output of an external discovery tool."""
+    returncode: int
+    stdout: str
+    stderr: str = ""
+
+
+# (argv, timeout) -> result, or None when the tool is not installed
+CommandRunner = Callable[[list[str], float], Awaitable[CommandResult | None]]
+LogFn = Callable[[str], None]
+# Receives each host as soon as it is fully enriched, and whether that came from the cache
+HostFn = Callable[["DiscoveredHost", bool], None]
+# Receives sweep progress for a subnet after each chunk
+ProgressFn = Callable[[dict], None]
+
+
+@dataclass
+class ScanTarget:
+    """A subnet to sweep and the interface that reaches it."""
+    subnet: str
+    interface: str | None = None  # None for routed subnets, which get no ARP sweep
+    host_cidr: str | None = None  # This host's address on the interface
+
+
+@dataclass
+class DiscoveredHost:
+    """A host found on the LAN and what was learned about it."""
+    ip: str
+    mac: str | None = None
+    vendor: str | None = None
+    hostname: str | None = None
+    hostname_source: str | None = None  # dns, mdns or netbios
+    snmp_sysname: str | None = None  # Raw snmpwalk output line(s)
+    snmp_sysdescr: str | None = None  # sysDescr value, only asked of hosts that answer sysName
+    role: str = "unknown"
+    depth: int = 2
+    sources: set[str] = field(default_factory=set)  # icmp, nmap, arp, neighbor
+
+    @property
+    def display_name(self) -> str:
+        return self.hostname or "Unknown"
+
+    def to_record(self, cached: bool = False) -> dict:
+        """JSON-serializable host record for structured (NDJSON) output.
+
+        Args:
+            cached: Whether the enrichment came from the discovery cache
+        """
+        return {
+            "ip": self.ip,
+            "mac": self.mac,
+            "vendor": self.vendor,
+            "hostname": self.hostname,
+            "hostname_source": self.hostname_source,
+            "role": self.role,
+            "depth": self.depth,
+            "sources": sorted(self.sources),
+            "snmp_sysname": self.snmp_sysname,
+            "snmp_sysdescr": self.snmp_sysdescr,
+            "cached": cached,
+        }
+
+
+@dataclass
+class DiscoveryResult:
+    """Everything one discovery run found."""
+    interface: str
+    host_cidr: str
+    subnet: str
+    gateway: str | None
+    hosts: list[DiscoveredHost]
+    lldp: str = ""
+    targets: list[ScanTarget] = field(default_factory=list)
+    probed: set[str] = field(default_factory=set)  # IPs whose hostname and SNMP were looked up
+    generated_at: float = field(default_factory=time.time)
+    duration_seconds: float = 0.0
+
+
+async def run_command(cmd: list[str], timeout: float) -> CommandResult | None:
+    """Run a tool, reading stdout and stderr together; None if it is not installed.
+
+    Args:
+        cmd: Command and arguments
+        timeout: Seconds before the process is killed
+
+    Returns:
+        CommandResult (returncode -1 on timeout), or None if the tool is missing
+    """
+    if shutil.which(cmd[0]) is None:
+        return None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except OSError:
+        return None
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return CommandResult(returncode=-1, stdout="", stderr=f"{cmd[0]} timed out after {timeout}s")
+    except BaseException:
+        # Cancelled from outside (e.g. the sweep deadline): don't orphan the tool
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    return CommandResult(
+        returncode=proc.returncode,
+        stdout=stdout.decode("utf-8", errors="replace"),
+        stderr=stderr.decode("utf-8", errors="replace"),
+    )
+
+
+def read_neighbor_macs(path: str = "/proc/net/arp") -> dict[str, str]:
+    """IP -> MAC for complete entries in the kernel ARP table (empty if unreadable)."""
+    macs: dict[str, str] = {}
+    try:
+        with open(path) as f:
+            next(f, None)  # Header
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 4 and parts[2] == "0x2" and parts[3] != "00:00:00:00:00:00":
+                    macs[parts[0]] = parts[3].lower()
+    except OSError:
+        pass
+    return macs
+
+
+def classify_role(
+    ip: str,
+    hostname: str | None,
+    mac: str | None,
+    gateway: str | None,
+    vendor: str | None = None,
+    sysdescr: str | None = None,
+) -> str:
+    """Heuristic device role with the configured classifier (see device_classifier).
+
+    The default rules mirror the classification in lan_mapper.sh.
+    """
+    return get_classifier().classify(ip, hostname, mac, gateway, vendor, sysdescr)
+
+
+def estimate_depth(ip: str, role: str, gateway: str | None) -> int:
+    """Hops from the gateway guessed from the role (gateway 0, infrastructure 1, others 2)."""
+    if ip == gateway or role == "gateway/router":
+        return 0
+    if role in ("switch/ap", "firewall"):
+        return 1
+    return 2
+
+
+class RateLimiter:
+    """Paces events to at most `rate` per second (token bucket, one second of burst)."""
+
+    def __init__(self, rate: float):
+        self._rate = max(float(rate), 1.0)
+        self._tokens = self._rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+def _ip_key(ip: str) -> tuple[int, int]:
+    addr = ipaddress.ip_address(ip)
+    return addr.version, int(addr)
+
+
+async def _no_result() -> None:
+    return None
+
+
+def _first_line(text: str) -> str | None:
+    for line in text.splitlines():
+        line = line.strip().rstrip(".")
+        if line:
+            return line
+    return None
+
+
+class LanDiscoveryEngine:
+    """Discovers and enriches LAN hosts with bounded parallelism."""
+
+    def __init__(
+        self,
+        runner: CommandRunner = run_command,
+        concurrency: int = 32,
+        neighbor_reader: Callable[[], dict[str, str]] = read_neighbor_macs,
+        interfaces: list[str] | None = None,
+        subnets: list[str] | None = None,
+        packets_per_second: int = DEFAULT_PACKETS_PER_SECOND,
+        sweep_chunk_size: int = DEFAULT_SWEEP_CHUNK_SIZE,
+        sweep_parallel: int = DEFAULT_SWEEP_PARALLEL,
+        classifier: DeviceClassifier | None = None,
+    ):
+        """
+        Args:
+            runner: Runs external tools (default: asyncio subprocesses)
+            concurrency: Hosts enriched at once
+            neighbor_reader: IP -> MAC from the kernel neighbor table
+            interfaces: Interfaces to sweep, or ["all"]; default picks one like the script
+            subnets: Extra subnets (CIDR) to sweep, local or routed
+            packets_per_second: Probe budget shared by every sweep
+            sweep_chunk_size: Addresses per sweep chunk (rounded down to a power of two)
+            sweep_parallel: Chunks swept at once
+            classifier: Role rules and OUI index (default: get_classifier())
+        """
+        self._run = runner
+        self._concurrency = max(1, concurrency)
+        self._read_neighbors = neighbor_reader
+        self._interfaces = interfaces or []
+        self._subnets = subnets or []
+        self._packets_per_second = max(1, packets_per_second)
+        self._chunk_bits = max(0, sweep_chunk_size.bit_length() - 1)
+        self._sweep_parallel = max(1, sweep_parallel)
+        self._ping_limiter = RateLimiter(self._packets_per_second)
+        self._warned_ping_sweep = False
+        self._classifier = classifier or get_classifier()
+
+    # ---------- Interface detection ----------
+
+    async def _interface_addresses(self) -> dict[str, str]:
+        result = await self._run(["ip", "-o", "-4", "addr", "show"], LOOKUP_TIMEOUT)
+        if result is None or result.returncode != 0:
+            raise DiscoveryUnavailable("`ip` is not available to list interfaces")
+
+        addresses: dict[str, str] = {}
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 4 and parts[2] == "inet" and not EXCLUDED_INTERFACES.match(parts[1]):
+                addresses.setdefault(parts[1], parts[3])
+        return addresses
+
+    @staticmethod
+    def _preferred_interface(addresses: dict[str, str]) -> str:
+        names = sorted(addresses)
+        bridges = [name for name in names if name.startswith("vmbr")]
+        return (bridges or names)[0]
+
+    async def detect_interface(self) -> tuple[str, str, str]:
+        """Pick the LAN interface like the script: first valid one, Proxmox vmbr bridges preferred.
+
+        Returns:
+            Tuple of (interface, host IP/CIDR, subnet)
+
+        Raises:
+            DiscoveryUnavailable: If no interface with an IPv4 address is usable
+        """
+        addresses = await self._interface_addresses()
+        if not addresses:
+            raise DiscoveryUnavailable("No valid LAN interface found")
+        iface = self._preferred_interface(addresses)
+        host_cidr = addresses[iface]
+        return iface, host_cidr, str(ipaddress.ip_network(host_cidr, strict=False))
+
+    async def detect_targets(self, log: LogFn = lambda line: None) -> list[ScanTarget]:
+        """Subnets to sweep: the configured interfaces and subnets, or the script's single interface.
+
+        Raises:
+            DiscoveryUnavailable: If nothing can be swept
+        """
+        addresses = await self._interface_addresses()
+        if self._interfaces == ["all"]:
+            names = sorted(addresses)
+        elif self._interfaces:
+            names = [name for name in self._interfaces if name in addresses]
+            for name in set(self._interfaces) - set(names):
+                log(f"⚠ Interface {name} has no usable IPv4 address, skipping")
+        elif not self._subnets and addresses:
+            names = [self._preferred_interface(addresses)]
+        else:
+            names = []
+
+        targets: dict[str, ScanTarget] = {}
+        for name in names:
+            subnet = str(ipaddress.ip_network(addresses[name], strict=False))
+            targets.setdefault(subnet, ScanTarget(subnet=subnet, interface=name, host_cidr=addresses[name]))
+        for cidr in self._subnets:
+            try:
+                network = ipaddress.ip_network(cidr, strict=False)
+            except ValueError:
+                raise DiscoveryUnavailable(f"Invalid subnet {cidr!r}")
+            # ARP only works on a subnet attached to one of our interfaces
+            iface = next((
+                name for name, host_cidr in addresses.items()
+                if network.overlaps(ipaddress.ip_network(host_cidr, strict=False))
+            ), None)
+            targets.setdefault(str(network), ScanTarget(
+                subnet=str(network), interface=iface, host_cidr=addresses.get(iface) if iface else None
+            ))
+
+        usable = []
+        for target in targets.values():
+            if ipaddress.ip_network(target.subnet).num_addresses > MAX_SUBNET_ADDRESSES:
+                log(f"⚠ Subnet {target.subnet} is larger than {MAX_SUBNET_ADDRESSES} addresses, skipping")
+            else:
+                usable.append(target)
+        if not usable:
+            raise DiscoveryUnavailable("No valid LAN interface found")
+        return usable
+
+    async def default_gateway(self) -> str | None:
+        result = await self._run(["ip", "route"], LOOKUP_TIMEOUT)
+        if result is None:
+            return None
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0] == "default" and parts[1] == "via":
+                return parts[2]
+        return None
+
+    # ---------- Sweep ----------
+
+    def _chunks(self, network: ipaddress.IPv4Network) -> list[ipaddress.IPv4Network]:
+        prefix = max(network.prefixlen, network.max_prefixlen - self._chunk_bits)
+        return list(network.subnets(new_prefix=prefix))
+
+    def estimate_sweep_seconds(self, targets: list[ScanTarget]) -> float:
+        """Rough time to sweep the targets within the packet budget (silent addresses are the slow ones)."""
+        addresses = sum(ipaddress.ip_network(t.subnet).num_addresses for t in targets)
+        return addresses * _PROBES_PER_ADDRESS * _SWEEP_TOOLS / self._packets_per_second
+
+    async def sweep(
+        self,
+        targets: list[ScanTarget],
+        log: LogFn,
+        on_progress: ProgressFn | None = None,
+        deadline: float | None = None,
+    ) -> dict[str, DiscoveredHost]:
+        """Sweep every target in chunks, a few chunks at a time, and merge what the tools found.
+
+        Args:
+            targets: Subnets to sweep
+            log: Receives progress lines
+            on_progress: Receives {"subnet", "interface", "scanned", "total", "percent", "hosts_up"}
+                after each chunk
+            deadline: time.monotonic() after which no more chunks are started; the
+                hosts found so far are returned
+
+        Returns:
+            IP -> DiscoveredHost for every host that answered
+        """
+        chunk_count = sum(len(self._chunks(ipaddress.ip_network(t.subnet))) for t in targets)
+        # Split the packet budget over the chunks that run at once and the tools inside each
+        tool_rate = max(1, self._packets_per_second // (min(self._sweep_parallel, chunk_count) * _SWEEP_TOOLS))
+        log(f"📡 Sweeping {', '.join(t.subnet for t in targets)} "
+            f"(fping + nmap + arp-scan in parallel, ≤{self._packets_per_second} packets/s)...")
+
+        hosts: dict[str, DiscoveredHost] = {}
+        semaphore = asyncio.Semaphore(self._sweep_parallel)
+        skipped = sum(await asyncio.gather(*(
+            self._sweep_target(target, hosts, semaphore, tool_rate, log, on_progress, deadline)
+            for target in targets
+        )))
+        if skipped:
+            total = sum(ipaddress.ip_network(t.subnet).num_addresses for t in targets)
+            log(f"⚠ Time budget reached: {skipped} of {total} addresses were not swept, the map is partial.")
+
+        # Fill in MACs for hosts that answered ICMP but not arp-scan
+        for ip, mac in self._read_neighbors().items():
+            host = hosts.get(ip)
+            if host is not None and host.mac is None:
+                host.mac = mac
+                host.sources.add("neighbor")
+
+        log(f"✔ Sweep complete: {len(hosts)} hosts up.")
+        return hosts
+
+    async def _sweep_target(
+        self,
+        target: ScanTarget,
+        hosts: dict[str, DiscoveredHost],
+        semaphore: asyncio.Semaphore,
+        tool_rate: int,
+        log: LogFn,
+        on_progress: ProgressFn | None,
+        deadline: float | None = None,
+    ) -> int:
+        """Sweep one target's chunks; returns how many addresses were skipped at the deadline."""
+        network = ipaddress.ip_network(target.subnet)
+        total = network.num_addresses
+        scanned = hosts_up = skipped = 0
+        logged_decile = -1
+
+        async def sweep_chunk(chunk: ipaddress.IPv4Network) -> None:
+            nonlocal scanned, hosts_up, skipped, logged_decile
+            async with semaphore:
+                if deadline is not None and time.monotonic() >= deadline:
+                    skipped += chunk.num_addresses
+                    return
+                hosts_up += await self._sweep_chunk(target, network, chunk, hosts, tool_rate, log)
+            scanned += chunk.num_addresses
+            percent = round(100 * scanned / total, 1)
+            if on_progress is not None:
+                on_progress({
+                    "subnet": target.subnet,
+                    "interface": target.interface,
+                    "scanned": scanned,
+                    "total": total,
+                    "percent": percent,
+                    "hosts_up": hosts_up,
+                })
+            # Log every 10% so a /16 doesn't print a line per chunk
+            if int(percent // 10) > logged_decile:
+                logged_decile = int(percent // 10)
+                log(f"📡 {target.subnet}: {percent}% ({scanned}/{total} addresses, {hosts_up} hosts up)")
+
+        await asyncio.gather(*(sweep_chunk(chunk) for chunk in self._chunks(network)))
+        return skipped
+
+    async def _sweep_chunk(
+        self,
+        target: ScanTarget,
+        network: ipaddress.IPv4Network,
+        chunk: ipaddress.IPv4Network,
+        hosts: dict[str, DiscoveredHost],
+        tool_rate: int,
+        log: LogFn,
+    ) -> int:
+        """Sweep one chunk with every available tool; returns how many new hosts were found."""
+        # Skip the subnet's own network and broadcast addresses, not every chunk's
+        addresses = [
+            addr for addr in chunk
+            if network.prefixlen >= 31 or addr not in (network.network_address, network.broadcast_address)
+        ]
+        if not addresses:
+            return 0
+        first, last = str(addresses[0]), str(addresses[-1])
+        arp_command = None
+        if target.interface:
+            arp_command = [
+                "arp-scan", f"--interface={target.interface}", "--retry=2",
+                f"--interval={1_000_000 // tool_rate}u", str(chunk),
+            ]
+        fping, nmap, arp = await asyncio.gather(
+            self._run(["fping", "-a", "-g", first, last, "-r", "1", "-t", "50",
+                       "-i", str(max(1, 1000 // tool_rate))], SWEEP_TIMEOUT),
+            self._run(["nmap", "-sn", "--max-rate", str(tool_rate), str(chunk), "-oG", "-"], SWEEP_TIMEOUT),
+            self._run(arp_command, SWEEP_TIMEOUT) if arp_command else _no_result(),
+        )
+
+        before = len(hosts)
+
+        def found(ip: str, source: str) -> DiscoveredHost:
+            host = hosts.get(ip)
+            if host is None:
+                host = hosts[ip] = DiscoveredHost(ip=ip)
+            host.sources.add(source)
+            return host
+
+        if fping is not None:
+            for line in fping.stdout.splitlines():
+                if _IPV4.match(line.strip()):
+                    found(line.strip(), "icmp")
+        if nmap is not None:
+            for line in nmap.stdout.splitlines():
+                match = _NMAP_UP_LINE.match(line)
+                if match:
+                    found(match.group(1), "nmap")
+        if arp is not None:
+            for line in arp.stdout.splitlines():
+                match = _ARP_SCAN_LINE.match(line)
+                if match:
+                    host = found(match.group(1), "arp")
+                    host.mac = host.mac or match.group(2).lower()
+                    host.vendor = host.vendor or (match.group(3).strip() or None)
+        if fping is None and nmap is None:
+            if not self._warned_ping_sweep:
+                self._warned_ping_sweep = True
+                log("⚠ fping and nmap not installed, falling back to a ping sweep...")
+            for ip in await self._ping_sweep([str(addr) for addr in addresses]):
+                found(ip, "icmp")
+        return len(hosts) - before
+
+    async def _ping_sweep(self, targets: list[str]) -> list[str]:
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def ping(ip: str) -> str | None:
+            async with semaphore:
+                await self._ping_limiter.acquire()
+                result = await self._run(["ping", "-c", "1", "-W", "1", ip], LOOKUP_TIMEOUT)
+            return ip if result is not None and result.returncode == 0 else None
+
+        return [ip for ip in await asyncio.gather(*(ping(ip) for ip in targets)) if ip]
+
+    # ---------- Enrichment ----------
+
+    async def _reverse_dns(self, ip: str) -> str | None:
+        loop = asyncio.get_running_loop()
+        try:
+            name, _ = await asyncio.wait_for(
+                loop.getnameinfo((ip, 0), socket.NI_NAMEREQD), LOOKUP_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return None
+        return name.rstrip(".") or None
+
+    async def _mdns(self, ip: str) -> str | None:
+        result = await self._run(["avahi-resolve-address", ip], LOOKUP_TIMEOUT)
+        if result is None or result.returncode != 0:
+            return None
+        parts = (_first_line(result.stdout) or "").split()
+        return parts[1].rstrip(".") if len(parts) >= 2 else None
+
+    async def _netbios(self, ip: str) -> str | None:
+        result = await self._run(["nmblookup", "-A", ip], LOOKUP_TIMEOUT)
+        if result is None:
+            return None
+        for line in result.stdout.splitlines():
+            if "<00>" in line and "Looking up" not in line:
+                return line.split()[0]
+        return None
+
+    async def resolve_hostname(self, ip: str) -> tuple[str | None, str | None]:
+        """Hostname and the source that produced it, trying DNS, then mDNS, then NetBIOS."""
+        for source, lookup in (("dns", self._reverse_dns), ("mdns", self._mdns), ("netbios", self._netbios)):
+            name = await lookup(ip)
+            if name:
+                return name, source
+        return None, None
+
+    async def snmp_sysname(self, ip: str) -> str | None:
+        result = await self._run(
+            ["snmpwalk", "-v2c", "-c", SNMP_COMMUNITY, "-t", "1", "-r", "1", ip, SNMP_SYSNAME_OID],
+            SNMP_TIMEOUT,
+        )
+        if result is None or result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    async def snmp_sysdescr(self, ip: str) -> str | None:
+        result = await self._run(
+            ["snmpwalk", "-v2c", "-c", SNMP_COMMUNITY, "-t", "1", "-r", "1", "-Oqv", ip, SNMP_SYSDESCR_OID],
+            SNMP_TIMEOUT,
+        )
+        if result is None or result.returncode != 0:
+            return None
+        return result.stdout.strip().strip('"') or None
+
+    def classify(self, host: DiscoveredHost, gateway: str | None) -> None:
+        """Fill in the host's vendor (from the OUI index when unknown), role and depth."""
+        host.vendor = self._classifier.vendor(host.mac, host.vendor)
+        host.role = self._classifier.classify(
+            host.ip, host.hostname, host.mac, gateway, host.vendor, host.snmp_sysdescr
+        )
+        host.depth = estimate_depth(host.ip, host.role, gateway)
+
+    async def enrich(
+        self,
+        hosts: list[DiscoveredHost],
+        gateway: str | None,
+        log: LogFn,
+        on_host: HostFn | None = None,
+        deadline: float | None = None,
+    ) -> list[DiscoveredHost]:
+        """Resolve names, query SNMP and classify every host, at most `concurrency` at a time.
+
+        Hosts still being looked up at `deadline` (a time.monotonic() value) are
+        classified from what the sweep found. Returns those hosts.
+        """
+        log(f"🔤 Resolving hostnames and SNMP sysName for {len(hosts)} hosts ({self._concurrency} at a time)...")
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def enrich_one(host: DiscoveredHost) -> None:
+            async with semaphore:
+                (name, source), sysname = await asyncio.gather(
+                    self.resolve_hostname(host.ip), self.snmp_sysname(host.ip)
+                )
+                # Most hosts don't speak SNMP; only those that do are asked a second time
+                sysdescr = await self.snmp_sysdescr(host.ip) if sysname else None
+            host.hostname, host.hostname_source, host.snmp_sysname = name, source, sysname
+            host.snmp_sysdescr = sysdescr
+            self.classify(host, gateway)
+            if on_host is not None:
+                on_host(host, False)
+
+        tasks = [asyncio.create_task(enrich_one(host)) for host in hosts]
+        if not tasks:
+            log("✔ Hostname and SNMP collection complete.")
+            return []
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in done:
+            task.result()
+        unprobed = [host for host, task in zip(hosts, tasks) if task in pending]
+        for host in unprobed:
+            self.classify(host, gateway)
+            if on_host is not None:
+                on_host(host, False)
+        if unprobed:
+            log(f"⚠ Time budget reached: {len(unprobed)} hosts mapped without hostname or SNMP lookups.")
+        else:
+            log("✔ Hostname and SNMP collection complete.")
+        return unprobed
+
+    async def collect_lldp(self, log: LogFn) -> str:
+        result = await self._run(["lldpctl"], LLDP_TIMEOUT)
+        if result is None or result.returncode != 0:
+            log("⚠ No LLDP data found.")
+            return ""
+        return result.stdout
+
+    # ---------- Run ----------
+
+    def reuse_cached(
+        self, hosts: list[DiscoveredHost], cache: "DiscoveryCache", gateway: str | None
+    ) -> list[DiscoveredHost]:
+        """Fill in hosts the cache still knows; returns the ones that need a deep probe."""
+        now = time.time()
+        to_probe = []
+        for host in hosts:
+            cached = cache.reusable(host, now)
+            if cached is None:
+                to_probe.append(host)
+                continue
+            host.hostname, host.hostname_source = cached.hostname, cached.hostname_source
+            host.snmp_sysname, host.snmp_sysdescr = cached.snmp_sysname, cached.snmp_sysdescr
+            host.vendor = host.vendor or cached.vendor
+            self.classify(host, gateway)
+        return to_probe
+
+    async def discover(
+        self,
+        log: LogFn = lambda line: None,
+        cache: "DiscoveryCache | None" = None,
+        on_host: HostFn | None = None,
+        on_progress: ProgressFn | None = None,
+        time_budget: float | None = None,
+    ) -> DiscoveryResult:
+        """Map the LAN.
+
+        Args:
+            log: Receives progress lines (the script's stdout equivalents)
+            cache: Reuse enrichment of unchanged hosts from this cache (incremental scan)
+            on_host: Receives each host once its enrichment is known, while the scan runs
+            on_progress: Receives per-subnet sweep progress (see sweep)
+            time_budget: Seconds the scan may take; the sweep gets SWEEP_TIME_SHARE of
+                it and lookups the rest, and whatever was found by then is mapped
+
+        Returns:
+            DiscoveryResult with hosts sorted by IP
+
+        Raises:
+            DiscoveryUnavailable: If no LAN interface can be used
+        """
+        started = time.monotonic()
+        log("=== LAN Mapper Starting (python engine) ===")
+        targets = await self.detect_targets(log)
+        gateway = await self.default_gateway()
+        for target in targets:
+            log(f"🔎 Using LAN interface: {target.interface or '(routed)'}")
+            log(f"🔎 Host IP: {target.host_cidr or ''}")
+            log(f"🔎 Subnet: {target.subnet}")
+        log(f"🌐 Gateway: {gateway or ''}")
+
+        deadline = sweep_deadline = None
+        if time_budget is not None:
+            deadline = started + time_budget
+            sweep_deadline = started + time_budget * SWEEP_TIME_SHARE
+            estimate = self.estimate_sweep_seconds(targets)
+            if estimate > time_budget * SWEEP_TIME_SHARE:
+                warning = (
+                    f"Sweeping {', '.join(t.subnet for t in targets)} takes about {estimate:.0f}s at "
+                    f"{self._packets_per_second} packets/s, more than the {time_budget * SWEEP_TIME_SHARE:.0f}s "
+                    f"this scan allows; the map will be partial. Raise MAPPER_TIMEOUT_SECONDS or "
+                    f"MAPPER_PACKETS_PER_SECOND, or sweep smaller subnets."
+                )
+                logger.warning(warning)
+                log(f"⚠ {warning}")
+
+        found = await self.sweep(targets, log, on_progress, sweep_deadline)
+        hosts = sorted(found.values(), key=lambda host: _ip_key(host.ip))
+        to_probe = hosts
+        if cache is not None:
+            to_probe = self.reuse_cached(hosts, cache, gateway)
+            log(f"♻ Reused {len(hosts) - len(to_probe)} known hosts from the discovery cache; "
+                f"{len(to_probe)} new or changed hosts to probe.")
+            if on_host is not None:
+                probing = {host.ip for host in to_probe}
+                for host in hosts:
+                    if host.ip not in probing:
+                        on_host(host, True)
+        lldp, unprobed = await asyncio.gather(
+            self.collect_lldp(log), self.enrich(to_probe, gateway, log, on_host, deadline)
+        )
+
+        return DiscoveryResult(
+            interface=", ".join(dict.fromkeys(t.interface for t in targets if t.interface)),
+            host_cidr=", ".join(dict.fromkeys(t.host_cidr for t in targets if t.host_cidr)),
+            subnet=", ".join(t.subnet for t in targets),
+            gateway=gateway,
+            hosts=hosts,
+            lldp=lldp,
+            targets=targets,
+            probed={host.ip for host in to_probe} - {host.ip for host in unprobed},
+            duration_seconds=round(time.monotonic() - started, 2),
+        )
+
+
+def render_network_map(result: DiscoveryResult) -> str:
+    """Format a discovery result exactly like the network_map.txt written by lan_mapper.sh."""
+    by_ip = {host.ip: host for host in result.hosts}
+    gateway = result.gateway or ""
+    gateway_host = by_ip.get(gateway)
+    gateway_name = gateway_host.display_name if gateway_host else ""
+    generated = time.strftime("%a %b %e %H:%M:%S %Z %Y", time.localtime(result.generated_at))
+
+    lines = [
+        "### LAN NETWORK MAP",
+        f"Generated: {generated}",
+        "",
+        f"Gateway: {gateway} ({gateway_name})",
+        f"LAN Interface: {result.interface}",
+        f"Subnet: {result.subnet}",
+        "",
+        "=== Devices Found ===",
+    ]
+    for host in result.hosts:
+        lines.append(f"{host.ip:<15} | {host.display_name:<35} | role={host.role:<15} | depth={host.depth}")
+    lines += ["", "=== LLDP Topology (raw) ==="]
+    lines += result.lldp.splitlines()
+    lines.append("")
+    lines.append("=== SNMP Hostnames (sysName) ===")
+    lines += [host.snmp_sysname for host in result.hosts if host.snmp_sysname]
+    lines += ["", "=== Heuristic Topology Tree ===", "", "Gateway (depth 0):"]
+    lines.append(f"  - {gateway} ({gateway_name}) [{gateway_host.role if gateway_host else ''}]")
+    lines.append("")
+
+    def section(title: str, roles: tuple[str, ...]) -> None:
+        lines.append(title)
+        entries = [
+            f"  - {host.ip:<15} ({host.display_name}) [{host.role}]"
+            for host in result.hosts
+            if host.role in roles and not (host.role == "unknown" and host.ip == gateway)
+        ]
+        lines.extend(sorted(entries))
+        lines.append("")
+
+    section("Infrastructure (depth 1: switches / AP / firewall):", ("switch/ap", "firewall"))
+    section("Servers / NAS / Services (depth 2):", ("server", "nas", "service"))
+    section("Clients (depth 2):", ("client",))
+    section("Unknown-role devices (depth 2):", ("unknown",))
+    return "\n".join(lines) + "\n"
+
+
+def parse_network_map(content: str) -> list[dict]:
+    """Device entries of a network_map.txt written by this engine or lan_mapper.sh.
+
+    Returns:
+        List of {"ip", "hostname", "role", "depth"} dicts in file order
+    """
+    devices = []
+    for line in content.splitlines():
+        match = _DEVICE_LINE.match(line)
+        if match:
+            ip, hostname, role, depth = match.groups()
+            devices.append({"ip": ip, "hostname": hostname.strip(), "role": role.lower(), "depth": int(depth)})
+    return devices
+
+
+async def run_discovery(
+    output_path: Path,
+    log: LogFn = lambda line: None,
+    engine: LanDiscoveryEngine | None = None,
+    cache: "DiscoveryCache | None" = None,
+    incremental: bool = False,
+    on_host: Callable[[dict], None] | None = None,
+    on_progress: ProgressFn | None = None,
+    time_budget: float | None = None,
+) -> DiscoveryResult:
+    """Discover the LAN and write network_map.txt.
+
+    Args:
+        output_path: Where to write the map
+        log: Receives progress lines
+        engine: Engine to use (default: LanDiscoveryEngine())
+        cache: Discovery cache, updated and saved after the scan
+        incremental: Reuse the cache's enrichment for unchanged hosts
+        on_host: Receives a host record (DiscoveredHost.to_record) as each host is enriched
+        on_progress: Receives per-subnet sweep progress
+        time_budget: Seconds the scan may take before mapping what it found so far
+
+    Returns:
+        The discovery result
+
+    Raises:
+        DiscoveryUnavailable: If no LAN interface can be used
+    """
+    engine = engine or LanDiscoveryEngine()
+    host_fn: HostFn | None = None
+    if on_host is not None:
+        def host_fn(host: DiscoveredHost, cached: bool) -> None:
+            on_host(host.to_record(cached))
+
+    result = await engine.discover(log, cache if incremental else None, host_fn, on_progress, time_budget)
+    output_path.write_text(render_network_map(result))
+    if cache is not None:
+        cache.update(result.hosts, result.probed, result.generated_at)
+        cache.save()
+    log("")
+    log(f"🎉 Network map generated in {result.duration_seconds}s:")
+    log(f"   → {output_path}")
+    return result
+
@@ -0,0 +1,220 @@
+"""
+Mapper job manager.
+
+A network scan takes minutes, so it runs as a background asyncio task (a
+"job") rather than inside a request. Every scan maps the same LAN and
+writes the same network_map.txt and discovery cache, so only one job runs
+at a time, whichever network asked for it: a request that arrives while a
+scan is running joins that job instead of starting a second one (the
+network ID is only a label on the job). Every job keeps its
+events, so clients can attach to a running job at any point (or after a
+page reload) and get the output so far replayed before the live events.
+Events are streamed as SSE or as NDJSON (one JSON object per line).
+Finished jobs are kept for a while so recent results can be served without
+scanning again.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Literal
+
+from ..config import get_settings
+from . import mapper_runner_service
+from .mapper_runner_service import MapperResult, sse_event
+
+logger = logging.getLogger(__name__)
+
+# Network key for scans not tied to a saved network (the legacy single-map flow)
+DEFAULT_NETWORK = "default"
+
+# Finished jobs kept for re-attaching and result reuse
+MAX_FINISHED_JOBS = 20
+
+StreamFormat = Literal["sse", "ndjson"]
+
+
+def format_event(event: str, data: str | dict, output: StreamFormat = "sse") -> str:
+    """Format a job event for the wire.
+
+    Args:
+        event: Event type (job, log, progress, host, reset, result, diff or done)
+        data: Text (log, done) or a JSON object
+        output: "sse" for Server-Sent Events, "ndjson" for newline-delimited JSON
+
+    Returns:
+        One SSE message, or one JSON line {"type": event, "data": data}
+    """
+    if output == "ndjson":
+        return json.dumps({"type": event, "data": data}) + "\n"
+    return sse_event(event, json.dumps(data) if isinstance(data, dict) else data)
+
+
+@dataclass
+class MapperJob:
+    """One mapper run and everything it has emitted so far."""
+    id: str
+    network_id: str
+    incremental: bool = False
+    status: str = "running"  # running, completed or failed
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    events: list[tuple[str, str | dict]] = field(default_factory=list)  # (event, data), in order
+    result: MapperResult | None = None
+    error: BaseException | None = None
+    task: asyncio.Task | None = field(default=None, repr=False)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def emit(self, event: str, data: str | dict) -> None:
+        self.events.append((event, data))
+        # Wake every attached stream; they re-arm after catching up
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "network_id": self.network_id,
+            "incremental": self.incremental,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "engine": self.result.engine if self.result else None,
+            "error": str(self.error) if self.error else None,
+        }
+
+
+class MapperJobManager:
+    """Runs mapper jobs, one at a time."""
+
+    def __init__(self, max_finished: int = MAX_FINISHED_JOBS):
+        self._max_finished = max_finished
+        self._jobs: OrderedDict[str, MapperJob] = OrderedDict()
+        self._running: MapperJob | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _check_loop(self) -> None:
+        # Running jobs belong to one event loop; a new loop (e.g. a restart in tests) orphans them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            job = self._running
+            if job is not None:
+                job.finished_at = time.time()
+                job.status = "failed"
+                job.emit("done", "exit=-1")
+            self._running = None
+
+    def get(self, job_id: str) -> MapperJob | None:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> list[MapperJob]:
+        """Known jobs, newest first."""
+        return list(reversed(self._jobs.values()))
+
+    def running(self) -> MapperJob | None:
+        return self._running
+
+    def recent_result(self, network_id: str | None, max_age_seconds: float) -> MapperJob | None:
+        """Latest completed job for the network that finished within `max_age_seconds`."""
+        network_id = network_id or DEFAULT_NETWORK
+        now = time.time()
+        for job in reversed(self._jobs.values()):
+            if job.network_id == network_id and job.status == "completed":
+                return job if now - job.finished_at <= max_age_seconds else None
+        return None
+
+    def start(self, network_id: str | None = None, incremental: bool = False) -> tuple[MapperJob, bool]:
+        """Start a scan, or join the one already running (for any network).
+
+        Args:
+            network_id: Network being mapped (None for the default map)
+            incremental: Only deep-probe new or changed hosts
+
+        Returns:
+            Tuple of (job, whether a new job was started)
+        """
+        self._check_loop()
+        if self._running is not None:
+            return self._running, False
+
+        job = MapperJob(id=uuid.uuid4().hex, network_id=network_id or DEFAULT_NETWORK, incremental=incremental)
+        self._jobs[job.id] = job
+        self._running = job
+        job.emit("job", job.summary())
+        job.task = asyncio.create_task(self._run(job))
+        self._prune()
+        return job, True
+
+    async def _run(self, job: MapperJob) -> None:
+        try:
+            result = await mapper_runner_service.run_mapper(
+                log=lambda line: job.emit("log", line),
+                timeout=get_settings().mapper_timeout_seconds,
+                incremental=job.incremental,
+                on_host=lambda record: job.emit("host", record),
+                on_progress=lambda progress: job.emit("progress", progress),
+                network_id=None if job.network_id == DEFAULT_NETWORK else job.network_id,
+                on_reset=lambda: job.emit("reset", {"engine": "script"}),
+            )
+        except Exception as exc:
+            logger.warning(f"Mapper job {job.id} failed: {exc}")
+            job.error = exc
+            job.finished_at = time.time()
+            job.status = "failed"
+            job.emit("log", f"ERROR: {exc}")
+            job.emit("done", "exit=-1")
+        else:
+            job.result = result
+            job.finished_at = time.time()
+            job.status = "completed"
+            job.emit("result", {
+                "content": result.content,
+                "script_exit_code": result.exit_code,
+                "network_map_path": result.map_path,
+                "engine": result.engine,
+            })
+            if result.diff is not None:
+                job.emit("diff", result.diff)
+            job.emit("done", f"exit={result.exit_code}")
+        finally:
+            if not job.done:  # Cancelled
+                job.finished_at = time.time()
+                job.status = "failed"
+                job.emit("done", "exit=-1")
+            if self._running is job:
+                self._running = None
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job_id]
+
+    async def wait(self, job: MapperJob) -> MapperJob:
+        """Wait for the job to finish; cancelling the waiter leaves the job running."""
+        if job.task is not None and not job.done:
+            await asyncio.shield(job.task)
+        return job
+
+    async def stream(self, job: MapperJob, output: StreamFormat = "sse") -> AsyncIterator[str]:
+        """Every event of the job: buffered ones first, then live ones until it finishes."""
+        sent = 0
+        while True:
+            changed = job._changed
+            while sent < len(job.events):
+                yield format_event(*job.events[sent], output)
+                sent += 1
+            if job.done:
+                return
+            await changed.wait()
+
+
+mapper_jobs = MapperJobManager()
@@ -2,18 +2,39 @@
 Mapper script execution service.
 
 Handles:
-- Network mapper script execution (sync and streaming)
+- Network mapping with the python discovery engine, or lan_mapper.sh as fallback
+- Network mapper script execution (asyncio subprocess, stdout and stderr read together)
 - Network map file discovery
+- Incremental scans (discovery cache) and diffs against the network's saved layout
 - Layout file persistence
 - SSE event formatting
 """
 
+import asyncio
+import ipaddress
 import json
+import logging
 import os
 import pathlib
-import subprocess
 from dataclasses import dataclass
-from typing import Generator
+from typing import Callable
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..config import get_settings
+from ..database import async_session_maker
+from ..models.network import Network
+from . import lan_discovery
+from .discovery_cache import DiscoveryCache
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("auto", "python", "script")
+
+# Share of the mapper timeout the python engine plans its scan for; the rest
+# covers chunks and lookups still running when its budget runs out
+DISCOVERY_TIME_SHARE = 0.9
 
 
 @dataclass
@@ -22,6 +43,8 @@ class MapperResult:
     content: str
     exit_code: int
     map_path: str | None = None
+    engine: str = "script"
+    diff: dict | None = None
 
 
 def project_root() -> pathlib.Path:
@@ -70,6 +93,15 @@ def saved_layout_path() -> pathlib.Path:
     return project_root() / "saved_network_layout.json"
 
 
+def discovery_cache_path() -> pathlib.Path:
+    """Get the path where the MAC-keyed discovery cache is stored.
+
+    Returns:
+        Path to discovery_cache.json, next to the saved layout
+    """
+    return saved_layout_path().with_name("discovery_cache.json")
+
+
 def sse_event(event: str, data: str) -> str:
     """Format data as a Server-Sent Event.
     
@@ -88,6 +120,155 @@ def sse_event(event: str, data: str) -> str:
     return "\n".join(chunks) + "\n"
 
 
+def mapper_engine() -> str:
+    """Get the configured mapping engine.
+
+    Returns:
+        "auto" (python engine, script if it cannot run), "python" or "script"
+    """
+    engine = get_settings().mapper_engine.lower()
+    return engine if engine in ENGINES else "auto"
+
+
+def discovery_output_path() -> pathlib.Path:
+    """Get where the python engine writes network_map.txt (same place as the script).
+
+    Returns:
+        Path to network_map.txt in the project root
+    """
+    return project_root() / "network_map.txt"
+
+
+def _split_list(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _discovery_engine() -> lan_discovery.LanDiscoveryEngine:
+    settings = get_settings()
+    return lan_discovery.LanDiscoveryEngine(
+        concurrency=settings.mapper_concurrency,
+        interfaces=_split_list(settings.mapper_interfaces),
+        subnets=_split_list(settings.mapper_subnets),
+        packets_per_second=settings.mapper_packets_per_second,
+        sweep_chunk_size=settings.mapper_sweep_chunk_size,
+        sweep_parallel=settings.mapper_sweep_parallel,
+    )
+
+
+def _discovery_cache() -> DiscoveryCache:
+    return DiscoveryCache.load(discovery_cache_path(), get_settings().mapper_cache_max_age_seconds)
+
+
+def map_host_records(content: str) -> list[dict]:
+    """Host records for a network_map.txt, for maps written by lan_mapper.sh.
+
+    The map only carries IP, hostname, role and depth, so the other record fields are empty.
+
+    Args:
+        content: network_map.txt content
+
+    Returns:
+        List of host records with the same keys as DiscoveredHost.to_record
+    """
+    records = []
+    for device in lan_discovery.parse_network_map(content):
+        host = lan_discovery.DiscoveredHost(
+            ip=device["ip"],
+            hostname=None if device["hostname"] == "Unknown" else device["hostname"],
+            role=device["role"],
+            depth=device["depth"],
+        )
+        records.append(host.to_record())
+    return records
+
+
+def _layout_devices(node: dict | None, devices: dict[str, dict]) -> dict[str, dict]:
+    if not node:
+        return devices
+    ip = node.get("ip")
+    if ip and node.get("role") != "group":
+        devices[ip] = {"ip": ip, "hostname": node.get("hostname"), "role": node.get("role")}
+    for child in node.get("children") or []:
+        _layout_devices(child, devices)
+    return devices
+
+
+def _ip_sort_key(device: dict) -> tuple[int, int]:
+    try:
+        addr = ipaddress.ip_address(device["ip"])
+        return addr.version, int(addr)
+    except ValueError:
+        return 0, 0
+
+
+def diff_against_layout(content: str, layout: dict | None) -> dict:
+    """Compare a network map with the devices of a saved layout.
+
+    Args:
+        content: network_map.txt content
+        layout: Saved layout ({"root": node tree}), or None if none was saved
+
+    Returns:
+        Dict with "added", "removed" and "changed" device lists (sorted by IP),
+        the "unchanged" count and whether a saved layout existed
+    """
+    current = {device["ip"]: device for device in lan_discovery.parse_network_map(content)}
+    previous = _layout_devices((layout or {}).get("root"), {})
+
+    added = [{k: v for k, v in device.items() if k != "depth"} for ip, device in current.items() if ip not in previous]
+    removed = [device for ip, device in previous.items() if ip not in current]
+    changed = []
+    for ip in current.keys() & previous.keys():
+        changes = {
+            key: {"old": previous[ip][key], "new": current[ip][key]}
+            for key in ("hostname", "role")
+            if previous[ip][key] != current[ip][key]
+        }
+        if changes:
+            changed.append({"ip": ip, "hostname": current[ip]["hostname"], "role": current[ip]["role"], "changes": changes})
+
+    return {
+        "added": sorted(added, key=_ip_sort_key),
+        "removed": sorted(removed, key=_ip_sort_key),
+        "changed": sorted(changed, key=_ip_sort_key),
+        "unchanged": len(current) - len(added) - len(changed),
+        "has_saved_layout": layout is not None,
+    }
+
+
+async def load_network_layout(network_id: str) -> dict | None:
+    """Load a network's saved layout (Network.layout_data).
+
+    Args:
+        network_id: Network UUID
+
+    Returns:
+        The layout, or None if the network has none
+
+    Raises:
+        RuntimeError: If the layout cannot be read
+    """
+    try:
+        async with async_session_maker() as session:
+            result = await session.execute(select(Network.layout_data).where(Network.id == network_id))
+            layout = result.scalar_one_or_none()
+        if isinstance(layout, str):
+            layout = json.loads(layout)
+    except (SQLAlchemyError, ValueError) as exc:
+        raise RuntimeError(f"Failed to load layout of network {network_id}: {exc}")
+    return layout
+
+
+async def _layout_diff(content: str, network_id: str | None) -> dict:
+    try:
+        # Networks keep their layout in the database; the file is the legacy single map's
+        layout = await load_network_layout(network_id) if network_id else load_layout()
+    except RuntimeError as exc:
+        logger.warning(f"Diffing against an empty layout: {exc}")
+        layout = None
+    return diff_against_layout(content, layout)
+
+
 def get_script_command() -> list[str]:
     """Get the command to run the mapper script.
     
@@ -101,125 +282,172 @@ def get_script_command() -> list[str]:
     return [str(script)]
 
 
-def run_mapper_sync(timeout: int = 300) -> MapperResult:
-    """Run the mapper script synchronously.
-    
+async def run_mapper(
+    log: Callable[[str], None] = lambda line: None,
+    timeout: float = 300,
+    incremental: bool = False,
+    on_host: Callable[[dict], None] | None = None,
+    on_progress: Callable[[dict], None] | None = None,
+    network_id: str | None = None,
+    on_reset: Callable[[], None] | None = None,
+) -> MapperResult:
+    """Map the network.
+
+    Uses the python discovery engine unless the engine is "script"; in "auto"
+    mode lan_mapper.sh is run when the engine cannot map this host.
+
     Args:
+        log: Receives progress lines as they are produced
         timeout: Maximum execution time in seconds
-        
+        incremental: Only deep-probe new or changed hosts (python engine) and
+            return a diff against the saved layout
+        on_host: Receives a structured record per host (see DiscoveredHost.to_record);
+            the python engine sends each one as soon as the host is enriched,
+            the script engine sends them all once the map is written
+        on_progress: Receives sweep progress per subnet (python engine only;
+            see LanDiscoveryEngine.sweep)
+        network_id: Network whose saved layout (Network.layout_data) the diff
+            is against; None uses saved_network_layout.json (legacy flow)
+        on_reset: Called when "auto" mode falls back to the script after the
+            python engine already sent host records; the records sent so far
+            must be discarded, the script's full set follows
+
     Returns:
         MapperResult with content, exit code, and optional map path
-        
+
     Raises:
-        FileNotFoundError: If script doesn't exist
-        TimeoutError: If script times out
-        RuntimeError: If script fails to run
+        FileNotFoundError: If the script is needed and doesn't exist
+        TimeoutError: If mapping times out
+        RuntimeError: If mapping fails
     """
+    engine = mapper_engine()
+    result: MapperResult | None = None
+    hosts_sent = 0
+
+    def forward_host(record: dict) -> None:
+        nonlocal hosts_sent
+        hosts_sent += 1
+        on_host(record)
+
+    if engine != "script":
+        try:
+            result = await _run_discovery(
+                log, timeout, incremental, forward_host if on_host is not None else None, on_progress
+            )
+        except TimeoutError:
+            raise
+        except Exception as exc:
+            if engine == "python":
+                raise RuntimeError(f"Network discovery failed: {exc}")
+            logger.warning(f"Python discovery engine unavailable, running lan_mapper.sh: {exc}")
+            log(f"⚠ Python discovery engine unavailable ({exc}), running lan_mapper.sh")
+    if result is None:
+        result = await _run_script(log, timeout)
+        if on_host is not None:
+            if hosts_sent and on_reset is not None:
+                on_reset()
+            for record in map_host_records(result.content):
+                on_host(record)
+    if incremental:
+        result.diff = await _layout_diff(result.content, network_id)
+    return result
+
+
+async def _run_discovery(
+    log: Callable[[str], None],
+    timeout: float,
+    incremental: bool,
+    on_host: Callable[[dict], None] | None = None,
+    on_progress: Callable[[dict], None] | None = None,
+) -> MapperResult:
+    output = discovery_output_path()
+    try:
+        await asyncio.wait_for(
+            lan_discovery.run_discovery(
+                output,
+                log=log,
+                engine=_discovery_engine(),
+                cache=_discovery_cache(),
+                incremental=incremental,
+                on_host=on_host,
+                on_progress=on_progress,
+                time_budget=timeout * DISCOVERY_TIME_SHARE,
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"Network discovery timed out after {timeout}s")
+    return MapperResult(content=output.read_text(), exit_code=0, map_path=str(output), engine="python")
+
+
+async def _pump_lines(stream: asyncio.StreamReader, emit: Callable[[str], None]) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        emit(line.decode("utf-8", errors="replace").rstrip("\n"))
+
+
+async def _run_script(log: Callable[[str], None], timeout: float) -> MapperResult:
     script = script_path()
     if not script.exists():
         raise FileNotFoundError(f"lan_mapper.sh not found at {script}")
-    
-    cmd = get_script_command()
-    
+
     try:
-        proc = subprocess.run(
-            cmd,
+        proc = await asyncio.create_subprocess_exec(
+            *get_script_command(),
             cwd=str(project_root()),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=timeout,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
-    except subprocess.TimeoutExpired:
-        raise TimeoutError(f"lan_mapper.sh timed out after {timeout}s")
     except Exception as exc:
         raise RuntimeError(f"Failed to run lan_mapper.sh: {exc}")
-    
+
+    stdout: list[str] = []
+    stderr: list[str] = []
+
+    def on_stdout(line: str) -> None:
+        stdout.append(line)
+        log(line)
+
+    def on_stderr(line: str) -> None:
+        stderr.append(line)
+        log(f"STDERR: {line}")
+
+    # Read both pipes at once so a chatty stderr can't fill up and block the script
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(_pump_lines(proc.stdout, on_stdout), _pump_lines(proc.stderr, on_stderr), proc.wait()),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise TimeoutError(f"lan_mapper.sh timed out after {timeout}s")
+
     # Prefer an actual file artifact if present
     content: str | None = None
     map_path: str | None = None
-    
+
     for candidate in network_map_candidates():
         if candidate.exists():
             try:
                 content = candidate.read_text()
                 map_path = str(candidate)
                 break
-            except Exception:
-                pass
-    
+            except Exception as exc:
+                log(f"ERROR: could not read {candidate}: {exc}")
+
     # Fallback to stdout
     if content is None:
-        content = proc.stdout.strip()
-    
+        content = "\n".join(stdout).strip()
+
     if not content:
-        stderr_msg = proc.stderr.strip() if proc.stderr else "No output"
+        stderr_msg = "\n".join(stderr).strip() or "No output"
         raise RuntimeError(f"No network_map.txt content produced. stderr: {stderr_msg}")
-    
-    return MapperResult(
-        content=content,
-        exit_code=proc.returncode,
-        map_path=map_path
-    )
 
-
-def run_mapper_streaming() -> Generator[str, None, None]:
-    """Run the mapper script with streaming output.
-    
-    Yields:
-        SSE-formatted event strings
-        
-    Raises:
-        FileNotFoundError: If script doesn't exist
-    """
-    script = script_path()
-    if not script.exists():
-        raise FileNotFoundError(f"lan_mapper.sh not found at {script}")
-    
-    cmd = get_script_command()
-    
-    try:
-        proc = subprocess.Popen(
-            cmd,
-            cwd=str(project_root()),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True,
-        )
-    except Exception as exc:
-        yield sse_event("log", f"ERROR: failed to start lan_mapper.sh: {exc}")
-        yield sse_event("done", "exit=-1")
-        return
-    
-    # Stream stdout
-    if proc.stdout:
-        for line in proc.stdout:
-            yield sse_event("log", line.rstrip("\n"))
-    
-    # Drain stderr afterwards
-    if proc.stderr:
-        for line in proc.stderr:
-            stripped = line.rstrip('\n')
-            yield sse_event("log", f"STDERR: {stripped}")
-    
-    exit_code = proc.wait()
-    
-    # Attempt to read produced file
-    result_payload = {"content": "", "script_exit_code": exit_code, "network_map_path": None}
-    
-    for candidate in network_map_candidates():
-        if candidate.exists():
-            try:
-                result_payload["content"] = candidate.read_text()
-                result_payload["network_map_path"] = str(candidate)
-                break
-            except Exception as exc:
-                yield sse_event("log", f"ERROR: could not read {candidate}: {exc}")
-    
-    yield sse_event("result", json.dumps(result_payload))
-    yield sse_event("done", f"exit={exit_code}")
+    return MapperResult(content=content, exit_code=proc.returncode, map_path=map_path)
 
 
 def find_network_map() -> pathlib.Path | None:
@@ -160,6 +160,7 @@ async def proxy_streaming_request(
     json_body: dict[str, Any] | None = None,
     headers: dict[str, str] | None = None,
     timeout: float = 300.0,
+    media_type: str = "text/event-stream",
 ) -> StreamingResponse:
     """
     Proxy a streaming request to an upstream service and return a StreamingResponse.
@@ -176,6 +177,7 @@ async def proxy_streaming_request(
         json_body: JSON body to send
         headers: Headers to forward (e.g., Authorization)
         timeout: Request timeout in seconds (default 300s for long AI operations)
+        media_type: Content type of the proxied stream (default SSE)
         
     Returns:
         FastAPI StreamingResponse with SSE content
@@ -201,7 +203,7 @@ async def proxy_streaming_request(
         # Return streaming response - generator handles cleanup
         return StreamingResponse(
             create_stream_generator(response, client),
-            media_type="text/event-stream",
+            media_type=media_type,
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
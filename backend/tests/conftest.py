@@ -18,6 +18,8 @@ os.environ["AUTH_SERVICE_URL"] = "http://test-auth:8002"
 os.environ["METRICS_SERVICE_URL"] = "http://test-metrics:8003"
 os.environ["ASSISTANT_SERVICE_URL"] = "http://test-assistant:8004"
 os.environ["NOTIFICATION_SERVICE_URL"] = "http://test-notification:8005"
+# Mapper tests run a stub lan_mapper.sh rather than scanning the test host
+os.environ["MAPPER_ENGINE"] = "script"
 
 
 @pytest.fixture
@@ -28,7 +28,7 @@ def readwrite_user():
 class TestMapperStreamGenerator:
     """Tests for mapper stream event generator"""
     
-    def test_stream_generator_popen_exception(self, tmp_path, readwrite_user):
+    async def test_stream_generator_popen_exception(self, tmp_path, readwrite_user):
         """Stream generator should handle Popen exceptions"""
         from app.routers.mapper import run_mapper_stream
         from app.services import mapper_runner_service
@@ -40,16 +40,20 @@ class TestMapperStreamGenerator:
         
         with patch.object(mapper_runner_service, 'script_path', return_value=script):
             with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
-                with patch('subprocess.Popen', side_effect=OSError("Cannot execute")):
-                    response = run_mapper_stream(user=readwrite_user)
+                with patch('asyncio.create_subprocess_exec', side_effect=OSError("Cannot execute")):
+                    response = await run_mapper_stream(user=readwrite_user)
+                    events = [chunk async for chunk in response.body_iterator]
                     
                     # Should return a streaming response
                     assert isinstance(response, StreamingResponse)
+                    assert any("Failed to run lan_mapper.sh: Cannot execute" in e for e in events)
+                    assert events[-1] == sse_event("done", "exit=-1")
     
-    def test_stream_generator_success(self, tmp_path, readwrite_user):
+    async def test_stream_generator_success(self, tmp_path, readwrite_user):
         """Stream generator should yield events correctly"""
         from app.routers.mapper import run_mapper_stream
         from app.services import mapper_runner_service
+        from app.services.mapper_runner_service import sse_event
         
         script = tmp_path / "lan_mapper.sh"
         script.write_text("#!/bin/bash\necho 'line1'\necho 'line2'")
@@ -61,10 +65,12 @@ class TestMapperStreamGenerator:
         with patch.object(mapper_runner_service, 'script_path', return_value=script):
             with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[tmp_path / "network_map.txt"]):
-                    response = run_mapper_stream(user=readwrite_user)
+                    response = await run_mapper_stream(user=readwrite_user)
+                    events = [chunk async for chunk in response.body_iterator]
                     
                     assert isinstance(response, StreamingResponse)
                     assert response.media_type == "text/event-stream"
+                    assert sse_event("log", "line2") in events
 
 
 class TestMapperEmbedDeleteWithMapping:
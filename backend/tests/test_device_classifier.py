@@ -0,0 +1,155 @@
+"""
+Unit tests for the OUI index and compiled role classification rules.
+"""
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.services import device_classifier
+from app.services.device_classifier import (
+    BUNDLED_OUI_FILE,
+    ClassificationRule,
+    DeviceClassifier,
+    OuiIndex,
+    get_classifier,
+    load_rules,
+)
+
+
+@pytest.fixture
+def classifier():
+    return DeviceClassifier(oui_index=OuiIndex({
+        "00:11:32": "Synology Incorporated",
+        "24:A4:3C": "Ubiquiti Inc",
+        "BC:24:11": "Proxmox Server Solutions GmbH",
+    }))
+
+
+@pytest.fixture
+def configured(tmp_path):
+    """Point get_classifier at test settings and rebuild it"""
+    settings = SimpleNamespace(mapper_oui_file="", mapper_rules_file="")
+    get_classifier.cache_clear()
+    with patch.object(device_classifier, "get_settings", return_value=settings):
+        yield settings
+    get_classifier.cache_clear()
+
+
+class TestOuiIndex:
+    """Tests for vendor lookups by MAC prefix"""
+
+    def test_reads_ieee_txt_csv_and_arp_scan_formats(self, tmp_path):
+        path = tmp_path / "oui.txt"
+        path.write_text(
+            "OUI/MA-L                                                    Organization\n"
+            "00-11-32   (hex)\t\tSynology Incorporated\n"
+            "001132     (base 16)\t\tSynology Incorporated\n"
+            "\t\t\t\t3F-3, No. 106, Chang An W. Rd.\n"
+            'MA-M,70B3D51,"Example, Ltd.",Somewhere\n'
+            "245EBE\tQNAP Systems, Inc.\n"
+        )
+        index = OuiIndex.load(path)
+
+        assert len(index) == 3
+        assert index.lookup("00:11:32:AA:BB:CC") == "Synology Incorporated"
+        assert index.lookup("24-5e-be-00-00-01") == "QNAP Systems, Inc."
+        assert index.lookup("70:b3:d5:1a:00:01") == "Example, Ltd."
+        assert index.lookup("70:b3:d5:2a:00:01") is None
+        assert index.lookup(None) is None
+
+    def test_bundled_registry_loads(self):
+        index = OuiIndex.load(BUNDLED_OUI_FILE)
+
+        assert len(index) > 100
+        assert index.lookup("4c:5e:0c:12:34:56") == "Routerboard.com"
+
+    def test_missing_file_gives_empty_index(self, tmp_path):
+        assert len(OuiIndex.load(tmp_path / "missing.txt")) == 0
+
+
+class TestDeviceClassifier:
+    """Tests for rule priority across hostname, sysDescr, vendor and MAC"""
+
+    @pytest.mark.parametrize("hostname,mac,vendor,sysdescr,role", [
+        ("unifi-ap", "00:11:32:00:00:01", None, None, "switch/ap"),  # Hostname beats vendor
+        (None, None, None, "FreeBSD 14.0-CURRENT pfSense 2.7.2", "firewall"),  # First rule wins, not first match
+        (None, "24:a4:3c:00:00:01", None, None, "switch/ap"),  # Vendor from the OUI index
+        (None, "00:11:32:00:00:01", "(Unknown)", None, "nas"),
+        (None, "bc:24:11:00:00:01", None, None, "service"),
+        (None, "aa:bb:cc:dd:ee:ff", None, None, "unknown"),
+        # A vendor beats a generic Linux sysDescr, which NAS and network gear report too
+        (None, "00:11:32:00:00:01", None, "Linux DiskStation 4.4.302+ #72806 SMP x86_64", "nas"),
+        (None, "24:a4:3c:00:00:01", None, "Linux U7PG2 4.4.153 #1 SMP mips", "switch/ap"),
+        (None, "bc:24:11:00:00:01", None, "Linux pve 6.8.12-4-pve x86_64", "service"),
+        (None, "aa:bb:cc:dd:ee:ff", None, "Linux web01 6.1.0-18-amd64 x86_64", "server"),
+        (None, None, None, "VMware ESXi 8.0.2 build-22380479", "server"),
+    ])
+    def test_roles(self, classifier, hostname, mac, vendor, sysdescr, role):
+        assert classifier.classify("10.0.0.9", hostname, mac, "10.0.0.1", vendor, sysdescr) == role
+
+    def test_vendor_keeps_known_names(self, classifier):
+        assert classifier.vendor("00:11:32:00:00:01", "Synology Inc.") == "Synology Inc."
+        assert classifier.vendor("00:11:32:00:00:01", "(Unknown)") == "Synology Incorporated"
+        assert classifier.vendor("02:42:ac:11:00:02", "(Unknown: locally administered)") == (
+            "(Unknown: locally administered)"
+        )
+
+    def test_thousands_of_hosts_in_milliseconds(self, classifier):
+        hosts = [(f"10.0.{i // 256}.{i % 256}", f"host-{i}", f"00:11:32:00:{i // 256:02x}:{i % 256:02x}")
+                 for i in range(5000)]
+
+        start = time.perf_counter()
+        roles = [classifier.classify(ip, name, mac, "10.0.0.1") for ip, name, mac in hosts]
+        elapsed = time.perf_counter() - start
+
+        assert roles.count("nas") == 4999 and elapsed < 0.5
+
+
+class TestRuleFiles:
+    """Tests for rules loaded from MAPPER_RULES_FILE"""
+
+    def test_file_rules_take_precedence(self, tmp_path, configured):
+        rules = tmp_path / "rules.json"
+        rules.write_text(json.dumps([
+            {"role": "server", "hostname": ["^nas-gw$"]},
+            {"role": "switch/ap", "vendor": "Routerboard", "mac": ["64:d1:54"]},
+        ]))
+        configured.mapper_rules_file = str(rules)
+
+        classifier = get_classifier()
+
+        assert classifier.rules[0] == ClassificationRule("server", hostname=("^nas-gw$",))
+        assert classifier.classify("10.0.0.2", "nas-gw", None, "10.0.0.1") == "server"
+        assert classifier.classify("10.0.0.3", "nas-box", None, "10.0.0.1") == "nas"
+        assert classifier.classify("10.0.0.4", None, "4c:5e:0c:00:00:01", "10.0.0.1") == "switch/ap"
+        assert get_classifier() is classifier
+
+    def test_generic_file_rules_come_after_specific_ones(self, tmp_path):
+        rules = tmp_path / "rules.json"
+        rules.write_text(json.dumps([
+            {"role": "server", "sysdescr": ["illumos"], "generic": True},
+            {"role": "nas", "vendor": ["ixsystems"]},
+        ]))
+        classifier = DeviceClassifier(load_rules(rules))
+
+        assert classifier.rules[0] == ClassificationRule("server", sysdescr=("illumos",), generic=True)
+        assert classifier.classify("10.0.0.2", None, None, "10.0.0.1", "iXsystems", "illumos omnios") == "nas"
+        assert classifier.classify("10.0.0.3", None, None, "10.0.0.1", None, "illumos omnios") == "server"
+
+    @pytest.mark.parametrize("content", [
+        '{"role": "nas"}',
+        '[{"role": "printer", "hostname": ["hp"]}]',
+        '[{"role": "nas", "hostname": ["("]}]',
+        '[{"role": "nas", "vendor": [1]}]',
+        '[{"role": "nas", "sysdescr": ["linux"], "generic": "yes"}]',
+        "not json",
+    ])
+    def test_invalid_rules_are_rejected(self, tmp_path, content):
+        path = tmp_path / "rules.json"
+        path.write_text(content)
+
+        with pytest.raises(ValueError):
+            load_rules(path)
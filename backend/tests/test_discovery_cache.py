@@ -0,0 +1,180 @@
+"""
+Unit tests for the discovery cache and incremental mapping.
+"""
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.services import lan_discovery, mapper_runner_service
+from app.services.discovery_cache import CachedHost, DiscoveryCache
+from app.services.lan_discovery import DiscoveredHost, LanDiscoveryEngine, run_discovery
+
+from .test_lan_discovery import FakeRunner, no_reverse_dns
+
+
+def host(ip, mac, hostname=None, role="unknown"):
+    return DiscoveredHost(ip=ip, mac=mac, hostname=hostname, role=role)
+
+
+class TestDiscoveryCache:
+    """Tests for the MAC-keyed cache"""
+
+    def test_round_trip_and_reuse_rules(self, tmp_path):
+        path = tmp_path / "discovery_cache.json"
+        cache = DiscoveryCache(path, max_age_seconds=100)
+        cache.update([
+            host("10.0.0.2", "AA:BB:CC:00:00:02", "nas", "nas"),
+            host("10.0.0.3", None, "no-mac"),
+        ], probed={"10.0.0.2", "10.0.0.3"}, now=1000)
+        cache.save()
+
+        loaded = DiscoveryCache.load(path, max_age_seconds=100)
+
+        assert len(loaded) == 1
+        assert loaded.get("aa:bb:cc:00:00:02") == CachedHost(
+            mac="aa:bb:cc:00:00:02", ip="10.0.0.2", hostname="nas", role="nas", probed_at=1000, last_seen=1000
+        )
+        assert loaded.reusable(host("10.0.0.2", "aa:bb:cc:00:00:02"), now=1050) is not None
+        assert loaded.reusable(host("10.0.0.9", "aa:bb:cc:00:00:02"), now=1050) is None  # Moved
+        assert loaded.reusable(host("10.0.0.2", "aa:bb:cc:00:00:02"), now=1200) is None  # Too old
+        assert loaded.reusable(host("10.0.0.2", None), now=1050) is None
+
+    def test_reused_hosts_keep_their_probe_time(self, tmp_path):
+        cache = DiscoveryCache(tmp_path / "cache.json")
+        cache.update([host("10.0.0.2", "aa:bb:cc:00:00:02")], probed={"10.0.0.2"}, now=1000)
+        cache.update([host("10.0.0.2", "aa:bb:cc:00:00:02")], probed=set(), now=2000)
+
+        cached = cache.get("aa:bb:cc:00:00:02")
+        assert (cached.probed_at, cached.last_seen) == (1000, 2000)
+
+    def test_corrupt_file_gives_empty_cache(self, tmp_path):
+        path = tmp_path / "discovery_cache.json"
+        path.write_text("{not json")
+
+        assert len(DiscoveryCache.load(path)) == 0
+
+
+class TestIncrementalDiscovery:
+    """Tests for scans that reuse cached enrichment"""
+
+    async def test_only_new_and_moved_hosts_are_probed(self, tmp_path):
+        cache = DiscoveryCache(tmp_path / "cache.json")
+        cache.update([
+            host("10.0.0.1", "aa:bb:cc:00:00:01", "cached-router"),
+            host("10.0.0.99", "02:42:ac:11:00:02", "old-container"),
+        ], probed={"10.0.0.1", "10.0.0.99"})
+        runner = FakeRunner()
+        engine = LanDiscoveryEngine(runner=runner, neighbor_reader=dict)
+
+        records = []
+        with patch.object(LanDiscoveryEngine, "_reverse_dns", no_reverse_dns):
+            result = await run_discovery(
+                tmp_path / "network_map.txt", engine=engine, cache=cache, incremental=True, on_host=records.append
+            )
+
+        snmp_targets = sorted(cmd[-2] for cmd in runner.calls if cmd[0] == "snmpwalk")
+        assert snmp_targets == ["10.0.0.20", "10.0.0.30", "10.0.0.40"]
+        assert result.probed == {"10.0.0.20", "10.0.0.30", "10.0.0.40"}
+        hosts = {h.ip: h for h in result.hosts}
+        assert (hosts["10.0.0.1"].hostname, hosts["10.0.0.1"].role) == ("cached-router", "gateway/router")
+        assert [r["ip"] for r in records if r["cached"]] == ["10.0.0.1"]
+        # The container moved from .99 to .30, so the cache follows its MAC
+        assert cache.get("02:42:ac:11:00:02").ip == "10.0.0.30"
+        assert (tmp_path / "cache.json").exists()
+
+    async def test_full_scan_probes_everything_but_fills_the_cache(self, tmp_path):
+        cache = DiscoveryCache(tmp_path / "cache.json")
+        cache.update([host("10.0.0.1", "aa:bb:cc:00:00:01", "cached-router")], probed={"10.0.0.1"})
+        engine = LanDiscoveryEngine(runner=FakeRunner(), neighbor_reader=dict)
+
+        with patch.object(LanDiscoveryEngine, "_reverse_dns", no_reverse_dns):
+            result = await run_discovery(tmp_path / "network_map.txt", engine=engine, cache=cache)
+
+        assert len(result.probed) == 4
+        assert cache.get("aa:bb:cc:00:00:01").hostname == "routerboard.lan"
+
+
+class TestLayoutDiff:
+    """Tests for diffs between a network map and the saved layout"""
+
+    MAP = (
+        "=== Devices Found ===\n"
+        "10.0.0.1        | router                              | role=gateway/router  | depth=0\n"
+        "10.0.0.2        | nas-renamed                         | role=nas             | depth=2\n"
+        "10.0.0.5        | Unknown                             | role=unknown         | depth=2\n"
+    )
+    LAYOUT = {"root": {
+        "id": "root", "ip": "10.0.0.1", "hostname": "router", "role": "gateway/router",
+        "children": [
+            {"id": "group:servers", "name": "Servers", "role": "group", "children": [
+                {"id": "10.0.0.2", "ip": "10.0.0.2", "hostname": "nas", "role": "nas"},
+                {"id": "10.0.0.7", "ip": "10.0.0.7", "hostname": "gone", "role": "server"},
+            ]},
+        ],
+    }}
+
+    def test_added_removed_changed(self):
+        diff = mapper_runner_service.diff_against_layout(self.MAP, self.LAYOUT)
+
+        assert diff["added"] == [{"ip": "10.0.0.5", "hostname": "Unknown", "role": "unknown"}]
+        assert diff["removed"] == [{"ip": "10.0.0.7", "hostname": "gone", "role": "server"}]
+        assert diff["changed"] == [{
+            "ip": "10.0.0.2", "hostname": "nas-renamed", "role": "nas",
+            "changes": {"hostname": {"old": "nas", "new": "nas-renamed"}},
+        }]
+        assert diff["unchanged"] == 1 and diff["has_saved_layout"] is True
+
+    def test_without_saved_layout_everything_is_added(self):
+        diff = mapper_runner_service.diff_against_layout(self.MAP, None)
+
+        assert len(diff["added"]) == 3 and diff["removed"] == [] and diff["has_saved_layout"] is False
+
+    async def test_incremental_run_returns_diff(self, tmp_path):
+        async def fake_discovery(output, log=lambda line: None, **kwargs):
+            assert kwargs["incremental"] is True
+            assert kwargs["time_budget"] == 300 * mapper_runner_service.DISCOVERY_TIME_SHARE
+            output.write_text(self.MAP)
+
+        (tmp_path / "saved_network_layout.json").write_text(json.dumps(self.LAYOUT))
+        with patch.object(mapper_runner_service, "project_root", return_value=tmp_path), \
+                patch.object(mapper_runner_service, "saved_layout_path",
+                             return_value=tmp_path / "saved_network_layout.json"), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="python"), \
+                patch.object(lan_discovery, "run_discovery", fake_discovery):
+            result = await mapper_runner_service.run_mapper(incremental=True)
+
+        assert [d["ip"] for d in result.diff["added"]] == ["10.0.0.5"]
+        assert result.diff["removed"][0]["ip"] == "10.0.0.7"
+
+    @pytest.mark.parametrize("stored,removed", [
+        (json.dumps(LAYOUT), ["10.0.0.7"]),  # Older rows hold the layout as a JSON string
+        (LAYOUT, ["10.0.0.7"]),
+        (SQLAlchemyError("database is locked"), []),
+    ])
+    async def test_network_scan_diffs_against_its_saved_layout(self, tmp_path, stored, removed):
+        """A network's diff uses Network.layout_data, not the legacy layout file"""
+        async def fake_discovery(output, log=lambda line: None, **kwargs):
+            output.write_text(self.MAP)
+
+        session = AsyncMock()
+        if isinstance(stored, Exception):
+            session.execute.side_effect = stored
+        else:
+            session.execute.return_value = MagicMock(scalar_one_or_none=MagicMock(return_value=stored))
+        session_maker = MagicMock(return_value=MagicMock(
+            __aenter__=AsyncMock(return_value=session), __aexit__=AsyncMock(return_value=False)
+        ))
+        (tmp_path / "saved_network_layout.json").write_text(json.dumps({"root": None}))
+        with patch.object(mapper_runner_service, "project_root", return_value=tmp_path), \
+                patch.object(mapper_runner_service, "saved_layout_path",
+                             return_value=tmp_path / "saved_network_layout.json"), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="python"), \
+                patch.object(mapper_runner_service, "async_session_maker", session_maker), \
+                patch.object(lan_discovery, "run_discovery", fake_discovery):
+            result = await mapper_runner_service.run_mapper(incremental=True, network_id="net-1")
+
+        assert [d["ip"] for d in result.diff["removed"]] == removed
+        assert result.diff["has_saved_layout"] is bool(removed)
+        session.execute.assert_awaited_once()
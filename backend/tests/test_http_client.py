@@ -287,6 +287,26 @@ class TestHTTPClientPool:
         
         await service.close()
     
+    async def test_request_forwards_freshness_headers(self, client_pool):
+        """Age and Cache-Control from upstream should reach the client"""
+        service = client_pool.register_service("test", "http://localhost:8001")
+        await service.initialize()
+        
+        upstream = httpx.Response(
+            200,
+            json={"ip": "10.0.0.1"},
+            headers={"Age": "12", "Cache-Control": "private, max-age=18", "X-Internal": "1"},
+        )
+        service.client.request = AsyncMock(return_value=upstream)
+        
+        response = await client_pool.request("test", "GET", "/check/10.0.0.1")
+        
+        assert response.headers["age"] == "12"
+        assert response.headers["cache-control"] == "private, max-age=18"
+        assert "x-internal" not in response.headers
+        
+        await service.close()
+    
     async def test_request_connect_error_records_failure(self, client_pool):
         """Connection error should record failure and raise 503"""
         service = client_pool.register_service("test", "http://localhost:8001")
@@ -0,0 +1,407 @@
+"""
+Unit tests for the python LAN discovery engine.
+"""
+import asyncio
+import json
+import re
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.services import lan_discovery, mapper_runner_service
+from app.services.lan_discovery import (
+    CommandResult,
+    DiscoveredHost,
+    DiscoveryResult,
+    DiscoveryUnavailable,
+    LanDiscoveryEngine,
+    ScanTarget,
+    classify_role,
+    estimate_depth,
+    render_network_map,
+)
+
+# Parsers used by frontend/src/composables/useNetworkData.ts
+GATEWAY_RE = re.compile(r"Gateway:\s*([0-9.]+)\s*\(([^)]+)\)")
+DEVICE_RE = re.compile(r"^\s*([0-9.]+)\s*\|\s*([^\|]+?)\s*\|\s*role=([a-z\/-]+)\s*\|\s*depth=(\d+)")
+
+IP_ADDR = (
+    "1: lo    inet 127.0.0.1/8 scope host lo\n"
+    "2: docker0    inet 172.17.0.1/16 scope global docker0\n"
+    "3: eth0    inet 192.168.1.5/24 brd 192.168.1.255 scope global eth0\n"
+    "4: vmbr0    inet 10.0.0.5/24 brd 10.0.0.255 scope global vmbr0\n"
+)
+
+SCAN_OUTPUT = {
+    "fping": "10.0.0.1\n10.0.0.20\n10.0.0.30\n",
+    "nmap": "Host: 10.0.0.40 ()\tStatus: Up\nHost: 10.0.0.1 ()\tStatus: Up\n",
+    "arp-scan": (
+        "Interface: vmbr0, type: EN10MB\n"
+        "10.0.0.1\taa:bb:cc:00:00:01\tMikroTik\n"
+        "10.0.0.30\t02:42:AC:11:00:02\t(Unknown)\n"
+    ),
+    "avahi-resolve-address": "10.0.0.20\tsynology-nas.local\n",
+    "nmblookup": "Looking up status of 10.0.0.40\n\tDESKTOP-PC      <00> -         B <ACTIVE>\n",
+    "lldpctl": "Interface: vmbr0\n  SysName: switch\n",
+}
+
+
+class FakeRunner:
+    """Serves canned tool output and records how many commands ran at once"""
+
+    def __init__(self, outputs=SCAN_OUTPUT, missing=()):
+        self.outputs = outputs
+        self.missing = set(missing)
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, cmd, timeout):
+        self.calls.append(cmd)
+        tool = cmd[0]
+        if tool in self.missing:
+            return None
+        if tool == "ip":
+            return CommandResult(0, IP_ADDR if "addr" in cmd else "default via 10.0.0.1 dev vmbr0\n")
+        if tool == "snmpwalk":
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            if cmd[-2] == "10.0.0.1" and cmd[-1] == lan_discovery.SNMP_SYSDESCR_OID:
+                return CommandResult(0, '"RouterOS CCR2004-16G-2S+"\n')
+            if cmd[-2] == "10.0.0.1":
+                return CommandResult(0, 'SNMPv2-MIB::sysName.0 = STRING: "core-router"\n')
+            return CommandResult(1, "", "Timeout")
+        if tool in ("avahi-resolve-address", "nmblookup") and cmd[-1] not in self.outputs[tool]:
+            return CommandResult(1, "")
+        return CommandResult(0, self.outputs.get(tool, ""))
+
+
+async def no_reverse_dns(self, ip):
+    return "routerboard.lan" if ip == "10.0.0.1" else None
+
+
+@pytest.fixture
+def engine():
+    with patch.object(LanDiscoveryEngine, "_reverse_dns", no_reverse_dns):
+        yield LanDiscoveryEngine(runner=FakeRunner(), concurrency=2, neighbor_reader=lambda: {
+            "10.0.0.20": "00:11:32:aa:bb:cc",
+        })
+
+
+class TestClassification:
+    """Tests for the role and depth heuristics ported from lan_mapper.sh"""
+
+    @pytest.mark.parametrize("hostname,mac,role", [
+        ("RouterBoard.lan", None, "gateway/router"),
+        ("tl-sg108e", None, "switch/ap"),
+        ("firewalla-gold", None, "firewall"),
+        ("ugreen-nas", None, "nas"),
+        ("grafana.lan", None, "service"),
+        ("ubuntu-box", None, "server"),
+        ("Jons-iPhone", None, "client"),
+        (None, "02:42:AC:11:00:02", "service"),
+        (None, "aa:bb:cc:dd:ee:ff", "unknown"),
+    ])
+    def test_roles(self, hostname, mac, role):
+        assert classify_role("10.0.0.9", hostname, mac, "10.0.0.1") == role
+
+    def test_gateway_ip_wins_and_sets_depth(self):
+        assert classify_role("10.0.0.1", "desktop", None, "10.0.0.1") == "gateway/router"
+        assert estimate_depth("10.0.0.1", "unknown", "10.0.0.1") == 0
+        assert estimate_depth("10.0.0.2", "firewall", "10.0.0.1") == 1
+        assert estimate_depth("10.0.0.3", "nas", "10.0.0.1") == 2
+
+
+class TestLanDiscoveryEngine:
+    """Tests for concurrent discovery"""
+
+    async def test_prefers_bridge_interface(self, engine):
+        assert await engine.detect_interface() == ("vmbr0", "10.0.0.5/24", "10.0.0.0/24")
+
+    async def test_no_interface_is_unavailable(self):
+        engine = LanDiscoveryEngine(runner=FakeRunner(missing={"ip"}))
+        with pytest.raises(DiscoveryUnavailable):
+            await engine.discover()
+
+    async def test_merges_sweeps_and_enriches_hosts(self, engine):
+        result = await engine.discover()
+        hosts = {host.ip: host for host in result.hosts}
+
+        assert [host.ip for host in result.hosts] == ["10.0.0.1", "10.0.0.20", "10.0.0.30", "10.0.0.40"]
+        assert result.gateway == "10.0.0.1"
+        assert hosts["10.0.0.1"].sources == {"icmp", "nmap", "arp"}
+        assert (hosts["10.0.0.1"].role, hosts["10.0.0.1"].depth) == ("gateway/router", 0)
+        assert hosts["10.0.0.1"].snmp_sysname.endswith('"core-router"')
+        assert (hosts["10.0.0.20"].hostname, hosts["10.0.0.20"].hostname_source) == ("synology-nas.local", "mdns")
+        assert hosts["10.0.0.20"].mac == "00:11:32:aa:bb:cc" and hosts["10.0.0.20"].role == "nas"
+        assert hosts["10.0.0.20"].vendor == "Synology Incorporated"  # From the bundled OUI index
+        assert hosts["10.0.0.30"].mac == "02:42:ac:11:00:02" and hosts["10.0.0.30"].role == "service"
+        assert (hosts["10.0.0.40"].hostname, hosts["10.0.0.40"].role) == ("DESKTOP-PC", "client")
+        assert "SysName: switch" in result.lldp
+
+    async def test_host_records_stream_as_hosts_are_enriched(self, engine, tmp_path):
+        records = []
+        result = await lan_discovery.run_discovery(tmp_path / "network_map.txt", engine=engine, on_host=records.append)
+
+        assert sorted(r["ip"] for r in records) == [h.ip for h in result.hosts]
+        gateway = next(r for r in records if r["ip"] == "10.0.0.1")
+        assert gateway == {
+            "ip": "10.0.0.1", "mac": "aa:bb:cc:00:00:01", "vendor": "MikroTik",
+            "hostname": "routerboard.lan", "hostname_source": "dns", "role": "gateway/router", "depth": 0,
+            "sources": ["arp", "icmp", "nmap"], "snmp_sysname": 'SNMPv2-MIB::sysName.0 = STRING: "core-router"',
+            "snmp_sysdescr": "RouterOS CCR2004-16G-2S+", "cached": False,
+        }
+
+    async def test_enrichment_is_bounded(self, engine):
+        await engine.discover()
+
+        assert engine._run.max_running == 2
+
+    async def test_missing_tools_fall_back_to_ping_sweep(self):
+        runner = FakeRunner(missing={"fping", "nmap", "arp-scan", "lldpctl"})
+        engine = LanDiscoveryEngine(runner=runner, neighbor_reader=dict, subnets=["10.0.0.0/29"])
+        result = await engine.discover()
+
+        assert sum(1 for cmd in runner.calls if cmd[0] == "ping") == 6
+        assert [host.ip for host in result.hosts] == [f"10.0.0.{i}" for i in range(1, 7)]
+        assert result.lldp == ""
+
+
+class TestMultiSubnetSweep:
+    """Tests for parallel, chunked and rate-limited sweeps"""
+
+    async def test_targets_from_interfaces_and_subnets(self):
+        engine = LanDiscoveryEngine(runner=FakeRunner(), interfaces=["all"],
+                                    subnets=["10.0.0.128/25", "172.20.0.0/24"])
+        targets = await engine.detect_targets()
+
+        assert [(t.subnet, t.interface) for t in targets] == [
+            ("192.168.1.0/24", "eth0"), ("10.0.0.0/24", "vmbr0"),
+            ("10.0.0.128/25", "vmbr0"), ("172.20.0.0/24", None),
+        ]
+
+    async def test_invalid_subnet_is_unavailable(self):
+        engine = LanDiscoveryEngine(runner=FakeRunner(), subnets=["10.0.0.0/33"])
+        with pytest.raises(DiscoveryUnavailable):
+            await engine.detect_targets()
+
+    async def test_chunks_report_progress_per_subnet(self):
+        runner = FakeRunner()
+        engine = LanDiscoveryEngine(runner=runner, neighbor_reader=dict, sweep_chunk_size=64,
+                                    packets_per_second=600, subnets=["10.0.0.0/24", "172.20.0.0/25"])
+        progress = []
+        hosts = await engine.sweep(await engine.detect_targets(), lambda line: None, progress.append)
+
+        by_subnet = {}
+        for event in progress:
+            by_subnet.setdefault(event["subnet"], []).append(event["percent"])
+        assert sorted(by_subnet["10.0.0.0/24"]) == [25.0, 50.0, 75.0, 100.0]
+        assert sorted(by_subnet["172.20.0.0/25"]) == [50.0, 100.0]
+        assert sorted(hosts) == ["10.0.0.1", "10.0.0.20", "10.0.0.30", "10.0.0.40"]
+
+        nmap = [cmd for cmd in runner.calls if cmd[0] == "nmap"]
+        arp = [cmd for cmd in runner.calls if cmd[0] == "arp-scan"]
+        assert len(nmap) == 6 and all(cmd[cmd.index("--max-rate") + 1] == "50" for cmd in nmap)
+        # Only the attached subnet gets ARP
+        assert len(arp) == 4 and all(cmd[-1].startswith("10.0.0.") for cmd in arp)
+
+    async def test_oversized_sweep_is_flagged_upfront(self):
+        """A /16 at the default pace can't finish in the default timeout"""
+        engine = LanDiscoveryEngine(runner=FakeRunner(), neighbor_reader=dict, subnets=["10.1.0.0/16"])
+        lines = []
+
+        assert engine.estimate_sweep_seconds([ScanTarget("10.1.0.0/16")]) > 300 * lan_discovery.SWEEP_TIME_SHARE
+        result = await engine.discover(lines.append, time_budget=0.001)
+
+        assert any("takes about 393s" in line and "the map will be partial" in line for line in lines)
+        assert "⚠ Time budget reached: 65536 of 65536 addresses were not swept, the map is partial." in lines
+        assert result.hosts == []
+
+    async def test_sweep_keeps_what_it_found_by_the_deadline(self):
+        """Chunks already running finish; later ones are skipped"""
+        class SlowRunner(FakeRunner):
+            async def __call__(self, cmd, timeout):
+                if cmd[0] in ("fping", "nmap", "arp-scan"):
+                    await asyncio.sleep(0.3)
+                return await super().__call__(cmd, timeout)
+
+        runner = SlowRunner()
+        engine = LanDiscoveryEngine(runner=runner, neighbor_reader=dict, sweep_parallel=1)
+        targets = [ScanTarget("10.0.0.0/23", "vmbr0")]
+        lines = []
+
+        hosts = await engine.sweep(targets, lines.append, deadline=time.monotonic() + 0.1)
+
+        assert sorted(hosts) == ["10.0.0.1", "10.0.0.20", "10.0.0.30", "10.0.0.40"]
+        assert sum(1 for cmd in runner.calls if cmd[0] == "nmap") == 1
+        assert "⚠ Time budget reached: 256 of 512 addresses were not swept, the map is partial." in lines
+
+    async def test_lookups_stop_at_the_deadline(self, engine):
+        hosts = [DiscoveredHost(ip="10.0.0.1"), DiscoveredHost(ip="10.0.0.30", mac="02:42:ac:11:00:02")]
+        lines, records = [], []
+
+        unprobed = await engine.enrich(hosts, "10.0.0.1", lines.append, lambda host, cached: records.append(host.ip),
+                                       deadline=time.monotonic())
+
+        assert unprobed == hosts and sorted(records) == ["10.0.0.1", "10.0.0.30"]
+        assert [host.role for host in hosts] == ["gateway/router", "service"]
+        assert hosts[0].snmp_sysname is None
+        assert lines[-1] == "⚠ Time budget reached: 2 hosts mapped without hostname or SNMP lookups."
+
+    async def test_rate_limiter_paces_after_burst(self):
+        limiter = lan_discovery.RateLimiter(100)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(110):
+            await limiter.acquire()
+
+        assert loop.time() - start >= 0.08
+
+
+class TestRunCommand:
+    """Tests for running discovery tools"""
+
+    async def test_own_timeout_kills_the_tool(self):
+        result = await lan_discovery.run_command([sys.executable, "-c", "import time; time.sleep(30)"], 0.2)
+
+        assert result.returncode == -1
+        assert "timed out" in result.stderr
+
+    async def test_cancellation_kills_the_tool(self):
+        """An outer deadline cancelling the call must not leave the tool running"""
+        spawned = []
+        create = asyncio.create_subprocess_exec
+
+        async def spy(*args, **kwargs):
+            proc = await create(*args, **kwargs)
+            spawned.append(proc)
+            return proc
+
+        with patch("asyncio.create_subprocess_exec", spy):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    lan_discovery.run_command([sys.executable, "-c", "import time; time.sleep(30)"], 30), 0.2
+                )
+
+        assert spawned[0].returncode is not None
+
+
+class TestRenderNetworkMap:
+    """Tests for network_map.txt output"""
+
+    def test_format_matches_script_and_frontend_parser(self):
+        result = DiscoveryResult(
+            interface="vmbr0", host_cidr="10.0.0.5/24", subnet="10.0.0.0/24", gateway="10.0.0.1",
+            hosts=[
+                DiscoveredHost(ip="10.0.0.1", hostname="router", role="gateway/router", depth=0,
+                               snmp_sysname="SNMPv2-MIB::sysName.0 = STRING: router"),
+                DiscoveredHost(ip="10.0.0.2", hostname="tl-sg108e", role="switch/ap", depth=1),
+                DiscoveredHost(ip="10.0.0.30", role="unknown"),
+            ],
+            lldp="LLDP raw\n",
+        )
+
+        text = render_network_map(result)
+        lines = text.splitlines()
+
+        assert lines[0] == "### LAN NETWORK MAP"
+        assert GATEWAY_RE.search(text).groups() == ("10.0.0.1", "router")
+        devices = lines[lines.index("=== Devices Found ===") + 1:lines.index("=== LLDP Topology (raw) ===") - 1]
+        assert [DEVICE_RE.match(line).groups() for line in devices] == [
+            ("10.0.0.1", "router", "gateway/router", "0"),
+            ("10.0.0.2", "tl-sg108e", "switch/ap", "1"),
+            ("10.0.0.30", "Unknown", "unknown", "2"),
+        ]
+        assert devices[0] == f"{'10.0.0.1':<15} | {'router':<35} | role={'gateway/router':<15} | depth=0"
+        assert "SNMPv2-MIB::sysName.0 = STRING: router" in lines
+        assert "  - 10.0.0.1 (router) [gateway/router]" in lines
+        assert f"  - {'10.0.0.2':<15} (tl-sg108e) [switch/ap]" in lines
+        assert f"  - {'10.0.0.30':<15} (Unknown) [unknown]" in lines
+
+
+class TestMapperEngineSelection:
+    """Tests for running the engine from the mapper service with the script as fallback"""
+
+    @pytest.fixture
+    def project(self, tmp_path):
+        script = tmp_path / "lan_mapper.sh"
+        script.write_text("#!/bin/bash\necho 'from script' > network_map.txt\necho 'script ran'")
+        script.chmod(0o755)
+        with patch.object(mapper_runner_service, "project_root", return_value=tmp_path), \
+                patch.object(mapper_runner_service, "script_path", return_value=script), \
+                patch.object(mapper_runner_service, "network_map_candidates",
+                             return_value=[tmp_path / "network_map.txt"]):
+            yield tmp_path
+
+    def _engine(self, mode):
+        return patch.object(mapper_runner_service, "mapper_engine", return_value=mode)
+
+    async def _fake_discovery(self, output, log=lambda line: None, **kwargs):
+        log("scanning")
+        output.write_text("### LAN NETWORK MAP\n")
+
+    async def _unavailable(self, output, log=lambda line: None, **kwargs):
+        raise DiscoveryUnavailable("No valid LAN interface found")
+
+    async def test_python_engine_writes_the_map(self, project):
+        lines = []
+        with self._engine("auto"), patch.object(lan_discovery, "run_discovery", self._fake_discovery):
+            result = await mapper_runner_service.run_mapper(log=lines.append)
+
+        assert (result.engine, result.content) == ("python", "### LAN NETWORK MAP\n")
+        assert lines == ["scanning"]
+
+    async def test_auto_falls_back_to_script(self, project):
+        lines = []
+        with self._engine("auto"), patch.object(lan_discovery, "run_discovery", self._unavailable):
+            result = await mapper_runner_service.run_mapper(log=lines.append)
+
+        assert result.engine == "script" and "from script" in result.content
+        assert "running lan_mapper.sh" in lines[0] and lines[-1] == "script ran"
+
+    async def test_script_maps_produce_host_records(self, project):
+        (project / "lan_mapper.sh").write_text(
+            "#!/bin/bash\n"
+            "echo '10.0.0.1        | router                              | role=gateway/router  | depth=0' > network_map.txt\n"
+            "echo '10.0.0.9        | Unknown                             | role=unknown         | depth=2' >> network_map.txt\n"
+        )
+        records = []
+        with self._engine("script"):
+            await mapper_runner_service.run_mapper(on_host=records.append)
+
+        assert [(r["ip"], r["hostname"], r["role"], r["depth"]) for r in records] == [
+            ("10.0.0.1", "router", "gateway/router", 0),
+            ("10.0.0.9", None, "unknown", 2),
+        ]
+
+    async def test_fallback_after_host_records_resets_them(self, project):
+        """Records the engine sent before failing are discarded before the script's arrive"""
+        (project / "lan_mapper.sh").write_text(
+            "#!/bin/bash\n"
+            "echo '10.0.0.1        | router                              | role=gateway/router  | depth=0' > network_map.txt\n"
+        )
+
+        async def partial(output, log=lambda line: None, on_host=None, **kwargs):
+            on_host({"ip": "10.0.0.1", "role": "gateway/router"})
+            raise DiscoveryUnavailable("Lost the interface")
+
+        events = []
+        with self._engine("auto"), patch.object(lan_discovery, "run_discovery", partial):
+            await mapper_runner_service.run_mapper(
+                on_host=lambda record: events.append(record["ip"]), on_reset=lambda: events.append("reset")
+            )
+        with self._engine("auto"), patch.object(lan_discovery, "run_discovery", self._unavailable):
+            await mapper_runner_service.run_mapper(
+                on_host=lambda record: events.append(record["ip"]), on_reset=lambda: events.append("reset")
+            )
+
+        assert events == ["10.0.0.1", "reset", "10.0.0.1", "10.0.0.1"]
+
+    async def test_python_only_engine_does_not_fall_back(self, project):
+        with self._engine("python"), patch.object(lan_discovery, "run_discovery", self._unavailable):
+            with pytest.raises(RuntimeError, match="No valid LAN interface"):
+                await mapper_runner_service.run_mapper()
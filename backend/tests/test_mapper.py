@@ -391,6 +391,38 @@ class TestEmbedHealthEndpoints:
             call_kwargs = mock_client.post.call_args
             assert call_kwargs[1]["json"] == {"ips": ["192.168.1.1"]}
     
+    async def test_get_cached_metrics_merges_deltas(self):
+        """Should fetch deltas after the first call and merge them into the mirror"""
+        from app.services import health_proxy_service
+        
+        full = MagicMock()
+        full.json.return_value = {
+            "cursor": "abc:2",
+            "full": True,
+            "devices": {"192.168.1.1": {"status": "healthy"}, "192.168.1.2": {"status": "healthy"}},
+            "removed": [],
+        }
+        delta = MagicMock()
+        delta.json.return_value = {
+            "cursor": "abc:3",
+            "full": False,
+            "devices": {"192.168.1.1": {"status": "unhealthy"}},
+            "removed": ["192.168.1.2"],
+        }
+        
+        with patch.object(health_proxy_service, '_cached_metrics', {}), \
+             patch.object(health_proxy_service, '_cached_metrics_cursor', None), \
+             patch.object(health_proxy_service, 'health_service_request', new_callable=AsyncMock) as mock_request:
+            mock_request.side_effect = [full, delta]
+            
+            first = await health_proxy_service.get_cached_metrics()
+            second = await health_proxy_service.get_cached_metrics()
+        
+        assert set(first) == {"192.168.1.1", "192.168.1.2"}
+        assert second == {"192.168.1.1": {"status": "unhealthy"}}
+        assert mock_request.call_args_list[0][1]["params"] == {"since": "0", "history": "downsampled"}
+        assert mock_request.call_args_list[1][1]["params"] == {"since": "abc:2", "history": "downsampled"}
+    
     async def test_health_service_request_unsupported_method(self):
         """Should raise ValueError for unsupported HTTP method"""
         from app.services.health_proxy_service import health_service_request
@@ -86,7 +86,7 @@ def sample_layout():
 class TestRunMapperEndpoint:
     """Tests for /run-mapper endpoint"""
     
-    def test_run_mapper_script_not_found(self, readwrite_user):
+    async def test_run_mapper_script_not_found(self, readwrite_user):
         """Should return 404 if script doesn't exist"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -95,12 +95,12 @@ class TestRunMapperEndpoint:
             mock_path.return_value = Path("/nonexistent/lan_mapper.sh")
             
             with pytest.raises(Exception) as exc_info:
-                run_mapper(user=readwrite_user)
+                await run_mapper(user=readwrite_user)
             
             assert "404" in str(exc_info.value.status_code) or "not found" in str(exc_info.value.detail).lower()
     
     @skip_on_windows
-    def test_run_mapper_executes_script(self, temp_project_root, readwrite_user):
+    async def test_run_mapper_executes_script(self, temp_project_root, readwrite_user):
         """Should execute script and return results"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -108,22 +108,22 @@ class TestRunMapperEndpoint:
         with patch.object(mapper_runner_service, 'project_root', return_value=temp_project_root):
             with patch.object(mapper_runner_service, 'script_path', return_value=temp_project_root / "lan_mapper.sh"):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[temp_project_root / "network_map.txt"]):
-                    response = run_mapper(user=readwrite_user)
+                    response = await run_mapper(user=readwrite_user)
                     
                     assert response.content is not None
                     assert response.script_exit_code == 0
     
-    def test_run_mapper_timeout(self, temp_project_root, readwrite_user):
+    async def test_run_mapper_timeout(self, temp_project_root, readwrite_user):
         """Should handle script timeout"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
-        import subprocess
         
         with patch.object(mapper_runner_service, 'project_root', return_value=temp_project_root):
             with patch.object(mapper_runner_service, 'script_path', return_value=temp_project_root / "lan_mapper.sh"):
-                with patch('subprocess.run', side_effect=subprocess.TimeoutExpired("script", 300)):
+                with patch.object(mapper_runner_service, '_run_script',
+                                  AsyncMock(side_effect=TimeoutError("lan_mapper.sh timed out after 300s"))):
                     with pytest.raises(Exception) as exc_info:
-                        run_mapper(user=readwrite_user)
+                        await run_mapper(user=readwrite_user)
                     
                     assert "504" in str(exc_info.value.status_code) or "timeout" in str(exc_info.value.detail).lower()
 
@@ -131,7 +131,7 @@ class TestRunMapperEndpoint:
 class TestRunMapperStreamEndpoint:
     """Tests for /run-mapper/stream endpoint"""
     
-    def test_run_mapper_stream_script_not_found(self, readwrite_user):
+    async def test_run_mapper_stream_script_not_found(self, readwrite_user):
         """Should return 404 if script doesn't exist"""
         from app.routers.mapper import run_mapper_stream
         from app.services import mapper_runner_service
@@ -140,7 +140,7 @@ class TestRunMapperStreamEndpoint:
             mock_path.return_value = Path("/nonexistent/lan_mapper.sh")
             
             with pytest.raises(Exception) as exc_info:
-                run_mapper_stream(user=readwrite_user)
+                await run_mapper_stream(user=readwrite_user)
             
             assert "404" in str(exc_info.value.status_code) or "not found" in str(exc_info.value.detail).lower()
 
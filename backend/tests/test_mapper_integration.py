@@ -41,7 +41,7 @@ class TestMapperScriptExecution:
     """Tests for run_mapper script execution"""
     
     @skip_on_windows
-    def test_run_mapper_with_executable_script(self, tmp_path, readwrite_user):
+    async def test_run_mapper_with_executable_script(self, tmp_path, readwrite_user):
         """Should run executable script directly"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -57,13 +57,13 @@ class TestMapperScriptExecution:
         with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
             with patch.object(mapper_runner_service, 'script_path', return_value=script):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[network_map]):
-                    result = run_mapper(user=readwrite_user)
+                    result = await run_mapper(user=readwrite_user)
                     
                     assert result.content is not None
                     assert "Router" in result.content
     
     @skip_on_windows
-    def test_run_mapper_with_non_executable_script(self, tmp_path, readwrite_user):
+    async def test_run_mapper_with_non_executable_script(self, tmp_path, readwrite_user):
         """Should run non-executable script with bash"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -79,12 +79,12 @@ class TestMapperScriptExecution:
         with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
             with patch.object(mapper_runner_service, 'script_path', return_value=script):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[network_map]):
-                    result = run_mapper(user=readwrite_user)
+                    result = await run_mapper(user=readwrite_user)
                     
                     assert result.content is not None
     
     @skip_on_windows
-    def test_run_mapper_fallback_to_stdout(self, tmp_path, readwrite_user):
+    async def test_run_mapper_fallback_to_stdout(self, tmp_path, readwrite_user):
         """Should fallback to stdout if no file produced"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -97,12 +97,12 @@ class TestMapperScriptExecution:
             with patch.object(mapper_runner_service, 'script_path', return_value=script):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[tmp_path / "nonexistent.txt"]):
                     # When file doesn't exist, it uses stdout
-                    result = run_mapper(user=readwrite_user)
+                    result = await run_mapper(user=readwrite_user)
                     
                     # Should have content from stdout
                     assert result.content == "stdout content"
     
-    def test_run_mapper_no_content_error(self, tmp_path, readwrite_user):
+    async def test_run_mapper_no_content_error(self, tmp_path, readwrite_user):
         """Should raise error if no content produced"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -115,11 +115,11 @@ class TestMapperScriptExecution:
             with patch.object(mapper_runner_service, 'script_path', return_value=script):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[tmp_path / "nonexistent.txt"]):
                     with pytest.raises(HTTPException) as exc_info:
-                        run_mapper(user=readwrite_user)
+                        await run_mapper(user=readwrite_user)
                     
                     assert exc_info.value.status_code == 500
     
-    def test_run_mapper_subprocess_exception(self, tmp_path, readwrite_user):
+    async def test_run_mapper_subprocess_exception(self, tmp_path, readwrite_user):
         """Should handle subprocess exceptions"""
         from app.routers.mapper import run_mapper
         from app.services import mapper_runner_service
@@ -130,9 +130,9 @@ class TestMapperScriptExecution:
         
         with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
             with patch.object(mapper_runner_service, 'script_path', return_value=script):
-                with patch('subprocess.run', side_effect=OSError("Execution failed")):
+                with patch('asyncio.create_subprocess_exec', side_effect=OSError("Execution failed")):
                     with pytest.raises(HTTPException) as exc_info:
-                        run_mapper(user=readwrite_user)
+                        await run_mapper(user=readwrite_user)
                     
                     assert exc_info.value.status_code == 500
 
@@ -140,18 +140,18 @@ class TestMapperScriptExecution:
 class TestRunMapperStream:
     """Tests for streaming mapper endpoint"""
     
-    def test_run_mapper_stream_script_not_found(self, readwrite_user):
+    async def test_run_mapper_stream_script_not_found(self, readwrite_user):
         """Should return 404 if script not found"""
         from app.routers.mapper import run_mapper_stream
         from app.services import mapper_runner_service
         
         with patch.object(mapper_runner_service, 'script_path', return_value=Path("/nonexistent/script.sh")):
             with pytest.raises(HTTPException) as exc_info:
-                run_mapper_stream(user=readwrite_user)
+                await run_mapper_stream(user=readwrite_user)
             
             assert exc_info.value.status_code == 404
     
-    def test_run_mapper_stream_generator(self, tmp_path, readwrite_user):
+    async def test_run_mapper_stream_generator(self, tmp_path, readwrite_user):
         """Should return StreamingResponse"""
         from app.routers.mapper import run_mapper_stream
         from app.services import mapper_runner_service
@@ -164,9 +164,12 @@ class TestRunMapperStream:
         with patch.object(mapper_runner_service, 'script_path', return_value=script):
             with patch.object(mapper_runner_service, 'project_root', return_value=tmp_path):
                 with patch.object(mapper_runner_service, 'network_map_candidates', return_value=[tmp_path / "map.txt"]):
-                    response = run_mapper_stream(user=readwrite_user)
+                    response = await run_mapper_stream(user=readwrite_user)
+                    events = [chunk async for chunk in response.body_iterator]
                     
                     assert isinstance(response, StreamingResponse)
+                    assert "event: log\ndata: line1\n\n" in events
+                    assert events[-1] == "event: done\ndata: exit=0\n\n"
 
 
 class TestEmbedDataEndpoint:
@@ -0,0 +1,219 @@
+"""
+Unit tests for the mapper job manager.
+"""
+import asyncio
+import json
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from app.dependencies.auth import AuthenticatedUser, UserRole
+from app.routers.mapper import get_mapper_job, list_mapper_jobs, run_mapper, run_mapper_stream
+from app.services import mapper_runner_service
+from app.services.mapper_jobs import DEFAULT_NETWORK, MapperJobManager
+from app.services.mapper_runner_service import MapperResult, sse_event
+
+skip_on_windows = pytest.mark.skipif(sys.platform == 'win32', reason="Bash scripts cannot run on Windows")
+
+
+@pytest.fixture
+def readwrite_user():
+    return AuthenticatedUser(user_id="rw-123", username="admin", role=UserRole.ADMIN)
+
+
+@pytest.fixture
+def manager():
+    manager = MapperJobManager()
+    with patch("app.routers.mapper.mapper_jobs", manager):
+        yield manager
+
+
+def gated_mapper():
+    """run_mapper stand-in that logs a line, then waits for the test to release it"""
+    release = asyncio.Event()
+
+    async def fake_run_mapper(log, timeout, incremental, on_host, on_progress, network_id, on_reset):
+        log("scanning")
+        on_progress({"subnet": "10.0.0.0/24", "percent": 100.0})
+        await release.wait()
+        on_host({"ip": "10.0.0.1", "role": "gateway/router"})
+        return MapperResult(content="map", exit_code=0, map_path="/tmp/network_map.txt", engine="python")
+
+    return AsyncMock(side_effect=fake_run_mapper), release
+
+
+class TestMapperJobManager:
+    """Tests for single-flight jobs and re-attachable streams"""
+
+    async def test_one_job_at_a_time(self, manager):
+        """Every scan writes the same map and cache, so other networks join the running job"""
+        fake, release = gated_mapper()
+        with patch.object(mapper_runner_service, "run_mapper", fake):
+            first, created = manager.start("net-a")
+            joined, joined_created = manager.start("net-a")
+            other, other_created = manager.start("net-b")
+            release.set()
+            await manager.wait(first)
+            after, after_created = manager.start("net-b")
+            after.task.cancel()
+
+        assert created is True and joined_created is False and joined is first
+        assert other is first and other_created is False and first.network_id == "net-a"
+        assert fake.await_count == 1
+        assert first.status == "completed"
+        assert after_created is True and after.network_id == "net-b" and manager.running() is after
+
+    async def test_late_attach_replays_buffered_output(self, manager):
+        fake, release = gated_mapper()
+        with patch.object(mapper_runner_service, "run_mapper", fake):
+            job, _ = manager.start()
+            await asyncio.sleep(0)
+            early = manager.stream(job)
+            first_two = [await early.__anext__(), await early.__anext__()]
+            release.set()
+            rest = [event async for event in early]
+            late = [event async for event in manager.stream(job)]
+
+        assert first_two[0].startswith("event: job") and first_two[1] == sse_event("log", "scanning")
+        assert rest[0] == sse_event("progress", '{"subnet": "10.0.0.0/24", "percent": 100.0}')
+        assert rest[1] == sse_event("host", '{"ip": "10.0.0.1", "role": "gateway/router"}')
+        assert rest[-1] == sse_event("done", "exit=0")
+        assert late == first_two + rest
+
+    async def test_failures_are_reported_and_release_the_network(self, manager):
+        failing = AsyncMock(side_effect=FileNotFoundError("lan_mapper.sh not found"))
+        with patch.object(mapper_runner_service, "run_mapper", failing):
+            job, _ = manager.start()
+            await manager.wait(job)
+
+        assert job.status == "failed" and isinstance(job.error, FileNotFoundError)
+        assert job.events[-1] == ("done", "exit=-1")
+        assert manager.running() is None
+
+    @skip_on_windows
+    async def test_stdout_and_stderr_are_read_concurrently(self, tmp_path):
+        """A script that fills the stderr pipe before writing stdout must not stall"""
+        script = tmp_path / "lan_mapper.sh"
+        script.write_text("#!/bin/bash\nseq 1 30000 >&2\necho 'mapped' > network_map.txt\necho done\n")
+        script.chmod(0o755)
+        lines = []
+
+        with patch.object(mapper_runner_service, "project_root", return_value=tmp_path), \
+                patch.object(mapper_runner_service, "script_path", return_value=script), \
+                patch.object(mapper_runner_service, "network_map_candidates",
+                             return_value=[tmp_path / "network_map.txt"]), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="script"):
+            result = await asyncio.wait_for(mapper_runner_service.run_mapper(log=lines.append), 10)
+
+        assert result.content == "mapped\n"
+        assert lines.count("done") == 1 and len(lines) == 30001
+        assert "STDERR: 30000" in lines
+
+
+class TestMapperJobEndpoints:
+    """Tests for job-aware mapper endpoints"""
+
+    async def test_recent_result_is_reused(self, manager, readwrite_user):
+        fake, release = gated_mapper()
+        release.set()
+        with patch.object(mapper_runner_service, "run_mapper", fake):
+            first = await run_mapper(user=readwrite_user)
+            cached = await run_mapper(user=readwrite_user, max_age_seconds=60)
+            fresh = await run_mapper(user=readwrite_user)
+
+        assert cached.job_id == first.job_id and cached.content == "map"
+        assert fake.call_args.kwargs["network_id"] is None  # Legacy flow diffs against the layout file
+        assert fresh.job_id != first.job_id
+        assert fake.await_count == 2
+
+    async def test_stream_reattaches_by_job_id(self, manager, readwrite_user):
+        fake, release = gated_mapper()
+        with patch.object(mapper_runner_service, "run_mapper", fake), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="python"):
+            response = await run_mapper_stream(user=readwrite_user)
+            job_id = response.headers["x-mapper-job-id"]
+            reattached = await run_mapper_stream(user=readwrite_user, job_id=job_id)
+            release.set()
+            events = [event async for event in reattached.body_iterator]
+            await manager.wait(manager.get(job_id))
+
+        assert events[1] == sse_event("log", "scanning") and events[-1] == sse_event("done", "exit=0")
+        assert fake.await_count == 1
+        status = await get_mapper_job(job_id, user=readwrite_user, db=None)
+        assert b'"status":"completed"' in status.body
+
+    async def test_ndjson_stream(self, manager, readwrite_user):
+        fake, release = gated_mapper()
+        release.set()
+        with patch.object(mapper_runner_service, "run_mapper", fake), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="python"):
+            response = await run_mapper_stream(user=readwrite_user, format="ndjson")
+            records = [json.loads(line) async for line in response.body_iterator]
+
+        assert response.media_type == "application/x-ndjson"
+        assert [r["type"] for r in records] == ["job", "log", "progress", "host", "result", "done"]
+        assert records[3]["data"] == {"ip": "10.0.0.1", "role": "gateway/router"}
+        assert records[4]["data"]["content"] == "map"
+
+    async def test_unknown_job_is_404(self, manager, readwrite_user):
+        with pytest.raises(HTTPException) as exc_info:
+            await run_mapper_stream(user=readwrite_user, job_id="missing")
+
+        assert exc_info.value.status_code == 404
+
+    async def test_network_access_is_checked_before_scanning(self, manager, readwrite_user):
+        denied = AsyncMock(side_effect=HTTPException(status_code=404, detail="Network not found"))
+        fake, release = gated_mapper()
+        with patch.object(mapper_runner_service, "run_mapper", fake), \
+                patch("app.routers.mapper.get_network_with_access", denied):
+            with pytest.raises(HTTPException) as exc_info:
+                await run_mapper(user=readwrite_user, network_id="someone-elses", db=None)
+
+        assert exc_info.value.status_code == 404
+        assert denied.call_args.kwargs["require_write"] is True
+        assert manager.running() is None and fake.await_count == 0
+
+    async def test_joining_another_networks_scan_needs_access_to_it(self, manager, readwrite_user):
+        fake, release = gated_mapper()
+        access = AsyncMock(return_value=(None, True, None))
+        with patch.object(mapper_runner_service, "run_mapper", fake), \
+                patch.object(mapper_runner_service, "mapper_engine", return_value="python"), \
+                patch("app.routers.mapper.get_network_with_access", access):
+            response = await run_mapper_stream(user=readwrite_user, network_id="net-a", db=None)
+            joined = await run_mapper_stream(user=readwrite_user, network_id="net-b", db=None)
+            access.side_effect = [None, HTTPException(status_code=404, detail="Network not found")]
+            with pytest.raises(HTTPException) as exc_info:
+                await run_mapper_stream(user=readwrite_user, network_id="net-c", db=None)
+            release.set()
+            await manager.wait(manager.get(response.headers["x-mapper-job-id"]))
+
+        assert joined.headers["x-mapper-job-id"] == response.headers["x-mapper-job-id"]
+        assert exc_info.value.status_code == 409
+        assert [c.args[0] for c in access.call_args_list] == ["net-a", "net-b", "net-a", "net-c", "net-a"]
+        assert fake.await_count == 1
+        assert fake.call_args.kwargs["network_id"] == "net-a"  # Diffed against the job's network
+
+    async def test_job_list_only_shows_accessible_networks(self, manager, readwrite_user):
+        fake, release = gated_mapper()
+        release.set()
+        with patch.object(mapper_runner_service, "run_mapper", fake):
+            for network_id in (None, "net-a", "net-b", "net-a"):
+                job, _ = manager.start(network_id)
+                await manager.wait(job)
+
+        def check(network_id, user_id, db, **kwargs):
+            if network_id == "net-b":
+                raise HTTPException(status_code=404, detail="Network not found")
+            return (None, True, None)
+
+        access = AsyncMock(side_effect=check)
+        with patch("app.routers.mapper.get_network_with_access", access):
+            response = await list_mapper_jobs(user=readwrite_user, db=None)
+
+        networks = [job["network_id"] for job in json.loads(response.body)["jobs"]]
+        assert sorted(networks) == sorted([DEFAULT_NETWORK, "net-a", "net-a"])
+        # One lookup per network, none for the default map
+        assert sorted(c.args[0] for c in access.call_args_list) == ["net-a", "net-b"]
+        assert all(c.kwargs["require_write"] is False for c in access.call_args_list)
@@ -71,6 +71,9 @@ class TestHealthProxyRouter:
             ip="192.168.1.1",
             include_ports=True,
             include_dns=False,
+            history="none",
+            bucket="5m",
+            max_age_seconds=None,
             user=owner_user
         )
         
@@ -92,7 +95,7 @@ class TestHealthProxyRouter:
         """get_cached should forward IP parameter"""
         from app.routers.health_proxy import get_cached
         
-        await get_cached(ip="192.168.1.1", user=owner_user)
+        await get_cached(ip="192.168.1.1", history="full", bucket="5m", user=owner_user)
         
         call_kwargs = mock_http_pool.request.call_args[1]
         assert "/cached/192.168.1.1" in call_kwargs["path"]
@@ -101,11 +104,47 @@ class TestHealthProxyRouter:
         """get_all_cached should request all cached metrics"""
         from app.routers.health_proxy import get_all_cached
         
-        await get_all_cached(user=owner_user)
+        await get_all_cached(history="full", bucket="5m", since=None, user=owner_user)
         
         call_kwargs = mock_http_pool.request.call_args[1]
         assert call_kwargs["path"].endswith("/cached")
     
+    async def test_get_all_cached_forwards_history(self, mock_http_pool, owner_user):
+        """get_all_cached should forward the history projection"""
+        from app.routers.health_proxy import get_all_cached
+        
+        await get_all_cached(history="downsampled", bucket="1h", since=None, user=owner_user)
+
+        call_kwargs = mock_http_pool.request.call_args[1]
+        assert call_kwargs["params"] == {"history": "downsampled", "bucket": "1h"}
+
+    async def test_get_all_cached_forwards_cursor(self, mock_http_pool, owner_user):
+        """get_all_cached should forward the delta cursor"""
+        from app.routers.health_proxy import get_all_cached
+
+        await get_all_cached(history="none", bucket="5m", since="abc:12", user=owner_user)
+
+        call_kwargs = mock_http_pool.request.call_args[1]
+        assert call_kwargs["params"] == {"history": "none", "bucket": "5m", "since": "abc:12"}
+
+    async def test_stream_changes_resumes_from_last_event_id(self, owner_user):
+        """stream_changes should proxy the SSE stream and forward the resume cursor"""
+        from app.routers.health_proxy import stream_changes
+        from fastapi.responses import StreamingResponse
+
+        mock_request = MagicMock()
+        mock_request.headers = {"last-event-id": "abc:42"}
+
+        with patch('app.routers.health_proxy.proxy_streaming_request', new_callable=AsyncMock) as mock_stream:
+            mock_stream.return_value = StreamingResponse(iter(()), media_type="text/event-stream")
+
+            response = await stream_changes(request=mock_request, since=None, user=owner_user)
+
+            assert isinstance(response, StreamingResponse)
+            call_kwargs = mock_stream.call_args[1]
+            assert call_kwargs["method"] == "GET"
+            assert call_kwargs["url"].endswith("/api/health/changes?since=abc%3A42")
+
     async def test_clear_cache_requires_write(self, mock_http_pool, readwrite_user):
         """clear_cache should work with write access"""
         from app.routers.health_proxy import clear_cache
@@ -128,11 +167,20 @@ class TestHealthProxyRouter:
         """scan_ports should forward IP"""
         from app.routers.health_proxy import scan_ports
         
-        await scan_ports(ip="192.168.1.1", user=owner_user)
+        await scan_ports(ip="192.168.1.1", ports=None, refresh=False, user=owner_user)
         
         call_kwargs = mock_http_pool.request.call_args[1]
         assert "/ports/192.168.1.1" in call_kwargs["path"]
     
+    async def test_scan_ports_forwards_port_set(self, mock_http_pool, owner_user):
+        """scan_ports should forward the port set and refresh flag"""
+        from app.routers.health_proxy import scan_ports
+        
+        await scan_ports(ip="192.168.1.1", ports="top100", refresh=True, user=owner_user)
+        
+        call_kwargs = mock_http_pool.request.call_args[1]
+        assert call_kwargs["params"] == {"refresh": True, "ports": "top100"}
+    
     async def test_check_dns(self, mock_http_pool, owner_user):
         """check_dns should forward IP"""
         from app.routers.health_proxy import check_dns
@@ -173,6 +221,21 @@ class TestHealthProxyRouter:
         call_kwargs = mock_http_pool.request.call_args[1]
         assert call_kwargs["method"] == "DELETE"
     
+    async def test_update_network_devices_forwards_method(self, mock_http_pool, readwrite_user):
+        """update_network_devices should forward the request method and body for the network"""
+        from app.routers.health_proxy import update_network_devices
+        
+        mock_request = MagicMock()
+        mock_request.method = "PATCH"
+        mock_request.json = AsyncMock(return_value={"add": ["192.168.1.5"], "remove": []})
+        
+        await update_network_devices(network_id="net-1", request=mock_request, user=readwrite_user)
+        
+        call_kwargs = mock_http_pool.request.call_args[1]
+        assert call_kwargs["method"] == "PATCH"
+        assert call_kwargs["path"].endswith("/monitoring/networks/net-1/devices")
+        assert call_kwargs["json_body"] == {"add": ["192.168.1.5"], "remove": []}
+    
     async def test_get_monitoring_config(self, mock_http_pool, owner_user):
         """get_monitoring_config should work"""
         from app.routers.health_proxy import get_monitoring_config
@@ -323,7 +386,47 @@ class TestHealthProxyRouter:
         call_kwargs = mock_http_pool.request.call_args[1]
         assert call_kwargs["method"] == "POST"
         assert call_kwargs["timeout"] == 120.0
+    
+    async def test_start_speed_test_job(self, mock_http_pool, readwrite_user):
+        """start_speed_test_job should POST the gateway to the job queue"""
+        from app.routers.health_proxy import start_speed_test_job
+        
+        await start_speed_test_job(gateway_ip="192.168.1.1", user=readwrite_user)
+        
+        call_kwargs = mock_http_pool.request.call_args[1]
+        assert call_kwargs["method"] == "POST"
+        assert call_kwargs["path"].endswith("/speedtest/jobs")
+        assert call_kwargs["json_body"] == {"gateway_ip": "192.168.1.1"}
+    
+    async def test_stream_speed_test_job(self, owner_user):
+        """stream_speed_test_job should proxy the job's SSE stream"""
+        from app.routers.health_proxy import stream_speed_test_job
+        from fastapi.responses import StreamingResponse
+        
+        with patch('app.routers.health_proxy.proxy_streaming_request', new_callable=AsyncMock) as mock_stream:
+            mock_stream.return_value = StreamingResponse(iter(()), media_type="text/event-stream")
+            
+            await stream_speed_test_job(job_id="abc123", user=owner_user)
+            
+            assert mock_stream.call_args[1]["url"].endswith("/api/health/speedtest/jobs/abc123/events")
 
+    
+    async def test_stream_batch_check(self, owner_user):
+        """stream_batch_check should proxy the NDJSON stream with the request body"""
+        from app.routers.health_proxy import stream_batch_check
+        from fastapi.responses import StreamingResponse
+        
+        mock_request = MagicMock()
+        mock_request.json = AsyncMock(return_value={"ips": ["192.168.1.1"]})
+        with patch('app.routers.health_proxy.proxy_streaming_request', new_callable=AsyncMock) as mock_stream:
+            mock_stream.return_value = StreamingResponse(iter(()), media_type="application/x-ndjson")
+            
+            await stream_batch_check(request=mock_request, format="ndjson", user=owner_user)
+            
+            call_kwargs = mock_stream.call_args[1]
+            assert call_kwargs["url"].endswith("/api/health/check/stream?format=ndjson")
+            assert call_kwargs["json_body"] == {"ips": ["192.168.1.1"]}
+            assert call_kwargs["media_type"] == "application/x-ndjson"
 
 # ==================== Auth Proxy Tests ====================
 
@@ -31,6 +31,13 @@ export interface MonitoringStatus {
 }
 
 // Re-export types for convenience
+export interface CachedMetricsDelta {
+  cursor: string;
+  full: boolean;
+  devices: Record<string, DeviceMetrics>;
+  removed: string[];
+}
+
 export type { GatewayTestIP, GatewayTestIPConfig, GatewayTestIPsResponse, SpeedTestResult };
 
 // ==================== Monitoring API ====================
@@ -66,6 +73,18 @@ export async function getAllCachedMetrics(): Promise<Record<string, DeviceMetric
   return response.data;
 }
 
+/**
+ * Cached metrics whose state changed since `since` (a cursor from a previous
+ * call, or "0" to start), with the given amount of check history
+ */
+export async function getCachedMetricsDelta(
+  since: string,
+  history: 'none' | 'downsampled' | 'full' = 'downsampled',
+): Promise<CachedMetricsDelta> {
+  const response = await client.get<CachedMetricsDelta>('/api/health/cached', { params: { since, history } });
+  return response.data;
+}
+
 export async function triggerHealthCheck(): Promise<void> {
   await client.post('/api/health/monitoring/check-now');
 }
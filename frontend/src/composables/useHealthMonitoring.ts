@@ -21,6 +21,8 @@ const monitoringConfig = ref<healthApi.MonitoringConfig>({
 const monitoringStatus = ref<healthApi.MonitoringStatus | null>(null);
 const isPolling = ref(false);
 let pollInterval: ReturnType<typeof setInterval> | null = null;
+// Cursor of the last cached-metrics delta applied to cachedMetrics
+let metricsCursor: string | null = null;
 
 export function useHealthMonitoring() {
   /**
@@ -85,11 +87,23 @@ export function useHealthMonitoring() {
   }
 
   /**
-   * Fetch all cached metrics from the server
+   * Fetch cached metrics from the server, downloading only devices whose
+   * state changed since the previous fetch or that are due their periodic
+   * refresh (at least once a minute), with downsampled history
    */
   async function fetchAllCachedMetrics(): Promise<Record<string, DeviceMetrics>> {
     try {
-      const data = await healthApi.getAllCachedMetrics();
+      const delta = await healthApi.getCachedMetricsDelta(metricsCursor ?? '0', 'downsampled');
+      let data: Record<string, DeviceMetrics>;
+      if (delta.full) {
+        data = delta.devices;
+      } else {
+        data = { ...cachedMetrics.value, ...delta.devices };
+        for (const ip of delta.removed) {
+          delete data[ip];
+        }
+      }
+      metricsCursor = delta.cursor;
       cachedMetrics.value = data;
       const deviceCount = Object.keys(data).length;
       if (deviceCount > 0) {
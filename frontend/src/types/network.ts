@@ -67,6 +67,49 @@ export interface ParsedNetworkMap {
 	root: TreeNode;
 }
 
+/** Mapper job summary, the "job" event that opens every scan stream */
+export interface MapperJobSummary {
+	job_id: string;
+	network_id: string;
+	incremental: boolean;
+	status: "running" | "completed" | "failed";
+}
+
+/** A discovered host, streamed as a "host" event as soon as it is known */
+export interface MapperHostRecord {
+	ip: string;
+	mac?: string | null;
+	vendor?: string | null;
+	hostname?: string | null;
+	role: DeviceRole;
+	depth: number;
+}
+
+/** Sweep progress of one subnet ("progress" event) */
+export interface MapperProgress {
+	subnet: string;
+	interface?: string | null;
+	scanned: number;
+	total: number;
+	percent: number;
+	hosts_up: number;
+}
+
+export interface MapperDiffDevice {
+	ip: string;
+	hostname: string;
+	role: DeviceRole;
+}
+
+/** Incremental scan compared with the saved layout ("diff" event, sent before "done") */
+export interface MapperDiff {
+	added: MapperDiffDevice[];
+	removed: MapperDiffDevice[];
+	changed: (MapperDiffDevice & { changes: Record<string, { old: string; new: string }> })[];
+	unchanged: number;
+	has_saved_layout: boolean;
+}
+
 export type HealthStatus = "healthy" | "degraded" | "unhealthy" | "unknown";
 
 export interface PingResult {
@@ -84,6 +127,8 @@ export interface DnsResult {
 	resolved_hostname?: string;
 	reverse_dns?: string;
 	resolution_time_ms?: number;
+	/** Served from the health service's DNS cache (resolution_time_ms is then 0) */
+	cached?: boolean;
 }
 
 export interface PortCheckResult {
@@ -100,6 +145,16 @@ export interface CheckHistoryEntry {
 	latency_ms?: number;
 }
 
+/** Aggregated checks for one downsampled time bucket (history=downsampled) */
+export interface HistoryBucket {
+	/** ISO timestamp of the bucket start */
+	timestamp: string;
+	checks: number;
+	passed: number;
+	uptime_percent: number;
+	avg_latency_ms?: number;
+}
+
 export interface DeviceMetrics {
 	ip: string;
 	status: HealthStatus;
@@ -114,6 +169,8 @@ export interface DeviceMetrics {
 	checks_failed_24h: number;
 	/** Recent check history for timeline display */
 	check_history: CheckHistoryEntry[];
+	/** Downsampled timeline, only present when requested with history=downsampled */
+	history_buckets?: HistoryBucket[];
 	/** ISO timestamp when device was last seen online */
 	last_seen_online?: string;
 	consecutive_failures: number;
@@ -6,6 +6,7 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from .routers.health import router as health_router
 from .services.health_checker import health_checker
+from .services.notification_reporter import notification_reporter
 from .services.usage_middleware import UsageTrackingMiddleware
 
 # Configure logging
@@ -18,13 +19,19 @@ async def lifespan(app: FastAPI):
     """Manage app startup and shutdown events"""
     # Startup: Start the background monitoring loop
     logger.info("Starting background health monitoring...")
+    health_checker.start_sharding()
     health_checker.start_monitoring()
+    health_checker.start_state_snapshots()
     
     yield
     
-    # Shutdown: Stop the background monitoring loop
+    # Shutdown: Stop the background monitoring loop and flush a final state snapshot
     logger.info("Stopping background health monitoring...")
     health_checker.stop_monitoring()
+    await health_checker.stop_sharding()
+    await health_checker.stop_state_snapshots()
+    health_checker.speed_tests.shutdown()
+    await notification_reporter.close()
 
 
 def create_app() -> FastAPI:
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal
 from datetime import datetime
 from enum import Enum
 
@@ -20,6 +20,15 @@ class PingResult(BaseModel):
     max_latency_ms: Optional[float] = None
     avg_latency_ms: Optional[float] = None
     jitter_ms: Optional[float] = None
+    # "neighbor": no echo was sent, the kernel neighbor table showed the host
+    # alive and the latency fields are carried over from the last echo
+    source: Literal["icmp", "neighbor"] = "icmp"
+    # Echo requests behind this result. Fast-path checks send one; when that
+    # one is lost or slow the full burst follows (escalated) and loss is
+    # counted over every echo sent.
+    probes_sent: Optional[int] = None
+    fast_path: bool = False
+    escalated: bool = False
 
 
 class DnsResult(BaseModel):
@@ -28,6 +37,7 @@ class DnsResult(BaseModel):
     resolved_hostname: Optional[str] = None
     reverse_dns: Optional[str] = None
     resolution_time_ms: Optional[float] = None
+    cached: bool = False  # Served from the resolver cache; resolution_time_ms is then 0
 
 
 class PortCheckResult(BaseModel):
@@ -45,6 +55,26 @@ class CheckHistoryEntry(BaseModel):
     latency_ms: Optional[float] = None
 
 
+class HistoryMode(str, Enum):
+    """How much check history to include in metrics responses"""
+    NONE = "none"
+    DOWNSAMPLED = "downsampled"
+    FULL = "full"
+
+
+# Bucket sizes for downsampled history
+HistoryBucketSize = Literal["5m", "15m", "1h"]
+
+
+class HistoryBucket(BaseModel):
+    """Aggregated check results for one downsampled time bucket"""
+    timestamp: datetime  # Bucket start
+    checks: int
+    passed: int
+    uptime_percent: float
+    avg_latency_ms: Optional[float] = None
+
+
 class DeviceMetrics(BaseModel):
     """Comprehensive metrics for a device"""
     ip: str
@@ -66,6 +96,7 @@ class DeviceMetrics(BaseModel):
     checks_passed_24h: int = 0
     checks_failed_24h: int = 0
     check_history: List[CheckHistoryEntry] = []  # Recent check history for timeline display
+    history_buckets: Optional[List[HistoryBucket]] = None  # Downsampled timeline (history=downsampled)
     
     # Additional info
     last_seen_online: Optional[datetime] = None
@@ -73,11 +104,39 @@ class DeviceMetrics(BaseModel):
     error_message: Optional[str] = None
 
 
+class CachedMetricsDelta(BaseModel):
+    """Cached metrics changed since a cursor (GET /cached?since=...)"""
+    cursor: str  # Pass back as `since` on the next poll
+    full: bool = False  # True when the cursor couldn't be served incrementally; replace all local state
+    devices: Dict[str, DeviceMetrics] = {}
+    removed: List[str] = []
+
+
+class DeviceChangeEvent(BaseModel):
+    """Compact change feed event, emitted when status, reachability or latency bucket changes"""
+    seq: int
+    ip: str
+    type: Literal["update", "removed"] = "update"
+    status: Optional[HealthStatus] = None
+    reachable: Optional[bool] = None
+    latency_bucket: Optional[str] = None  # e.g. "<10", "10-50", ">=200"; None when unreachable
+    latency_ms: Optional[float] = None
+    timestamp: datetime
+
+
 class HealthCheckRequest(BaseModel):
     """Request to check health of specific IPs"""
     ips: List[str]
     include_ports: bool = False
     include_dns: bool = True
+    history: HistoryMode = HistoryMode.FULL
+    history_bucket: HistoryBucketSize = "5m"
+    max_age_seconds: Optional[float] = Field(None, ge=0)  # Serve cached metrics up to this old
+
+
+class StreamHealthCheckRequest(HealthCheckRequest):
+    """Request for a streaming batch check; sweeps omit history unless asked for"""
+    history: HistoryMode = HistoryMode.NONE
 
 
 class BatchHealthResponse(BaseModel):
@@ -86,6 +145,16 @@ class BatchHealthResponse(BaseModel):
     check_timestamp: datetime
 
 
+class BatchCheckSummary(BaseModel):
+    """Final record of a streamed batch health check"""
+    requested: int  # Distinct IPs in the request
+    completed: int
+    from_cache: int  # Served from cached metrics via max_age_seconds
+    by_status: dict[HealthStatus, int]
+    duration_ms: float
+    check_timestamp: datetime
+
+
 class DeviceToMonitor(BaseModel):
     """Device registered for monitoring"""
     ip: str
@@ -97,6 +166,45 @@ class MonitoringConfig(BaseModel):
     enabled: bool = True
     check_interval_seconds: int = 30
     include_dns: bool = True
+    
+    # Probe scheduling limits
+    max_concurrent_checks: int = 64  # Global cap on in-flight device checks
+    subnet_rate_limit_per_second: float = 0.0  # Checks started per subnet per second (0 = unlimited)
+    subnet_prefix_length: int = 24  # Prefix length used to group devices into subnets
+    
+    # "burst" checks every device at once each interval; "staggered" (opt-in)
+    # spreads probes across the interval on a timing wheel
+    scheduling_mode: Literal["staggered", "burst"] = "burst"
+    
+    # Per-device adaptive intervals (opt-in, staggered mode only)
+    adaptive_intervals: bool = False
+    failing_interval_seconds: int = 10  # Fast re-probe for unhealthy/degraded devices
+    max_interval_seconds: int = 300  # Upper bound for stable-device backoff
+    stable_checks_before_backoff: int = 5  # Consecutive healthy checks before backing off
+    backoff_factor: float = 2.0
+    critical_roles: List[str] = ["gateway", "firewall"]  # Roles pinned to the critical interval
+    critical_interval_seconds: int = 15
+    
+    # Background probes of an IP watched by several consumers (a device that is
+    # also a gateway test IP, a test IP shared by gateways) share one ping
+    dedupe_probes: bool = True
+    
+    # Passive liveness: healthy on-link devices the kernel neighbor table saw
+    # answering within passive_max_age_seconds are marked up without a ping.
+    # They are still pinged every passive_probe_interval_seconds for latency.
+    passive_liveness: bool = False
+    passive_max_age_seconds: float = 30.0
+    passive_probe_interval_seconds: int = 300
+    
+    # Fast path: devices healthy for fast_path_stable_checks checks in a row get
+    # one echo instead of a burst, escalating to the burst when that echo is
+    # lost or slower than fast_path_latency_factor x their 24h average.
+    # fast_path_networks overrides fast_path per network ID.
+    fast_path: bool = False
+    fast_path_networks: Dict[str, bool] = {}
+    fast_path_stable_checks: int = 3
+    fast_path_latency_factor: float = 2.0
+    fast_path_timeout_seconds: float = 1.0
 
 
 class MonitoringStatus(BaseModel):
@@ -107,12 +215,51 @@ class MonitoringStatus(BaseModel):
     monitored_devices: List[str]
     last_check: Optional[datetime] = None
     next_check: Optional[datetime] = None
+    
+    # Scheduler metrics
+    queue_depth: int = 0
+    in_flight_checks: int = 0
+    max_concurrent_checks: int = 0
+    last_cycle_duration_seconds: Optional[float] = None
+    overrun_count: int = 0  # Cycles that took longer than the check interval
+    skipped_cycles: int = 0  # Cycles skipped because the previous one was still running
+    scheduling_mode: Optional[str] = None
+    scheduled_devices: int = 0  # Targets currently on the timing wheel
+    shared_probes: int = 0  # Monitoring probes answered by another consumer's ping
+    passive_checks: int = 0  # Monitoring checks answered from the kernel neighbor table
+    
+    # Sharding (only set when HEALTH_SHARD_MODE is enabled)
+    shard_worker_id: Optional[str] = None
+    shard_workers: int = 1
+    owned_devices: Optional[int] = None  # Monitored devices this worker probes
 
 
 class RegisterDevicesRequest(BaseModel):
     """Request to register devices for monitoring"""
     ips: List[str]
     network_id: str  # UUID string - the network these devices belong to
+    roles: Dict[str, str] = {}  # Optional IP -> device role (e.g. "gateway", "firewall")
+
+
+class NetworkDevicesRequest(BaseModel):
+    """Devices to add to, or to replace, one network's monitored set"""
+    ips: List[str]
+    roles: Dict[str, str] = {}
+
+
+class NetworkDevicesPatchRequest(BaseModel):
+    """Incremental change to one network's monitored set"""
+    add: List[str] = []
+    remove: List[str] = []
+    roles: Dict[str, str] = {}
+
+
+class NetworkDevicesDiff(BaseModel):
+    """What a registry change did to one network's monitored set"""
+    network_id: str
+    added: List[str] = []
+    removed: List[str] = []
+    total: int = 0  # Devices in the network afterwards
 
 
 # ==================== Gateway Test IP Models ====================
@@ -194,3 +341,29 @@ class SpeedTestResult(BaseModel):
     # Duration of the test
     duration_seconds: Optional[float] = None
 
+
+class SpeedTestJobStatus(str, Enum):
+    """Lifecycle of a speed test job"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class SpeedTestJob(BaseModel):
+    """A speed test run, shared by every request made for the same gateway while it runs"""
+    job_id: str
+    gateway_ip: Optional[str] = None
+    status: SpeedTestJobStatus = SpeedTestJobStatus.QUEUED
+    phase: str = "queued"  # queued, server_selection, download, upload, done
+    progress: float = 0.0  # Overall progress, 0.0 - 1.0
+    attached_requests: int = 1  # Requests sharing this run
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[SpeedTestResult] = None
+
+
+class SpeedTestJobRequest(BaseModel):
+    """Request to start (or join) a speed test job"""
+    gateway_ip: Optional[str] = None
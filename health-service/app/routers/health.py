@@ -1,98 +1,623 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Literal, Optional, Tuple, Union
 from datetime import datetime
 
+import httpx
+
 from ..models import (
+    BatchCheckSummary,
+    CachedMetricsDelta,
     DeviceMetrics,
     HealthCheckRequest,
+    StreamHealthCheckRequest,
+    HealthStatus,
+    HistoryMode,
+    HistoryBucketSize,
     BatchHealthResponse,
     DeviceToMonitor,
     MonitoringConfig,
     MonitoringStatus,
     RegisterDevicesRequest,
+    NetworkDevicesDiff,
+    NetworkDevicesPatchRequest,
+    NetworkDevicesRequest,
     GatewayTestIPConfig,
     GatewayTestIPsResponse,
     SetGatewayTestIPsRequest,
+    SpeedTestJob,
+    SpeedTestJobRequest,
+    SpeedTestJobStatus,
     SpeedTestResult,
 )
 from ..services.health_checker import health_checker
-from ..services.notification_reporter import sync_devices_with_notification_service
+from ..services.port_scanner import parse_port_spec
+from ..services.notification_reporter import sync_device_changes_with_notification_service
+from ..services.sharding import (
+    SHARD_PEER_TIMEOUT_SECONDS,
+    decode_shard_cursor,
+    encode_shard_cursor,
+    peer_request,
+    shard_coordinator,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/health", tags=["health"])
 
+# Largest batch answered in one response; bigger sweeps use the streaming endpoint
+MAX_BATCH_IPS = 100
+# Largest streaming batch check
+MAX_STREAM_BATCH_IPS = int(os.environ.get("HEALTH_STREAM_CHECK_MAX_IPS", "65536"))
+
+# Comment lines sent on idle change streams so proxies don't time them out
+CHANGE_STREAM_KEEPALIVE_SECONDS = 15.0
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+def _sse(event: str, data: str, event_id: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+# ==================== Shard Helpers ====================
+# With sharding enabled, reads are merged from every worker and registry
+# changes are copied to every worker. Peers are called with local=true so
+# they answer from their own state instead of fanning out again.
+
+LOCAL_QUERY = Query(False, description="Answer from this shard worker only (used between workers)")
+
+
+def _sharded(local: bool) -> bool:
+    return shard_coordinator is not None and not local
+
+
+async def _gather_from_peers(method: str, path: str, params: Optional[dict] = None, json_body=None) -> Dict[str, tuple]:
+    """Worker ID -> (status, body) for one request sent to every peer"""
+    peers = shard_coordinator.peers()
+    client = health_checker.get_peer_client()
+    results = await asyncio.gather(*(
+        peer_request(client, url, method, path, params=params, json_body=json_body)
+        for url in peers.values()
+    ))
+    return dict(zip(peers, results))
+
+
+def _merge_by_owner(per_worker: Dict[str, dict]) -> dict:
+    """
+    Merge per-worker maps keyed by IP. Right after a rebalance a device can be
+    cached on both its old and new worker; the current owner's entry wins.
+    """
+    shard = shard_coordinator
+    merged: dict = {}
+    for worker_id, entries in per_worker.items():
+        for ip, value in entries.items():
+            if ip not in merged or shard.owner(ip) == worker_id:
+                merged[ip] = value
+    return merged
+
+
+async def _fan_out(request: Request) -> None:
+    """Repeat a registry or config change on every peer worker"""
+    body = await request.body()
+    results = await _gather_from_peers(
+        request.method,
+        request.url.path,
+        params=dict(request.query_params),
+        json_body=json.loads(body) if body else None,
+    )
+    for worker_id, (status, _) in results.items():
+        if status >= 400 or status == 0:
+            logger.warning(f"Shard peer {worker_id} rejected {request.method} {request.url.path} ({status})")
+
+
+async def _merged_cached_metrics(history: HistoryMode, bucket: str) -> dict:
+    params = {"history": history.value, "bucket": bucket}
+    results = await _gather_from_peers("GET", "/api/health/cached", params=params)
+    per_worker = {
+        worker_id: data for worker_id, (status, data) in results.items()
+        if status == 200 and isinstance(data, dict)
+    }
+    local = health_checker.get_all_cached_metrics(history=history, history_bucket=bucket)
+    per_worker[shard_coordinator.worker_id] = local
+    return _merge_by_owner(per_worker)
+
+
+async def _merged_cached_metrics_delta(since: str, history: HistoryMode, bucket: str) -> CachedMetricsDelta:
+    """
+    Delta across all workers. The cursor packs one cursor per worker; if the
+    worker set changed or any worker has to resync, the response is full.
+    """
+    shard = shard_coordinator
+    cursors = decode_shard_cursor(since)
+    # Workers without an advertised URL can't be read, so they aren't part of the cursor
+    members = {shard.worker_id, *shard.peers()}
+    if set(cursors) != members:
+        cursors = {}
+    
+    async def fetch(worker_cursors: Dict[str, str], worker_ids) -> Dict[str, Optional[dict]]:
+        parts: Dict[str, Optional[dict]] = {}
+        peers = shard.peers()
+        client = health_checker.get_peer_client()
+        peer_ids = [wid for wid in worker_ids if wid in peers]
+        responses = await asyncio.gather(*(
+            peer_request(client, peers[wid], "GET", "/api/health/cached", params={
+                "history": history.value, "bucket": bucket, "since": worker_cursors.get(wid, "0"),
+            })
+            for wid in peer_ids
+        ))
+        for wid, (status, data) in zip(peer_ids, responses):
+            parts[wid] = data if status == 200 and isinstance(data, dict) and "cursor" in data else None
+        if shard.worker_id in worker_ids:
+            delta = health_checker.get_cached_metrics_delta(
+                worker_cursors.get(shard.worker_id, "0"), history=history, history_bucket=bucket
+            )
+            parts[shard.worker_id] = delta.model_dump(mode="json")
+        return parts
+    
+    parts = await fetch(cursors, list(members))
+    full = not cursors or any(part is None or part.get("full") for part in parts.values())
+    if full and cursors:
+        # Some worker resynced: everyone else has to send their full state too
+        stale = [wid for wid, part in parts.items() if part is not None and not part.get("full")]
+        parts.update(await fetch({}, stale))
+    
+    new_cursors = {wid: part["cursor"] if part else "0" for wid, part in parts.items()}
+    devices = _merge_by_owner({wid: part.get("devices", {}) for wid, part in parts.items() if part})
+    removed = sorted({
+        ip for part in parts.values() if part for ip in part.get("removed", []) if ip not in devices
+    })
+    return CachedMetricsDelta(cursor=encode_shard_cursor(new_cursors), full=full, devices=devices, removed=removed)
+
+
+def _set_freshness_headers(response: Response, metrics: List[DeviceMetrics], max_age_seconds: Optional[float]) -> None:
+    """
+    Age: seconds since the oldest returned measurement. Cache-Control tells
+    callers how much longer the data stays within their requested max age.
+    """
+    now = datetime.utcnow()
+    age = int(max((max(0.0, (now - m.last_check).total_seconds()) for m in metrics), default=0.0))
+    response.headers["Age"] = str(age)
+    if max_age_seconds is None:
+        response.headers["Cache-Control"] = "private, no-cache"
+    else:
+        response.headers["Cache-Control"] = f"private, max-age={max(0, int(max_age_seconds) - age)}"
+
 
 @router.get("/check/{ip}", response_model=DeviceMetrics)
 async def check_single_device(
     ip: str,
+    response: Response,
     include_ports: bool = Query(False, description="Include port scanning"),
-    include_dns: bool = Query(True, description="Include DNS resolution")
+    include_dns: bool = Query(True, description="Include DNS resolution"),
+    history: HistoryMode = Query(HistoryMode.FULL, description="Check history to include: none, downsampled or full"),
+    bucket: HistoryBucketSize = Query("5m", description="Bucket size for downsampled history"),
+    max_age_seconds: Optional[float] = Query(
+        None, ge=0, description="Serve cached metrics up to this old instead of probing"
+    )
 ):
     """
     Check the health of a single device by IP address.
     Returns comprehensive metrics including ping, DNS, and optionally open ports.
+    
+    With `max_age_seconds`, recent enough cached metrics (e.g. from background
+    monitoring) are returned without probing. Concurrent checks of the same
+    device share one probe. The `Age` header gives the data's age in seconds.
     """
     try:
-        metrics = await health_checker.check_device_health(
+        metrics = await health_checker.get_device_health(
             ip=ip,
             include_ports=include_ports,
-            include_dns=include_dns
+            include_dns=include_dns,
+            history=history,
+            history_bucket=bucket,
+            max_age_seconds=max_age_seconds
         )
-        return metrics
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    _set_freshness_headers(response, [metrics], max_age_seconds)
+    return metrics
 
 
 @router.post("/check/batch", response_model=BatchHealthResponse)
-async def check_multiple_devices(request: HealthCheckRequest):
+async def check_multiple_devices(request: HealthCheckRequest, response: Response):
     """
     Check the health of multiple devices at once.
     More efficient than calling the single endpoint multiple times.
+    Honors `max_age_seconds` per device; `Age` is that of the oldest result.
     """
     if not request.ips:
         raise HTTPException(status_code=400, detail="No IPs provided")
     
-    if len(request.ips) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 IPs per request")
+    if len(request.ips) > MAX_BATCH_IPS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {MAX_BATCH_IPS} IPs per request; use /check/stream for larger batches"
+        )
     
     try:
         metrics = await health_checker.check_multiple_devices(
             ips=request.ips,
             include_ports=request.include_ports,
-            include_dns=request.include_dns
-        )
-        return BatchHealthResponse(
-            devices=metrics,
-            check_timestamp=datetime.utcnow()
+            include_dns=request.include_dns,
+            history=request.history,
+            history_bucket=request.history_bucket,
+            max_age_seconds=request.max_age_seconds
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    _set_freshness_headers(response, list(metrics.values()), request.max_age_seconds)
+    return BatchHealthResponse(
+        devices=metrics,
+        check_timestamp=datetime.utcnow()
+    )
+
+
+async def _batch_check_stream(request: StreamHealthCheckRequest, output: str) -> AsyncIterator[str]:
+    started = time.monotonic()
+    requested = len(set(request.ips))
+    completed = from_cache = 0
+    by_status = {status: 0 for status in HealthStatus}
+
+    def encode(record_type: str, record: dict) -> str:
+        if output == "sse":
+            return _sse(record_type, json.dumps(record))
+        return json.dumps({"type": record_type, **record}) + "\n"
+
+    results = health_checker.stream_device_checks(
+        ips=request.ips,
+        include_ports=request.include_ports,
+        include_dns=request.include_dns,
+        history=request.history,
+        history_bucket=request.history_bucket,
+        max_age_seconds=request.max_age_seconds
+    )
+    try:
+        async for metrics, cached in results:
+            completed += 1
+            from_cache += cached
+            by_status[metrics.status] += 1
+            yield encode("device", {"cached": cached, "device": metrics.model_dump(mode="json")})
+    finally:
+        await results.aclose()
+
+    summary = BatchCheckSummary(
+        requested=requested,
+        completed=completed,
+        from_cache=from_cache,
+        by_status=by_status,
+        duration_ms=round((time.monotonic() - started) * 1000, 1),
+        check_timestamp=datetime.utcnow(),
+    )
+    yield encode("summary", summary.model_dump(mode="json"))
+
+
+@router.post("/check/stream")
+async def stream_device_checks(
+    request: StreamHealthCheckRequest,
+    format: Literal["ndjson", "sse"] = Query("ndjson", description="ndjson lines or Server-Sent Events"),
+):
+    """
+    Check up to thousands of devices, streaming each result as it completes.
+    
+    Emits one `device` record per distinct IP in completion order (fresh cached
+    results first when `max_age_seconds` is set), then a `summary` record with
+    per-status counts. As NDJSON each line is `{"type": ..., ...}`; as SSE
+    the record type is the event name. Unlike /check/batch, `history`
+    defaults to "none"; ask for "downsampled" or "full" to include it.
+    """
+    if not request.ips:
+        raise HTTPException(status_code=400, detail="No IPs provided")
+    if len(request.ips) > MAX_STREAM_BATCH_IPS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_STREAM_BATCH_IPS} IPs per request")
+    if format == "sse":
+        return StreamingResponse(
+            _batch_check_stream(request, format), media_type="text/event-stream", headers=SSE_HEADERS
+        )
+    return StreamingResponse(
+        _batch_check_stream(request, format), media_type="application/x-ndjson", headers=SSE_HEADERS
+    )
 
 
 @router.get("/cached/{ip}", response_model=Optional[DeviceMetrics])
-async def get_cached_metrics(ip: str):
+async def get_cached_metrics(
+    ip: str,
+    history: HistoryMode = Query(HistoryMode.FULL, description="Check history to include: none, downsampled or full"),
+    bucket: HistoryBucketSize = Query("5m", description="Bucket size for downsampled history"),
+    local: bool = LOCAL_QUERY
+):
     """
     Get cached metrics for a device without performing a new check.
     Returns None if no cached data exists.
     """
-    metrics = health_checker.get_cached_metrics(ip)
+    shard = shard_coordinator
+    if _sharded(local) and not shard.owns(ip):
+        # Ask the worker that probes this device; fall back to whatever we cached
+        url = shard.peer_url(shard.owner(ip))
+        if url:
+            status, data = await peer_request(
+                health_checker.get_peer_client(), url, "GET", f"/api/health/cached/{ip}",
+                params={"history": history.value, "bucket": bucket},
+            )
+            if status == 200 and data:
+                return data
+    metrics = health_checker.get_cached_metrics(ip, history=history, history_bucket=bucket)
     if metrics is None:
         raise HTTPException(status_code=404, detail="No cached data for this IP")
     return metrics
 
 
-@router.get("/cached", response_model=dict[str, DeviceMetrics])
-async def get_all_cached_metrics():
+@router.get("/cached", response_model=Union[CachedMetricsDelta, dict[str, DeviceMetrics]])
+async def get_all_cached_metrics(
+    history: HistoryMode = Query(HistoryMode.FULL, description="Check history to include: none, downsampled or full"),
+    bucket: HistoryBucketSize = Query("5m", description="Bucket size for downsampled history"),
+    since: Optional[str] = Query(None, description="Cursor from a previous delta response; use 0 to start"),
+    local: bool = LOCAL_QUERY
+):
     """
     Get all cached metrics for all monitored devices.
+    Use history=none or history=downsampled to keep large responses small.
+    
+    With `since`, only devices whose status, reachability, latency bucket or
+    error changed after that cursor are returned, along with the IPs removed
+    since then and a new cursor. Every device is also returned at least once
+    per HEALTH_CHANGE_JOURNAL_REFRESH (60s), so a mirror built from deltas has
+    last_check, 24h counters and history no older than that. Delta pollers
+    should ask for history=none or downsampled.
+    
+    When sharding is enabled, every worker's cache is merged into the response.
     """
-    return health_checker.get_all_cached_metrics()
+    if _sharded(local):
+        if since is not None:
+            return await _merged_cached_metrics_delta(since, history, bucket)
+        return await _merged_cached_metrics(history, bucket)
+    if since is not None:
+        return health_checker.get_cached_metrics_delta(since, history=history, history_bucket=bucket)
+    return health_checker.get_all_cached_metrics(history=history, history_bucket=bucket)
+
+
+# (event, data, SSE id) of one change stream message; None stands for a keepalive
+ChangeMessage = Optional[Tuple[str, str, Optional[str]]]
+
+
+def _change_snapshot_message() -> ChangeMessage:
+    feed = health_checker.change_feed
+    devices = [event.model_dump(mode="json", exclude_none=True) for event in feed.snapshot()]
+    return "snapshot", json.dumps({"cursor": feed.cursor, "devices": devices}), feed.cursor
+
+
+async def _local_change_messages(cursor: Optional[str]) -> AsyncIterator[ChangeMessage]:
+    """This worker's change feed from `cursor`, starting with a snapshot if it can't be replayed"""
+    feed = health_checker.change_feed
+    # Subscribe before reading the backlog so nothing published in between is missed
+    subscription = feed.subscribe()
+    try:
+        backlog = feed.events_since(cursor)
+        if backlog is None:
+            last_seq = feed.seq
+            yield _change_snapshot_message()
+        else:
+            last_seq = backlog[-1].seq if backlog else feed.seq
+            for event in backlog:
+                yield "change", event.model_dump_json(exclude_none=True), feed.format_cursor(event.seq)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), CHANGE_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                # Fell behind and events were dropped: start over from current state
+                last_seq = feed.seq
+                yield _change_snapshot_message()
+                continue
+            if event.seq <= last_seq:
+                continue
+            last_seq = event.seq
+            yield "change", event.model_dump_json(exclude_none=True), feed.format_cursor(event.seq)
+    finally:
+        feed.unsubscribe(subscription)
+
+
+async def _peer_change_messages(url: str, cursor: Optional[str]) -> AsyncIterator[ChangeMessage]:
+    """A peer worker's local change stream, parsed from SSE; ends when the connection does"""
+    params = {"local": "true", **({"since": cursor} if cursor else {})}
+    # Peers send keepalives, so a read that stalls for several of them means the peer is gone
+    timeout = httpx.Timeout(SHARD_PEER_TIMEOUT_SECONDS, read=CHANGE_STREAM_KEEPALIVE_SECONDS * 3)
+    client = health_checker.get_peer_client()
+    async with client.stream("GET", f"{url}/api/health/changes", params=params, timeout=timeout) as response:
+        if response.status_code != 200:
+            logger.warning(f"Shard peer {url} refused the change stream ({response.status_code})")
+            return
+        event, data, event_id = "message", [], None
+        async for line in response.aiter_lines():
+            if not line:
+                if data:
+                    yield event, "\n".join(data), event_id
+                event, data, event_id = "message", [], None
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+            elif field == "id":
+                event_id = value
+
+
+async def _merged_change_stream(cursor: Optional[str]) -> AsyncIterator[str]:
+    """
+    Change stream across all workers. Each worker's stream is read
+    concurrently; the SSE id packs one cursor per worker. Every worker's
+    devices are tracked so that a worker resyncing (or joining) yields one
+    merged snapshot. When a worker resyncs while the client resumed from a
+    cursor, the other workers' full state is unknown, so every worker is
+    restarted from a snapshot, like a full delta in _merged_cached_metrics_delta.
+    """
+    shard = shard_coordinator
+    cursors = decode_shard_cursor(cursor)
+    if set(cursors) != {shard.worker_id, *shard.peers()}:
+        cursors = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    pumps: Dict[str, Tuple[int, asyncio.Task]] = {}  # Worker ID -> (generation, reader task)
+    portions: Dict[str, Dict[str, dict]] = {}  # Worker ID -> IP -> device, for workers whose full state we hold
+    generation = 0
+
+    async def pump(worker_id: str, gen: int, since: Optional[str]) -> None:
+        try:
+            if worker_id == shard.worker_id:
+                messages = _local_change_messages(since)
+            else:
+                messages = _peer_change_messages(shard.peers()[worker_id], since)
+            try:
+                async for message in messages:
+                    if message is not None:
+                        queue.put_nowait((worker_id, gen, message))
+            finally:
+                await messages.aclose()
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning(f"Change stream from shard peer {worker_id} ended: {e}")
+        finally:
+            queue.put_nowait((worker_id, gen, None))
+
+    def start(worker_id: str, since: Optional[str]) -> None:
+        nonlocal generation
+        if worker_id in pumps:
+            pumps[worker_id][1].cancel()
+        generation += 1
+        pumps[worker_id] = (generation, asyncio.create_task(pump(worker_id, generation, since)))
+
+    def merged_cursor() -> str:
+        return encode_shard_cursor(cursors)
+
+    def merged_snapshot() -> str:
+        devices = list(_merge_by_owner(portions).values())
+        return _sse("snapshot", json.dumps({"cursor": merged_cursor(), "devices": devices}), merged_cursor())
+
+    for worker_id in [shard.worker_id, *shard.peers()]:
+        start(worker_id, cursors.get(worker_id))
+    # With no cursor every worker starts with a snapshot; hold changes until all have arrived
+    awaiting = set() if cursors else set(pumps)
+    try:
+        while True:
+            try:
+                worker_id, gen, message = await asyncio.wait_for(queue.get(), CHANGE_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                for peer_id in shard.peers():
+                    if peer_id not in pumps:
+                        # Joined (or came back): it starts with a snapshot
+                        start(peer_id, None)
+                continue
+            if worker_id not in pumps or pumps[worker_id][0] != gen:
+                continue  # From a reader that was replaced
+
+            if message is None:
+                # Worker left or is unreachable; a keepalive tick reconnects it if it's still a member
+                del pumps[worker_id]
+                cursors.pop(worker_id, None)
+                awaiting.discard(worker_id)
+                if portions.pop(worker_id, None) is not None and not awaiting and len(portions) == len(pumps):
+                    yield merged_snapshot()
+                continue
+
+            event, data, event_id = message
+            if event_id:
+                cursors[worker_id] = event_id
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                continue
+            if event == "snapshot":
+                portions[worker_id] = {device["ip"]: device for device in payload.get("devices", [])}
+                awaiting.discard(worker_id)
+                unknown = [wid for wid in pumps if wid not in portions]
+                if unknown and not awaiting:
+                    for wid in unknown:
+                        start(wid, None)
+                    awaiting = set(unknown)
+                if not awaiting:
+                    yield merged_snapshot()
+                continue
+
+            portion = portions.get(worker_id)
+            if portion is not None:
+                if payload.get("type") == "removed":
+                    portion.pop(payload.get("ip"), None)
+                else:
+                    portion[payload.get("ip")] = payload
+            if not awaiting:
+                yield _sse(event, data, merged_cursor())
+    finally:
+        tasks = [task for _, task in pumps.values()]
+        for task in tasks:
+            task.cancel()
+        # Let the readers unsubscribe and close their connections before the response ends
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _change_stream(cursor: Optional[str]) -> AsyncIterator[str]:
+    messages = _local_change_messages(cursor)
+    try:
+        async for message in messages:
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _sse(*message)
+    finally:
+        # Unsubscribe now rather than whenever the inner generator is collected
+        await messages.aclose()
+
+
+@router.get("/changes")
+async def stream_changes(
+    since: Optional[str] = Query(None, description="Resume after this cursor (the id of the last event received)"),
+    last_event_id: Optional[str] = Header(None),
+    local: bool = LOCAL_QUERY,
+):
+    """
+    Server-Sent Events stream of device state changes.
+    
+    A `change` event is sent whenever a device's status, reachability or
+    latency bucket changes, or it is removed; each carries a sequence number
+    and its SSE id is a resumable cursor. New subscribers, and subscribers
+    whose cursor can no longer be replayed, first receive a `snapshot` event
+    with the current state of every device.
+    
+    When sharding is enabled, every worker's changes are merged into one stream.
+    """
+    cursor = since or last_event_id
+    return StreamingResponse(
+        _merged_change_stream(cursor) if _sharded(local) else _change_stream(cursor),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 
 @router.delete("/cache")
-async def clear_cache():
+async def clear_cache(raw_request: Request, local: bool = LOCAL_QUERY):
     """
     Clear the metrics cache. Useful for testing or reset.
     """
+    if _sharded(local):
+        await _fan_out(raw_request)
     health_checker.clear_cache()
     return {"message": "Cache cleared"}
 
@@ -111,13 +636,25 @@ async def quick_ping(ip: str, count: int = Query(3, ge=1, le=10)):
 
 
 @router.get("/ports/{ip}")
-async def scan_ports(ip: str):
+async def scan_ports(
+    ip: str,
+    ports: Optional[str] = Query(
+        None,
+        description="Port set (quick, common, top100) or ports/ranges such as 22,80,8000-8100"
+    ),
+    refresh: bool = Query(False, description="Rescan instead of using cached results")
+):
     """
-    Scan common ports on a device.
-    Returns only open ports.
+    Scan ports on a device.
+    Returns only open ports. Results are cached per device for a few minutes.
     """
     try:
-        open_ports = await health_checker.scan_common_ports(ip)
+        port_list = parse_port_spec(ports) if ports else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        open_ports = await health_checker.scan_ports(ip, ports=port_list, use_cache=not refresh)
         return {"ip": ip, "open_ports": open_ports}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -139,7 +676,7 @@ async def check_dns(ip: str):
 # ==================== Monitoring Endpoints ====================
 
 @router.post("/monitoring/devices")
-async def register_devices(request: RegisterDevicesRequest):
+async def register_devices(request: RegisterDevicesRequest, raw_request: Request, local: bool = LOCAL_QUERY):
     """
     Register devices for passive monitoring.
     These devices will be checked periodically in the background.
@@ -147,20 +684,40 @@ async def register_devices(request: RegisterDevicesRequest):
     Args:
         request: Contains list of IPs and network_id (UUID string)
     """
-    # Create mapping of IP to network_id (now a UUID string)
-    devices_map = {ip: request.network_id for ip in request.ips}
-    health_checker.set_monitored_devices(devices_map)
+    # Replaces this network's devices only; other networks are untouched
+    diff = health_checker.replace_network_devices(request.network_id, request.ips)
+    if request.roles:
+        health_checker.set_device_roles(request.roles)
     
     # Sync with notification service so ML anomaly detection tracks only current devices
-    await sync_devices_with_notification_service(request.ips, network_id=request.network_id)
+    await _sync_network_diff(diff, raw_request, local)
     
     return {
         "message": f"Registered {len(request.ips)} devices for monitoring",
         "devices": request.ips,
-        "network_id": request.network_id
+        "network_id": request.network_id,
+        "added": diff.added,
+        "removed": diff.removed,
     }
 
 
+async def _sync_network_diff(diff: NetworkDevicesDiff, raw_request: Request, local: bool) -> None:
+    """
+    Forward a registry change to the notification service, and to the other
+    shard workers. Only the worker that received the request reports it.
+    """
+    if local:
+        return
+    if _sharded(local):
+        await _fan_out(raw_request)
+    await sync_device_changes_with_notification_service(
+        diff.network_id,
+        diff.added,
+        diff.removed,
+        current_devices=health_checker.get_monitored_devices(diff.network_id),
+    )
+
+
 @router.get("/monitoring/devices")
 async def get_monitored_devices():
     """Get list of devices currently being monitored"""
@@ -168,16 +725,92 @@ async def get_monitored_devices():
 
 
 @router.delete("/monitoring/devices")
-async def clear_monitored_devices():
+async def clear_monitored_devices(raw_request: Request, local: bool = LOCAL_QUERY):
     """Clear all devices from monitoring"""
-    health_checker.set_monitored_devices({})
-    
-    # Sync with notification service to clear device tracking
-    await sync_devices_with_notification_service([])
+    if _sharded(local):
+        await _fan_out(raw_request)
+    for diff in health_checker.clear_monitored_devices():
+        # Sync with notification service to clear device tracking
+        if not local:
+            await sync_device_changes_with_notification_service(diff.network_id, diff.added, diff.removed, current_devices=[])
     
     return {"message": "Cleared all monitored devices"}
 
 
+@router.get("/monitoring/networks")
+async def get_monitored_networks():
+    """Get the number of monitored devices in each network"""
+    return {"networks": health_checker.get_monitored_networks()}
+
+
+@router.get("/monitoring/networks/{network_id}/devices")
+async def get_network_devices(network_id: str):
+    """Get the devices monitored for one network"""
+    return {"network_id": network_id, "devices": health_checker.get_monitored_devices(network_id)}
+
+
+@router.post("/monitoring/networks/{network_id}/devices", response_model=NetworkDevicesDiff)
+async def add_network_devices(network_id: str, request: NetworkDevicesRequest, raw_request: Request, local: bool = LOCAL_QUERY):
+    """Add devices to a network's monitored set"""
+    diff = health_checker.add_network_devices(network_id, request.ips)
+    if request.roles:
+        health_checker.set_device_roles(request.roles)
+    await _sync_network_diff(diff, raw_request, local)
+    return diff
+
+
+@router.put("/monitoring/networks/{network_id}/devices", response_model=NetworkDevicesDiff)
+async def replace_network_devices(network_id: str, request: NetworkDevicesRequest, raw_request: Request, local: bool = LOCAL_QUERY):
+    """Replace a network's monitored set; returns what was added and removed"""
+    diff = health_checker.replace_network_devices(network_id, request.ips)
+    if request.roles:
+        health_checker.set_device_roles(request.roles)
+    await _sync_network_diff(diff, raw_request, local)
+    return diff
+
+
+@router.patch("/monitoring/networks/{network_id}/devices", response_model=NetworkDevicesDiff)
+async def update_network_devices(network_id: str, request: NetworkDevicesPatchRequest, raw_request: Request, local: bool = LOCAL_QUERY):
+    """Add and remove devices in a network's monitored set"""
+    removed = health_checker.remove_network_devices(network_id, request.remove)
+    added = health_checker.add_network_devices(network_id, request.add)
+    if request.roles:
+        health_checker.set_device_roles(request.roles)
+    # An IP both removed and re-added is unchanged
+    readded = set(added.added) & set(removed.removed)
+    diff = NetworkDevicesDiff(
+        network_id=network_id,
+        added=[ip for ip in added.added if ip not in readded],
+        removed=[ip for ip in removed.removed if ip not in readded],
+        total=added.total,
+    )
+    await _sync_network_diff(diff, raw_request, local)
+    return diff
+
+
+@router.delete("/monitoring/networks/{network_id}/devices", response_model=NetworkDevicesDiff)
+async def clear_network_devices(network_id: str, raw_request: Request, local: bool = LOCAL_QUERY):
+    """Stop monitoring every device in a network"""
+    diffs = health_checker.clear_monitored_devices(network_id)
+    diff = diffs[0] if diffs else NetworkDevicesDiff(network_id=network_id)
+    await _sync_network_diff(diff, raw_request, local)
+    return diff
+
+
+# ==================== Shard Endpoints ====================
+
+@router.get("/shard/status")
+async def get_shard_status():
+    """Shard ring membership and how many monitored devices this worker probes"""
+    return health_checker.get_shard_status()
+
+
+@router.get("/shard/registry")
+async def get_shard_registry():
+    """Full device registry and gateway test IPs, pulled by workers joining the ring"""
+    return health_checker.export_registry()
+
+
 @router.get("/monitoring/config", response_model=MonitoringConfig)
 async def get_monitoring_config():
     """Get current monitoring configuration"""
@@ -185,25 +818,62 @@ async def get_monitoring_config():
 
 
 @router.post("/monitoring/config", response_model=MonitoringConfig)
-async def set_monitoring_config(config: MonitoringConfig):
+async def set_monitoring_config(config: MonitoringConfig, raw_request: Request, local: bool = LOCAL_QUERY):
     """
     Update monitoring configuration.
-    Changes take effect immediately.
+    Only the fields present in the body are changed; others keep their current values.
+    Changes take effect immediately, on every shard worker.
     """
-    health_checker.set_monitoring_config(config)
+    current = health_checker.get_monitoring_config()
+    health_checker.set_monitoring_config(current.model_copy(update=config.model_dump(exclude_unset=True)))
+    if _sharded(local):
+        await _fan_out(raw_request)
     return health_checker.get_monitoring_config()
 
 
+def _merge_monitoring_status(local_status: MonitoringStatus, peer_statuses: List[MonitoringStatus]) -> MonitoringStatus:
+    """Scheduler and probe counters summed over workers; the registry and config are the same everywhere"""
+    statuses = [local_status, *peer_statuses]
+    summed = (
+        "queue_depth", "in_flight_checks", "max_concurrent_checks", "overrun_count", "skipped_cycles",
+        "scheduled_devices", "shared_probes", "passive_checks",
+    )
+    merged = {field: sum(getattr(status, field) for status in statuses) for field in summed}
+    last_checks = [status.last_check for status in statuses if status.last_check]
+    next_checks = [status.next_check for status in statuses if status.next_check]
+    durations = [status.last_cycle_duration_seconds for status in statuses if status.last_cycle_duration_seconds is not None]
+    return local_status.model_copy(update={
+        **merged,
+        "last_check": max(last_checks, default=None),
+        "next_check": min(next_checks, default=None),
+        "last_cycle_duration_seconds": max(durations, default=None),
+        "owned_devices": sum(status.owned_devices or 0 for status in statuses),
+    })
+
+
 @router.get("/monitoring/status", response_model=MonitoringStatus)
-async def get_monitoring_status():
+async def get_monitoring_status(local: bool = LOCAL_QUERY):
     """
     Get current monitoring status including:
     - Whether monitoring is enabled
     - Current check interval
     - List of monitored devices
     - Last and next check timestamps
+    
+    When sharding is enabled, scheduler counters cover every worker and
+    `owned_devices` is the number probed by all reachable workers together.
     """
-    return health_checker.get_monitoring_status()
+    status = health_checker.get_monitoring_status()
+    if not _sharded(local):
+        return status
+    results = await _gather_from_peers("GET", "/api/health/monitoring/status")
+    peers = []
+    for worker_id, (code, data) in results.items():
+        if code == 200 and isinstance(data, dict):
+            peers.append(MonitoringStatus.model_validate(data))
+        else:
+            logger.warning(f"Shard peer {worker_id} status unavailable ({code})")
+    return _merge_monitoring_status(status, peers)
 
 
 @router.post("/monitoring/start")
@@ -221,15 +891,19 @@ async def stop_monitoring():
 
 
 @router.post("/monitoring/check-now")
-async def trigger_immediate_check():
+async def trigger_immediate_check(raw_request: Request, local: bool = LOCAL_QUERY):
     """
     Trigger an immediate health check of all monitored devices.
     Useful for forcing a refresh outside the normal interval.
+    With sharding, every worker checks the devices it owns.
     """
     if not health_checker.get_monitored_devices():
         raise HTTPException(status_code=400, detail="No devices registered for monitoring")
     
-    await health_checker._perform_monitoring_check()
+    if _sharded(local):
+        await asyncio.gather(_fan_out(raw_request), health_checker._perform_monitoring_check())
+    else:
+        await health_checker._perform_monitoring_check()
     return {
         "message": "Check completed",
         "checked_devices": len(health_checker.get_monitored_devices()),
@@ -249,11 +923,20 @@ async def get_all_gateway_test_ips():
 
 
 @router.get("/gateway/test-ips/all/metrics")
-async def get_all_gateway_test_ip_metrics():
+async def get_all_gateway_test_ip_metrics(local: bool = LOCAL_QUERY):
     """
     Get all gateway test IP metrics (with status) from cache.
     Returns a dict mapping gateway_ip -> {test_ips: [...metrics...]}
     """
+    if _sharded(local):
+        results = await _gather_from_peers("GET", "/api/health/gateway/test-ips/all/metrics")
+        per_worker = {
+            worker_id: data for worker_id, (status, data) in results.items()
+            if status == 200 and isinstance(data, dict)
+        }
+        per_worker[shard_coordinator.worker_id] = await get_all_gateway_test_ip_metrics(local=True)
+        return _merge_by_owner(per_worker)
+    
     result = {}
     for gateway_ip in health_checker.get_all_gateway_test_ips().keys():
         metrics = health_checker.get_cached_test_ip_metrics(gateway_ip)
@@ -266,7 +949,12 @@ async def get_all_gateway_test_ip_metrics():
 
 
 @router.post("/gateway/{gateway_ip}/test-ips", response_model=GatewayTestIPConfig)
-async def set_gateway_test_ips(gateway_ip: str, request: SetGatewayTestIPsRequest):
+async def set_gateway_test_ips(
+    gateway_ip: str,
+    request: SetGatewayTestIPsRequest,
+    raw_request: Request,
+    local: bool = LOCAL_QUERY
+):
     """
     Set test IPs for a gateway device.
     These IPs will be checked periodically to test internet connectivity.
@@ -275,6 +963,8 @@ async def set_gateway_test_ips(gateway_ip: str, request: SetGatewayTestIPsReques
         raise HTTPException(status_code=400, detail="Gateway IP in path must match request body")
     
     config = health_checker.set_gateway_test_ips(gateway_ip, request.test_ips)
+    if _sharded(local):
+        await _fan_out(raw_request)
     return config
 
 
@@ -290,10 +980,12 @@ async def get_gateway_test_ips(gateway_ip: str):
 
 
 @router.delete("/gateway/{gateway_ip}/test-ips")
-async def remove_gateway_test_ips(gateway_ip: str):
+async def remove_gateway_test_ips(gateway_ip: str, raw_request: Request, local: bool = LOCAL_QUERY):
     """
     Remove all test IPs for a gateway device.
     """
+    if _sharded(local):
+        await _fan_out(raw_request)
     if health_checker.remove_gateway_test_ips(gateway_ip):
         return {"message": f"Removed test IPs for gateway {gateway_ip}"}
     raise HTTPException(status_code=404, detail="No test IPs configured for this gateway")
@@ -313,10 +1005,19 @@ async def check_gateway_test_ips(gateway_ip: str):
 
 
 @router.get("/gateway/{gateway_ip}/test-ips/cached", response_model=GatewayTestIPsResponse)
-async def get_cached_test_ip_metrics(gateway_ip: str):
+async def get_cached_test_ip_metrics(gateway_ip: str, local: bool = LOCAL_QUERY):
     """
     Get cached metrics for all test IPs of a gateway without performing a new check.
     """
+    shard = shard_coordinator
+    if _sharded(local) and not shard.owns(gateway_ip):
+        url = shard.peer_url(shard.owner(gateway_ip))
+        if url:
+            status, data = await peer_request(
+                health_checker.get_peer_client(), url, "GET", f"/api/health/gateway/{gateway_ip}/test-ips/cached"
+            )
+            if status == 200 and data:
+                return data
     return health_checker.get_cached_test_ip_metrics(gateway_ip)
 
 
@@ -327,7 +1028,8 @@ async def run_speed_test(gateway_ip: Optional[str] = None):
     """
     Run an ISP speed test.
     This is a manual operation that takes 30-60 seconds to complete.
-    Returns download/upload speeds in Mbps.
+    Returns download/upload speeds in Mbps. If a test for the same gateway
+    is already queued or running, this waits for that test instead.
     
     Args:
         gateway_ip: Optional gateway IP to associate this test with (for storage/retrieval)
@@ -344,6 +1046,75 @@ async def run_gateway_speed_test(gateway_ip: str):
     return await health_checker.run_speed_test(gateway_ip)
 
 
+@router.post("/speedtest/jobs", response_model=SpeedTestJob, status_code=202)
+async def start_speed_test_job(request: Optional[SpeedTestJobRequest] = None):
+    """
+    Start a speed test without waiting for it.
+    Returns the job for the gateway's test that is already queued or
+    running, if there is one. Poll the job or stream its events.
+    """
+    return health_checker.speed_tests.submit(request.gateway_ip if request else None)
+
+
+@router.get("/speedtest/jobs", response_model=List[SpeedTestJob])
+async def list_speed_test_jobs():
+    """Queued, running and recently finished speed test jobs, newest first"""
+    return health_checker.speed_tests.list_jobs()
+
+
+@router.get("/speedtest/jobs/{job_id}", response_model=SpeedTestJob)
+async def get_speed_test_job(job_id: str):
+    """Status, phase, progress and (once finished) result of a speed test job"""
+    job = health_checker.speed_tests.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Speed test job not found")
+    return job
+
+
+async def _speed_test_job_stream(job_id: str, queue: asyncio.Queue) -> AsyncIterator[str]:
+    jobs = health_checker.speed_tests
+    finished = (SpeedTestJobStatus.COMPLETED, SpeedTestJobStatus.FAILED)
+    try:
+        job = jobs.get(job_id)
+        if job is None:
+            # Pruned between subscribing and the stream starting
+            yield _sse("error", json.dumps({"detail": "Speed test job not found"}))
+            return
+        if job.status not in finished:
+            yield _sse("progress", job.model_dump_json())
+        while job.status not in finished:
+            try:
+                job = await asyncio.wait_for(queue.get(), CHANGE_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if job.status not in finished:
+                yield _sse("progress", job.model_dump_json())
+        yield _sse("complete", job.model_dump_json())
+    finally:
+        jobs.unsubscribe(job_id, queue)
+
+
+@router.get("/speedtest/jobs/{job_id}/events")
+async def stream_speed_test_job(job_id: str):
+    """
+    Server-Sent Events stream of a speed test job.
+    
+    A `progress` event carrying the job is sent on every phase change
+    (queued, server_selection, download, upload) and as progress advances.
+    The stream ends with a `complete` event holding the result, or with an
+    `error` event if the job was dropped before the stream started.
+    """
+    queue = health_checker.speed_tests.subscribe(job_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Speed test job not found")
+    return StreamingResponse(
+        _speed_test_job_stream(job_id, queue),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
 @router.get("/gateway/{gateway_ip}/speedtest", response_model=Optional[SpeedTestResult])
 async def get_gateway_speed_test(gateway_ip: str):
     """
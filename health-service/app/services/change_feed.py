@@ -0,0 +1,303 @@
+"""
+Device state change feed.
+
+Every health check is compared against the last state published for the
+device, and a compact event is emitted only when its status, reachability or
+latency bucket changes. Events carry a sequence number that increases
+monotonically within a feed epoch (a random ID chosen at startup), are kept in
+a bounded replay buffer and are fanned out to per-subscriber queues. A
+subscriber that falls too far behind is flagged for a resync instead of
+blocking the probe loop.
+
+ChangeJournal is the polling counterpart: it records which devices' cached
+metrics changed state (status, reachability, latency bucket or error) or were
+removed at which sequence number, so a poller can ask for everything that
+changed after its cursor. Checks that leave the state as it was are not
+recorded, except that every device is recorded again once per refresh
+period (HEALTH_CHANGE_JOURNAL_REFRESH, 60s) so a poller's copy of
+last_check, the 24h counters and the history is never older than that.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+from ..models import DeviceChangeEvent, DeviceMetrics
+
+logger = logging.getLogger(__name__)
+
+CHANGE_FEED_BUFFER_SIZE = int(os.environ.get("HEALTH_CHANGE_FEED_BUFFER", "10000"))
+CHANGE_FEED_QUEUE_SIZE = int(os.environ.get("HEALTH_CHANGE_FEED_QUEUE_SIZE", "1000"))
+CHANGE_JOURNAL_MAX_TOMBSTONES = int(os.environ.get("HEALTH_CHANGE_JOURNAL_TOMBSTONES", "10000"))
+CHANGE_JOURNAL_REFRESH_SECONDS = float(os.environ.get("HEALTH_CHANGE_JOURNAL_REFRESH", "60"))
+
+# Upper bounds (ms) of the latency buckets; anything slower falls in the last one
+LATENCY_BUCKET_BOUNDS_MS = (10, 50, 100, 200)
+
+
+def latency_bucket(latency_ms: Optional[float]) -> Optional[str]:
+    """Bucket label for a latency, e.g. "<10", "50-100" or ">=200"""
+    if latency_ms is None:
+        return None
+    lower = None
+    for upper in LATENCY_BUCKET_BOUNDS_MS:
+        if latency_ms < upper:
+            return f"<{upper}" if lower is None else f"{lower}-{upper}"
+        lower = upper
+    return f">={lower}"
+
+
+def journal_state(metrics: DeviceMetrics) -> Tuple:
+    """
+    The part of a device's metrics whose change is recorded in the
+    ChangeJournal: its state, plus the refresh period of its last check so
+    counters and history that change on every check are recorded periodically.
+    """
+    ping = metrics.ping
+    reachable = ping.success if ping else None
+    latency = ping.avg_latency_ms if ping and ping.success else None
+    checked_at = metrics.last_check.replace(tzinfo=timezone.utc).timestamp()
+    refresh_period = int(checked_at // max(1.0, CHANGE_JOURNAL_REFRESH_SECONDS))
+    return metrics.status, reachable, latency_bucket(latency), metrics.error_message, refresh_period
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    """Split an "epoch:seq" cursor; raises ValueError if malformed"""
+    epoch, _, seq = cursor.partition(":")
+    if not epoch or not seq:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return epoch, int(seq)
+
+
+class ChangeSubscription:
+    """Queue of events for one subscriber"""
+
+    def __init__(self, max_size: int = CHANGE_FEED_QUEUE_SIZE):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def put(self, event: DeviceChangeEvent) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self) -> Optional[DeviceChangeEvent]:
+        """Next event, or None if events were dropped and the subscriber must resync"""
+        if self.overflowed:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self.overflowed = False
+            return None
+        return await self._queue.get()
+
+
+class ChangeFeed:
+    """Sequence-numbered stream of device state changes with a replay buffer"""
+
+    def __init__(
+        self,
+        buffer_size: int = CHANGE_FEED_BUFFER_SIZE,
+        queue_size: int = CHANGE_FEED_QUEUE_SIZE,
+    ):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._queue_size = queue_size
+        self._events: Deque[DeviceChangeEvent] = deque(maxlen=max(1, buffer_size))
+        self._state: Dict[str, DeviceChangeEvent] = {}  # IP -> latest event
+        self._subscribers: Set[ChangeSubscription] = set()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def cursor(self) -> str:
+        return self.format_cursor(self._seq)
+
+    def format_cursor(self, seq: int) -> str:
+        return f"{self.epoch}:{seq}"
+
+    def get_stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self._seq,
+            "devices": len(self._state),
+            "buffered_events": len(self._events),
+            "subscribers": len(self._subscribers),
+        }
+
+    def observe(self, metrics: DeviceMetrics) -> Optional[DeviceChangeEvent]:
+        """Publish an event if the device's status, reachability or latency bucket changed"""
+        ping = metrics.ping
+        reachable = ping.success if ping else None
+        latency = ping.avg_latency_ms if ping and ping.success else None
+        bucket = latency_bucket(latency)
+
+        previous = self._state.get(metrics.ip)
+        if (
+            previous is not None
+            and previous.status == metrics.status
+            and previous.reachable == reachable
+            and previous.latency_bucket == bucket
+        ):
+            return None
+
+        return self._publish(DeviceChangeEvent(
+            seq=self._seq + 1,
+            ip=metrics.ip,
+            status=metrics.status,
+            reachable=reachable,
+            latency_bucket=bucket,
+            latency_ms=round(latency, 2) if latency is not None else None,
+            timestamp=metrics.last_check,
+        ))
+
+    def remove(self, ip: str) -> Optional[DeviceChangeEvent]:
+        """Publish a removal for a device that has state"""
+        if ip not in self._state:
+            return None
+        return self._publish(DeviceChangeEvent(
+            seq=self._seq + 1,
+            ip=ip,
+            type="removed",
+            timestamp=datetime.utcnow(),
+        ))
+
+    def remove_all(self) -> None:
+        for ip in list(self._state):
+            self.remove(ip)
+
+    def _publish(self, event: DeviceChangeEvent) -> DeviceChangeEvent:
+        self._seq = event.seq
+        self._events.append(event)
+        if event.type == "removed":
+            self._state.pop(event.ip, None)
+        else:
+            self._state[event.ip] = event
+        for subscription in self._subscribers:
+            subscription.put(event)
+        return event
+
+    def snapshot(self) -> List[DeviceChangeEvent]:
+        """Latest event for every device, i.e. the state a mirror should hold at `seq`"""
+        return list(self._state.values())
+
+    def events_since(self, cursor: Optional[str]) -> Optional[List[DeviceChangeEvent]]:
+        """
+        Events after `cursor`, or None if the cursor belongs to another epoch,
+        is malformed or is older than the replay buffer (the caller must resync
+        from a snapshot).
+        """
+        if not cursor:
+            return None
+        try:
+            epoch, seq = parse_cursor(cursor)
+        except ValueError:
+            return None
+        if epoch != self.epoch or seq > self._seq:
+            return None
+        if seq == self._seq:
+            return []
+        if not self._events or self._events[0].seq > seq + 1:
+            return None
+        return [event for event in self._events if event.seq > seq]
+
+    def subscribe(self) -> ChangeSubscription:
+        subscription = ChangeSubscription(self._queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ChangeSubscription) -> None:
+        self._subscribers.discard(subscription)
+
+
+class ChangeJournal:
+    """
+    Per-device record of the sequence number of the last metrics change,
+    plus tombstones for removed devices. Devices are kept in change order so
+    a delta only walks the entries newer than the cursor.
+    """
+
+    def __init__(self, max_tombstones: int = CHANGE_JOURNAL_MAX_TOMBSTONES):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._max_tombstones = max(1, max_tombstones)
+        self._changed: "OrderedDict[str, int]" = OrderedDict()  # IP -> seq, oldest change first
+        self._states: Dict[str, Hashable] = {}  # IP -> state at its last recorded change
+        self._removed: "OrderedDict[str, int]" = OrderedDict()  # IP -> seq, oldest removal first
+        self._floor = 0  # Cursors before this may have missed pruned tombstones
+
+    @property
+    def cursor(self) -> str:
+        return f"{self.epoch}:{self._seq}"
+
+    def get_stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self._seq,
+            "devices": len(self._changed),
+            "tombstones": len(self._removed),
+        }
+
+    def record(self, ip: str, state: Optional[Hashable] = None) -> None:
+        """
+        Note that the metrics for `ip` were replaced. With a `state` (see
+        journal_state), nothing is recorded if it equals the last one.
+        """
+        if state is not None:
+            if ip in self._changed and self._states.get(ip) == state:
+                return
+            self._states[ip] = state
+        else:
+            self._states.pop(ip, None)
+        self._seq += 1
+        self._changed[ip] = self._seq
+        self._changed.move_to_end(ip)
+        self._removed.pop(ip, None)
+
+    def remove(self, ip: str) -> None:
+        """Note that `ip` no longer has metrics"""
+        if self._changed.pop(ip, None) is None:
+            return
+        self._states.pop(ip, None)
+        self._seq += 1
+        self._removed[ip] = self._seq
+        while len(self._removed) > self._max_tombstones:
+            _, seq = self._removed.popitem(last=False)
+            self._floor = seq
+
+    def changes_since(self, cursor: Optional[str]) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        (changed IPs, removed IPs) after `cursor`, or None if the cursor can't
+        be served incrementally and the caller needs every device.
+        """
+        if not cursor:
+            return None
+        try:
+            epoch, seq = parse_cursor(cursor)
+        except ValueError:
+            return None
+        if epoch != self.epoch or seq > self._seq or seq < self._floor:
+            return None
+
+        changed = []
+        for ip in reversed(self._changed):
+            if self._changed[ip] <= seq:
+                break
+            changed.append(ip)
+        changed.reverse()
+
+        removed = []
+        for ip in reversed(self._removed):
+            if self._removed[ip] <= seq:
+                break
+            removed.append(ip)
+        removed.reverse()
+        return changed, removed
@@ -0,0 +1,116 @@
+"""
+Per-network monitored device registry.
+
+Each network's device set is tracked separately, so registering one network
+never disturbs another, and every mutation returns the diff it caused so
+downstream syncs only carry what changed. An IP present in several networks
+(overlapping private ranges across tenants) is probed once; its results are
+attributed to the network that registered it most recently.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from ..models import NetworkDevicesDiff
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """Network ID -> device IPs, with a derived IP -> owning network map"""
+
+    def __init__(self):
+        self._networks: Dict[str, Set[str]] = {}
+        self._memberships: Dict[str, List[str]] = {}  # IP -> network IDs, most recent last
+        # IP -> owning network ID; shared with HealthChecker as its monitored device map
+        self.owners: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def network_ids(self) -> List[str]:
+        return list(self._networks)
+
+    def counts(self) -> Dict[str, int]:
+        return {network_id: len(ips) for network_id, ips in self._networks.items()}
+
+    def devices(self, network_id: str) -> List[str]:
+        return sorted(self._networks.get(network_id, ()))
+
+    def networks_for(self, ip: str) -> List[str]:
+        return list(self._memberships.get(ip, ()))
+
+    def _link(self, network_id: str, ip: str) -> None:
+        networks = self._memberships.setdefault(ip, [])
+        networks.append(network_id)
+        self.owners[ip] = network_id
+
+    def _unlink(self, network_id: str, ip: str) -> None:
+        networks = self._memberships.get(ip)
+        if not networks:
+            return
+        networks.remove(network_id)
+        if networks:
+            self.owners[ip] = networks[-1]
+        else:
+            del self._memberships[ip]
+            del self.owners[ip]
+
+    def _diff(self, network_id: str, added: Iterable[str], removed: Iterable[str]) -> NetworkDevicesDiff:
+        return NetworkDevicesDiff(
+            network_id=network_id,
+            added=sorted(added),
+            removed=sorted(removed),
+            total=len(self._networks.get(network_id, ())),
+        )
+
+    def add(self, network_id: str, ips: Iterable[str]) -> NetworkDevicesDiff:
+        """Add devices to a network; already registered ones are ignored"""
+        members = self._networks.setdefault(network_id, set())
+        added = set(ips) - members
+        for ip in added:
+            members.add(ip)
+            self._link(network_id, ip)
+        return self._diff(network_id, added, ())
+
+    def remove(self, network_id: str, ips: Iterable[str]) -> NetworkDevicesDiff:
+        """Remove devices from a network; unknown ones are ignored"""
+        members = self._networks.get(network_id)
+        if members is None:
+            return self._diff(network_id, (), ())
+        removed = members & set(ips)
+        for ip in removed:
+            members.discard(ip)
+            self._unlink(network_id, ip)
+        if not members:
+            del self._networks[network_id]
+        return self._diff(network_id, (), removed)
+
+    def replace(self, network_id: str, ips: Iterable[str]) -> NetworkDevicesDiff:
+        """Make `ips` the network's device set, returning what was added and removed"""
+        wanted = set(ips)
+        current = self._networks.get(network_id, set())
+        removed = current - wanted
+        added = wanted - current
+        self.remove(network_id, removed)
+        self.add(network_id, added)
+        if not wanted:
+            self._networks.pop(network_id, None)
+        return self._diff(network_id, added, removed)
+
+    def remove_everywhere(self, ips: Iterable[str]) -> List[NetworkDevicesDiff]:
+        """Remove devices from every network they belong to"""
+        by_network: Dict[str, List[str]] = {}
+        for ip in ips:
+            for network_id in self._memberships.get(ip, ()):
+                by_network.setdefault(network_id, []).append(ip)
+        return [self.remove(network_id, network_ips) for network_id, network_ips in by_network.items()]
+
+    def clear(self, network_id: Optional[str] = None) -> List[NetworkDevicesDiff]:
+        """Drop one network's devices, or every network's"""
+        network_ids = [network_id] if network_id is not None else list(self._networks)
+        return [
+            self.replace(nid, ())
+            for nid in network_ids
+            if nid in self._networks
+        ]
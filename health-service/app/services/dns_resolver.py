@@ -0,0 +1,174 @@
+"""
+Caching reverse-DNS resolver.
+
+PTR and gethostbyaddr lookups are blocking calls, so they run side by side
+in worker threads behind a concurrency limit instead of on the event loop;
+the PTR query is bounded by the resolver lifetime and gethostbyaddr, which
+has no timeout of its own, by asyncio.wait_for. Results are cached in memory
+(failures for a shorter time) and concurrent lookups for the same IP share a
+single in-flight resolution. Cache hits are marked `cached` with a 0 ms
+resolution time.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..models import DnsResult
+
+logger = logging.getLogger(__name__)
+
+DNS_CACHE_TTL = float(os.environ.get("HEALTH_DNS_CACHE_TTL", "3600"))
+DNS_NEGATIVE_TTL = float(os.environ.get("HEALTH_DNS_NEGATIVE_TTL", "300"))
+DNS_MAX_CONCURRENCY = int(os.environ.get("HEALTH_DNS_CONCURRENCY", "16"))
+DNS_TIMEOUT = float(os.environ.get("HEALTH_DNS_TIMEOUT", "2.0"))
+DNS_CACHE_MAX_ENTRIES = 10000
+
+
+def lookup_reverse_dns(ip: str, timeout: float = DNS_TIMEOUT) -> DnsResult:
+    """Blocking PTR lookup, bounded by `timeout`"""
+    try:
+        import dns.resolver
+        import dns.reversename
+
+        start_time = time.time()
+
+        reverse_name = None
+        try:
+            addr = dns.reversename.from_address(ip)
+            answers = dns.resolver.resolve(addr, 'PTR', lifetime=timeout)
+            if answers:
+                reverse_name = str(answers[0]).rstrip('.')
+        except Exception:
+            pass
+
+        return DnsResult(
+            success=reverse_name is not None,
+            reverse_dns=reverse_name,
+            resolution_time_ms=(time.time() - start_time) * 1000
+        )
+    except Exception as e:
+        logger.debug(f"DNS check failed for {ip}: {e}")
+        return DnsResult(success=False)
+
+
+def lookup_hostname(ip: str) -> Optional[str]:
+    """Blocking gethostbyaddr (hosts file, mDNS, NSS), with no timeout of its own"""
+    try:
+        return socket.gethostbyaddr(ip)[0]
+    except Exception:
+        return None
+
+
+class ReverseDnsResolver:
+    """Async front end for reverse lookups with TTL/negative caching and request coalescing"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = DNS_CACHE_TTL,
+        negative_ttl_seconds: float = DNS_NEGATIVE_TTL,
+        max_concurrency: int = DNS_MAX_CONCURRENCY,
+        timeout: float = DNS_TIMEOUT,
+        max_entries: int = DNS_CACHE_MAX_ENTRIES,
+    ):
+        self._ttl = ttl_seconds
+        self._negative_ttl = negative_ttl_seconds
+        self._max_concurrency = max(1, max_concurrency)
+        self._timeout = timeout
+        self._max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[float, DnsResult]]" = OrderedDict()  # IP -> (expires_at, result)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hits = 0
+        self._misses = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "in_flight": len(self._in_flight),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def get_cached(self, ip: str) -> Optional[DnsResult]:
+        """Cached result for `ip` if it hasn't expired"""
+        entry = self._cache.get(ip)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._cache[ip]
+            return None
+        self._cache.move_to_end(ip)
+        return result
+
+    def _store(self, ip: str, result: DnsResult) -> None:
+        ttl = self._ttl if result.success else self._negative_ttl
+        if ttl <= 0:
+            return
+        self._cache[ip] = (time.monotonic() + ttl, result)
+        self._cache.move_to_end(ip)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._in_flight.clear()
+        return self._semaphore
+
+    async def resolve(self, ip: str) -> DnsResult:
+        """Resolve `ip`, serving from cache and joining any lookup already in flight"""
+        cached = self.get_cached(ip)
+        if cached is not None:
+            self._hits += 1
+            return cached.model_copy(update={"resolution_time_ms": 0.0, "cached": True})
+
+        semaphore = self._get_semaphore()
+        task = self._in_flight.get(ip)
+        if task is None:
+            self._misses += 1
+            task = asyncio.ensure_future(self._lookup(ip, semaphore))
+            self._in_flight[ip] = task
+            task.add_done_callback(lambda t, ip=ip: self._forget(ip, t))
+
+        # Shield so one caller being cancelled doesn't abort the lookup for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, ip: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(ip) is task:
+            del self._in_flight[ip]
+
+    async def _lookup(self, ip: str, semaphore: asyncio.Semaphore) -> DnsResult:
+        async with semaphore:
+            start = time.monotonic()
+            result, hostname = await asyncio.gather(
+                asyncio.to_thread(lookup_reverse_dns, ip, self._timeout),
+                self._lookup_hostname(ip),
+            )
+            elapsed_ms = (time.monotonic() - start) * 1000
+        update = {"resolution_time_ms": elapsed_ms}
+        if hostname is not None:
+            update.update(success=True, resolved_hostname=hostname)
+        result = result.model_copy(update=update)
+        self._store(ip, result)
+        return result
+
+    async def _lookup_hostname(self, ip: str) -> Optional[str]:
+        # A timed-out call keeps its worker thread until the OS gives up, but
+        # no longer holds the caller or a concurrency slot
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(lookup_hostname, ip), self._timeout)
+        except asyncio.TimeoutError:
+            logger.debug(f"gethostbyaddr timed out for {ip} after {self._timeout}s")
+            return None
@@ -1,30 +1,56 @@
 import asyncio
-import socket
 import time
 import json
 import os
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Set
-from collections import deque
+from typing import AsyncIterator, Optional, Dict, List, Set, Tuple
+from functools import partial
 import logging
 
+import httpx
+
 from ..models import (
     DeviceMetrics, 
     HealthStatus, 
     PingResult, 
     DnsResult, 
     PortCheckResult,
+    CachedMetricsDelta,
     CheckHistoryEntry,
+    HistoryBucket,
+    HistoryMode,
     MonitoringConfig,
     MonitoringStatus,
+    NetworkDevicesDiff,
     GatewayTestIP,
     GatewayTestIPConfig,
     GatewayTestIPMetrics,
     GatewayTestIPsResponse,
     SpeedTestResult,
 )
-from .notification_reporter import report_health_check
+from .notification_reporter import notification_reporter
+from .icmp_engine import IcmpEngine, IcmpUnavailableError, build_ping_result, combine_ping_results, is_ipv4_address
+from .probe_scheduler import ProbeScheduler, PRIORITY_GATEWAY, PRIORITY_FLAGGED, PRIORITY_NORMAL
+from .timing_wheel import TimingWheel
+from .dns_resolver import ReverseDnsResolver
+from .change_feed import ChangeFeed, ChangeJournal, journal_state
+from .device_registry import DeviceRegistry
+from .speed_test_jobs import ProgressReporter, SpeedTestJobManager
+from .probe_cache import SharedProbeCache
+from .neighbor_table import NeighborTable
+from .sharding import ShardCoordinator, peer_request, shard_coordinator
+from .port_scanner import COMMON_PORTS, PORT_SCAN_DEFAULT_SET, PortScanner, parse_port_spec
+from .history_store import BUCKET_SIZES, HistoryRing, from_epoch
+from .state_store import (
+    RECORD_DEVICE_HISTORY,
+    RECORD_DEVICE_METRICS,
+    RECORD_TEST_IP_HISTORY,
+    RECORD_TEST_IP_METRICS,
+    encode_snapshot,
+    read_snapshot,
+    write_snapshot,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,25 +58,40 @@ logger = logging.getLogger(__name__)
 DATA_DIR = Path(os.environ.get("HEALTH_DATA_DIR", "/app/data"))
 GATEWAY_TEST_IPS_FILE = DATA_DIR / "gateway_test_ips.json"
 SPEED_TEST_RESULTS_FILE = DATA_DIR / "speed_test_results.json"
+STATE_SNAPSHOT_FILE = DATA_DIR / "health_state.bin"
+
+# How often in-memory history and metrics are snapshotted for warm restarts
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("HEALTH_SNAPSHOT_INTERVAL", "60"))
+
+# Ping backend: "auto" uses the native ICMP engine when sockets are available
+# and falls back to the system ping command, "icmp" forces the engine (still
+# falling back if it cannot open a socket), "subprocess" always forks ping.
+PING_MODE = os.environ.get("HEALTH_PING_MODE", "auto").lower()
+
+# A fast-path echo only escalates when it is also this much slower than the baseline,
+# so sub-millisecond LAN latencies don't escalate on scheduling noise
+FAST_PATH_LATENCY_SLACK_MS = 5.0
 
-# Common ports to check for different services
-COMMON_PORTS = {
-    22: "SSH",
-    80: "HTTP", 
-    443: "HTTPS",
-    21: "FTP",
-    23: "Telnet",
-    25: "SMTP",
-    53: "DNS",
-    110: "POP3",
-    143: "IMAP",
-    3389: "RDP",
-    5900: "VNC",
-    8080: "HTTP-Alt",
-    8443: "HTTPS-Alt",
-    445: "SMB",
-    139: "NetBIOS",
-}
+# Probes from one streaming batch check queued at a time, as a multiple of the scheduler's concurrency
+STREAM_CHECK_WINDOW_FACTOR = 2
+
+# Resolution of the staggered scheduling timing wheel (seconds per tick)
+WHEEL_TICK_SECONDS = 1.0
+
+# Monitoring reuses an IP's ping for this fraction of the shortest probe
+# interval, so no consumer sees a result older than half its own cadence
+PROBE_SHARE_FRACTION = 0.5
+
+def _write_json_atomic(path: Path, data, **dump_kwargs) -> None:
+    """
+    Replace `path` with `data` as JSON. Shard workers share these files, so
+    each writes its own temp file and renames it over the target: readers see
+    a whole file and concurrent writers can't interleave.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_path, path)
 
 
 class HealthChecker:
@@ -58,29 +99,182 @@ class HealthChecker:
     
     def __init__(self):
         self._metrics_cache: Dict[str, DeviceMetrics] = {}
-        self._history: Dict[str, deque] = {}  # IP -> deque of (timestamp, success, latency)
-        self._history_max_size = 1440  # 24 hours at 1-minute intervals
+        self._history: Dict[str, HistoryRing] = {}  # IP -> ring of (timestamp, success, latency)
+        # Raw checks kept per target (about 4-12h at 10-30s intervals); 24h
+        # stats fall back to the ring's 5-minute buckets once it overflows
+        self._history_max_size = 1440
         
         # Background monitoring state
-        # Map device IP to network_id for multi-tenant support
-        self._monitored_devices: Dict[str, int] = {}  # IP -> network_id
+        # Devices are registered per network; the registry's IP -> network_id
+        # map is the set of monitored devices
+        self._registry = DeviceRegistry()
+        self._monitored_devices: Dict[str, str] = self._registry.owners
         self._monitoring_config = MonitoringConfig()
         self._monitoring_task: Optional[asyncio.Task] = None
         self._last_check_time: Optional[datetime] = None
         self._next_check_time: Optional[datetime] = None
         self._is_checking: bool = False
         
+        # Probe scheduling (shared by monitoring cycles and on-demand batches)
+        self._scheduler = ProbeScheduler(
+            max_concurrency=self._monitoring_config.max_concurrent_checks,
+            subnet_rate_per_second=self._monitoring_config.subnet_rate_limit_per_second,
+            subnet_prefix_length=self._monitoring_config.subnet_prefix_length,
+        )
+        self._last_cycle_duration: Optional[float] = None
+        self._overrun_count: int = 0
+        self._skipped_cycles: int = 0
+        
+        # Staggered scheduling state
+        self._device_roles: Dict[str, str] = {}  # IP -> role (e.g. "gateway")
+        self._wheel: Optional[TimingWheel] = None
+        self._wheel_dirty: bool = True  # Monitored set changed since the wheel was synced
+        self._staggered_in_flight: Set[tuple] = set()  # Wheel keys with a probe running
+        self._stable_streaks: Dict[str, int] = {}  # IP -> consecutive healthy checks
+        
         # Gateway test IP state
         self._gateway_test_ips: Dict[str, GatewayTestIPConfig] = {}  # gateway_ip -> config
         self._test_ip_metrics_cache: Dict[str, Dict[str, GatewayTestIPMetrics]] = {}  # gateway_ip -> {test_ip -> metrics}
-        self._test_ip_history: Dict[str, deque] = {}  # "gateway_ip:test_ip" -> deque of (timestamp, success, latency)
+        self._test_ip_history: Dict[str, HistoryRing] = {}  # "gateway_ip:test_ip" -> ring of (timestamp, success, latency)
         
         # Speed test results storage
         self._speed_test_results: Dict[str, SpeedTestResult] = {}  # gateway_ip -> last result
+        # One speed test per gateway at a time, on a dedicated executor
+        self._speed_tests = SpeedTestJobManager(self._execute_speed_test, self._store_speed_test_result)
+        
+        # Reverse DNS lookups (threaded, cached, deduplicated)
+        self._dns_resolver = ReverseDnsResolver()
+        
+        # Port scanning (global connect limit, per-device result cache)
+        self._port_scanner = PortScanner()
+        self._default_ports = parse_port_spec(PORT_SCAN_DEFAULT_SET)
+        
+        # Pings shared between monitoring consumers of the same IP
+        self._shared_probes = SharedProbeCache()
+        self._neighbors = NeighborTable()
+        self._last_active_probe: Dict[str, float] = {}  # IP -> monotonic time of the last echo
+        self._passive_checks = 0
+        
+        # On-demand checks: identical concurrent checks share one probe
+        self._check_in_flight: Dict[tuple, asyncio.Task] = {}  # (ip, include_ports, include_dns) -> task
+        self._check_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Native ICMP engine (None when forced to subprocess mode)
+        self._ping_mode = PING_MODE
+        self._icmp_engine: Optional[IcmpEngine] = IcmpEngine() if PING_MODE != "subprocess" else None
+        
+        # Push feed of status/reachability/latency bucket changes
+        self._change_feed = ChangeFeed()
+        # Which devices' cached metrics changed when, for cursor-based deltas
+        self._change_journal = ChangeJournal()
+        
+        # Sharding across workers (None unless HEALTH_SHARD_MODE is set); each
+        # worker keeps the full registry but only probes the targets it owns
+        self._shard: Optional[ShardCoordinator] = shard_coordinator
+        if self._shard:
+            self._shard.add_rebalance_listener(self._on_shard_rebalance)
+        self._peer_client: Optional[httpx.AsyncClient] = None
+        self._registry_bootstrapped: bool = False
+        
+        # Warm-restart snapshots (written behind the probe loop)
+        self._snapshot_task: Optional[asyncio.Task] = None
+        # Shard workers share DATA_DIR, so each keeps its own snapshot
+        self._snapshot_path: Path = (
+            DATA_DIR / f"health_state.{self._shard.worker_id}.bin" if self._shard else STATE_SNAPSHOT_FILE
+        )
+        self._state_version: int = 0  # Bumped on every recorded check
+        self._saved_state_version: int = 0
         
         # Load persisted data
         self._load_gateway_test_ips()
         self._load_speed_test_results()
+        self._load_state_snapshot()
+        for ip, metrics in self._metrics_cache.items():
+            self._change_feed.observe(metrics)
+            self._change_journal.record(ip, journal_state(metrics))
+    
+    @property
+    def change_feed(self) -> ChangeFeed:
+        return self._change_feed
+    
+    # ==================== Sharding ====================
+    
+    @property
+    def shard(self) -> Optional[ShardCoordinator]:
+        return self._shard
+    
+    def owns_target(self, ip: str) -> bool:
+        """Whether this worker probes `ip` (always true when sharding is off)"""
+        return self._shard is None or self._shard.owns(ip)
+    
+    def _on_shard_rebalance(self) -> None:
+        """Ring membership changed: resync the wheel and pull the registry if we just joined"""
+        self._wheel_dirty = True
+        if not self._registry_bootstrapped and self._shard.peers():
+            self._registry_bootstrapped = True
+            if not self._registry and not self._gateway_test_ips:
+                asyncio.ensure_future(self._bootstrap_registry())
+    
+    def get_peer_client(self) -> httpx.AsyncClient:
+        """HTTP client for peer workers, created on first use"""
+        if self._peer_client is None or self._peer_client.is_closed:
+            self._peer_client = httpx.AsyncClient()
+        return self._peer_client
+    
+    def export_registry(self) -> dict:
+        """Everything a joining worker needs to take over its share of targets"""
+        return {
+            "networks": {nid: self._registry.devices(nid) for nid in self._registry.network_ids()},
+            "roles": dict(self._device_roles),
+            "gateway_test_ips": {
+                gw: config.model_dump(mode="json") for gw, config in self._gateway_test_ips.items()
+            },
+        }
+    
+    def import_registry(self, data: dict) -> None:
+        """Adopt a registry exported by a peer worker"""
+        for network_id, ips in data.get("networks", {}).items():
+            self.replace_network_devices(network_id, ips)
+        self.set_device_roles(data.get("roles", {}))
+        for gw, config in data.get("gateway_test_ips", {}).items():
+            self._gateway_test_ips[gw] = GatewayTestIPConfig.model_validate(config)
+            self._test_ip_metrics_cache.setdefault(gw, {})
+        if data.get("gateway_test_ips"):
+            self._save_gateway_test_ips()
+        self._wheel_dirty = True
+    
+    async def _bootstrap_registry(self) -> None:
+        """Copy the registry from the first peer that answers"""
+        client = self.get_peer_client()
+        for worker_id, url in self._shard.peers().items():
+            status, data = await peer_request(client, url, "GET", "/api/health/shard/registry")
+            if status == 200 and isinstance(data, dict):
+                self.import_registry(data)
+                logger.info(f"Loaded {len(self._monitored_devices)} monitored devices from shard peer {worker_id}")
+                return
+        logger.warning("No shard peer returned a device registry")
+    
+    def get_shard_status(self) -> dict:
+        """Ring membership and this worker's share of the monitored targets"""
+        if self._shard is None:
+            return {"enabled": False}
+        status = self._shard.get_status()
+        status["owned_devices"] = sum(1 for ip in self._monitored_devices if self._shard.owns(ip))
+        status["monitored_devices"] = len(self._monitored_devices)
+        return status
+    
+    def start_sharding(self) -> None:
+        """Start renewing this worker's lease (no-op when sharding is off)"""
+        if self._shard:
+            self._shard.start()
+    
+    async def stop_sharding(self) -> None:
+        """Release this worker's lease so peers take over its targets"""
+        if self._shard:
+            await self._shard.stop()
+        if self._peer_client is not None:
+            await self._peer_client.aclose()
+            self._peer_client = None
     
     def _save_gateway_test_ips(self) -> None:
         """Save gateway test IP configurations to disk"""
@@ -97,9 +291,7 @@ class HealthChecker:
                     "enabled": config.enabled
                 }
             
-            # Write to file
-            with open(GATEWAY_TEST_IPS_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            _write_json_atomic(GATEWAY_TEST_IPS_FILE, data, indent=2)
             
             logger.debug(f"Saved {len(data)} gateway test IP configurations to {GATEWAY_TEST_IPS_FILE}")
         except Exception as e:
@@ -140,8 +332,7 @@ class HealthChecker:
             for gateway_ip, result in self._speed_test_results.items():
                 data[gateway_ip] = result.model_dump(mode="json")
             
-            with open(SPEED_TEST_RESULTS_FILE, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
+            _write_json_atomic(SPEED_TEST_RESULTS_FILE, data, indent=2, default=str)
             
             logger.debug(f"Saved {len(data)} speed test results to {SPEED_TEST_RESULTS_FILE}")
         except Exception as e:
@@ -167,6 +358,119 @@ class HealthChecker:
         except Exception as e:
             logger.error(f"Failed to load speed test results: {e}")
     
+    def _collect_state_records(self) -> List[tuple]:
+        """
+        Capture the state to snapshot. Only detached ring copies (array
+        memcpys) are taken on the event loop; they are dumped off-loop with
+        the cached metrics, which are replaced rather than mutated, so their
+        JSON is encoded off-loop too.
+        """
+        records: List[tuple] = []
+        for ip, ring in self._history.items():
+            records.append((RECORD_DEVICE_HISTORY, ip, ring.copy()))
+        for key, ring in self._test_ip_history.items():
+            records.append((RECORD_TEST_IP_HISTORY, key, ring.copy()))
+        for ip, metrics in self._metrics_cache.items():
+            records.append((RECORD_DEVICE_METRICS, ip, metrics))
+        for gateway_ip, test_metrics in self._test_ip_metrics_cache.items():
+            records.append((RECORD_TEST_IP_METRICS, gateway_ip, dict(test_metrics)))
+        return records
+    
+    @staticmethod
+    def _encode_state_records(records: List[tuple]) -> bytes:
+        """Encode collected records into the snapshot format"""
+        def payloads():
+            for record_type, key, payload in records:
+                if record_type in (RECORD_DEVICE_HISTORY, RECORD_TEST_IP_HISTORY):
+                    payload = payload.dump()
+                elif record_type == RECORD_DEVICE_METRICS:
+                    payload = payload.model_dump_json().encode()
+                elif record_type == RECORD_TEST_IP_METRICS:
+                    payload = json.dumps(
+                        {tip: m.model_dump(mode="json") for tip, m in payload.items()}
+                    ).encode()
+                yield record_type, key, payload
+        return encode_snapshot(payloads())
+    
+    async def save_state_snapshot(self) -> bool:
+        """
+        Write a snapshot of history and cached metrics to the snapshot file.
+        Encoding and disk I/O run in a worker thread. Returns False when
+        nothing changed since the last snapshot.
+        """
+        version = self._state_version
+        if version == self._saved_state_version:
+            return False
+        records = self._collect_state_records()
+        path = self._snapshot_path
+        
+        def write():
+            write_snapshot(path, self._encode_state_records(records))
+        
+        await asyncio.to_thread(write)
+        self._saved_state_version = version
+        logger.debug(f"Saved health state snapshot ({len(records)} records) to {path}")
+        return True
+    
+    def _load_state_snapshot(self) -> None:
+        """Restore history and cached metrics from the last snapshot"""
+        try:
+            snapshot = read_snapshot(self._snapshot_path)
+            if snapshot is None:
+                logger.debug(f"No health state snapshot found at {self._snapshot_path}")
+                return
+            
+            written_at, records = snapshot
+            for record_type, key, payload in records:
+                if record_type == RECORD_DEVICE_HISTORY:
+                    self._history[key] = HistoryRing.load(payload)
+                elif record_type == RECORD_TEST_IP_HISTORY:
+                    self._test_ip_history[key] = HistoryRing.load(payload)
+                elif record_type == RECORD_DEVICE_METRICS:
+                    self._metrics_cache[key] = DeviceMetrics.model_validate_json(payload)
+                elif record_type == RECORD_TEST_IP_METRICS:
+                    self._test_ip_metrics_cache[key] = {
+                        tip: GatewayTestIPMetrics.model_validate(m) for tip, m in json.loads(payload).items()
+                    }
+            
+            logger.info(
+                f"Restored health state for {len(self._history)} devices from {self._snapshot_path} "
+                f"(snapshot age {time.time() - written_at:.0f}s)"
+            )
+        except Exception as e:
+            logger.error(f"Failed to load health state snapshot: {e}")
+            self._history.clear()
+            self._test_ip_history.clear()
+            self._metrics_cache.clear()
+            self._test_ip_metrics_cache.clear()
+    
+    async def _snapshot_loop(self) -> None:
+        """Periodically write state snapshots until cancelled"""
+        while True:
+            try:
+                await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+                await self.save_state_snapshot()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Failed to save health state snapshot: {e}")
+    
+    def start_state_snapshots(self) -> None:
+        """Start the write-behind snapshot task"""
+        if self._snapshot_task and not self._snapshot_task.done():
+            return
+        self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+    
+    async def stop_state_snapshots(self) -> None:
+        """Stop the snapshot task and write a final snapshot"""
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+        try:
+            await self.save_state_snapshot()
+        except Exception as e:
+            logger.error(f"Failed to save health state snapshot: {e}")
+    
     def get_last_speed_test(self, gateway_ip: str) -> Optional[SpeedTestResult]:
         """Get the last speed test result for a gateway"""
         return self._speed_test_results.get(gateway_ip)
@@ -175,55 +479,177 @@ class HealthChecker:
         """Get all stored speed test results"""
         return self._speed_test_results.copy()
     
+    def _record_history(self, store: Dict[str, HistoryRing], key: str, success: bool, latency_ms: Optional[float]):
+        """Append a check result to the ring for `key`, creating it on first use"""
+        ring = store.get(key)
+        if ring is None:
+            ring = store[key] = HistoryRing(self._history_max_size)
+        ring.append(time.time(), success, latency_ms)
+        self._state_version += 1
+    
+    def _history_stats(self, ring: Optional[HistoryRing]) -> tuple[Optional[float], Optional[float], int, int]:
+        """24-hour statistics from a ring's running totals"""
+        if ring is None:
+            return None, None, 0, 0
+        return ring.stats(time.time())
+    
+    def _history_entries(self, ring: Optional[HistoryRing], hours: int) -> List[CheckHistoryEntry]:
+        """Materialize ring entries newer than `hours` as CheckHistoryEntry objects"""
+        if ring is None or len(ring) == 0:
+            return []
+        since = time.time() - hours * 3600
+        return [
+            CheckHistoryEntry(timestamp=from_epoch(ts), success=success, latency_ms=latency)
+            for ts, success, latency in ring.entries(since)
+        ]
+    
+    def _history_buckets(self, ring: Optional[HistoryRing], bucket: str) -> List[HistoryBucket]:
+        """Downsampled timeline from a ring's precomputed 5 minute aggregates"""
+        if ring is None:
+            return []
+        return [
+            HistoryBucket(
+                timestamp=from_epoch(start),
+                checks=checks,
+                passed=passed,
+                uptime_percent=(passed / checks) * 100,
+                avg_latency_ms=latency,
+            )
+            for start, checks, passed, latency in ring.buckets(time.time(), BUCKET_SIZES[bucket])
+        ]
+    
     def _record_check(self, ip: str, success: bool, latency_ms: Optional[float]):
         """Record a health check result for historical tracking"""
-        if ip not in self._history:
-            self._history[ip] = deque(maxlen=self._history_max_size)
-        self._history[ip].append((datetime.utcnow(), success, latency_ms))
+        self._record_history(self._history, ip, success, latency_ms)
     
     def _calculate_historical_stats(self, ip: str) -> tuple[Optional[float], Optional[float], int, int]:
         """Calculate 24-hour historical statistics"""
-        if ip not in self._history or len(self._history[ip]) == 0:
-            return None, None, 0, 0
-        
-        cutoff = datetime.utcnow() - timedelta(hours=24)
-        recent = [(ts, success, lat) for ts, success, lat in self._history[ip] if ts > cutoff]
-        
-        if not recent:
-            return None, None, 0, 0
-        
-        passed = sum(1 for _, s, _ in recent if s)
-        failed = sum(1 for _, s, _ in recent if not s)
-        
-        latencies = [lat for _, _, lat in recent if lat is not None]
-        avg_latency = sum(latencies) / len(latencies) if latencies else None
-        
-        uptime_percent = (passed / len(recent)) * 100 if recent else None
-        
-        return uptime_percent, avg_latency, passed, failed
+        return self._history_stats(self._history.get(ip))
     
     def _get_check_history(self, ip: str, hours: int = 24) -> List[CheckHistoryEntry]:
         """Get check history for timeline display"""
-        if ip not in self._history or len(self._history[ip]) == 0:
-            return []
-        
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
-        history = []
-        
-        for ts, success, latency in self._history[ip]:
-            if ts > cutoff:
-                history.append(CheckHistoryEntry(
-                    timestamp=ts,
-                    success=success,
-                    latency_ms=latency
-                ))
-        
-        return history
+        return self._history_entries(self._history.get(ip), hours)
     
     async def ping_host(self, ip: str, count: int = 3, timeout: float = 2.0) -> PingResult:
         """
         Ping a host and return results.
-        Uses subprocess to run system ping for reliability.
+        Uses the native ICMP engine when available, otherwise the system ping command.
+        """
+        engine = self._icmp_engine
+        if engine is not None and is_ipv4_address(ip) and engine.is_available():
+            try:
+                return await engine.ping(ip, count=count, timeout=timeout)
+            except IcmpUnavailableError as e:
+                logger.warning(f"ICMP engine failed, falling back to ping subprocess: {e}")
+                self._icmp_engine = None
+            except Exception as e:
+                logger.error(f"Ping failed for {ip}: {e}")
+                return PingResult(success=False, packet_loss_percent=100.0)
+        
+        return await self._ping_subprocess(ip, count=count, timeout=timeout)
+    
+    def _probe_share_window(self) -> float:
+        """How long a monitoring ping is reused: a fraction of the shortest probe interval"""
+        config = self._monitoring_config
+        intervals = [config.check_interval_seconds]
+        if config.scheduling_mode == "staggered" and config.adaptive_intervals:
+            intervals += [config.failing_interval_seconds, config.critical_interval_seconds]
+        return max(0.0, min(intervals) * PROBE_SHARE_FRACTION)
+    
+    def _test_ip_share_window(self) -> float:
+        """
+        How long a test IP's monitoring ping is reused. Staggered scheduling
+        spreads gateways over a whole cycle, so a test IP shared by several
+        gateways is reused for just under a cycle (one wheel tick of slack)
+        and pinged once per cycle rather than once per gateway.
+        """
+        window = self._probe_share_window()
+        config = self._monitoring_config
+        if config.scheduling_mode == "staggered":
+            window = max(window, config.check_interval_seconds - WHEEL_TICK_SECONDS)
+        return window
+    
+    async def _probe(self, ip: str, shared: bool, share_window: Optional[float] = None) -> PingResult:
+        """
+        Ping `ip`. Shared (monitoring) probes may be answered by the neighbor
+        table, or reuse a recent or in-flight ping of the same IP within
+        `share_window` (default: _probe_share_window()).
+        """
+        if shared and self._monitoring_config.passive_liveness:
+            passive = self._passive_ping(ip)
+            if passive is not None:
+                return passive
+        if shared and self._monitoring_config.dedupe_probes:
+            if share_window is None:
+                share_window = self._probe_share_window()
+            result = await self._shared_probes.probe(ip, self._monitoring_ping, share_window)
+        elif shared:
+            result = await self._monitoring_ping(ip)
+        else:
+            result = await self.ping_host(ip)
+        self._last_active_probe[ip] = time.monotonic()
+        return result
+    
+    def _fast_path_enabled(self, ip: str) -> bool:
+        config = self._monitoring_config
+        network_id = self._monitored_devices.get(ip)
+        if network_id is not None and network_id in config.fast_path_networks:
+            return config.fast_path_networks[network_id]
+        return config.fast_path
+    
+    async def _monitoring_ping(self, ip: str) -> PingResult:
+        """
+        Background ping. Stable healthy devices on fast-path networks get a
+        single echo; a lost echo, or one well above the device's 24h average,
+        escalates to the full burst so loss and jitter are still measured.
+        """
+        config = self._monitoring_config
+        cached = self._metrics_cache.get(ip)
+        history = self._history.get(ip)
+        if (
+            not self._fast_path_enabled(ip)
+            or cached is None
+            or cached.status != HealthStatus.HEALTHY
+            or history is None
+            or history.success_streak(config.fast_path_stable_checks) < config.fast_path_stable_checks
+        ):
+            return await self.ping_host(ip)
+        
+        first = await self.ping_host(ip, count=1, timeout=config.fast_path_timeout_seconds)
+        baseline = cached.avg_latency_24h_ms
+        if first.success and (
+            baseline is None
+            or first.avg_latency_ms <= baseline * config.fast_path_latency_factor + FAST_PATH_LATENCY_SLACK_MS
+        ):
+            return first.model_copy(update={"fast_path": True, "probes_sent": 1})
+        
+        burst = await self.ping_host(ip)
+        combined = combine_ping_results([(first, 1), (burst, burst.probes_sent or 3)])
+        return combined.model_copy(update={"fast_path": True, "escalated": True})
+    
+    def _passive_ping(self, ip: str) -> Optional[PingResult]:
+        """
+        Healthy result for `ip` without sending an echo, if the kernel confirmed
+        traffic with it recently. Only devices whose last check was healthy and
+        that were pinged within the passive probe interval qualify, so unknown,
+        stale and off-link targets (which have no neighbor entry) are pinged.
+        """
+        config = self._monitoring_config
+        cached = self._metrics_cache.get(ip)
+        if cached is None or cached.status != HealthStatus.HEALTHY or cached.ping is None:
+            return None
+        last_active = self._last_active_probe.get(ip)
+        if last_active is None or time.monotonic() - last_active >= config.passive_probe_interval_seconds:
+            return None
+        if not self._neighbors.is_alive(ip, config.passive_max_age_seconds):
+            return None
+        self._passive_checks += 1
+        return cached.ping.model_copy(update={"source": "neighbor"})
+    
+    async def _ping_subprocess(self, ip: str, count: int = 3, timeout: float = 2.0) -> PingResult:
+        """
+        Ping a host by running the system ping command.
+        Fallback for hosts without ICMP socket support and for non-IPv4 targets.
         """
         try:
             # Use system ping command for reliability
@@ -260,33 +686,7 @@ class HealthChecker:
                 transmitted = int(stats_match.group(1))
                 received = int(stats_match.group(2))
             
-            if latencies:
-                min_lat = min(latencies)
-                max_lat = max(latencies)
-                avg_lat = sum(latencies) / len(latencies)
-                
-                # Calculate jitter (variance in latency)
-                if len(latencies) > 1:
-                    jitter = sum(abs(latencies[i] - latencies[i-1]) for i in range(1, len(latencies))) / (len(latencies) - 1)
-                else:
-                    jitter = 0.0
-                
-                packet_loss = ((transmitted - received) / transmitted) * 100 if transmitted > 0 else 100
-                
-                return PingResult(
-                    success=received > 0,
-                    latency_ms=avg_lat,
-                    packet_loss_percent=packet_loss,
-                    min_latency_ms=min_lat,
-                    max_latency_ms=max_lat,
-                    avg_latency_ms=avg_lat,
-                    jitter_ms=jitter
-                )
-            else:
-                return PingResult(
-                    success=False,
-                    packet_loss_percent=100.0
-                )
+            return build_ping_result(latencies, transmitted=transmitted, received=received)
                 
         except asyncio.TimeoutError:
             return PingResult(success=False, packet_loss_percent=100.0)
@@ -295,41 +695,11 @@ class HealthChecker:
             return PingResult(success=False, packet_loss_percent=100.0)
     
     async def check_dns(self, ip: str) -> DnsResult:
-        """Perform DNS resolution and reverse DNS lookup"""
-        try:
-            import dns.resolver
-            import dns.reversename
-            
-            start_time = time.time()
-            
-            # Reverse DNS lookup
-            reverse_name = None
-            try:
-                addr = dns.reversename.from_address(ip)
-                answers = dns.resolver.resolve(addr, 'PTR')
-                if answers:
-                    reverse_name = str(answers[0]).rstrip('.')
-            except Exception:
-                pass
-            
-            resolution_time = (time.time() - start_time) * 1000
-            
-            # Also try socket reverse lookup as fallback
-            resolved_hostname = None
-            try:
-                resolved_hostname = socket.gethostbyaddr(ip)[0]
-            except Exception:
-                pass
-            
-            return DnsResult(
-                success=reverse_name is not None or resolved_hostname is not None,
-                resolved_hostname=resolved_hostname,
-                reverse_dns=reverse_name,
-                resolution_time_ms=resolution_time
-            )
-        except Exception as e:
-            logger.debug(f"DNS check failed for {ip}: {e}")
-            return DnsResult(success=False)
+        """
+        Perform DNS resolution and reverse DNS lookup.
+        Lookups run off the event loop and are cached (see ReverseDnsResolver).
+        """
+        return await self._dns_resolver.resolve(ip)
     
     async def check_port(self, ip: str, port: int, timeout: float = 2.0) -> PortCheckResult:
         """Check if a specific port is open"""
@@ -365,25 +735,46 @@ class HealthChecker:
                 service=COMMON_PORTS.get(port)
             )
     
+    async def scan_ports(
+        self,
+        ip: str,
+        ports: Optional[List[int]] = None,
+        use_cache: bool = True,
+        rtt_ms: Optional[float] = None
+    ) -> List[PortCheckResult]:
+        """
+        Scan ports on a device (the default port set if `ports` is None) and
+        return the open ones. Connect timeouts adapt to the device's RTT,
+        taken from its last ping when not given.
+        """
+        if rtt_ms is None:
+            cached = self._metrics_cache.get(ip)
+            if cached and cached.ping:
+                rtt_ms = cached.ping.avg_latency_ms
+        return await self._port_scanner.scan(
+            ip, ports or self._default_ports, rtt_ms=rtt_ms, use_cache=use_cache
+        )
+    
     async def scan_common_ports(self, ip: str) -> List[PortCheckResult]:
-        """Scan common ports on a device"""
-        # Only scan a subset of common ports to keep it fast
-        ports_to_scan = [22, 80, 443, 21, 23, 53, 3389, 445, 8080]
-        
-        tasks = [self.check_port(ip, port) for port in ports_to_scan]
-        results = await asyncio.gather(*tasks)
-        
-        # Only return open ports
-        return [r for r in results if r.open]
+        """Scan the default port set on a device"""
+        return await self.scan_ports(ip)
     
     async def check_device_health(
         self, 
         ip: str, 
         include_ports: bool = False,
-        include_dns: bool = True
+        include_dns: bool = True,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m",
+        shared_probe: bool = False
     ) -> DeviceMetrics:
         """
         Perform a comprehensive health check on a device.
+        
+        The cached metrics never embed the check history; it is projected from
+        the history ring according to `history` (see _with_history), so
+        background checks don't rebuild it every time. With `shared_probe`
+        (monitoring), the ping may be shared with other consumers of the IP.
         """
         now = datetime.utcnow()
         
@@ -391,10 +782,11 @@ class HealthChecker:
         cached = self._metrics_cache.get(ip)
         
         # Perform ping check
-        ping_result = await self.ping_host(ip)
+        ping_result = await self._probe(ip, shared_probe)
         
-        # Record for historical tracking
-        self._record_check(ip, ping_result.success, ping_result.avg_latency_ms)
+        # Record for historical tracking; passive results carry no new latency sample
+        measured_latency = ping_result.avg_latency_ms if ping_result.source == "icmp" else None
+        self._record_check(ip, ping_result.success, measured_latency)
         
         # Calculate historical stats
         uptime_24h, avg_lat_24h, passed_24h, failed_24h = self._calculate_historical_stats(ip)
@@ -421,10 +813,7 @@ class HealthChecker:
         # Port scan (only if requested - can be slow)
         open_ports = []
         if include_ports:
-            open_ports = await self.scan_common_ports(ip)
-        
-        # Get check history for timeline
-        check_history = self._get_check_history(ip)
+            open_ports = await self.scan_ports(ip, rtt_ms=ping_result.avg_latency_ms)
         
         # Build metrics object
         metrics = DeviceMetrics(
@@ -438,69 +827,286 @@ class HealthChecker:
             avg_latency_24h_ms=avg_lat_24h,
             checks_passed_24h=passed_24h,
             checks_failed_24h=failed_24h,
-            check_history=check_history,
             last_seen_online=now if ping_result.success else (cached.last_seen_online if cached else None),
             consecutive_failures=consecutive_failures,
         )
         
-        # Cache the results
+        # Cache the results and publish any state change
         self._metrics_cache[ip] = metrics
+        self._change_journal.record(ip, journal_state(metrics))
+        self._change_feed.observe(metrics)
         
-        # Report to notification service (async, fire-and-forget to not slow down checks)
+        # Queue for batched delivery to the notification service
         # Get network_id if device is being monitored
         network_id = self._monitored_devices.get(ip)
-        asyncio.create_task(report_health_check(
+        notification_reporter.enqueue(
             device_ip=ip,
             success=ping_result.success,
             network_id=network_id,
             latency_ms=ping_result.avg_latency_ms,
             packet_loss=ping_result.packet_loss_percent / 100.0 if ping_result.packet_loss_percent else None,
             device_name=dns_result.resolved_hostname if dns_result and dns_result.resolved_hostname else None,
-        ))
+        )
+        
+        return self._with_history(metrics, history, history_bucket)
+    
+    @staticmethod
+    def metrics_age_seconds(metrics: DeviceMetrics) -> float:
+        """Seconds since the metrics were measured"""
+        return max(0.0, (datetime.utcnow() - metrics.last_check).total_seconds())
+    
+    def _fresh_cached(self, ip: str, include_ports: bool, include_dns: bool, max_age_seconds: float) -> Optional[DeviceMetrics]:
+        """
+        Cached metrics for `ip` if they are at most `max_age_seconds` old and
+        carry what was asked for. Port results aren't part of the device cache
+        (monitoring never scans), so port checks always go to the port scanner.
+        """
+        cached = self._metrics_cache.get(ip)
+        if cached is None or include_ports or self.metrics_age_seconds(cached) > max_age_seconds:
+            return None
+        if include_dns and cached.dns is None:
+            return None
+        return cached
+    
+    async def _check_once(
+        self,
+        ip: str,
+        include_ports: bool,
+        include_dns: bool,
+        shared_probe: bool = False
+    ) -> DeviceMetrics:
+        """
+        Run check_device_health, joining a check of the same IP already in
+        flight if it measures at least as much. Returns metrics without history.
+        """
+        loop = asyncio.get_running_loop()
+        if self._check_loop is not loop:
+            self._check_loop = loop
+            self._check_in_flight.clear()
+        
+        # Any in-flight check of this IP that covers the requested ports/DNS will do
+        covering = [(ip, ports, dns) for ports in (include_ports, True) for dns in (include_dns, True)]
+        task = next((self._check_in_flight[k] for k in covering if k in self._check_in_flight), None)
+        if task is None:
+            key = (ip, include_ports, include_dns)
+            task = asyncio.ensure_future(
+                self.check_device_health(ip, include_ports, include_dns, HistoryMode.NONE, "5m", shared_probe)
+            )
+            self._check_in_flight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget_check(key, t))
+        
+        # Shield so one caller going away doesn't cancel the check for the others
+        return await asyncio.shield(task)
+    
+    def _forget_check(self, key: tuple, task: asyncio.Task) -> None:
+        if self._check_in_flight.get(key) is task:
+            del self._check_in_flight[key]
+    
+    async def get_device_health(
+        self,
+        ip: str,
+        include_ports: bool = False,
+        include_dns: bool = True,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m",
+        max_age_seconds: Optional[float] = None
+    ) -> DeviceMetrics:
+        """
+        On-demand health check. Serves cached metrics no older than
+        `max_age_seconds` when given, otherwise probes; concurrent requests
+        for the same device share one probe.
+        """
+        if max_age_seconds is not None:
+            cached = self._fresh_cached(ip, include_ports, include_dns, max_age_seconds)
+            if cached is not None:
+                return self._with_history(cached, history, history_bucket)
         
-        return metrics
+        metrics = await self._check_once(ip, include_ports, include_dns)
+        return self._with_history(metrics, history, history_bucket)
+    
+    def _probe_priority(self, ip: str) -> int:
+        """Gateways first, then devices that are failing or degraded, then everything else"""
+        if ip in self._gateway_test_ips:
+            return PRIORITY_GATEWAY
+        cached = self._metrics_cache.get(ip)
+        if cached and (cached.status != HealthStatus.HEALTHY or cached.consecutive_failures > 0):
+            return PRIORITY_FLAGGED
+        return PRIORITY_NORMAL
     
     async def check_multiple_devices(
         self,
         ips: List[str],
         include_ports: bool = False,
-        include_dns: bool = True
+        include_dns: bool = True,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m",
+        shared_probe: bool = False,
+        max_age_seconds: Optional[float] = None
     ) -> Dict[str, DeviceMetrics]:
-        """Check health of multiple devices in parallel"""
-        tasks = [
-            self.check_device_health(ip, include_ports, include_dns)
-            for ip in ips
+        """
+        Check health of multiple devices through the bounded-concurrency scheduler.
+        Devices with cached metrics no older than `max_age_seconds` are served
+        from the cache; checks already in flight for a device are joined.
+        """
+        metrics_map = {}
+        to_check = []
+        for ip in dict.fromkeys(ips):
+            cached = None
+            if max_age_seconds is not None:
+                cached = self._fresh_cached(ip, include_ports, include_dns, max_age_seconds)
+            if cached is not None:
+                metrics_map[ip] = self._with_history(cached, history, history_bucket)
+            else:
+                to_check.append(ip)
+        
+        probes = [
+            (ip, partial(self._check_once, ip, include_ports, include_dns, shared_probe), self._probe_priority(ip))
+            for ip in to_check
         ]
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await self._scheduler.run(probes)
         
-        metrics_map = {}
-        for ip, result in zip(ips, results):
-            if isinstance(result, Exception):
-                logger.error(f"Health check failed for {ip}: {result}")
-                metrics_map[ip] = DeviceMetrics(
-                    ip=ip,
-                    status=HealthStatus.UNKNOWN,
-                    last_check=datetime.utcnow(),
-                    error_message=str(result)
-                )
+        for ip, result in zip(to_check, results):
+            if isinstance(result, BaseException):
+                metrics_map[ip] = self._failed_check(ip, result)
             else:
-                metrics_map[ip] = result
+                metrics_map[ip] = self._with_history(result, history, history_bucket)
         
         return metrics_map
     
-    def get_cached_metrics(self, ip: str) -> Optional[DeviceMetrics]:
+    async def stream_device_checks(
+        self,
+        ips: List[str],
+        include_ports: bool = False,
+        include_dns: bool = True,
+        history: HistoryMode = HistoryMode.NONE,
+        history_bucket: str = "5m",
+        max_age_seconds: Optional[float] = None
+    ) -> AsyncIterator[Tuple[DeviceMetrics, bool]]:
+        """
+        Check many devices, yielding (metrics, from_cache) as each one finishes.
+        
+        Fresh cached devices come first. The rest go through the scheduler a
+        window at a time, so only a few probes per concurrency slot are queued
+        however large the batch. Results are not retained once yielded.
+        """
+        to_check = []
+        for ip in dict.fromkeys(ips):
+            cached = None
+            if max_age_seconds is not None:
+                cached = self._fresh_cached(ip, include_ports, include_dns, max_age_seconds)
+            if cached is not None:
+                yield self._with_history(cached, history, history_bucket), True
+            else:
+                to_check.append(ip)
+        
+        probes = (
+            (ip, partial(self._check_once, ip, include_ports, include_dns, False), self._probe_priority(ip))
+            for ip in to_check
+        )
+        window = self._scheduler.max_concurrency * STREAM_CHECK_WINDOW_FACTOR
+        results = self._scheduler.as_completed(probes, window)
+        try:
+            async for ip, result in results:
+                if isinstance(result, BaseException):
+                    yield self._failed_check(ip, result), False
+                else:
+                    yield self._with_history(result, history, history_bucket), False
+        finally:
+            await results.aclose()
+    
+    @staticmethod
+    def _failed_check(ip: str, error: BaseException) -> DeviceMetrics:
+        logger.error(f"Health check failed for {ip}: {error}")
+        return DeviceMetrics(
+            ip=ip,
+            status=HealthStatus.UNKNOWN,
+            last_check=datetime.utcnow(),
+            error_message=str(error)
+        )
+    
+    def _with_history(
+        self,
+        metrics: DeviceMetrics,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m"
+    ) -> DeviceMetrics:
+        """
+        Project cached metrics for a response.
+        
+        FULL attaches every raw check, DOWNSAMPLED attaches per-bucket aggregates
+        (at most 288 per day regardless of probe rate) and NONE returns the
+        summary fields only.
+        """
+        if history == HistoryMode.NONE or metrics.ip not in self._history:
+            return metrics
+        if history == HistoryMode.DOWNSAMPLED:
+            buckets = self._history_buckets(self._history.get(metrics.ip), history_bucket)
+            return metrics.model_copy(update={"history_buckets": buckets})
+        return metrics.model_copy(update={"check_history": self._get_check_history(metrics.ip)})
+    
+    def get_cached_metrics(
+        self,
+        ip: str,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m"
+    ) -> Optional[DeviceMetrics]:
         """Get cached metrics for a device"""
-        return self._metrics_cache.get(ip)
+        metrics = self._metrics_cache.get(ip)
+        return self._with_history(metrics, history, history_bucket) if metrics else None
     
-    def get_all_cached_metrics(self) -> Dict[str, DeviceMetrics]:
+    def get_all_cached_metrics(
+        self,
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m"
+    ) -> Dict[str, DeviceMetrics]:
         """Get all cached metrics"""
-        return self._metrics_cache.copy()
+        return {
+            ip: self._with_history(metrics, history, history_bucket)
+            for ip, metrics in self._metrics_cache.items()
+        }
+    
+    def get_cached_metrics_delta(
+        self,
+        since: Optional[str],
+        history: HistoryMode = HistoryMode.FULL,
+        history_bucket: str = "5m"
+    ) -> CachedMetricsDelta:
+        """
+        Cached metrics whose state changed after the `since` cursor (see
+        journal_state), plus the IPs removed since then. Unknown, expired or malformed cursors get every
+        device with `full` set, so the caller replaces its copy.
+        """
+        changes = self._change_journal.changes_since(since)
+        if changes is None:
+            return CachedMetricsDelta(
+                cursor=self._change_journal.cursor,
+                full=True,
+                devices=self.get_all_cached_metrics(history, history_bucket),
+            )
+        changed, removed = changes
+        return CachedMetricsDelta(
+            cursor=self._change_journal.cursor,
+            devices={
+                ip: self._with_history(self._metrics_cache[ip], history, history_bucket)
+                for ip in changed
+                if ip in self._metrics_cache
+            },
+            removed=removed,
+        )
     
     def clear_cache(self):
         """Clear the metrics cache"""
+        for ip in self._metrics_cache:
+            self._change_journal.remove(ip)
         self._metrics_cache.clear()
         self._history.clear()
+        self._dns_resolver.clear()
+        self._port_scanner.clear()
+        self._shared_probes.clear()
+        self._last_active_probe.clear()
+        self._change_feed.remove_all()
+        self._state_version += 1
     
     # ==================== Gateway Test IP Methods ====================
     
@@ -512,6 +1118,7 @@ class HealthChecker:
             enabled=True
         )
         self._gateway_test_ips[gateway_ip] = config
+        self._wheel_dirty = True
         
         # Initialize metrics cache for this gateway if not exists
         if gateway_ip not in self._test_ip_metrics_cache:
@@ -535,6 +1142,7 @@ class HealthChecker:
         """Remove test IPs configuration for a gateway"""
         if gateway_ip in self._gateway_test_ips:
             del self._gateway_test_ips[gateway_ip]
+            self._wheel_dirty = True
             if gateway_ip in self._test_ip_metrics_cache:
                 del self._test_ip_metrics_cache[gateway_ip]
             # Persist to disk
@@ -550,60 +1158,43 @@ class HealthChecker:
     def _record_test_ip_check(self, gateway_ip: str, test_ip: str, success: bool, latency_ms: Optional[float]):
         """Record a test IP check result for historical tracking"""
         key = self._get_test_ip_history_key(gateway_ip, test_ip)
-        if key not in self._test_ip_history:
-            self._test_ip_history[key] = deque(maxlen=self._history_max_size)
-        self._test_ip_history[key].append((datetime.utcnow(), success, latency_ms))
+        self._record_history(self._test_ip_history, key, success, latency_ms)
     
     def _calculate_test_ip_historical_stats(self, gateway_ip: str, test_ip: str) -> tuple[Optional[float], Optional[float], int, int]:
         """Calculate 24-hour historical statistics for a test IP"""
         key = self._get_test_ip_history_key(gateway_ip, test_ip)
-        if key not in self._test_ip_history or len(self._test_ip_history[key]) == 0:
-            return None, None, 0, 0
-        
-        cutoff = datetime.utcnow() - timedelta(hours=24)
-        recent = [(ts, success, lat) for ts, success, lat in self._test_ip_history[key] if ts > cutoff]
-        
-        if not recent:
-            return None, None, 0, 0
-        
-        passed = sum(1 for _, s, _ in recent if s)
-        failed = sum(1 for _, s, _ in recent if not s)
-        
-        latencies = [lat for _, _, lat in recent if lat is not None]
-        avg_latency = sum(latencies) / len(latencies) if latencies else None
-        
-        uptime_percent = (passed / len(recent)) * 100 if recent else None
-        
-        return uptime_percent, avg_latency, passed, failed
+        return self._history_stats(self._test_ip_history.get(key))
     
     def _get_test_ip_check_history(self, gateway_ip: str, test_ip: str, hours: int = 24) -> List[CheckHistoryEntry]:
         """Get check history for a test IP"""
         key = self._get_test_ip_history_key(gateway_ip, test_ip)
-        if key not in self._test_ip_history or len(self._test_ip_history[key]) == 0:
-            return []
-        
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
-        history = []
-        
-        for ts, success, latency in self._test_ip_history[key]:
-            if ts > cutoff:
-                history.append(CheckHistoryEntry(
-                    timestamp=ts,
-                    success=success,
-                    latency_ms=latency
-                ))
-        
-        return history
+        return self._history_entries(self._test_ip_history.get(key), hours)
+    
+    def _with_test_ip_history(self, gateway_ip: str, metrics: GatewayTestIPMetrics) -> GatewayTestIPMetrics:
+        """Project cached test IP metrics for a response, attaching the raw check history"""
+        return metrics.model_copy(update={"check_history": self._get_test_ip_check_history(gateway_ip, metrics.ip)})
     
-    async def check_test_ip(self, gateway_ip: str, test_ip: str, label: Optional[str] = None) -> GatewayTestIPMetrics:
-        """Check a single test IP and return metrics"""
+    async def check_test_ip(
+        self,
+        gateway_ip: str,
+        test_ip: str,
+        label: Optional[str] = None,
+        shared_probe: bool = False,
+        include_history: bool = True,
+    ) -> GatewayTestIPMetrics:
+        """
+        Check a single test IP and return metrics.
+        
+        The cached metrics carry the O(1) ring statistics only; the check
+        history is attached to the returned copy if `include_history`.
+        """
         now = datetime.utcnow()
         
         # Get cached metrics if available
         cached = self._test_ip_metrics_cache.get(gateway_ip, {}).get(test_ip)
         
         # Perform ping check
-        ping_result = await self.ping_host(test_ip)
+        ping_result = await self._probe(test_ip, shared_probe, self._test_ip_share_window())
         
         # Record for historical tracking
         self._record_test_ip_check(gateway_ip, test_ip, ping_result.success, ping_result.avg_latency_ms)
@@ -625,9 +1216,6 @@ class HealthChecker:
             status = HealthStatus.HEALTHY
             consecutive_failures = 0
         
-        # Get check history
-        check_history = self._get_test_ip_check_history(gateway_ip, test_ip)
-        
         metrics = GatewayTestIPMetrics(
             ip=test_ip,
             label=label,
@@ -638,7 +1226,6 @@ class HealthChecker:
             avg_latency_24h_ms=avg_lat_24h,
             checks_passed_24h=passed_24h,
             checks_failed_24h=failed_24h,
-            check_history=check_history,
             last_seen_online=now if ping_result.success else (cached.last_seen_online if cached else None),
             consecutive_failures=consecutive_failures,
         )
@@ -648,9 +1235,14 @@ class HealthChecker:
             self._test_ip_metrics_cache[gateway_ip] = {}
         self._test_ip_metrics_cache[gateway_ip][test_ip] = metrics
         
-        return metrics
+        return self._with_test_ip_history(gateway_ip, metrics) if include_history else metrics
     
-    async def check_gateway_test_ips(self, gateway_ip: str) -> GatewayTestIPsResponse:
+    async def check_gateway_test_ips(
+        self,
+        gateway_ip: str,
+        shared_probe: bool = False,
+        include_history: bool = True,
+    ) -> GatewayTestIPsResponse:
         """Check all test IPs for a gateway"""
         config = self._gateway_test_ips.get(gateway_ip)
         if not config or not config.enabled:
@@ -658,7 +1250,7 @@ class HealthChecker:
         
         # Check all test IPs in parallel
         tasks = [
-            self.check_test_ip(gateway_ip, tip.ip, tip.label)
+            self.check_test_ip(gateway_ip, tip.ip, tip.label, shared_probe, include_history)
             for tip in config.test_ips
         ]
         
@@ -693,7 +1285,7 @@ class HealthChecker:
         if config:
             for tip in config.test_ips:
                 if tip.ip in cached_metrics:
-                    metrics_list.append(cached_metrics[tip.ip])
+                    metrics_list.append(self._with_test_ip_history(gateway_ip, cached_metrics[tip.ip]))
         
         # Determine last check time from metrics
         last_check = None
@@ -708,33 +1300,50 @@ class HealthChecker:
     
     # ==================== Speed Test ====================
     
+    @property
+    def speed_tests(self) -> SpeedTestJobManager:
+        return self._speed_tests
+    
     async def run_speed_test(self, gateway_ip: Optional[str] = None) -> SpeedTestResult:
         """
-        Run an ISP speed test using speedtest-cli.
-        This is a blocking operation that can take 30-60 seconds.
+        Run an ISP speed test using speedtest-cli, or join the one already
+        queued or running for this gateway. Takes 30-60 seconds.
         
         Args:
             gateway_ip: Optional gateway IP to associate this test with
         """
+        return await self._speed_tests.run(gateway_ip)
+    
+    def _store_speed_test_result(self, gateway_ip: Optional[str], result: SpeedTestResult) -> None:
+        """Keep a finished test's result if it was run for a gateway"""
+        if gateway_ip and result.success:
+            self._speed_test_results[gateway_ip] = result
+            self._save_speed_test_results()
+    
+    @staticmethod
+    def _speed_test_callback(report: ProgressReporter, phase: str):
+        """speedtest-cli per-request callback -> phase progress"""
+        def callback(i, request_count, start=False, end=False):
+            if end:
+                report(phase, (i + 1) / request_count)
+        return callback
+    
+    def _execute_speed_test(self, gateway_ip: Optional[str], report: ProgressReporter) -> SpeedTestResult:
+        """Blocking speed test; runs on the speed test executor"""
         start_time = time.time()
         
         try:
             import speedtest
             
-            logger.info("Starting speed test...")
-            
-            # Run speedtest in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
+            logger.info(f"Starting speed test{f' for gateway {gateway_ip}' if gateway_ip else ''}...")
             
-            def do_speed_test():
-                st = speedtest.Speedtest()
-                st.get_best_server()
-                st.download()
-                st.upload()
-                return st.results.dict()
-            
-            # Run in thread pool executor
-            results = await loop.run_in_executor(None, do_speed_test)
+            report("server_selection", 0.0)
+            st = speedtest.Speedtest()
+            st.get_best_server()
+            report("server_selection", 1.0)
+            st.download(callback=self._speed_test_callback(report, "download"))
+            st.upload(callback=self._speed_test_callback(report, "upload"))
+            results = st.results.dict()
             
             duration = time.time() - start_time
             
@@ -748,7 +1357,7 @@ class HealthChecker:
             
             logger.info(f"Speed test completed: {download_mbps:.2f} Mbps down, {upload_mbps:.2f} Mbps up")
             
-            result = SpeedTestResult(
+            return SpeedTestResult(
                 success=True,
                 timestamp=datetime.utcnow(),
                 download_mbps=round(download_mbps, 2),
@@ -762,13 +1371,6 @@ class HealthChecker:
                 duration_seconds=round(duration, 1)
             )
             
-            # Store result if gateway_ip provided
-            if gateway_ip:
-                self._speed_test_results[gateway_ip] = result
-                self._save_speed_test_results()
-            
-            return result
-            
         except ImportError:
             logger.error("speedtest-cli not installed")
             return SpeedTestResult(
@@ -788,36 +1390,96 @@ class HealthChecker:
     
     # ==================== Background Monitoring ====================
     
-    def register_devices(self, devices: Dict[str, int]) -> None:
+    @staticmethod
+    def _group_by_network(devices: Dict[str, str]) -> Dict[str, List[str]]:
+        by_network: Dict[str, List[str]] = {}
+        for ip, network_id in devices.items():
+            by_network.setdefault(network_id, []).append(ip)
+        return by_network
+    
+    def _registry_changed(self, diffs: List[NetworkDevicesDiff]) -> List[NetworkDevicesDiff]:
+        if any(diff.added or diff.removed for diff in diffs):
+            self._wheel_dirty = True
+        return diffs
+    
+    def register_devices(self, devices: Dict[str, str]) -> List[NetworkDevicesDiff]:
         """
         Register devices to be monitored passively.
         
         Args:
             devices: Dict mapping device IP to network_id
         """
-        self._monitored_devices.update(devices)
+        diffs = self._registry_changed([
+            self._registry.add(network_id, ips)
+            for network_id, ips in self._group_by_network(devices).items()
+        ])
         logger.info(f"Registered {len(devices)} devices for monitoring. Total: {len(self._monitored_devices)}")
+        return diffs
     
-    def unregister_devices(self, ips: List[str]) -> None:
-        """Unregister devices from passive monitoring"""
-        for ip in ips:
-            self._monitored_devices.pop(ip, None)
+    def unregister_devices(self, ips: List[str]) -> List[NetworkDevicesDiff]:
+        """Unregister devices from passive monitoring in every network"""
+        diffs = self._registry_changed(self._registry.remove_everywhere(ips))
         logger.info(f"Unregistered {len(ips)} devices. Remaining: {len(self._monitored_devices)}")
+        return diffs
     
-    def set_monitored_devices(self, devices: Dict[str, int]) -> None:
+    def set_monitored_devices(self, devices: Dict[str, str]) -> List[NetworkDevicesDiff]:
         """
-        Set the full list of devices to monitor (replaces existing).
+        Set the full list of devices to monitor across all networks (replaces existing).
         
         Args:
             devices: Dict mapping device IP to network_id
         """
-        self._monitored_devices = devices.copy()
+        by_network = self._group_by_network(devices)
+        diffs = [
+            self._registry.replace(network_id, ())
+            for network_id in self._registry.network_ids()
+            if network_id not in by_network
+        ]
+        diffs.extend(self._registry.replace(network_id, ips) for network_id, ips in by_network.items())
+        self._registry_changed(diffs)
         logger.info(f"Set {len(self._monitored_devices)} devices for monitoring")
+        return diffs
+    
+    def add_network_devices(self, network_id: str, ips: List[str]) -> NetworkDevicesDiff:
+        """Add devices to one network's monitored set"""
+        return self._registry_changed([self._registry.add(network_id, ips)])[0]
+    
+    def remove_network_devices(self, network_id: str, ips: List[str]) -> NetworkDevicesDiff:
+        """Remove devices from one network's monitored set"""
+        return self._registry_changed([self._registry.remove(network_id, ips)])[0]
     
-    def get_monitored_devices(self) -> List[str]:
-        """Get list of currently monitored device IPs"""
+    def replace_network_devices(self, network_id: str, ips: List[str]) -> NetworkDevicesDiff:
+        """Replace one network's monitored set, leaving other networks untouched"""
+        diff = self._registry_changed([self._registry.replace(network_id, ips)])[0]
+        logger.info(
+            f"Network {network_id}: {len(diff.added)} devices added, {len(diff.removed)} removed, "
+            f"{diff.total} monitored"
+        )
+        return diff
+    
+    def clear_monitored_devices(self, network_id: Optional[str] = None) -> List[NetworkDevicesDiff]:
+        """Stop monitoring one network's devices, or every network's"""
+        return self._registry_changed(self._registry.clear(network_id))
+    
+    def get_monitored_devices(self, network_id: Optional[str] = None) -> List[str]:
+        """Get list of currently monitored device IPs, optionally for one network"""
+        if network_id is not None:
+            return self._registry.devices(network_id)
         return list(self._monitored_devices.keys())
     
+    def get_monitored_networks(self) -> Dict[str, int]:
+        """Network ID -> number of monitored devices"""
+        return self._registry.counts()
+    
+    def set_device_roles(self, roles: Dict[str, str]) -> None:
+        """
+        Record device roles used for scheduling policy.
+        
+        Args:
+            roles: Dict mapping device IP to role (e.g. "gateway", "firewall")
+        """
+        self._device_roles.update({ip: role.lower() for ip, role in roles.items() if role})
+    
     def get_monitoring_config(self) -> MonitoringConfig:
         """Get current monitoring configuration"""
         return self._monitoring_config
@@ -825,6 +1487,11 @@ class HealthChecker:
     def set_monitoring_config(self, config: MonitoringConfig) -> None:
         """Update monitoring configuration"""
         self._monitoring_config = config
+        self._scheduler.configure(
+            max_concurrency=config.max_concurrent_checks,
+            subnet_rate_per_second=config.subnet_rate_limit_per_second,
+            subnet_prefix_length=config.subnet_prefix_length,
+        )
         logger.info(f"Updated monitoring config: interval={config.check_interval_seconds}s, enabled={config.enabled}")
         
         # Restart monitoring task if running to apply new interval
@@ -841,7 +1508,20 @@ class HealthChecker:
             include_dns=self._monitoring_config.include_dns,
             monitored_devices=list(self._monitored_devices.keys()),
             last_check=self._last_check_time,
-            next_check=self._next_check_time
+            next_check=self._next_check_time,
+            queue_depth=self._scheduler.queue_depth,
+            in_flight_checks=self._scheduler.in_flight,
+            max_concurrent_checks=self._scheduler.max_concurrency,
+            last_cycle_duration_seconds=self._last_cycle_duration,
+            overrun_count=self._overrun_count,
+            skipped_cycles=self._skipped_cycles,
+            scheduling_mode=self._monitoring_config.scheduling_mode,
+            scheduled_devices=len(self._wheel) if self._wheel else 0,
+            shared_probes=self._shared_probes.get_stats()["shared"],
+            passive_checks=self._passive_checks,
+            shard_worker_id=self._shard.worker_id if self._shard else None,
+            shard_workers=len(self._shard.members()) if self._shard else 1,
+            owned_devices=sum(1 for ip in self._monitored_devices if self.owns_target(ip)) if self._shard else None,
         )
     
     async def _perform_monitoring_check(self) -> None:
@@ -851,53 +1531,225 @@ class HealthChecker:
         
         if self._is_checking:
             logger.warning("Previous check still in progress, skipping this cycle")
+            self._skipped_cycles += 1
             return
         
         self._is_checking = True
+        cycle_start = time.monotonic()
         try:
             self._last_check_time = datetime.utcnow()
             
-            # Check all devices in parallel
-            if self._monitored_devices:
-                logger.debug(f"Starting passive health check for {len(self._monitored_devices)} devices")
+            # Check all devices through the scheduler (gateways and flagged devices first)
+            owned = [ip for ip in self._monitored_devices if self.owns_target(ip)]
+            if owned:
+                logger.debug(f"Starting passive health check for {len(owned)} devices")
                 await self.check_multiple_devices(
-                    ips=list(self._monitored_devices),
+                    ips=owned,
                     include_ports=False,  # Don't scan ports during passive checks (too slow)
-                    include_dns=self._monitoring_config.include_dns
+                    include_dns=self._monitoring_config.include_dns,
+                    history=HistoryMode.NONE,  # Results are only cached; history is attached on read
+                    shared_probe=True
                 )
             
             # Check all gateway test IPs in parallel
             # Note: Test IPs are checked independently of gateway device monitoring status
             # because they monitor external internet connectivity, not the gateway itself
             if self._gateway_test_ips:
-                enabled_gateways = [gw for gw, config in self._gateway_test_ips.items() if config.enabled]
+                enabled_gateways = [
+                    gw for gw, config in self._gateway_test_ips.items()
+                    if config.enabled and self.owns_target(gw)
+                ]
                 if enabled_gateways:
                     logger.debug(f"Starting passive test IP check for {len(enabled_gateways)} gateways")
-                    tasks = [self.check_gateway_test_ips(gw) for gw in enabled_gateways]
-                    await asyncio.gather(*tasks, return_exceptions=True)
+                    await self._scheduler.run([
+                        (gw, partial(self.check_gateway_test_ips, gw, shared_probe=True, include_history=False), PRIORITY_GATEWAY)
+                        for gw in enabled_gateways
+                    ])
             
             logger.debug(f"Completed passive health check")
         except Exception as e:
             logger.error(f"Error during monitoring check: {e}")
         finally:
             self._is_checking = False
+            self._last_cycle_duration = time.monotonic() - cycle_start
+            if self._last_cycle_duration > self._monitoring_config.check_interval_seconds:
+                self._overrun_count += 1
+                logger.warning(
+                    f"Monitoring cycle took {self._last_cycle_duration:.1f}s, "
+                    f"longer than the {self._monitoring_config.check_interval_seconds}s interval"
+                )
+    
+    # ==================== Staggered Scheduling ====================
+    
+    def _is_critical(self, ip: str) -> bool:
+        """Whether a device's role pins it to the critical interval"""
+        if ip in self._gateway_test_ips:
+            return "gateway" in self._monitoring_config.critical_roles
+        return self._device_roles.get(ip) in self._monitoring_config.critical_roles
+    
+    def _next_probe_interval(self, ip: str) -> float:
+        """
+        Seconds until a device's next probe.
+        Critical roles use the critical interval, failing or degraded devices are
+        re-probed quickly and devices that stay healthy back off exponentially.
+        """
+        config = self._monitoring_config
+        base = config.check_interval_seconds
+        if not config.adaptive_intervals:
+            return base
+        if self._is_critical(ip):
+            return min(base, config.critical_interval_seconds)
+        
+        cached = self._metrics_cache.get(ip)
+        if cached is None:
+            return base
+        if cached.status != HealthStatus.HEALTHY:
+            return min(base, config.failing_interval_seconds)
+        
+        backoff_steps = self._stable_streaks.get(ip, 0) - config.stable_checks_before_backoff + 1
+        if backoff_steps <= 0:
+            return base
+        # Bound the exponent so long healthy streaks can't overflow
+        backoff_steps = min(backoff_steps, 32)
+        return max(base, min(config.max_interval_seconds, base * config.backoff_factor ** backoff_steps))
+    
+    def _wants_on_wheel(self, key: tuple) -> bool:
+        """Whether a single key belongs on the wheel (O(1), unlike building _wheel_targets)"""
+        kind, target = key
+        if kind == "device":
+            return target in self._monitored_devices and self.owns_target(target)
+        config = self._gateway_test_ips.get(target)
+        return config is not None and config.enabled and self.owns_target(target)
+    
+    def _wheel_targets(self) -> Set[tuple]:
+        """Keys that should be on the timing wheel"""
+        targets = {("device", ip) for ip in self._monitored_devices if self.owns_target(ip)}
+        targets.update(
+            ("gateway", gw) for gw, config in self._gateway_test_ips.items()
+            if config.enabled and self.owns_target(gw)
+        )
+        return targets
+    
+    def _sync_wheel(self) -> None:
+        """Add newly monitored targets (spread evenly over one interval) and drop removed ones"""
+        wanted = self._wheel_targets()
+        current = set(self._wheel.keys()) | self._staggered_in_flight
+        
+        for key in current - wanted:
+            self._wheel.cancel(key)
+        
+        added = sorted(wanted - current)
+        interval = self._monitoring_config.check_interval_seconds
+        for i, key in enumerate(added):
+            self._wheel.schedule(key, (i + 1) * interval / len(added))
+        
+        self._wheel_dirty = False
+        if added:
+            logger.debug(f"Staggered {len(added)} new targets across {interval}s")
+    
+    def _dispatch_staggered_probe(self, key: tuple) -> None:
+        """Queue a due target on the probe scheduler and reschedule it when done"""
+        kind, target = key
+        if kind == "device":
+            if target not in self._monitored_devices:
+                return
+            factory = partial(
+                self.check_device_health, target, False, self._monitoring_config.include_dns, HistoryMode.NONE,
+                shared_probe=True,
+            )
+            priority = self._probe_priority(target)
+        else:
+            config = self._gateway_test_ips.get(target)
+            if not config or not config.enabled:
+                return
+            factory = partial(self.check_gateway_test_ips, target, shared_probe=True, include_history=False)
+            priority = PRIORITY_GATEWAY
+        
+        wheel = self._wheel
+        self._staggered_in_flight.add(key)
+        future = self._scheduler.submit(target, factory, priority)
+        future.add_done_callback(lambda f: self._on_staggered_probe_done(key, wheel, f))
+    
+    def _on_staggered_probe_done(self, key: tuple, wheel: TimingWheel, future: asyncio.Future) -> None:
+        """Update stability tracking and put the target back on the wheel"""
+        self._staggered_in_flight.discard(key)
+        kind, target = key
+        
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Staggered check failed for {target}: {error}")
+        
+        self._last_check_time = datetime.utcnow()
+        if kind == "device":
+            result = None if error else future.result()
+            if result is not None and result.status == HealthStatus.HEALTHY:
+                self._stable_streaks[target] = self._stable_streaks.get(target, 0) + 1
+            else:
+                self._stable_streaks[target] = 0
+        
+        if not self._wants_on_wheel(key):
+            self._stable_streaks.pop(target, None)
+            return
+        if wheel is not self._wheel:
+            # Monitoring loop restarted while the probe ran; let the new wheel pick it up
+            self._wheel_dirty = True
+            return
+        
+        if kind == "device":
+            delay = self._next_probe_interval(target)
+        else:
+            delay = self._monitoring_config.check_interval_seconds
+        wheel.schedule(key, delay)
+    
+    async def _staggered_monitoring_loop(self) -> None:
+        """Advance the timing wheel every tick and probe whatever came due"""
+        self._wheel = TimingWheel(tick_seconds=WHEEL_TICK_SECONDS)
+        self._wheel_dirty = True
+        
+        while True:
+            try:
+                if self._monitoring_config.enabled:
+                    if self._wheel_dirty:
+                        self._sync_wheel()
+                    for key in self._wheel.advance():
+                        self._dispatch_staggered_probe(key)
+                
+                self._next_check_time = datetime.utcnow() + timedelta(seconds=WHEEL_TICK_SECONDS)
+                await asyncio.sleep(WHEEL_TICK_SECONDS)
+                
+            except asyncio.CancelledError:
+                logger.info("Monitoring loop cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in monitoring loop: {e}")
+                await asyncio.sleep(5)  # Wait a bit before retrying
     
     async def _monitoring_loop(self) -> None:
         """Background loop that periodically checks all monitored devices"""
         logger.info("Starting background monitoring loop")
         
+        if self._monitoring_config.scheduling_mode == "staggered":
+            await self._staggered_monitoring_loop()
+            return
+        
+        self._wheel = None
         while True:
             try:
+                cycle_start = time.monotonic()
                 if self._monitoring_config.enabled and self._monitored_devices:
                     # Perform the check
                     await self._perform_monitoring_check()
                 
-                # Calculate next check time
+                # Keep a fixed cadence: an overrunning cycle shortens the wait
+                # instead of pushing every later cycle back
                 interval = self._monitoring_config.check_interval_seconds
-                self._next_check_time = datetime.utcnow() + timedelta(seconds=interval)
+                delay = max(0.0, interval - (time.monotonic() - cycle_start))
+                self._next_check_time = datetime.utcnow() + timedelta(seconds=delay)
                 
                 # Wait for next interval
-                await asyncio.sleep(interval)
+                await asyncio.sleep(delay)
                 
             except asyncio.CancelledError:
                 logger.info("Monitoring loop cancelled")
@@ -0,0 +1,430 @@
+"""
+Columnar ring-buffer history store.
+
+Each monitored target keeps its check history in fixed-size typed arrays
+(float64 epoch timestamps, a success bitset and float32 latencies) instead of
+a deque of tuples. Pass/fail counts and the latency sum are maintained
+incrementally as entries are appended and expire, so 24-hour statistics are
+O(1) per check. A parallel series of 5 minute bucket aggregates is updated on
+append so downsampled timelines are served without scanning raw entries. It
+keeps running totals of its own, expired a bucket at a time, and backs the
+statistics (still O(1) amortized) once a fast probe interval has overrun the
+ring's capacity and pushed in-window checks out of it.
+
+Both structures serialize to their raw array bytes (dump/load) for
+warm-restart snapshots; snapshots are host-local so native byte order is used.
+copy() takes a detached copy of the arrays so a snapshot can be dumped in a
+worker thread while the live ring keeps changing.
+"""
+
+import math
+import struct
+from array import array
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
+# Rolling window for uptime/latency statistics
+HISTORY_WINDOW_SECONDS = 24 * 60 * 60
+
+# Downsampled buckets are kept at 5 minute resolution; coarser sizes are
+# aggregated from these when served
+BASE_BUCKET_SECONDS = 300
+BUCKET_SIZES = {"5m": 300, "15m": 900, "1h": 3600}
+
+_NAN = float("nan")
+
+_RING_HEADER = struct.Struct("<IIIdIIdI")  # capacity, head, size, window, then the running totals
+_SERIES_HEADER = struct.Struct("<II")  # resolution, slots
+
+
+def _read_array(typecode: str, data: memoryview, offset: int, count: int) -> Tuple[array, int]:
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    if end > len(data):
+        raise ValueError("Truncated history data")
+    values.frombytes(data[offset:end])
+    return values, end
+
+
+def to_epoch(dt: datetime) -> float:
+    """Convert a naive UTC (or aware) datetime to epoch seconds"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def from_epoch(ts: float) -> datetime:
+    """Convert epoch seconds to a naive UTC datetime (matching datetime.utcnow())"""
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class BucketSeries:
+    """
+    Per-bucket aggregates over the rolling window, updated on every append.
+    Slots are keyed by bucket number so stale slots are recycled lazily.
+    Running totals over the window's buckets are kept alongside; buckets are
+    subtracted as they leave the window, so totals() doesn't scan the slots.
+    """
+
+    __slots__ = (
+        "_resolution", "_keys", "_passed", "_failed", "_latency_sum", "_latency_count",
+        "_floor", "_total_passed", "_total_failed", "_total_latency_sum", "_total_latency_count",
+    )
+
+    def __init__(self, resolution: int = BASE_BUCKET_SECONDS, window_seconds: float = HISTORY_WINDOW_SECONDS):
+        slots = max(1, int(window_seconds // resolution))
+        self._resolution = resolution
+        self._keys = array("q", [-1]) * slots
+        self._passed = array("H", [0]) * slots
+        self._failed = array("H", [0]) * slots
+        self._latency_sum = array("d", [0.0]) * slots
+        self._latency_count = array("H", [0]) * slots
+        self._floor = 0  # Oldest bucket key still counted in the running totals
+        self._total_passed = 0
+        self._total_failed = 0
+        self._total_latency_sum = 0.0
+        self._total_latency_count = 0
+
+    def _resum(self) -> None:
+        """Recompute the running totals from the buckets at or after the floor"""
+        self._total_passed = self._total_failed = self._total_latency_count = 0
+        self._total_latency_sum = 0.0
+        for slot, key in enumerate(self._keys):
+            if key >= self._floor:
+                self._total_passed += self._passed[slot]
+                self._total_failed += self._failed[slot]
+                self._total_latency_sum += self._latency_sum[slot]
+                self._total_latency_count += self._latency_count[slot]
+
+    def _expire(self, now_key: int) -> None:
+        """Subtract the buckets that left the window ending at bucket `now_key`"""
+        floor = now_key - len(self._keys) + 1
+        if floor <= self._floor:
+            return
+        slots = len(self._keys)
+        if floor - self._floor >= slots or floor // slots != self._floor // slots:
+            # Big jump, or once per window so float add/subtract drift can't accumulate
+            self._floor = floor
+            self._resum()
+            return
+        for key in range(self._floor, floor):
+            slot = key % slots
+            if self._keys[slot] == key:
+                self._total_passed -= self._passed[slot]
+                self._total_failed -= self._failed[slot]
+                self._total_latency_sum -= self._latency_sum[slot]
+                self._total_latency_count -= self._latency_count[slot]
+        self._floor = floor
+
+    def add(self, timestamp: float, success: bool, latency_ms: Optional[float]) -> None:
+        key = int(timestamp // self._resolution)
+        self._expire(key)
+        if key < self._floor:
+            return  # Already outside the window; its slot belongs to a newer bucket
+        slot = key % len(self._keys)
+        if self._keys[slot] != key:
+            # The slot's previous bucket is older than the floor, so no longer counted
+            self._keys[slot] = key
+            self._passed[slot] = 0
+            self._failed[slot] = 0
+            self._latency_sum[slot] = 0.0
+            self._latency_count[slot] = 0
+        if success:
+            if self._passed[slot] < 0xFFFF:
+                self._passed[slot] += 1
+                self._total_passed += 1
+        elif self._failed[slot] < 0xFFFF:
+            self._failed[slot] += 1
+            self._total_failed += 1
+        if latency_ms is not None and self._latency_count[slot] < 0xFFFF:
+            self._latency_sum[slot] += latency_ms
+            self._latency_count[slot] += 1
+            self._total_latency_sum += latency_ms
+            self._total_latency_count += 1
+
+    def buckets(self, now: float, size_seconds: int) -> List[Tuple[float, int, int, Optional[float]]]:
+        """
+        Return (start_epoch, checks, passed, avg_latency_ms) oldest first for
+        non-empty buckets of `size_seconds` (a multiple of the base resolution)
+        within the window.
+        """
+        group = max(1, size_seconds // self._resolution)
+        now_key = int(now // self._resolution)
+        slots = len(self._keys)
+
+        result: List[Tuple[float, int, int, Optional[float]]] = []
+        current_group = None
+        checks = passed = latency_count = 0
+        latency_sum = 0.0
+        for key in range(now_key - slots + 1, now_key + 1):
+            slot = key % slots
+            if self._keys[slot] != key:
+                continue
+            group_key = key // group
+            if group_key != current_group:
+                if checks:
+                    result.append((current_group * group * self._resolution, checks, passed,
+                                   latency_sum / latency_count if latency_count else None))
+                current_group = group_key
+                checks = passed = latency_count = 0
+                latency_sum = 0.0
+            checks += self._passed[slot] + self._failed[slot]
+            passed += self._passed[slot]
+            latency_sum += self._latency_sum[slot]
+            latency_count += self._latency_count[slot]
+        if checks:
+            result.append((current_group * group * self._resolution, checks, passed,
+                           latency_sum / latency_count if latency_count else None))
+        return result
+
+    def totals(self, now: float) -> Tuple[int, int, float, int]:
+        """(passed, failed, latency_sum, latency_count) over the buckets within the window"""
+        self._expire(int(now // self._resolution))
+        if self._total_latency_count == 0:
+            self._total_latency_sum = 0.0
+        return self._total_passed, self._total_failed, self._total_latency_sum, self._total_latency_count
+
+    def copy(self) -> "BucketSeries":
+        series = BucketSeries.__new__(BucketSeries)
+        series._resolution = self._resolution
+        series._keys = self._keys[:]
+        series._passed = self._passed[:]
+        series._failed = self._failed[:]
+        series._latency_sum = self._latency_sum[:]
+        series._latency_count = self._latency_count[:]
+        series._floor = self._floor
+        series._total_passed = self._total_passed
+        series._total_failed = self._total_failed
+        series._total_latency_sum = self._total_latency_sum
+        series._total_latency_count = self._total_latency_count
+        return series
+
+    def dump(self) -> bytes:
+        return b"".join((
+            _SERIES_HEADER.pack(self._resolution, len(self._keys)),
+            self._keys.tobytes(),
+            self._passed.tobytes(),
+            self._failed.tobytes(),
+            self._latency_sum.tobytes(),
+            self._latency_count.tobytes(),
+        ))
+
+    @classmethod
+    def load(cls, data: memoryview, offset: int = 0) -> Tuple["BucketSeries", int]:
+        """Rebuild a series from dump() output; returns (series, end offset)"""
+        if offset + _SERIES_HEADER.size > len(data):
+            raise ValueError("Truncated history data")
+        resolution, slots = _SERIES_HEADER.unpack_from(data, offset)
+        offset += _SERIES_HEADER.size
+        series = cls.__new__(cls)
+        series._resolution = resolution
+        series._keys, offset = _read_array("q", data, offset, slots)
+        series._passed, offset = _read_array("H", data, offset, slots)
+        series._failed, offset = _read_array("H", data, offset, slots)
+        series._latency_sum, offset = _read_array("d", data, offset, slots)
+        series._latency_count, offset = _read_array("H", data, offset, slots)
+        # Totals aren't stored; count the window ending at the newest bucket
+        series._floor = max(max(series._keys, default=-1) - slots + 1, 0)
+        series._resum()
+        return series, offset
+
+
+class HistoryRing:
+    """Fixed-capacity ring of check results with running window totals"""
+
+    __slots__ = (
+        "_capacity", "_window", "_timestamps", "_latencies", "_success",
+        "_head", "_size", "_passed", "_failed", "_latency_sum", "_latency_count",
+        "_evictions", "_series", "_evicted_until",
+    )
+
+    def __init__(self, capacity: int = 1440, window_seconds: float = HISTORY_WINDOW_SECONDS):
+        self._capacity = capacity
+        self._window = window_seconds
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._latencies = array("f", [_NAN]) * capacity
+        self._success = bytearray((capacity + 7) // 8)
+        self._head = 0  # Index of the oldest entry
+        self._size = 0
+        self._passed = 0
+        self._failed = 0
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._evictions = 0
+        self._series = BucketSeries(window_seconds=window_seconds)
+        # Newest timestamp pushed out by capacity rather than age; while it is
+        # inside the window the ring no longer holds the whole window
+        self._evicted_until = -math.inf
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def _get_success(self, index: int) -> bool:
+        return bool(self._success[index >> 3] & (1 << (index & 7)))
+
+    def _set_success(self, index: int, value: bool) -> None:
+        if value:
+            self._success[index >> 3] |= 1 << (index & 7)
+        else:
+            self._success[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def _drop_oldest(self) -> None:
+        index = self._head
+        if self._get_success(index):
+            self._passed -= 1
+        else:
+            self._failed -= 1
+        latency = self._latencies[index]
+        if not math.isnan(latency):
+            self._latency_sum -= latency
+            self._latency_count -= 1
+        self._head = (self._head + 1) % self._capacity
+        self._size -= 1
+
+        # Re-sum periodically so float add/subtract drift can't accumulate
+        self._evictions += 1
+        if self._latency_count == 0:
+            self._latency_sum = 0.0
+        elif self._evictions >= self._capacity:
+            self._evictions = 0
+            self._latency_sum = sum(lat for _, _, lat in self._iter_raw() if not math.isnan(lat))
+
+    def _iter_raw(self) -> Iterator[Tuple[float, bool, float]]:
+        for offset in range(self._size):
+            index = (self._head + offset) % self._capacity
+            yield self._timestamps[index], self._get_success(index), self._latencies[index]
+
+    def append(self, timestamp: float, success: bool, latency_ms: Optional[float]) -> None:
+        """Record a check result; overwrites the oldest entry when full"""
+        if self._size == self._capacity:
+            self._evicted_until = self._timestamps[self._head]
+            self._drop_oldest()
+        index = (self._head + self._size) % self._capacity
+        self._timestamps[index] = timestamp
+        self._set_success(index, success)
+        if latency_ms is None:
+            self._latencies[index] = _NAN
+        else:
+            self._latencies[index] = latency_ms
+            # Sum the stored float32 value so expiry subtracts exactly what was added
+            self._latency_sum += self._latencies[index]
+            self._latency_count += 1
+        if success:
+            self._passed += 1
+        else:
+            self._failed += 1
+        self._size += 1
+        self._series.add(timestamp, success, latency_ms)
+
+    def expire(self, now: float) -> None:
+        """Drop entries that have left the rolling window"""
+        cutoff = now - self._window
+        while self._size and self._timestamps[self._head] <= cutoff:
+            self._drop_oldest()
+
+    def stats(self, now: float) -> Tuple[Optional[float], Optional[float], int, int]:
+        """
+        Return (uptime_percent, avg_latency_ms, passed, failed) for the window:
+        exact from the ring's totals while it holds the whole window, else
+        from the bucket series (5 minute granularity at the window's start).
+        """
+        self.expire(now)
+        if self._size == 0:
+            return None, None, 0, 0
+        if self._evicted_until > now - self._window:
+            passed, failed, latency_sum, latency_count = self._series.totals(now)
+        else:
+            passed, failed = self._passed, self._failed
+            latency_sum, latency_count = self._latency_sum, self._latency_count
+        uptime_percent = (passed / (passed + failed)) * 100
+        avg_latency = latency_sum / latency_count if latency_count else None
+        return uptime_percent, avg_latency, passed, failed
+
+    def entries(self, since: Optional[float] = None) -> Iterator[Tuple[float, bool, Optional[float]]]:
+        """Yield (timestamp, success, latency_ms) oldest first for entries newer than `since`"""
+        for timestamp, success, latency in self._iter_raw():
+            if since is None or timestamp > since:
+                yield timestamp, success, None if math.isnan(latency) else latency
+
+    def buckets(self, now: float, size_seconds: int = BASE_BUCKET_SECONDS) -> List[Tuple[float, int, int, Optional[float]]]:
+        """Precomputed downsampled buckets, see BucketSeries.buckets"""
+        return self._series.buckets(now, size_seconds)
+
+    def copy(self) -> "HistoryRing":
+        """Detached copy (array memcpys only) that can be dumped off the event loop"""
+        ring = HistoryRing.__new__(HistoryRing)
+        for name in self.__slots__:
+            setattr(ring, name, getattr(self, name))
+        ring._timestamps = self._timestamps[:]
+        ring._latencies = self._latencies[:]
+        ring._success = bytearray(self._success)
+        ring._series = self._series.copy()
+        return ring
+
+    def dump(self) -> bytes:
+        """Serialize the ring (physical layout, so no reordering) and its bucket series"""
+        return b"".join((
+            _RING_HEADER.pack(
+                self._capacity, self._head, self._size, self._window,
+                self._passed, self._failed, self._latency_sum, self._latency_count,
+            ),
+            self._timestamps.tobytes(),
+            self._latencies.tobytes(),
+            bytes(self._success),
+            self._series.dump(),
+        ))
+
+    @classmethod
+    def load(cls, data: bytes) -> "HistoryRing":
+        """Rebuild a ring from dump() output"""
+        view = memoryview(data)
+        if len(view) < _RING_HEADER.size:
+            raise ValueError("Truncated history data")
+        capacity, head, size, window, passed, failed, latency_sum, latency_count = _RING_HEADER.unpack_from(view, 0)
+        if size > capacity or (capacity and head >= capacity) or passed + failed != size:
+            raise ValueError("Corrupt history ring header")
+        ring = cls.__new__(cls)
+        ring._capacity = capacity
+        ring._window = window
+        ring._head = head
+        ring._size = size
+        ring._passed = passed
+        ring._failed = failed
+        ring._latency_sum = latency_sum
+        ring._latency_count = latency_count
+        ring._evictions = 0
+        offset = _RING_HEADER.size
+        ring._timestamps, offset = _read_array("d", view, offset, capacity)
+        ring._latencies, offset = _read_array("f", view, offset, capacity)
+        bitset_len = (capacity + 7) // 8
+        if offset + bitset_len > len(view):
+            raise ValueError("Truncated history data")
+        ring._success = bytearray(view[offset:offset + bitset_len])
+        offset += bitset_len
+        ring._series, offset = BucketSeries.load(view, offset)
+        # Whether entries were evicted isn't stored; a full ring may have lost
+        # some just before its oldest entry
+        ring._evicted_until = ring._timestamps[head] if size and size == capacity else -math.inf
+        return ring
+
+    def last(self) -> Optional[Tuple[float, bool, Optional[float]]]:
+        """Most recent entry, if any"""
+        if self._size == 0:
+            return None
+        index = (self._head + self._size - 1) % self._capacity
+        latency = self._latencies[index]
+        return self._timestamps[index], self._get_success(index), None if math.isnan(latency) else latency
+
+    def success_streak(self, limit: int) -> int:
+        """Consecutive successful checks at the end of the ring, counting at most `limit`"""
+        streak = 0
+        while streak < min(limit, self._size):
+            index = (self._head + self._size - 1 - streak) % self._capacity
+            if not self._get_success(index):
+                break
+            streak += 1
+        return streak
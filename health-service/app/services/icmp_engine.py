@@ -0,0 +1,286 @@
+"""
+Native asyncio ICMP echo engine.
+
+Sends echo requests for every target over a small, shared pool of ICMP
+sockets instead of forking one ``ping`` process per check. Unprivileged
+ICMP datagram sockets are preferred (Linux ``net.ipv4.ping_group_range``);
+raw sockets are used when the process has ``CAP_NET_RAW``. Replies are
+matched back to their request by source address and sequence number.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..models import PingResult
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# Number of datagram sockets to spread echo requests over. Raw sockets each
+# receive every ICMP reply on the host, so only one is ever opened in raw mode.
+ICMP_SOCKET_COUNT = max(1, int(os.environ.get("HEALTH_ICMP_SOCKETS", "2")))
+
+# Delay between consecutive echoes to the same target (seconds)
+ICMP_PROBE_INTERVAL = float(os.environ.get("HEALTH_ICMP_INTERVAL", "0.2"))
+
+_PAYLOAD = b"cartographer-health".ljust(32, b"\x00")
+
+
+class IcmpUnavailableError(RuntimeError):
+    """Raised when no ICMP socket could be opened"""
+
+
+def build_ping_result(latencies: List[float], transmitted: int, received: int) -> PingResult:
+    """Summarize round-trip times into a PingResult (min/avg/max/jitter/loss)"""
+    if not latencies:
+        return PingResult(success=False, packet_loss_percent=100.0, probes_sent=transmitted)
+
+    min_lat = min(latencies)
+    max_lat = max(latencies)
+    avg_lat = sum(latencies) / len(latencies)
+
+    # Jitter is the mean absolute difference between consecutive samples
+    if len(latencies) > 1:
+        jitter = sum(abs(latencies[i] - latencies[i-1]) for i in range(1, len(latencies))) / (len(latencies) - 1)
+    else:
+        jitter = 0.0
+
+    packet_loss = ((transmitted - received) / transmitted) * 100 if transmitted > 0 else 100
+
+    return PingResult(
+        success=received > 0,
+        latency_ms=avg_lat,
+        packet_loss_percent=packet_loss,
+        min_latency_ms=min_lat,
+        max_latency_ms=max_lat,
+        avg_latency_ms=avg_lat,
+        jitter_ms=jitter,
+        probes_sent=transmitted,
+    )
+
+
+def combine_ping_results(results: List[Tuple[PingResult, int]]) -> PingResult:
+    """
+    Merge (result, echoes sent) pairs for one target into a single result,
+    weighting latency by replies and counting loss over every echo sent.
+    """
+    sent = sum(count for _, count in results)
+    replied = [(result, round(count * (1 - result.packet_loss_percent / 100))) for result, count in results]
+    received = sum(count for _, count in replied)
+    answered = [(result, count) for result, count in replied if result.success and count]
+    if not answered:
+        return PingResult(success=False, packet_loss_percent=100.0, probes_sent=sent)
+    avg_lat = sum(result.avg_latency_ms * count for result, count in answered) / received
+    jitters = [result.jitter_ms for result, count in answered if count > 1 and result.jitter_ms is not None]
+    return PingResult(
+        success=True,
+        latency_ms=avg_lat,
+        packet_loss_percent=(sent - received) / sent * 100,
+        min_latency_ms=min(result.min_latency_ms or result.avg_latency_ms for result, _ in answered),
+        max_latency_ms=max(result.max_latency_ms or result.avg_latency_ms for result, _ in answered),
+        avg_latency_ms=avg_lat,
+        jitter_ms=jitters[-1] if jitters else 0.0,
+        probes_sent=sent,
+    )
+
+
+def icmp_checksum(data: bytes) -> int:
+    """RFC 1071 internet checksum"""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, seq: int, payload: bytes = _PAYLOAD) -> bytes:
+    """Build an ICMP echo request packet"""
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def parse_echo_reply(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Parse an ICMP echo reply and return (ident, seq).
+
+    Raw sockets (and datagram sockets on BSD/macOS) deliver the IPv4 header
+    in front of the ICMP message; it is stripped when present.
+    Returns None for anything that is not an echo reply.
+    """
+    if data and data[0] >> 4 == 4:
+        header_len = (data[0] & 0x0F) * 4
+        data = data[header_len:]
+    if len(data) < 8:
+        return None
+    icmp_type, _code, _checksum, ident, seq = struct.unpack("!BBHHH", data[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def is_ipv4_address(value: str) -> bool:
+    """Whether a target is a literal IPv4 address the engine can probe"""
+    try:
+        return isinstance(ipaddress.ip_address(value), ipaddress.IPv4Address)
+    except ValueError:
+        return False
+
+
+class IcmpEngine:
+    """Multiplexes ICMP echo requests for many targets over a few sockets"""
+
+    def __init__(self, socket_count: int = ICMP_SOCKET_COUNT, probe_interval: float = ICMP_PROBE_INTERVAL):
+        self._socket_count = socket_count
+        self._probe_interval = probe_interval
+        self._sockets: List[socket.socket] = []
+        self._raw = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._available: Optional[bool] = None
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        # (target_ip, seq) -> future resolved with the receive timestamp
+        self._pending: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    @property
+    def mode(self) -> Optional[str]:
+        """Socket type in use ("dgram" or "raw"), or None if not open"""
+        if not self._sockets:
+            return None
+        return "raw" if self._raw else "dgram"
+
+    def _open_sockets(self) -> None:
+        """Open datagram ICMP sockets, falling back to a single raw socket"""
+        sockets: List[socket.socket] = []
+        raw = False
+        try:
+            for _ in range(self._socket_count):
+                sockets.append(socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP))
+        except OSError as e:
+            for sock in sockets:
+                sock.close()
+            sockets = []
+            logger.debug(f"Unprivileged ICMP sockets unavailable ({e}), trying raw socket")
+            try:
+                sockets = [socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)]
+                raw = True
+            except OSError as raw_error:
+                raise IcmpUnavailableError(f"Cannot open ICMP socket: {raw_error}") from raw_error
+
+        for sock in sockets:
+            sock.setblocking(False)
+        self._sockets = sockets
+        self._raw = raw
+
+    def _ensure_open(self) -> None:
+        """Open sockets and attach readers to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._sockets and self._loop is loop and not loop.is_closed():
+            return
+        self.close()
+        self._open_sockets()
+        self._loop = loop
+        for sock in self._sockets:
+            loop.add_reader(sock.fileno(), self._on_readable, sock)
+        logger.info(f"ICMP engine using {len(self._sockets)} {self.mode} socket(s)")
+
+    def is_available(self) -> bool:
+        """Check (once) whether ICMP sockets can be opened in this process"""
+        if self._sockets:
+            return True
+        if self._available is None:
+            try:
+                self._open_sockets()
+                self._available = True
+            except IcmpUnavailableError as e:
+                logger.warning(f"Native ICMP engine unavailable, using ping subprocess: {e}")
+                self._available = False
+            finally:
+                for sock in self._sockets:
+                    sock.close()
+                self._sockets = []
+        return self._available
+
+    def close(self) -> None:
+        """Detach readers and close all sockets"""
+        for sock in self._sockets:
+            if self._loop is not None and not self._loop.is_closed():
+                try:
+                    self._loop.remove_reader(sock.fileno())
+                except Exception:
+                    pass
+            sock.close()
+        self._sockets = []
+        self._loop = None
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    def _on_readable(self, sock: socket.socket) -> None:
+        """Drain every queued reply from a socket"""
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f"ICMP receive error: {e}")
+                return
+            self._handle_packet(data, addr[0], time.perf_counter())
+
+    def _handle_packet(self, data: bytes, source_ip: str, received_at: float) -> None:
+        """Resolve the pending echo a reply belongs to"""
+        parsed = parse_echo_reply(data)
+        if parsed is None:
+            return
+        ident, seq = parsed
+        # Datagram sockets have their id rewritten by the kernel and only see
+        # their own replies; raw sockets see everything, so check our id.
+        if self._raw and ident != self._ident:
+            return
+        future = self._pending.get((source_ip, seq))
+        if future is not None and not future.done():
+            future.set_result(received_at)
+
+    async def _echo(self, ip: str, timeout: float) -> Optional[float]:
+        """Send a single echo request and return its round-trip time in ms"""
+        seq = self._next_seq()
+        key = (ip, seq)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        sock = self._sockets[hash(ip) % len(self._sockets)]
+        try:
+            sent_at = time.perf_counter()
+            sock.sendto(build_echo_request(self._ident, seq), (ip, 0))
+            received_at = await asyncio.wait_for(future, timeout=timeout)
+            return (received_at - sent_at) * 1000
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._pending.pop(key, None)
+
+    async def ping(self, ip: str, count: int = 3, timeout: float = 2.0) -> PingResult:
+        """
+        Ping a host with `count` echo requests spaced by the probe interval.
+        Each echo waits up to `timeout` seconds for its reply.
+        """
+        self._ensure_open()
+
+        async def probe(index: int) -> Optional[float]:
+            if index:
+                await asyncio.sleep(index * self._probe_interval)
+            return await self._echo(ip, timeout)
+
+        rtts = await asyncio.gather(*(probe(i) for i in range(count)))
+        latencies = [rtt for rtt in rtts if rtt is not None]
+        return build_ping_result(latencies, transmitted=count, received=len(latencies))
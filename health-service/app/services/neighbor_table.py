@@ -0,0 +1,175 @@
+"""
+Kernel neighbor table (ARP/NDP) reader for passive liveness.
+
+Hosts on the same L2 segment as the service already have neighbor entries,
+and the kernel notes when each entry was last confirmed by two-way traffic
+(an ARP/NDP reply or an upper-layer acknowledgement). The table is dumped
+over an rtnetlink socket (RTM_GETNEIGH), which costs one syscall round trip
+for every neighbor at once. `/proc/net/arp` is not used because it carries
+no confirmation time, so it cannot tell a live host from a stale entry.
+"""
+
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a neighbor table dump is reused before the kernel is asked again
+NEIGHBOR_REFRESH_SECONDS = float(os.environ.get("HEALTH_NEIGHBOR_REFRESH", "2.0"))
+
+NETLINK_ROUTE = 0
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+
+NDA_DST = 1
+NDA_LLADDR = 2
+NDA_CACHEINFO = 3
+
+# Neighbor unreachability detection states (include/uapi/linux/neighbour.h)
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_FAILED = 0x20
+NUD_NOARP = 0x40
+NUD_PERMANENT = 0x80
+
+# Entries that say nothing about whether the host answered recently
+_UNCONFIRMED_STATES = NUD_INCOMPLETE | NUD_FAILED | NUD_NOARP | NUD_PERMANENT
+
+_NLMSGHDR = struct.Struct("=LHHLL")
+_NDMSG = struct.Struct("=BxxxiHBB")
+_RTATTR = struct.Struct("=HH")
+_CACHEINFO = struct.Struct("=LLLL")
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+@dataclass
+class NeighborEntry:
+    """One kernel neighbor table entry"""
+    ip: str
+    state: int
+    ifindex: int
+    mac: Optional[str] = None
+    confirmed_age_seconds: Optional[float] = None  # Since the entry was last confirmed
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def parse_neighbor_messages(data: bytes, clock_ticks: int = _CLOCK_TICKS) -> Tuple[List[NeighborEntry], bool]:
+    """Parse a buffer of netlink messages; returns (entries, dump finished)"""
+    entries: List[NeighborEntry] = []
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        if msg_type == NLMSG_DONE:
+            return entries, True
+        if msg_type == NLMSG_ERROR:
+            (error,) = struct.unpack_from("=i", data, offset + _NLMSGHDR.size)
+            raise OSError(-error, "RTM_GETNEIGH failed")
+        if msg_type == RTM_NEWNEIGH:
+            entry = _parse_neighbor(data[offset + _NLMSGHDR.size:offset + length], clock_ticks)
+            if entry is not None:
+                entries.append(entry)
+        offset += _align(length)
+    return entries, False
+
+
+def _parse_neighbor(payload: bytes, clock_ticks: int) -> Optional[NeighborEntry]:
+    family, ifindex, state, _, _ = _NDMSG.unpack_from(payload)
+    ip = mac = confirmed_age = None
+    offset = _NDMSG.size
+    while offset + _RTATTR.size <= len(payload):
+        length, attr_type = _RTATTR.unpack_from(payload, offset)
+        if length < _RTATTR.size:
+            break
+        value = payload[offset + _RTATTR.size:offset + length]
+        if attr_type == NDA_DST and family in (socket.AF_INET, socket.AF_INET6):
+            ip = str(ipaddress.ip_address(value))
+        elif attr_type == NDA_LLADDR and value:
+            mac = ":".join(f"{b:02x}" for b in value)
+        elif attr_type == NDA_CACHEINFO and len(value) >= _CACHEINFO.size:
+            confirmed, _, _, _ = _CACHEINFO.unpack_from(value)
+            confirmed_age = confirmed / clock_ticks
+        offset += _align(length)
+    if ip is None:
+        return None
+    return NeighborEntry(ip=ip, state=state, ifindex=ifindex, mac=mac, confirmed_age_seconds=confirmed_age)
+
+
+def dump_neighbors() -> List[NeighborEntry]:
+    """Read every IPv4 and IPv6 neighbor entry; raises OSError without rtnetlink"""
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+        sock.bind((0, 0))
+        request = _NDMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(request), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+        entries: List[NeighborEntry] = []
+        while True:
+            batch, done = parse_neighbor_messages(sock.recv(65536))
+            entries.extend(batch)
+            if done:
+                return entries
+
+
+class NeighborTable:
+    """Cached view of the kernel neighbor table, refreshed at most every few seconds"""
+
+    def __init__(self, refresh_seconds: float = NEIGHBOR_REFRESH_SECONDS, reader=dump_neighbors):
+        self._refresh_seconds = refresh_seconds
+        self._reader = reader
+        self._entries: Dict[str, NeighborEntry] = {}
+        self._read_at: Optional[float] = None
+        self._available = True
+        self._reads = 0
+
+    @property
+    def available(self) -> bool:
+        """False once the table could not be read (no rtnetlink, e.g. non-Linux hosts)"""
+        return self._available
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._read_at is not None and now - self._read_at < self._refresh_seconds:
+            return
+        self._read_at = now
+        try:
+            self._entries = {entry.ip: entry for entry in self._reader()}
+            self._reads += 1
+        except OSError as e:
+            logger.warning(f"Neighbor table unavailable, passive liveness disabled: {e}")
+            self._available = False
+            self._entries = {}
+
+    def lookup(self, ip: str) -> Optional[NeighborEntry]:
+        if not self._available:
+            return None
+        self._refresh()
+        return self._entries.get(ip)
+
+    def is_alive(self, ip: str, max_age_seconds: float) -> bool:
+        """True if the kernel confirmed two-way traffic with `ip` within `max_age_seconds`"""
+        entry = self.lookup(ip)
+        if entry is None or entry.state & _UNCONFIRMED_STATES:
+            return False
+        if entry.confirmed_age_seconds is None:
+            return bool(entry.state & NUD_REACHABLE)
+        return entry.confirmed_age_seconds <= max_age_seconds
+
+    def get_stats(self) -> dict:
+        return {"available": self._available, "reads": self._reads, "entries": len(self._entries)}
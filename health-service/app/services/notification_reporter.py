@@ -3,12 +3,18 @@ Notification reporter service.
 
 Reports health check results to the notification service for
 anomaly detection and alerting.
+
+Monitoring results go through NotificationReporter, which buffers them and
+ships them in batches to the bulk ingest endpoint over one persistent client,
+retrying with backoff while the notification service is unavailable.
 """
 
 import os
+import uuid
 import asyncio
 import logging
-from typing import Optional, Dict
+from collections import deque
+from typing import Optional, Dict, Deque, List, Set, Tuple
 from datetime import datetime
 
 import httpx
@@ -18,114 +24,231 @@ logger = logging.getLogger(__name__)
 # Notification service URL
 NOTIFICATION_SERVICE_URL = os.environ.get("NOTIFICATION_SERVICE_URL", "http://localhost:8005")
 
+# Batching of monitoring results
+REPORT_BATCH_SIZE = int(os.environ.get("HEALTH_REPORT_BATCH_SIZE", "200"))
+REPORT_FLUSH_INTERVAL = float(os.environ.get("HEALTH_REPORT_FLUSH_INTERVAL", "2.0"))
+REPORT_BUFFER_MAX = int(os.environ.get("HEALTH_REPORT_BUFFER_MAX", "20000"))
+REPORT_MAX_BACKOFF = 60.0
+# Long enough for the notification service to apply a full batch; a timed
+# out batch is resent with the same batch_id, so a late success isn't doubled
+REPORT_TIMEOUT = float(os.environ.get("HEALTH_REPORT_TIMEOUT", "30.0"))
+
 # Track previous states for state change detection
 _previous_states: Dict[str, str] = {}
 
+# Networks whose device changes weren't delivered; the registry has already
+# applied them, so the next sync for the network sends the full device list
+_unsynced_networks: Set[str] = set()
 
-async def report_health_check(
-    device_ip: str,
-    success: bool,
-    network_id: Optional[str] = None,
-    latency_ms: Optional[float] = None,
-    packet_loss: Optional[float] = None,
-    device_name: Optional[str] = None,
-) -> bool:
+
+def _track_state(device_ip: str, success: bool) -> Optional[str]:
+    """Record the device's current state and return the previous one"""
+    previous_state = _previous_states.get(device_ip)
+    _previous_states[device_ip] = "online" if success else "offline"
+    return previous_state
+
+
+class NotificationReporter:
     """
-    Report a health check result to the notification service.
+    Buffers health check results and delivers them in batches.
     
-    This enables:
-    - ML-based anomaly detection
-    - Automatic notification dispatch
+    Results are appended in check order, so previous_state transitions stay
+    consistent. A flush happens when a batch fills up or `flush_interval`
+    after the first result of a cycle is queued. A failed batch is held back
+    and resent unchanged, under the same batch_id, with exponential backoff,
+    so the notification service can discard a retry of a batch it already
+    applied. When the buffer exceeds `max_buffer` the oldest results are dropped.
+    """
     
-    Args:
-        device_ip: IP address of the device
-        success: Whether the health check succeeded
-        network_id: The network this device belongs to (required for notifications)
-        latency_ms: Optional latency measurement
-        packet_loss: Optional packet loss percentage
-        device_name: Optional device name
+    def __init__(
+        self,
+        batch_size: int = REPORT_BATCH_SIZE,
+        flush_interval: float = REPORT_FLUSH_INTERVAL,
+        max_buffer: int = REPORT_BUFFER_MAX,
+    ):
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._max_buffer = max(self._batch_size, max_buffer)
+        self._buffer: Deque[dict] = deque()
+        # Batch that failed to deliver, retried before anything newer
+        self._pending: Optional[Tuple[str, List[dict]]] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._consecutive_failures = 0
+        self._delivered = 0
+        self._dropped = 0
     
-    Returns True if successfully reported, False otherwise.
+    @property
+    def queue_depth(self) -> int:
+        pending = len(self._pending[1]) if self._pending else 0
+        return len(self._buffer) + pending
     
-    Note: If network_id is None, the notification service will not send notifications
-    but will still train the ML model.
-    """
-    global _previous_states
+    def get_stats(self) -> dict:
+        """Delivery counters for monitoring"""
+        return {
+            "queued": self.queue_depth,
+            "delivered": self._delivered,
+            "dropped": self._dropped,
+            "consecutive_failures": self._consecutive_failures,
+        }
     
-    # Get previous state for this device
-    previous_state = _previous_states.get(device_ip)
+    def enqueue(
+        self,
+        device_ip: str,
+        success: bool,
+        network_id: Optional[str] = None,
+        latency_ms: Optional[float] = None,
+        packet_loss: Optional[float] = None,
+        device_name: Optional[str] = None,
+    ) -> bool:
+        """
+        Queue a health check result for delivery. Must be called from the event loop.
+        
+        Returns True if queued, False if skipped (no network_id).
+        """
+        previous_state = _track_state(device_ip, success)
+        
+        if network_id is None:
+            logger.debug(f"Skipping notification report for {device_ip} (no network_id)")
+            return False
+        
+        report = {"device_ip": device_ip, "success": success, "network_id": network_id}
+        if latency_ms is not None:
+            report["latency_ms"] = latency_ms
+        if packet_loss is not None:
+            report["packet_loss"] = packet_loss
+        if device_name is not None:
+            report["device_name"] = device_name
+        if previous_state is not None:
+            report["previous_state"] = previous_state
+        
+        self._buffer.append(report)
+        self._trim()
+        self._ensure_flusher()
+        if len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+        return True
     
-    # Update tracked state
-    current_state = "online" if success else "offline"
-    _previous_states[device_ip] = current_state
+    def _trim(self) -> None:
+        """Drop the oldest results beyond the buffer cap"""
+        overflow = len(self._buffer) - self._max_buffer
+        if overflow > 0:
+            for _ in range(overflow):
+                self._buffer.popleft()
+            self._dropped += overflow
+            logger.warning(f"Notification report buffer full, dropped {overflow} oldest results")
     
-    # Skip reporting if no network_id (device not part of a monitored network)
-    if network_id is None:
-        logger.debug(f"Skipping notification report for {device_ip} (no network_id)")
-        return False
+    def _ensure_flusher(self) -> None:
+        """Start the flush task on the current loop if it isn't running"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # New event loop (e.g. app restart in tests): the old client and task are unusable
+            self._loop = loop
+            self._client = None
+            self._flush_task = None
+            self._wakeup = asyncio.Event()
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_loop())
     
-    try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            params = {
-                "device_ip": device_ip,
-                "success": success,
-                "network_id": network_id,
-            }
-            
-            if latency_ms is not None:
-                params["latency_ms"] = latency_ms
-            if packet_loss is not None:
-                params["packet_loss"] = packet_loss
-            if device_name is not None:
-                params["device_name"] = device_name
-            if previous_state is not None:
-                params["previous_state"] = previous_state
-            
-            response = await client.post(
-                f"{NOTIFICATION_SERVICE_URL}/api/notifications/process-health-check",
-                params=params,
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=REPORT_TIMEOUT,
+                limits=httpx.Limits(max_connections=2, max_keepalive_connections=2),
             )
-            
-            if response.status_code == 200:
-                return True
-            else:
-                logger.warning(f"Notification service returned {response.status_code}: {response.text}")
+        return self._client
+    
+    def _backoff_delay(self) -> float:
+        return min(REPORT_MAX_BACKOFF, self._flush_interval * (2 ** (self._consecutive_failures - 1)))
+    
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if not self._buffer and self._pending is None:
+                    continue
+                if not await self.flush():
+                    delay = self._backoff_delay()
+                    logger.debug(f"Notification delivery failed, retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in notification report loop: {e}")
+                await asyncio.sleep(self._flush_interval)
+    
+    async def flush(self) -> bool:
+        """
+        Deliver everything buffered, one batch per request.
+        
+        Returns False if a batch could not be delivered (it is kept for the next flush).
+        """
+        while self._pending is not None or self._buffer:
+            if self._pending is None:
+                count = min(self._batch_size, len(self._buffer))
+                batch: List[dict] = [self._buffer.popleft() for _ in range(count)]
+                self._pending = (uuid.uuid4().hex, batch)
+            batch_id, batch = self._pending
+            if not await self._send_batch(batch_id, batch):
+                self._consecutive_failures += 1
                 return False
-                
-    except httpx.ConnectError:
-        logger.debug("Notification service not available")
-        return False
-    except Exception as e:
-        logger.warning(f"Failed to report health check to notification service: {e}")
-        return False
-
-
-async def report_health_checks_batch(
-    results: Dict[str, tuple],  # ip -> (success, latency_ms, packet_loss, device_name)
-) -> int:
-    """
-    Report multiple health check results in parallel.
+            self._pending = None
+            self._consecutive_failures = 0
+        return True
     
-    Returns the number of successfully reported checks.
-    """
-    tasks = []
-    for device_ip, (success, latency_ms, packet_loss, device_name) in results.items():
-        tasks.append(report_health_check(
-            device_ip=device_ip,
-            success=success,
-            latency_ms=latency_ms,
-            packet_loss=packet_loss,
-            device_name=device_name,
-        ))
+    async def _send_batch(self, batch_id: str, batch: List[dict]) -> bool:
+        """POST one batch. Returns False if it should be retried."""
+        try:
+            response = await self._get_client().post(
+                f"{NOTIFICATION_SERVICE_URL}/api/notifications/process-health-checks",
+                json={"batch_id": batch_id, "results": batch},
+            )
+        except httpx.TransportError as e:
+            logger.debug(f"Notification service not available: {e}")
+            return False
+        except Exception as e:
+            logger.warning(f"Failed to report health checks to notification service: {e}")
+            return False
+        
+        if response.status_code == 200:
+            self._delivered += len(batch)
+            return True
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            logger.warning(f"Notification service returned {response.status_code}, will retry")
+            return False
+        # Other client errors won't succeed on retry
+        self._dropped += len(batch)
+        logger.warning(f"Notification service rejected {len(batch)} results ({response.status_code}): {response.text}")
+        return True
     
-    results = await asyncio.gather(*tasks)
-    return sum(1 for r in results if r)
+    async def close(self) -> None:
+        """Stop the flush task, make a final delivery attempt and close the client"""
+        if self._loop is not asyncio.get_running_loop():
+            # Started on an earlier event loop (e.g. app restart in tests): its task and client are unusable
+            self._flush_task = None
+            self._client = None
+            return
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self.queue_depth:
+            await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
 
 def clear_state_tracking():
     """Clear tracked device states (for testing/reset)"""
     global _previous_states
     _previous_states.clear()
+    _unsynced_networks.clear()
 
 
 async def sync_devices_with_notification_service(device_ips: list, network_id: Optional[str] = None) -> bool:
@@ -155,6 +278,7 @@ async def sync_devices_with_notification_service(device_ips: list, network_id: O
             
             if response.status_code == 200:
                 logger.info(f"Synced {len(device_ips)} devices with notification service for network {network_id}")
+                _unsynced_networks.discard(network_id)
                 return True
             else:
                 logger.warning(f"Notification service returned {response.status_code}: {response.text}")
@@ -167,3 +291,65 @@ async def sync_devices_with_notification_service(device_ips: list, network_id: O
         logger.warning(f"Failed to sync devices with notification service: {e}")
         return False
 
+
+async def sync_device_changes_with_notification_service(
+    network_id: str,
+    added: List[str],
+    removed: List[str],
+    current_devices: Optional[List[str]] = None,
+) -> bool:
+    """
+    Send only the devices added to and removed from a network since the last sync.
+    
+    Falls back to a full sync of `current_devices` if the notification
+    service predates the incremental endpoint. The registry applies changes
+    before they are sent, so a failed send marks the network unsynced and its
+    next sync sends `current_devices` in full, even if nothing changed since.
+    
+    Returns True if successfully synced (or there was nothing to sync), False otherwise.
+    """
+    if network_id in _unsynced_networks and current_devices is not None:
+        return await sync_devices_with_notification_service(current_devices, network_id=network_id)
+    if not added and not removed:
+        return True
+    if not await _send_device_changes(network_id, added, removed, current_devices):
+        _unsynced_networks.add(network_id)
+        return False
+    return True
+
+
+async def _send_device_changes(
+    network_id: str,
+    added: List[str],
+    removed: List[str],
+    current_devices: Optional[List[str]],
+) -> bool:
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.post(
+                f"{NOTIFICATION_SERVICE_URL}/api/notifications/ml/sync-devices/changes",
+                params={"network_id": network_id},
+                json={"added": added, "removed": removed},
+            )
+            
+            if response.status_code == 200:
+                logger.info(
+                    f"Synced device changes with notification service for network {network_id}: "
+                    f"+{len(added)} -{len(removed)}"
+                )
+                return True
+            if response.status_code in (404, 405) and current_devices is not None:
+                return await sync_devices_with_notification_service(current_devices, network_id=network_id)
+            logger.warning(f"Notification service returned {response.status_code}: {response.text}")
+            return False
+                
+    except httpx.ConnectError:
+        logger.debug("Notification service not available for device sync")
+        return False
+    except Exception as e:
+        logger.warning(f"Failed to sync device changes with notification service: {e}")
+        return False
+
+
+# Singleton instance
+notification_reporter = NotificationReporter()
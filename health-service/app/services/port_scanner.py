@@ -0,0 +1,258 @@
+"""
+TCP port scan engine.
+
+Ports are probed with non-blocking connects, capped by a global limit on
+in-flight connection attempts shared by every scan in the process. Each
+connect timeout is derived from the device's measured RTT, so LAN hosts
+are scanned with sub-second timeouts. Open-port results are cached per
+device for a TTL, and identical scans already running are joined instead
+of repeated.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..models import PortCheckResult
+
+logger = logging.getLogger(__name__)
+
+PORT_SCAN_MAX_IN_FLIGHT = int(os.environ.get("HEALTH_PORT_SCAN_CONCURRENCY", "256"))
+PORT_SCAN_CACHE_TTL = float(os.environ.get("HEALTH_PORT_CACHE_TTL", "300"))
+PORT_SCAN_DEFAULT_SET = os.environ.get("HEALTH_PORT_SET", "quick")
+PORT_SCAN_MAX_PORTS = int(os.environ.get("HEALTH_PORT_SCAN_MAX_PORTS", "4096"))
+
+# Connect timeout = RTT * multiplier, clamped to [min, max]; max is used when RTT is unknown
+PORT_SCAN_MIN_TIMEOUT = 0.2
+PORT_SCAN_MAX_TIMEOUT = 2.0
+PORT_SCAN_RTT_MULTIPLIER = 4.0
+
+# Common ports to check for different services
+COMMON_PORTS = {
+    22: "SSH",
+    80: "HTTP",
+    443: "HTTPS",
+    21: "FTP",
+    23: "Telnet",
+    25: "SMTP",
+    53: "DNS",
+    110: "POP3",
+    143: "IMAP",
+    3389: "RDP",
+    5900: "VNC",
+    8080: "HTTP-Alt",
+    8443: "HTTPS-Alt",
+    445: "SMB",
+    139: "NetBIOS",
+}
+
+# Extra service names for ports in the larger sets
+SERVICE_NAMES = {
+    **COMMON_PORTS,
+    111: "RPC",
+    161: "SNMP",
+    389: "LDAP",
+    554: "RTSP",
+    631: "IPP",
+    993: "IMAPS",
+    995: "POP3S",
+    1433: "MSSQL",
+    1883: "MQTT",
+    1900: "UPnP",
+    2049: "NFS",
+    3306: "MySQL",
+    5432: "PostgreSQL",
+    5060: "SIP",
+    6379: "Redis",
+    8000: "HTTP-Alt",
+    8888: "HTTP-Alt",
+    9100: "JetDirect",
+}
+
+PORT_SETS: Dict[str, List[int]] = {
+    # The original subset scanned on every include_ports check
+    "quick": [22, 80, 443, 21, 23, 53, 3389, 445, 8080],
+    "common": list(COMMON_PORTS),
+    # Nmap's 100 most frequently open TCP ports
+    "top100": [
+        7, 9, 13, 21, 22, 23, 25, 26, 37, 53, 79, 80, 81, 88, 106, 110, 111, 113, 119, 135,
+        139, 143, 144, 179, 199, 389, 427, 443, 444, 445, 465, 513, 514, 515, 543, 544, 548,
+        554, 587, 631, 646, 873, 990, 993, 995, 1025, 1026, 1027, 1028, 1029, 1110, 1433,
+        1720, 1723, 1755, 1900, 2000, 2001, 2049, 2121, 2717, 3000, 3128, 3306, 3389, 3986,
+        4899, 5000, 5009, 5051, 5060, 5101, 5190, 5357, 5432, 5631, 5666, 5800, 5900, 6000,
+        6001, 6646, 7070, 8000, 8008, 8009, 8080, 8081, 8443, 8888, 9100, 9999, 10000,
+        32768, 49152, 49153, 49154, 49155, 49156, 49157,
+    ],
+}
+
+# Close with RST instead of FIN so mass scans don't leave sockets in TIME_WAIT
+_LINGER_RESET = struct.pack("ii", 1, 0)
+
+
+def parse_port_spec(spec: str, max_ports: int = PORT_SCAN_MAX_PORTS) -> List[int]:
+    """
+    Parse a port set name ("quick", "common", "top100") or a comma separated
+    list of ports and ranges ("22,80,8000-8100"). Raises ValueError if invalid.
+    """
+    spec = spec.strip()
+    if spec in PORT_SETS:
+        return list(PORT_SETS[spec])
+
+    ports: List[int] = []
+    seen = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if part in PORT_SETS:
+            values: Iterable[int] = PORT_SETS[part]
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+            if start > end:
+                raise ValueError(f"Invalid port range: {part}")
+            values = range(start, end + 1)
+        else:
+            values = (int(part),)
+        for port in values:
+            if not 1 <= port <= 65535:
+                raise ValueError(f"Port out of range: {port}")
+            if port not in seen:
+                seen.add(port)
+                ports.append(port)
+                if len(ports) > max_ports:
+                    raise ValueError(f"Too many ports (maximum {max_ports})")
+    if not ports:
+        raise ValueError("No ports specified")
+    return ports
+
+
+def connect_timeout(rtt_ms: Optional[float]) -> float:
+    """Connect timeout for a host with the given round-trip time"""
+    if rtt_ms is None or rtt_ms <= 0:
+        return PORT_SCAN_MAX_TIMEOUT
+    timeout = (rtt_ms / 1000.0) * PORT_SCAN_RTT_MULTIPLIER
+    return min(PORT_SCAN_MAX_TIMEOUT, max(PORT_SCAN_MIN_TIMEOUT, timeout))
+
+
+class PortScanner:
+    """Shared port scan engine with a global in-flight connect limit and a per-device result cache"""
+
+    def __init__(
+        self,
+        max_in_flight: int = PORT_SCAN_MAX_IN_FLIGHT,
+        cache_ttl_seconds: float = PORT_SCAN_CACHE_TTL,
+    ):
+        self._max_in_flight = max(1, max_in_flight)
+        self._cache_ttl = cache_ttl_seconds
+        # IP -> (expires_at, {port: result}) for every port scanned
+        self._cache: Dict[str, Tuple[float, Dict[int, PortCheckResult]]] = {}
+        self._in_flight: Dict[Tuple[str, Tuple[int, ...]], asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connects = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "cached_devices": len(self._cache),
+            "scans_in_flight": len(self._in_flight),
+            "connects": self._connects,
+        }
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+            self._in_flight.clear()
+        return self._semaphore
+
+    def get_cached(self, ip: str, ports: List[int]) -> Optional[List[PortCheckResult]]:
+        """Open ports among `ports` if every one of them was scanned within the TTL"""
+        entry = self._cache.get(ip)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at <= time.monotonic():
+            del self._cache[ip]
+            return None
+        if any(port not in results for port in ports):
+            return None
+        return [results[port] for port in ports if results[port].open]
+
+    def _store(self, ip: str, results: List[PortCheckResult]) -> None:
+        if self._cache_ttl <= 0:
+            return
+        entry = self._cache.get(ip)
+        merged = dict(entry[1]) if entry and entry[0] > time.monotonic() else {}
+        merged.update((r.port, r) for r in results)
+        self._cache[ip] = (time.monotonic() + self._cache_ttl, merged)
+
+    async def scan(
+        self,
+        ip: str,
+        ports: List[int],
+        rtt_ms: Optional[float] = None,
+        use_cache: bool = True,
+    ) -> List[PortCheckResult]:
+        """Scan `ports` on `ip` and return the open ones in the order requested"""
+        if use_cache:
+            cached = self.get_cached(ip, ports)
+            if cached is not None:
+                return cached
+
+        semaphore = self._get_semaphore()
+        key = (ip, tuple(ports))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._scan(ip, ports, connect_timeout(rtt_ms), semaphore))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        results = await asyncio.shield(task)
+        return [r for r in results if r.open]
+
+    def _forget(self, key: Tuple[str, Tuple[int, ...]], task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def _scan(self, ip: str, ports: List[int], timeout: float, semaphore: asyncio.Semaphore) -> List[PortCheckResult]:
+        results = await asyncio.gather(*(self._probe(ip, port, timeout, semaphore) for port in ports))
+        self._store(ip, results)
+        return results
+
+    async def _probe(self, ip: str, port: int, timeout: float, semaphore: asyncio.Semaphore) -> PortCheckResult:
+        async with semaphore:
+            self._connects += 1
+            return await self.connect(ip, port, timeout)
+
+    async def connect(self, ip: str, port: int, timeout: float) -> PortCheckResult:
+        """Single non-blocking TCP connect"""
+        service = SERVICE_NAMES.get(port)
+        loop = asyncio.get_running_loop()
+        try:
+            sock = socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            logger.debug(f"Could not create socket for {ip}:{port}: {e}")
+            return PortCheckResult(port=port, open=False, service=service)
+        try:
+            sock.setblocking(False)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+            start = time.perf_counter()
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, port)), timeout)
+            return PortCheckResult(
+                port=port,
+                open=True,
+                service=service,
+                response_time_ms=(time.perf_counter() - start) * 1000,
+            )
+        except (asyncio.TimeoutError, OSError):
+            return PortCheckResult(port=port, open=False, service=service)
+        finally:
+            sock.close()
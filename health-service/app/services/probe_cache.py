@@ -0,0 +1,88 @@
+"""
+Shared ping results for background monitoring.
+
+The same IP is often watched by several consumers: public test IPs such as
+1.1.1.1 are configured on every gateway, and a monitored device can also be
+a test IP. Monitoring probes go through this cache, so an IP is pinged once
+per window and every consumer reuses that result. Pings already in flight
+are joined, and results expire after the window.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from ..models import PingResult
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_MAX_ENTRIES = 10000
+
+
+class SharedProbeCache:
+    """IP -> latest ping result, reused by every consumer within a window"""
+
+    def __init__(self, max_entries: int = PROBE_CACHE_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._results: Dict[str, Tuple[float, PingResult]] = {}  # IP -> (monotonic time, result)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._probes = 0
+        self._shared = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "probes": self._probes,
+            "shared": self._shared,
+            "cached": len(self._results),
+            "in_flight": len(self._in_flight),
+        }
+
+    def clear(self) -> None:
+        self._results.clear()
+
+    def _check_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._in_flight.clear()
+
+    async def probe(
+        self,
+        ip: str,
+        ping: Callable[[str], Awaitable[PingResult]],
+        window_seconds: float,
+    ) -> PingResult:
+        """Ping `ip` unless it was pinged in the last `window_seconds` or is being pinged now"""
+        self._check_loop()
+        entry = self._results.get(ip)
+        if entry is not None and time.monotonic() - entry[0] < window_seconds:
+            self._shared += 1
+            return entry[1]
+
+        task = self._in_flight.get(ip)
+        if task is None:
+            self._probes += 1
+            task = asyncio.ensure_future(self._ping(ip, ping))
+            self._in_flight[ip] = task
+            task.add_done_callback(lambda t, ip=ip: self._forget(ip, t))
+        else:
+            self._shared += 1
+
+        # Shield so one consumer being cancelled doesn't abort the ping for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, ip: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(ip) is task:
+            del self._in_flight[ip]
+
+    async def _ping(self, ip: str, ping: Callable[[str], Awaitable[PingResult]]) -> PingResult:
+        result = await ping(ip)
+        self._results[ip] = (time.monotonic(), result)
+        if len(self._results) > self._max_entries:
+            # Drop the oldest half; they are far outside any window by now
+            oldest = sorted(self._results, key=lambda k: self._results[k][0])
+            for key in oldest[:len(oldest) // 2]:
+                del self._results[key]
+        return result
@@ -0,0 +1,265 @@
+"""
+Bounded-concurrency probe scheduler.
+
+All health probes (monitoring cycles and on-demand batch checks) are queued
+here instead of being gathered at once. Probes run in priority order under a
+global concurrency cap, and each subnet has an optional token-bucket rate
+limit so a large flat network is not hit with every probe at the same instant.
+
+Probes of a subnet that is out of tokens wait in a side queue for that subnet
+instead of the main queue, and one of them is moved back when the subnet's
+retry timer fires or the probe ahead of it starts, so completions elsewhere
+don't keep re-sorting probes that cannot run yet.
+"""
+
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Probe priorities (lower runs first)
+PRIORITY_GATEWAY = 0
+PRIORITY_FLAGGED = 1
+PRIORITY_NORMAL = 2
+
+
+@dataclass(order=True)
+class _QueuedProbe:
+    """A probe waiting for a concurrency slot"""
+    priority: int
+    seq: int
+    subnet: str = field(compare=False)
+    factory: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class _TokenBucket:
+    """Per-subnet rate limiter state"""
+    tokens: float
+    updated_at: float
+
+
+def subnet_key(ip: str, prefix_length: int = 24) -> str:
+    """Group an address into its enclosing subnet for rate limiting"""
+    try:
+        addr = ipaddress.ip_address(ip)
+        prefix = prefix_length if addr.version == 4 else min(128, prefix_length + 40)
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+    except ValueError:
+        return ip
+
+
+class ProbeScheduler:
+    """Runs probe coroutines in priority order with bounded concurrency"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        subnet_rate_per_second: float = 0.0,
+        subnet_prefix_length: int = 24,
+    ):
+        self._max_concurrency = max(1, max_concurrency)
+        self._subnet_rate = max(0.0, subnet_rate_per_second)
+        self._subnet_prefix_length = subnet_prefix_length
+        self._queue: List[_QueuedProbe] = []
+        self._held: Dict[str, List[_QueuedProbe]] = {}  # Subnet -> probes behind its rate limit
+        self._wakeups: Dict[str, asyncio.TimerHandle] = {}  # Subnet -> retry timer while out of tokens
+        self._counter = itertools.count()
+        self._in_flight = 0
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._completed = 0
+
+    def configure(
+        self,
+        max_concurrency: Optional[int] = None,
+        subnet_rate_per_second: Optional[float] = None,
+        subnet_prefix_length: Optional[int] = None,
+    ) -> None:
+        """Update limits; queued probes are dispatched under the new limits"""
+        if max_concurrency is not None:
+            self._max_concurrency = max(1, max_concurrency)
+        if subnet_rate_per_second is not None:
+            self._subnet_rate = max(0.0, subnet_rate_per_second)
+            self._buckets.clear()
+            self._release_all()
+        if subnet_prefix_length is not None:
+            self._subnet_prefix_length = subnet_prefix_length
+        if self._queue:
+            self._pump()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of probes waiting for a slot"""
+        return len(self._queue) + sum(len(held) for held in self._held.values())
+
+    @property
+    def in_flight(self) -> int:
+        """Number of probes currently running"""
+        return self._in_flight
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def completed(self) -> int:
+        """Total probes finished since startup"""
+        return self._completed
+
+    def submit(self, ip: str, factory: Callable[[], Awaitable[Any]], priority: int = PRIORITY_NORMAL) -> asyncio.Future:
+        """
+        Queue a probe. `factory` is called to create the coroutine once a slot
+        is free, so queued probes hold no resources while waiting.
+        """
+        future = self._enqueue(ip, factory, priority)
+        self._pump()
+        return future
+
+    async def run(self, probes: List[Tuple[str, Callable[[], Awaitable[Any]], int]]) -> List[Any]:
+        """
+        Run (ip, factory, priority) probes and return results in input order.
+        Exceptions are returned in place of results, like gather(return_exceptions=True).
+        """
+        # Queue the whole batch before dispatching so priorities apply across it
+        futures = [self._enqueue(ip, factory, priority) for ip, factory, priority in probes]
+        self._pump()
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def as_completed(
+        self,
+        probes: Iterable[Tuple[str, Callable[[], Awaitable[Any]], int]],
+        window: int,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Run (ip, factory, priority) probes and yield (ip, result) as each finishes.
+        At most `window` probes from `probes` are queued at once, so a batch of
+        thousands is consumed lazily. Exceptions are yielded in place of results.
+        Closing the iterator cancels the probes it has queued but not started.
+        """
+        source = iter(probes)
+        window = max(1, window)
+        pending: Dict[asyncio.Future, str] = {}
+
+        def refill() -> None:
+            for ip, factory, priority in itertools.islice(source, window - len(pending)):
+                pending[self._enqueue(ip, factory, priority)] = ip
+            self._pump()
+
+        try:
+            refill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    ip = pending.pop(future)
+                    if future.cancelled():
+                        yield ip, asyncio.CancelledError()
+                    else:
+                        yield ip, future.exception() or future.result()
+                refill()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _enqueue(self, ip: str, factory: Callable[[], Awaitable[Any]], priority: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        probe = _QueuedProbe(
+            priority=priority,
+            seq=next(self._counter),
+            subnet=subnet_key(ip, self._subnet_prefix_length),
+            factory=factory,
+            future=future,
+        )
+        # Behind a rate-limited subnet's earlier probes, or in the main queue
+        heapq.heappush(self._held.get(probe.subnet, self._queue), probe)
+        return future
+
+    def _take_token(self, subnet: str, now: float) -> float:
+        """Consume a token for `subnet`; returns 0 on success or seconds until one is available"""
+        if self._subnet_rate <= 0:
+            return 0.0
+        burst = max(1.0, self._subnet_rate)
+        bucket = self._buckets.get(subnet)
+        if bucket is None:
+            bucket = self._buckets[subnet] = _TokenBucket(tokens=burst, updated_at=now)
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * self._subnet_rate)
+        bucket.updated_at = now
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return 0.0
+        return (1.0 - bucket.tokens) / self._subnet_rate
+
+    def _pump(self) -> None:
+        """Start as many queued probes as the concurrency cap and rate limits allow"""
+        now = time.monotonic()
+        while self._queue and self._in_flight < self._max_concurrency:
+            probe = heapq.heappop(self._queue)
+            if probe.future.done():
+                # Caller was cancelled before the probe started
+                self._promote(probe.subnet)
+                continue
+            wait = self._take_token(probe.subnet, now)
+            if wait > 0:
+                self._hold(probe, wait)
+                continue
+            self._start(probe)
+            self._promote(probe.subnet)
+
+    def _hold(self, probe: _QueuedProbe, wait: float) -> None:
+        """Park a probe of a subnet that is out of tokens until it gets one"""
+        heapq.heappush(self._held.setdefault(probe.subnet, []), probe)
+        if probe.subnet not in self._wakeups:
+            self._wakeups[probe.subnet] = asyncio.get_running_loop().call_later(wait, self._release, probe.subnet)
+
+    def _promote(self, subnet: str) -> None:
+        """Move a rate-limited subnet's next probe to the main queue once it may have a token"""
+        held = self._held.get(subnet)
+        if held is None or subnet in self._wakeups:
+            return
+        while held:
+            probe = heapq.heappop(held)
+            if not probe.future.done():
+                heapq.heappush(self._queue, probe)
+                break
+        if not held:
+            del self._held[subnet]
+
+    def _release(self, subnet: str) -> None:
+        del self._wakeups[subnet]
+        self._promote(subnet)
+        self._pump()
+
+    def _release_all(self) -> None:
+        """Return every held probe to the main queue (the rate limit changed)"""
+        for wakeup in self._wakeups.values():
+            wakeup.cancel()
+        self._wakeups.clear()
+        for held in self._held.values():
+            self._queue.extend(held)
+        self._held.clear()
+        heapq.heapify(self._queue)
+
+    def _start(self, probe: _QueuedProbe) -> None:
+        self._in_flight += 1
+        task = asyncio.ensure_future(probe.factory())
+
+        def on_done(t: asyncio.Task) -> None:
+            self._in_flight -= 1
+            self._completed += 1
+            if not probe.future.done():
+                if t.cancelled():
+                    probe.future.cancel()
+                elif t.exception() is not None:
+                    probe.future.set_exception(t.exception())
+                else:
+                    probe.future.set_result(t.result())
+            if self._queue:
+                self._pump()
+
+        task.add_done_callback(on_done)
@@ -0,0 +1,308 @@
+"""
+Sharded monitoring across health service workers.
+
+Several health service processes (or replicas) can split the monitored
+devices between them. Every worker holds the full device registry but only
+probes the targets a consistent-hash ring assigns to it, so adding or
+removing a worker only moves roughly 1/N of the targets. Ring membership
+comes from leases: each worker renews a lease every third of its TTL and
+drops out of everyone's ring when it stops renewing. Leases live as small
+JSON files in a shared directory, which is enough for workers on one host or
+on a shared volume.
+"""
+
+import asyncio
+import base64
+import binascii
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# "off" disables sharding; "file" coordinates workers through lease files
+SHARD_MODE = os.environ.get("HEALTH_SHARD_MODE", "off").lower()
+# Directory holding worker lease files (must be shared by all workers)
+SHARD_DIR = Path(os.environ.get(
+    "HEALTH_SHARD_DIR", os.path.join(os.environ.get("HEALTH_DATA_DIR", "/app/data"), "shards")
+))
+# Stable worker identity; keep it fixed across restarts so snapshots are reused.
+# Defaults to the hostname, so instances sharing a host must each set it
+SHARD_WORKER_ID = os.environ.get("HEALTH_SHARD_WORKER_ID", "")
+# Base URL other workers use to reach this one (e.g. http://health-1:8001)
+SHARD_ADVERTISE_URL = os.environ.get("HEALTH_SHARD_ADVERTISE_URL", "")
+SHARD_LEASE_TTL_SECONDS = float(os.environ.get("HEALTH_SHARD_LEASE_TTL", "15"))
+SHARD_VIRTUAL_NODES = int(os.environ.get("HEALTH_SHARD_VNODES", "64"))
+# Timeout for requests to peer workers (merged reads, registry fan-out)
+SHARD_PEER_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_SHARD_PEER_TIMEOUT", "5"))
+
+LEASE_SUFFIX = ".lease"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring of worker IDs with virtual nodes"""
+
+    def __init__(self, workers: Iterable[str] = (), virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self._virtual_nodes = max(1, virtual_nodes)
+        self._workers: List[str] = sorted(set(workers))
+        points = sorted(
+            (_hash(f"{worker}#{i}"), worker)
+            for worker in self._workers
+            for i in range(self._virtual_nodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    @property
+    def workers(self) -> List[str]:
+        return list(self._workers)
+
+    def owner(self, key: str) -> Optional[str]:
+        """Worker responsible for `key`, or None for an empty ring"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class FileLeaseStore:
+    """
+    Worker leases as one JSON file per worker in a shared directory.
+    Files are written to a temp name and renamed, so readers never see a
+    partial lease; expired leases are ignored and cleaned up by whoever
+    notices them first.
+    """
+
+    def __init__(self, directory: Path):
+        self._directory = Path(directory)
+
+    def _path(self, worker_id: str) -> Path:
+        return self._directory / f"{worker_id}{LEASE_SUFFIX}"
+
+    def renew(self, worker_id: str, url: str, ttl_seconds: float) -> None:
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(worker_id)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({
+            "worker_id": worker_id,
+            "url": url,
+            "expires_at": time.time() + ttl_seconds,
+        }))
+        os.replace(tmp, path)
+
+    def release(self, worker_id: str) -> None:
+        try:
+            self._path(worker_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def live_workers(self) -> Dict[str, str]:
+        """Worker ID -> advertised URL for every unexpired lease"""
+        now = time.time()
+        workers: Dict[str, str] = {}
+        if not self._directory.is_dir():
+            return workers
+        for path in self._directory.glob(f"*{LEASE_SUFFIX}"):
+            try:
+                lease = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # Removed or replaced while listing
+            if lease.get("expires_at", 0) > now:
+                workers[lease["worker_id"]] = lease.get("url", "")
+            else:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        return workers
+
+
+def encode_shard_cursor(cursors: Dict[str, str]) -> str:
+    """Pack per-worker delta cursors into one opaque cursor"""
+    raw = json.dumps(cursors, sort_keys=True, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_shard_cursor(cursor: Optional[str]) -> Dict[str, str]:
+    """Unpack a merged cursor; anything unreadable starts every worker over"""
+    if not cursor:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursors = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return {}
+    if not isinstance(cursors, dict):
+        return {}
+    return {str(k): str(v) for k, v in cursors.items()}
+
+
+class ShardCoordinator:
+    """
+    Keeps this worker's lease alive and the hash ring in step with the set of
+    live workers, notifying rebalance listeners whenever membership changes.
+    """
+
+    def __init__(
+        self,
+        store: FileLeaseStore,
+        worker_id: str,
+        advertise_url: str = "",
+        lease_ttl_seconds: float = SHARD_LEASE_TTL_SECONDS,
+        virtual_nodes: int = SHARD_VIRTUAL_NODES,
+    ):
+        self._store = store
+        self.worker_id = worker_id
+        self.advertise_url = advertise_url.rstrip("/")
+        self._lease_ttl = lease_ttl_seconds
+        self._virtual_nodes = virtual_nodes
+        self._listeners: List[Callable[[], None]] = []
+        self._members: Dict[str, str] = {worker_id: self.advertise_url}
+        self._ring = HashRing([worker_id], virtual_nodes)
+        self._task: Optional[asyncio.Task] = None
+        self._rebalances = 0
+        self._last_renewal: Optional[float] = None
+
+    def add_rebalance_listener(self, listener: Callable[[], None]) -> None:
+        self._listeners.append(listener)
+
+    def owner(self, key: str) -> str:
+        return self._ring.owner(key) or self.worker_id
+
+    def owns(self, key: str) -> bool:
+        return self.owner(key) == self.worker_id
+
+    def members(self) -> Dict[str, str]:
+        """Worker ID -> URL for every worker in the ring, including this one"""
+        return dict(self._members)
+
+    def peers(self) -> Dict[str, str]:
+        """Other live workers that advertise a URL"""
+        return {wid: url for wid, url in self._members.items() if wid != self.worker_id and url}
+
+    def peer_url(self, worker_id: str) -> Optional[str]:
+        if worker_id == self.worker_id:
+            return None
+        return self._members.get(worker_id) or None
+
+    def _apply_membership(self, members: Dict[str, str]) -> bool:
+        """Rebuild the ring if the worker set changed; returns True on a rebalance"""
+        members = dict(members)
+        members[self.worker_id] = self.advertise_url  # Our own lease may lag a renewal
+        changed = set(members) != set(self._members)
+        self._members = members
+        if not changed:
+            return False
+        self._ring = HashRing(members, self._virtual_nodes)
+        self._rebalances += 1
+        logger.info(f"Shard ring now has {len(members)} workers: {', '.join(sorted(members))}")
+        for listener in self._listeners:
+            listener()
+        return True
+
+    async def refresh(self) -> bool:
+        """Renew our lease and pick up joins and departures"""
+        def renew_and_list() -> Dict[str, str]:
+            self._store.renew(self.worker_id, self.advertise_url, self._lease_ttl)
+            return self._store.live_workers()
+
+        members = await asyncio.to_thread(renew_and_list)
+        self._last_renewal = time.time()
+        return self._apply_membership(members)
+
+    async def _lease_loop(self) -> None:
+        interval = self._lease_ttl / 3
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Shard lease renewal failed: {e}")
+            try:
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                break
+
+    def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._lease_loop())
+        logger.info(f"Shard worker {self.worker_id} joining via {SHARD_MODE} leases")
+
+    async def stop(self) -> None:
+        """Stop renewing and release the lease so peers rebalance right away"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            await asyncio.to_thread(self._store.release, self.worker_id)
+        except Exception as e:
+            logger.error(f"Failed to release shard lease: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            "enabled": True,
+            "mode": SHARD_MODE,
+            "worker_id": self.worker_id,
+            "advertise_url": self.advertise_url or None,
+            "workers": self.members(),
+            "lease_ttl_seconds": self._lease_ttl,
+            "last_renewal": self._last_renewal,
+            "rebalances": self._rebalances,
+        }
+
+
+def build_shard_coordinator() -> Optional[ShardCoordinator]:
+    """Coordinator for the configured HEALTH_SHARD_MODE, or None when sharding is off"""
+    if SHARD_MODE in ("", "off"):
+        return None
+    if SHARD_MODE != "file":
+        logger.error(f"Unknown HEALTH_SHARD_MODE '{SHARD_MODE}', sharding disabled")
+        return None
+    worker_id = SHARD_WORKER_ID or socket.gethostname()
+    if not SHARD_ADVERTISE_URL:
+        logger.warning("HEALTH_SHARD_ADVERTISE_URL not set; peers can't merge reads from this worker")
+    return ShardCoordinator(FileLeaseStore(SHARD_DIR), worker_id, SHARD_ADVERTISE_URL)
+
+
+async def peer_request(
+    client: httpx.AsyncClient,
+    url: str,
+    method: str,
+    path: str,
+    params: Optional[dict] = None,
+    json_body: Optional[object] = None,
+) -> Tuple[int, Optional[object]]:
+    """Call a peer worker's API; returns (status, JSON body), with status 0 on transport errors"""
+    try:
+        response = await client.request(
+            method,
+            f"{url}{path}",
+            params={**(params or {}), "local": "true"},
+            json=json_body,
+            timeout=SHARD_PEER_TIMEOUT_SECONDS,
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"Shard peer {url} unreachable: {e}")
+        return 0, None
+    try:
+        return response.status_code, response.json()
+    except ValueError:
+        return response.status_code, None
+
+
+# Singleton instance (None unless HEALTH_SHARD_MODE enables sharding)
+shard_coordinator = build_shard_coordinator()
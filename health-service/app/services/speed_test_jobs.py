@@ -0,0 +1,214 @@
+"""
+Speed test job queue.
+
+A speed test saturates the uplink for 30-60 seconds, so two tests for the
+same gateway would skew each other. Requests for a gateway that already has
+a test queued or running attach to that job instead of starting another.
+Tests run on a small dedicated thread pool rather than the default executor,
+so a queue of speed tests can't starve DNS lookups and other threaded work.
+Each job reports its phase (server selection, download, upload) to any
+number of subscribers, and finished jobs are kept for status polling.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from ..models import SpeedTestJob, SpeedTestJobStatus, SpeedTestResult
+
+logger = logging.getLogger(__name__)
+
+# Speed tests running at once across all gateways; more wait in the queue
+SPEEDTEST_MAX_CONCURRENT = int(os.environ.get("HEALTH_SPEEDTEST_CONCURRENCY", "1"))
+# Finished jobs kept for status polling
+SPEEDTEST_JOB_HISTORY = int(os.environ.get("HEALTH_SPEEDTEST_JOB_HISTORY", "50"))
+
+# Share of overall progress covered by each phase
+PHASE_SPANS = {
+    "server_selection": (0.0, 0.1),
+    "download": (0.1, 0.55),
+    "upload": (0.55, 1.0),
+}
+# Minimum progress change before subscribers are notified again
+PROGRESS_STEP = 0.05
+
+# (phase, fraction of that phase done) -> None; safe to call from the worker thread
+ProgressReporter = Callable[[str, float], None]
+SpeedTestRunner = Callable[[Optional[str], ProgressReporter], SpeedTestResult]
+
+
+class _JobState:
+    def __init__(self, job: SpeedTestJob):
+        self.job = job
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[asyncio.Queue] = []
+
+
+class SpeedTestJobManager:
+    """Single-flight speed test jobs keyed by gateway, run on a bounded executor"""
+
+    def __init__(
+        self,
+        runner: SpeedTestRunner,
+        on_result: Optional[Callable[[Optional[str], SpeedTestResult], None]] = None,
+        max_concurrent: int = SPEEDTEST_MAX_CONCURRENT,
+        max_finished_jobs: int = SPEEDTEST_JOB_HISTORY,
+    ):
+        self._runner = runner
+        self._on_result = on_result
+        self._max_concurrent = max(1, max_concurrent)
+        self._max_finished_jobs = max_finished_jobs
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, _JobState]" = OrderedDict()  # job ID -> state, oldest first
+        self._active: Dict[str, _JobState] = {}  # gateway key -> queued or running job
+
+    @staticmethod
+    def _key(gateway_ip: Optional[str]) -> str:
+        return gateway_ip or ""
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_concurrent, thread_name_prefix="speedtest"
+            )
+        return self._executor
+
+    def submit(self, gateway_ip: Optional[str] = None) -> SpeedTestJob:
+        """Start a test for `gateway_ip`, or attach to the one already queued or running"""
+        loop = asyncio.get_running_loop()
+        key = self._key(gateway_ip)
+        state = self._active.get(key)
+        if state is not None and state.task is not None and state.task.get_loop() is loop:
+            state.job.attached_requests += 1
+            logger.info(f"Speed test request for {key or 'default'} attached to job {state.job.job_id}")
+            return state.job
+
+        job = SpeedTestJob(job_id=uuid.uuid4().hex, gateway_ip=gateway_ip, created_at=datetime.utcnow())
+        state = _JobState(job)
+        self._jobs[job.job_id] = state
+        self._active[key] = state
+        state.task = asyncio.ensure_future(self._run(state))
+        state.task.add_done_callback(lambda t, key=key, state=state: self._forget(key, state))
+        self._prune()
+        logger.info(f"Queued speed test job {job.job_id} for {key or 'default'}")
+        return job
+
+    async def wait(self, job_id: str) -> Optional[SpeedTestResult]:
+        """Wait for a job's result; None for unknown jobs"""
+        state = self._jobs.get(job_id)
+        if state is None:
+            return None
+        if state.task is None or state.task.done():
+            return state.job.result
+        # Shield so a disconnecting caller doesn't cancel the test for the others
+        return await asyncio.shield(state.task)
+
+    async def run(self, gateway_ip: Optional[str] = None) -> SpeedTestResult:
+        """Submit (or join) a test and wait for its result"""
+        job = self.submit(gateway_ip)
+        return await self.wait(job.job_id)
+
+    def get(self, job_id: str) -> Optional[SpeedTestJob]:
+        state = self._jobs.get(job_id)
+        return state.job if state else None
+
+    def list_jobs(self) -> List[SpeedTestJob]:
+        """All retained jobs, newest first"""
+        return [state.job for state in reversed(self._jobs.values())]
+
+    def subscribe(self, job_id: str) -> Optional[asyncio.Queue]:
+        """Queue receiving a job snapshot on every progress update; None for unknown jobs"""
+        state = self._jobs.get(job_id)
+        if state is None:
+            return None
+        queue: asyncio.Queue = asyncio.Queue()
+        state.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        state = self._jobs.get(job_id)
+        if state is not None and queue in state.subscribers:
+            state.subscribers.remove(queue)
+
+    def _forget(self, key: str, state: _JobState) -> None:
+        if self._active.get(key) is state:
+            del self._active[key]
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs beyond the retention limit"""
+        finished = [
+            job_id for job_id, state in self._jobs.items()
+            if state.job.status in (SpeedTestJobStatus.COMPLETED, SpeedTestJobStatus.FAILED)
+        ]
+        for job_id in finished[:max(0, len(finished) - self._max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def _publish(self, state: _JobState) -> None:
+        snapshot = state.job.model_copy(deep=True)
+        for queue in state.subscribers:
+            queue.put_nowait(snapshot)
+
+    def _progress(self, state: _JobState, phase: str, fraction: float) -> None:
+        job = state.job
+        if job.status != SpeedTestJobStatus.RUNNING:
+            return
+        start, end = PHASE_SPANS.get(phase, (job.progress, job.progress))
+        progress = round(start + (end - start) * min(max(fraction, 0.0), 1.0), 3)
+        if phase == job.phase and progress - job.progress < PROGRESS_STEP and fraction < 1.0:
+            return
+        job.phase = phase
+        job.progress = max(job.progress, progress)
+        self._publish(state)
+
+    def _started(self, state: _JobState) -> None:
+        state.job.status = SpeedTestJobStatus.RUNNING
+        state.job.started_at = datetime.utcnow()
+        self._publish(state)
+
+    async def _run(self, state: _JobState) -> SpeedTestResult:
+        loop = asyncio.get_running_loop()
+        job = state.job
+
+        def report(phase: str, fraction: float) -> None:
+            loop.call_soon_threadsafe(self._progress, state, phase, fraction)
+
+        def work() -> SpeedTestResult:
+            loop.call_soon_threadsafe(self._started, state)
+            return self._runner(job.gateway_ip, report)
+
+        try:
+            result = await loop.run_in_executor(self._get_executor(), work)
+        except Exception as e:
+            logger.error(f"Speed test job {job.job_id} failed: {e}")
+            result = SpeedTestResult(success=False, timestamp=datetime.utcnow(), error_message=str(e))
+
+        job.status = SpeedTestJobStatus.COMPLETED if result.success else SpeedTestJobStatus.FAILED
+        job.phase = "done"
+        job.progress = 1.0
+        job.finished_at = datetime.utcnow()
+        job.result = result
+        if self._on_result:
+            self._on_result(job.gateway_ip, result)
+        self._publish(state)
+        self._prune()
+        return result
+
+    def get_stats(self) -> dict:
+        statuses = [state.job.status for state in self._jobs.values()]
+        return {
+            "max_concurrent": self._max_concurrent,
+            "queued": statuses.count(SpeedTestJobStatus.QUEUED),
+            "running": statuses.count(SpeedTestJobStatus.RUNNING),
+            "retained_jobs": len(self._jobs),
+        }
+
+    def shutdown(self) -> None:
+        """Stop the executor; running tests finish in the background, queued ones are dropped"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
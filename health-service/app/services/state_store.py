@@ -0,0 +1,111 @@
+"""
+Binary snapshot file for warm restarts.
+
+The snapshot is a flat sequence of typed records (record type, key, payload)
+behind a small header and followed by a CRC32 of everything before it.
+Writes go to a temporary file that is fsynced and atomically renamed over the
+previous snapshot, so a crash mid-write leaves the last good snapshot intact.
+"""
+
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+SNAPSHOT_MAGIC = b"CGHS"
+SNAPSHOT_VERSION = 1
+
+# Record types
+RECORD_DEVICE_HISTORY = 1  # key: device IP, payload: HistoryRing.dump()
+RECORD_TEST_IP_HISTORY = 2  # key: "gateway_ip:test_ip", payload: HistoryRing.dump()
+RECORD_DEVICE_METRICS = 3  # key: device IP, payload: DeviceMetrics JSON
+RECORD_TEST_IP_METRICS = 4  # key: gateway IP, payload: JSON object of test IP -> metrics
+
+_HEADER = struct.Struct("<4sHdI")  # magic, version, written_at, record count
+_RECORD = struct.Struct("<BHI")  # type, key length, payload length
+_TRAILER = struct.Struct("<I")  # crc32
+
+Record = Tuple[int, str, bytes]
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is truncated, corrupt or of an unknown version"""
+
+
+def encode_snapshot(records: Iterable[Record], written_at: Optional[float] = None) -> bytes:
+    """Serialize records into the snapshot format"""
+    parts = []
+    count = 0
+    for record_type, key, payload in records:
+        key_bytes = key.encode("utf-8")
+        parts.append(_RECORD.pack(record_type, len(key_bytes), len(payload)))
+        parts.append(key_bytes)
+        parts.append(payload)
+        count += 1
+    header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, written_at or time.time(), count)
+    body = header + b"".join(parts)
+    return body + _TRAILER.pack(zlib.crc32(body))
+
+
+def decode_snapshot(data: bytes) -> Tuple[float, List[Record]]:
+    """Parse a snapshot, returning (written_at, records)"""
+    if len(data) < _HEADER.size + _TRAILER.size:
+        raise SnapshotError("Snapshot is truncated")
+    view = memoryview(data)
+    body = view[:-_TRAILER.size]
+    (crc,) = _TRAILER.unpack_from(view, len(body))
+    if zlib.crc32(body) != crc:
+        raise SnapshotError("Snapshot checksum mismatch")
+
+    magic, version, written_at, count = _HEADER.unpack_from(body, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a health state snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    records: List[Record] = []
+    offset = _HEADER.size
+    for _ in range(count):
+        if offset + _RECORD.size > len(body):
+            raise SnapshotError("Snapshot record header is truncated")
+        record_type, key_len, payload_len = _RECORD.unpack_from(body, offset)
+        offset += _RECORD.size
+        end = offset + key_len + payload_len
+        if end > len(body):
+            raise SnapshotError("Snapshot record is truncated")
+        key = bytes(body[offset:offset + key_len]).decode("utf-8")
+        records.append((record_type, key, bytes(body[offset + key_len:end])))
+        offset = end
+    return written_at, records
+
+
+def write_snapshot(path: Path, data: bytes) -> None:
+    """Atomically replace `path` with `data` (temp file + fsync + rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+def read_snapshot(path: Path) -> Optional[Tuple[float, List[Record]]]:
+    """Read and decode the snapshot at `path`, or None if there isn't one"""
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    return decode_snapshot(data)
@@ -0,0 +1,75 @@
+"""
+Hashed timing wheel for staggered probe scheduling.
+
+Each monitored target sits in one slot of a fixed ring of ticks. Advancing the
+wheel only touches the slots whose tick has passed, so scheduling, cancelling
+and collecting due targets are O(1) per target regardless of fleet size.
+Delays longer than one revolution are handled with a per-entry round counter.
+"""
+
+import math
+import time
+from typing import Dict, Hashable, Iterator, List, Optional
+
+
+class TimingWheel:
+    """Ring of `slots` ticks, each `tick_seconds` long"""
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512, now: Optional[float] = None):
+        self._tick = tick_seconds
+        self._slots: List[Dict[Hashable, int]] = [{} for _ in range(slots)]  # key -> remaining rounds
+        self._positions: Dict[Hashable, int] = {}  # key -> slot index
+        self._current = 0
+        self._last_advance = time.monotonic() if now is None else now
+
+    @property
+    def tick_seconds(self) -> float:
+        return self._tick
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._positions
+
+    def keys(self) -> Iterator[Hashable]:
+        return iter(self._positions)
+
+    def schedule(self, key: Hashable, delay_seconds: float) -> None:
+        """(Re)schedule `key` to fire after `delay_seconds` (at least one tick)"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay_seconds / self._tick))
+        slot = (self._current + ticks) % len(self._slots)
+        self._slots[slot][key] = (ticks - 1) // len(self._slots)
+        self._positions[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        """Remove `key` from the wheel; returns whether it was scheduled"""
+        slot = self._positions.pop(key, None)
+        if slot is None:
+            return False
+        self._slots[slot].pop(key, None)
+        return True
+
+    def advance(self, now: Optional[float] = None) -> List[Hashable]:
+        """Move the wheel forward to `now` and return every key that came due"""
+        now = time.monotonic() if now is None else now
+        elapsed_ticks = int((now - self._last_advance) / self._tick)
+        if elapsed_ticks <= 0:
+            return []
+        self._last_advance += elapsed_ticks * self._tick
+
+        due: List[Hashable] = []
+        for _ in range(elapsed_ticks):
+            self._current = (self._current + 1) % len(self._slots)
+            bucket = self._slots[self._current]
+            if not bucket:
+                continue
+            fired = [key for key, rounds in bucket.items() if rounds == 0]
+            for key in fired:
+                del bucket[key]
+                del self._positions[key]
+            for key in bucket:
+                bucket[key] -= 1
+            due.extend(fired)
+        return due
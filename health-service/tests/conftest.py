@@ -5,11 +5,11 @@ import os
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 from datetime import datetime
-from collections import deque
 
 # Set test environment variables before imports
 os.environ["NOTIFICATION_SERVICE_URL"] = "http://test-notification:8005"
 os.environ["HEALTH_DATA_DIR"] = "/tmp/test-health-data"
+os.environ["HEALTH_PING_MODE"] = "subprocess"
 
 
 @pytest.fixture
@@ -81,11 +81,26 @@ def health_checker_instance(tmp_path):
     with patch('app.services.health_checker.DATA_DIR', tmp_path):
         with patch('app.services.health_checker.GATEWAY_TEST_IPS_FILE', tmp_path / "gateway_test_ips.json"):
             with patch('app.services.health_checker.SPEED_TEST_RESULTS_FILE', tmp_path / "speed_test_results.json"):
-                checker = HealthChecker()
-                yield checker
-                # Cleanup
-                if checker._monitoring_task:
-                    checker._monitoring_task.cancel()
+                with patch('app.services.health_checker.STATE_SNAPSHOT_FILE', tmp_path / "health_state.bin"):
+                    checker = HealthChecker()
+                    yield checker
+                    # Cleanup
+                    if checker._monitoring_task:
+                        checker._monitoring_task.cancel()
+
+
+@pytest.fixture
+def make_history_ring():
+    """Build a HistoryRing from (datetime, success, latency_ms) tuples"""
+    from app.services.history_store import HistoryRing, to_epoch
+    
+    def _make(entries, capacity=1440):
+        ring = HistoryRing(capacity)
+        for ts, success, latency in entries:
+            ring.append(to_epoch(ts), success, latency)
+        return ring
+    
+    return _make
 
 
 @pytest.fixture
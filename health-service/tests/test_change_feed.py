@@ -0,0 +1,304 @@
+"""
+Unit tests for the device state change feed.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from app.models import DeviceMetrics, HealthStatus, PingResult
+from app.routers.health import _change_stream
+from app.services.change_feed import ChangeFeed, ChangeJournal, journal_state, latency_bucket
+
+
+def make_metrics(ip="192.168.1.10", success=True, latency=5.0, status=None):
+    """DeviceMetrics with a ping result"""
+    return DeviceMetrics(
+        ip=ip,
+        status=status or (HealthStatus.HEALTHY if success else HealthStatus.UNHEALTHY),
+        last_check=datetime.utcnow(),
+        ping=PingResult(
+            success=success,
+            latency_ms=latency if success else None,
+            avg_latency_ms=latency if success else None,
+            packet_loss_percent=0.0 if success else 100.0,
+        ),
+    )
+
+
+def parse_sse(chunk):
+    """Split one SSE message into (event, id, data)"""
+    fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+    return fields["event"], fields.get("id"), json.loads(fields["data"])
+
+
+class TestLatencyBucket:
+    """Tests for latency bucketing"""
+
+    def test_bucket_labels(self):
+        """Latencies should map to labelled ranges"""
+        assert latency_bucket(None) is None
+        assert latency_bucket(3.0) == "<10"
+        assert latency_bucket(10.0) == "10-50"
+        assert latency_bucket(99.9) == "50-100"
+        assert latency_bucket(150.0) == "100-200"
+        assert latency_bucket(900.0) == ">=200"
+
+
+class TestChangeFeed:
+    """Tests for change detection and replay"""
+
+    def test_first_observation_publishes(self):
+        """The first check of a device should publish its state"""
+        feed = ChangeFeed()
+        event = feed.observe(make_metrics())
+
+        assert event.seq == 1
+        assert event.reachable is True
+        assert event.latency_bucket == "<10"
+        assert feed.seq == 1
+
+    def test_unchanged_state_is_suppressed(self):
+        """Latency moving within a bucket shouldn't publish"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics(latency=2.0))
+
+        assert feed.observe(make_metrics(latency=8.0)) is None
+        assert feed.seq == 1
+
+    def test_changes_publish_with_increasing_seq(self):
+        """Bucket, reachability and status changes should each publish"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics(latency=2.0))
+        bucket_change = feed.observe(make_metrics(latency=60.0))
+        down = feed.observe(make_metrics(success=False))
+        degraded = feed.observe(make_metrics(latency=60.0, status=HealthStatus.DEGRADED))
+
+        assert [bucket_change.seq, down.seq, degraded.seq] == [2, 3, 4]
+        assert down.reachable is False
+        assert down.latency_bucket is None
+        assert degraded.status == HealthStatus.DEGRADED
+
+    def test_remove_publishes_once(self):
+        """Removing a known device should publish a removal and drop its state"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics())
+
+        event = feed.remove("192.168.1.10")
+
+        assert event.type == "removed"
+        assert feed.snapshot() == []
+        assert feed.remove("192.168.1.10") is None
+
+    def test_events_since_cursor(self):
+        """Replay should return only events after the cursor"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics(ip="10.0.0.1"))
+        cursor = feed.cursor
+        feed.observe(make_metrics(ip="10.0.0.2"))
+        feed.observe(make_metrics(ip="10.0.0.3"))
+
+        events = feed.events_since(cursor)
+
+        assert [e.ip for e in events] == ["10.0.0.2", "10.0.0.3"]
+        assert feed.events_since(feed.cursor) == []
+
+    def test_events_since_requires_resync(self):
+        """Foreign, malformed or expired cursors can't be replayed"""
+        feed = ChangeFeed(buffer_size=2)
+        for i in range(5):
+            feed.observe(make_metrics(ip=f"10.0.0.{i}"))
+
+        assert feed.events_since(None) is None
+        assert feed.events_since("garbage") is None
+        assert feed.events_since("other-epoch:3") is None
+        assert feed.events_since(feed.format_cursor(1)) is None
+        assert feed.events_since(feed.format_cursor(99)) is None
+        assert len(feed.events_since(feed.format_cursor(3))) == 2
+
+    async def test_subscriber_receives_events(self):
+        """Subscribers should receive published events in order"""
+        feed = ChangeFeed()
+        subscription = feed.subscribe()
+        feed.observe(make_metrics(ip="10.0.0.1"))
+        feed.observe(make_metrics(ip="10.0.0.2"))
+
+        assert (await subscription.get()).ip == "10.0.0.1"
+        assert (await subscription.get()).ip == "10.0.0.2"
+
+        feed.unsubscribe(subscription)
+        feed.observe(make_metrics(ip="10.0.0.3"))
+        assert feed.get_stats()["subscribers"] == 0
+
+    async def test_slow_subscriber_is_told_to_resync(self):
+        """A full queue should drop events and signal a resync instead of blocking"""
+        feed = ChangeFeed(queue_size=2)
+        subscription = feed.subscribe()
+        for i in range(5):
+            feed.observe(make_metrics(ip=f"10.0.0.{i}"))
+
+        assert await subscription.get() is None
+        feed.observe(make_metrics(ip="10.0.0.9"))
+        assert (await subscription.get()).ip == "10.0.0.9"
+
+
+class TestChangeJournal:
+    """Tests for the cursor-based change journal"""
+
+    def test_changes_in_order_without_duplicates(self):
+        """A device changed twice should appear once, at its latest position"""
+        journal = ChangeJournal()
+        journal.record("10.0.0.1")
+        cursor = journal.cursor
+        journal.record("10.0.0.2")
+        journal.record("10.0.0.3")
+        journal.record("10.0.0.2")
+
+        assert journal.changes_since(cursor) == (["10.0.0.3", "10.0.0.2"], [])
+        assert journal.changes_since(journal.cursor) == ([], [])
+
+    def test_unchanged_state_is_not_recorded(self):
+        """Checks that leave status, reachability, latency bucket and error as they were are skipped"""
+        start = datetime(2024, 1, 1, 12, 0, 0)
+
+        def state(latency, seconds=0, error=None):
+            metrics = make_metrics("10.0.0.1", latency=latency)
+            metrics.last_check = start + timedelta(seconds=seconds)
+            metrics.error_message = error
+            return journal_state(metrics)
+
+        journal = ChangeJournal()
+        journal.record("10.0.0.1", state(5.0))
+        cursor = journal.cursor
+
+        journal.record("10.0.0.1", state(8.0, seconds=30))
+        assert journal.changes_since(cursor) == ([], [])
+
+        journal.record("10.0.0.1", state(60.0, seconds=31))
+        assert journal.changes_since(cursor) == (["10.0.0.1"], [])
+
+        cursor = journal.cursor
+        journal.record("10.0.0.1", state(60.0, seconds=32, error="timeout"))
+        assert journal.changes_since(cursor) == (["10.0.0.1"], [])
+
+        # A removed device is recorded again when it comes back in the same state
+        journal.remove("10.0.0.1")
+        cursor = journal.cursor
+        journal.record("10.0.0.1", state(60.0, seconds=33, error="timeout"))
+        assert journal.changes_since(cursor) == (["10.0.0.1"], [])
+
+    def test_steady_devices_recorded_once_per_refresh_period(self):
+        """Counters and history change on every check, so a steady device still shows up every period"""
+        start = datetime(2024, 1, 1, 12, 0, 0)
+        journal = ChangeJournal()
+        cursor = journal.cursor
+        recorded = []
+        for seconds in range(0, 300, 30):
+            metrics = make_metrics("10.0.0.1")
+            metrics.last_check = start + timedelta(seconds=seconds)
+            journal.record("10.0.0.1", journal_state(metrics))
+            changed, _ = journal.changes_since(cursor)
+            cursor = journal.cursor
+            recorded.append(bool(changed))
+
+        assert recorded == [True, False] * 5
+
+    def test_removals_and_readds(self):
+        """Removed devices should be reported until they come back"""
+        journal = ChangeJournal()
+        journal.record("10.0.0.1")
+        journal.record("10.0.0.2")
+        cursor = journal.cursor
+        journal.remove("10.0.0.1")
+        journal.remove("10.0.0.9")  # Unknown devices are ignored
+
+        assert journal.changes_since(cursor) == ([], ["10.0.0.1"])
+
+        journal.record("10.0.0.1")
+        assert journal.changes_since(cursor) == (["10.0.0.1"], [])
+
+    def test_unservable_cursors(self):
+        """Foreign, malformed, future or pre-pruning cursors need a full resync"""
+        journal = ChangeJournal(max_tombstones=1)
+        for i in range(3):
+            journal.record(f"10.0.0.{i}")
+        cursor = journal.cursor
+        journal.remove("10.0.0.0")
+        journal.remove("10.0.0.1")
+
+        assert journal.changes_since(None) is None
+        assert journal.changes_since("0") is None
+        assert journal.changes_since("other:1") is None
+        assert journal.changes_since(f"{journal.epoch}:99") is None
+        assert journal.changes_since(cursor) is None
+        assert journal.changes_since(journal.cursor) == ([], [])
+
+
+class TestChangeStream:
+    """Tests for the SSE change stream generator"""
+
+    async def test_new_subscriber_gets_snapshot_then_changes(self):
+        """Without a cursor the stream should open with a snapshot"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics(ip="10.0.0.1"))
+
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.change_feed = feed
+            stream = _change_stream(None)
+            try:
+                event, event_id, data = parse_sse(await stream.__anext__())
+                assert event == "snapshot"
+                assert event_id == feed.cursor
+                assert [d["ip"] for d in data["devices"]] == ["10.0.0.1"]
+
+                feed.observe(make_metrics(ip="10.0.0.1", success=False))
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                assert event == "change"
+                assert event_id == feed.format_cursor(2)
+                assert data["seq"] == 2
+                assert data["reachable"] is False
+            finally:
+                await stream.aclose()
+
+        assert feed.get_stats()["subscribers"] == 0
+
+    async def test_resume_replays_missed_events(self):
+        """A current cursor should replay the backlog without a snapshot"""
+        feed = ChangeFeed()
+        feed.observe(make_metrics(ip="10.0.0.1"))
+        cursor = feed.cursor
+        feed.observe(make_metrics(ip="10.0.0.2"))
+
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.change_feed = feed
+            stream = _change_stream(cursor)
+            try:
+                event, _, data = parse_sse(await stream.__anext__())
+                assert event == "change"
+                assert data["ip"] == "10.0.0.2"
+
+                feed.observe(make_metrics(ip="10.0.0.3"))
+                _, _, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                # The backlog event also sits in the queue and must not repeat
+                assert data["ip"] == "10.0.0.3"
+            finally:
+                await stream.aclose()
+
+    async def test_keepalive_and_resync_after_overflow(self):
+        """Idle streams send keepalives; a subscriber that fell behind gets a fresh snapshot"""
+        feed = ChangeFeed(queue_size=1)
+
+        with patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.CHANGE_STREAM_KEEPALIVE_SECONDS', 0.01):
+            mock_checker.change_feed = feed
+            stream = _change_stream(feed.cursor)
+            try:
+                assert await asyncio.wait_for(stream.__anext__(), 1) == ": keepalive\n\n"
+
+                feed.observe(make_metrics(ip="10.0.0.1"))
+                feed.observe(make_metrics(ip="10.0.0.2"))
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                assert event == "snapshot" and event_id == feed.format_cursor(2)
+                assert sorted(d["ip"] for d in data["devices"]) == ["10.0.0.1", "10.0.0.2"]
+            finally:
+                await stream.aclose()
@@ -0,0 +1,62 @@
+"""
+Unit tests for the per-network device registry.
+"""
+from app.services.device_registry import DeviceRegistry
+
+
+class TestDeviceRegistry:
+    """Tests for network-scoped registration diffs"""
+
+    def test_add_reports_only_new_devices(self):
+        """Adding registered devices again should be a no-op"""
+        registry = DeviceRegistry()
+        first = registry.add("net-a", ["10.0.0.1", "10.0.0.2"])
+        second = registry.add("net-a", ["10.0.0.2", "10.0.0.3"])
+
+        assert first.added == ["10.0.0.1", "10.0.0.2"]
+        assert second.added == ["10.0.0.3"]
+        assert second.total == 3
+        assert registry.owners == {"10.0.0.1": "net-a", "10.0.0.2": "net-a", "10.0.0.3": "net-a"}
+
+    def test_replace_returns_diff_and_leaves_other_networks(self):
+        """Replacing one network shouldn't clobber another"""
+        registry = DeviceRegistry()
+        registry.add("net-a", ["10.0.0.1", "10.0.0.2"])
+        registry.add("net-b", ["192.168.1.1"])
+
+        diff = registry.replace("net-a", ["10.0.0.2", "10.0.0.3"])
+
+        assert diff.added == ["10.0.0.3"]
+        assert diff.removed == ["10.0.0.1"]
+        assert registry.devices("net-b") == ["192.168.1.1"]
+        assert set(registry.owners) == {"10.0.0.2", "10.0.0.3", "192.168.1.1"}
+
+    def test_shared_ip_stays_monitored_until_last_network_drops_it(self):
+        """An IP in two networks should fall back to the remaining network"""
+        registry = DeviceRegistry()
+        registry.add("net-a", ["192.168.1.1"])
+        registry.add("net-b", ["192.168.1.1"])
+        assert registry.owners["192.168.1.1"] == "net-b"
+
+        registry.remove("net-b", ["192.168.1.1"])
+        assert registry.owners["192.168.1.1"] == "net-a"
+
+        registry.remove("net-a", ["192.168.1.1"])
+        assert registry.owners == {}
+        assert registry.network_ids() == []
+
+    def test_remove_everywhere_and_clear(self):
+        """Removing by IP should touch every network containing it"""
+        registry = DeviceRegistry()
+        registry.add("net-a", ["192.168.1.1", "192.168.1.2"])
+        registry.add("net-b", ["192.168.1.1"])
+
+        diffs = registry.remove_everywhere(["192.168.1.1"])
+        assert sorted((d.network_id, tuple(d.removed)) for d in diffs) == [
+            ("net-a", ("192.168.1.1",)),
+            ("net-b", ("192.168.1.1",)),
+        ]
+
+        cleared = registry.clear()
+        assert [(d.network_id, d.removed) for d in cleared] == [("net-a", ["192.168.1.2"])]
+        assert len(registry) == 0
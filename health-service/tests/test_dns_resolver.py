@@ -0,0 +1,157 @@
+"""
+Unit tests for the caching reverse-DNS resolver.
+"""
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.models import DnsResult
+from app.services.dns_resolver import ReverseDnsResolver, lookup_hostname, lookup_reverse_dns
+
+
+def make_lookup(result=None, delay=0.0):
+    """Blocking lookup stub that counts calls and tracks peak concurrency"""
+    state = {"calls": 0, "active": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def lookup(ip, timeout):
+        with lock:
+            state["calls"] += 1
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(delay)
+        with lock:
+            state["active"] -= 1
+        return result or DnsResult(success=True, reverse_dns=f"host-{ip}")
+
+    return lookup, state
+
+
+class TestLookupReverseDns:
+    """Tests for the blocking lookup"""
+
+    def test_passes_timeout_to_resolver(self):
+        """The PTR query should be bounded by the configured timeout"""
+        with patch('dns.reversename.from_address'):
+            with patch('dns.resolver.resolve') as mock_resolve:
+                with patch('socket.gethostbyaddr', side_effect=OSError("no host")):
+                    mock_resolve.return_value = [MagicMock(__str__=lambda self: "ptr.local.")]
+
+                    result = lookup_reverse_dns("192.168.1.1", timeout=0.5)
+
+        assert result.reverse_dns == "ptr.local"
+        assert result.resolved_hostname is None
+        assert mock_resolve.call_args.kwargs["lifetime"] == 0.5
+
+    def test_hostname_lookup_failure(self):
+        with patch('socket.gethostbyaddr', side_effect=OSError("no host")):
+            assert lookup_hostname("192.168.1.1") is None
+
+
+class TestReverseDnsResolver:
+    """Tests for caching, negative caching, dedup and the concurrency limit"""
+
+    @pytest.fixture(autouse=True)
+    def no_hostname_lookup(self):
+        with patch('app.services.dns_resolver.lookup_hostname', return_value=None) as lookup:
+            yield lookup
+
+    async def test_positive_results_cached(self):
+        """A second resolve within the TTL should not hit DNS and report a cached 0 ms lookup"""
+        lookup, state = make_lookup(delay=0.01)
+        resolver = ReverseDnsResolver(ttl_seconds=60)
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            first = await resolver.resolve("10.0.0.1")
+            second = await resolver.resolve("10.0.0.1")
+
+        assert first.reverse_dns == second.reverse_dns == "host-10.0.0.1"
+        assert first.cached is False and first.resolution_time_ms >= 10
+        assert second.cached is True and second.resolution_time_ms == 0.0
+        assert resolver.get_cached("10.0.0.1") is not second
+        assert state["calls"] == 1
+        assert resolver.get_stats()["hits"] == 1
+
+    async def test_hostname_fallback_is_bounded(self, no_hostname_lookup):
+        """gethostbyaddr answers fill in the hostname; a hung call is abandoned after the timeout"""
+        lookup, _ = make_lookup(result=DnsResult(success=False))
+        resolver = ReverseDnsResolver(timeout=0.05)
+        no_hostname_lookup.side_effect = lambda ip: "nas.local" if ip == "10.0.0.1" else time.sleep(0.5)
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            found = await resolver.resolve("10.0.0.1")
+            start = time.monotonic()
+            hung = await resolver.resolve("10.0.0.2")
+            elapsed = time.monotonic() - start
+
+        assert (found.success, found.resolved_hostname) == (True, "nas.local")
+        assert (hung.success, hung.resolved_hostname) == (False, None)
+        assert elapsed < 0.4
+
+    async def test_negative_results_use_shorter_ttl(self):
+        """Failures should be cached for the negative TTL only"""
+        lookup, state = make_lookup(result=DnsResult(success=False))
+        resolver = ReverseDnsResolver(ttl_seconds=3600, negative_ttl_seconds=10)
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            await resolver.resolve("10.0.0.1")
+            await resolver.resolve("10.0.0.1")
+            assert state["calls"] == 1
+
+            with patch('app.services.dns_resolver.time.monotonic', return_value=time.monotonic() + 11):
+                await resolver.resolve("10.0.0.1")
+
+        assert state["calls"] == 2
+
+    async def test_concurrent_lookups_deduplicated(self):
+        """Concurrent resolves of one IP should share a single lookup"""
+        lookup, state = make_lookup(delay=0.05)
+        resolver = ReverseDnsResolver()
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            results = await asyncio.gather(*(resolver.resolve("10.0.0.1") for _ in range(10)))
+
+        assert state["calls"] == 1
+        assert all(r is results[0] for r in results)
+        assert resolver.get_stats()["in_flight"] == 0
+
+    async def test_concurrency_limited(self):
+        """No more than max_concurrency lookups should run at once"""
+        lookup, state = make_lookup(delay=0.02)
+        resolver = ReverseDnsResolver(max_concurrency=3)
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            await asyncio.gather(*(resolver.resolve(f"10.0.0.{i}") for i in range(12)))
+
+        assert state["calls"] == 12
+        assert state["peak"] <= 3
+
+    async def test_cancelled_caller_does_not_abort_shared_lookup(self):
+        """Other waiters should still get the result when one caller is cancelled"""
+        lookup, state = make_lookup(delay=0.05)
+        resolver = ReverseDnsResolver()
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            first = asyncio.ensure_future(resolver.resolve("10.0.0.1"))
+            second = asyncio.ensure_future(resolver.resolve("10.0.0.1"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            result = await second
+
+        assert result.success is True
+        assert resolver.get_cached("10.0.0.1") is result
+
+    async def test_cache_bounded(self):
+        """The least recently used entries are evicted beyond max_entries"""
+        lookup, _ = make_lookup()
+        resolver = ReverseDnsResolver(max_entries=2)
+
+        with patch('app.services.dns_resolver.lookup_reverse_dns', lookup):
+            for ip in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+                await resolver.resolve(ip)
+
+        assert resolver.get_cached("10.0.0.1") is None
+        assert resolver.get_cached("10.0.0.3") is not None
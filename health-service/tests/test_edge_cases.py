@@ -6,7 +6,6 @@ import pytest
 import json
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock, AsyncMock
-from collections import deque
 
 from app.models import (
     HealthStatus,
@@ -94,12 +93,12 @@ class TestDnsEdgeCases:
 class TestHistoricalStatsEdgeCases:
     """Edge cases for historical statistics"""
     
-    def test_old_history_excluded(self, health_checker_instance):
+    def test_old_history_excluded(self, health_checker_instance, make_history_ring):
         """Should exclude history older than 24 hours"""
         old_time = datetime.utcnow() - timedelta(hours=25)
         recent_time = datetime.utcnow()
         
-        health_checker_instance._history["192.168.1.1"] = deque([
+        health_checker_instance._history["192.168.1.1"] = make_history_ring([
             (old_time, True, 20.0),
             (recent_time, True, 25.0),
             (recent_time, False, None),
@@ -112,10 +111,10 @@ class TestHistoricalStatsEdgeCases:
         assert failed == 1
         assert avg_lat == 25.0
     
-    def test_history_with_no_latencies(self, health_checker_instance):
+    def test_history_with_no_latencies(self, health_checker_instance, make_history_ring):
         """Should handle history with no latency data"""
         now = datetime.utcnow()
-        health_checker_instance._history["192.168.1.1"] = deque([
+        health_checker_instance._history["192.168.1.1"] = make_history_ring([
             (now, False, None),
             (now, False, None),
         ])
@@ -133,7 +132,7 @@ class TestCheckDeviceHealthEdgeCases:
         """Should increment consecutive failures"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             # First failure
             metrics1 = await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
             assert metrics1.consecutive_failures == 1
@@ -144,7 +143,7 @@ class TestCheckDeviceHealthEdgeCases:
     
     async def test_consecutive_failures_reset_on_success(self, health_checker_instance, mock_ping_success, mock_ping_failure):
         """Should reset consecutive failures on success"""
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             # First failure
             health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
             await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
@@ -159,7 +158,7 @@ class TestCheckDeviceHealthEdgeCases:
         """Should update last seen online on success"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
             
             assert metrics.last_seen_online is not None
@@ -254,7 +253,7 @@ class TestMonitoringLoopEdgeCases:
         health_checker_instance.set_gateway_test_ips("192.168.1.1", sample_gateway_test_ips)
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             await health_checker_instance._perform_monitoring_check()
             
             # Should have cached metrics for test IPs
@@ -464,13 +463,13 @@ class TestCheckHistoryEntry:
         history = health_checker_instance._get_test_ip_check_history("192.168.1.1", "8.8.8.8")
         assert history == []
     
-    def test_get_test_ip_check_history_with_hours(self, health_checker_instance):
+    def test_get_test_ip_check_history_with_hours(self, health_checker_instance, make_history_ring):
         """Should respect hours parameter"""
         now = datetime.utcnow()
         old_time = now - timedelta(hours=12)
         
         key = health_checker_instance._get_test_ip_history_key("192.168.1.1", "8.8.8.8")
-        health_checker_instance._test_ip_history[key] = deque([
+        health_checker_instance._test_ip_history[key] = make_history_ring([
             (old_time, True, 20.0),
             (now, True, 25.0),
         ])
@@ -6,7 +6,6 @@ import pytest
 import json
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, AsyncMock, patch
-from collections import deque
 
 from app.models import (
     HealthStatus,
@@ -14,11 +13,13 @@ from app.models import (
     DnsResult,
     PortCheckResult,
     DeviceMetrics,
+    HistoryMode,
     MonitoringConfig,
     GatewayTestIP,
     GatewayTestIPConfig,
     SpeedTestResult,
 )
+from app.services.icmp_engine import build_ping_result
 
 
 class TestHealthCheckerInit:
@@ -78,6 +79,34 @@ class TestPingHost:
             
             assert result.success is False
 
+    async def test_ping_uses_icmp_engine(self, health_checker_instance, mock_ping_success):
+        """Should use the native ICMP engine for IPv4 targets when available"""
+        engine = MagicMock()
+        engine.is_available.return_value = True
+        engine.ping = AsyncMock(return_value=mock_ping_success)
+        health_checker_instance._icmp_engine = engine
+
+        with patch('asyncio.create_subprocess_exec') as mock_exec:
+            result = await health_checker_instance.ping_host("192.168.1.1", count=2)
+
+            assert result is mock_ping_success
+            engine.ping.assert_awaited_once_with("192.168.1.1", count=2, timeout=2.0)
+            mock_exec.assert_not_called()
+
+    async def test_ping_falls_back_when_engine_unavailable(self, health_checker_instance, mock_subprocess_ping_success):
+        """Should run the ping subprocess when ICMP sockets cannot be opened"""
+        engine = MagicMock()
+        engine.is_available.return_value = False
+        health_checker_instance._icmp_engine = engine
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(mock_subprocess_ping_success, b""))
+
+        with patch('asyncio.create_subprocess_exec', return_value=mock_proc) as mock_exec:
+            result = await health_checker_instance.ping_host("192.168.1.1")
+
+            assert result.success is True
+            mock_exec.assert_called_once()
+
 
 class TestCheckDns:
     """Tests for check_dns method"""
@@ -101,6 +130,19 @@ class TestCheckDns:
                 result = await health_checker_instance.check_dns("192.168.1.1")
                 
                 assert result.success is False
+    
+    async def test_dns_cached_between_checks(self, health_checker_instance):
+        """Repeat checks should be served from the resolver cache until cleared"""
+        with patch('dns.reversename.from_address'):
+            with patch('dns.resolver.resolve', side_effect=Exception("NXDOMAIN")):
+                with patch('socket.gethostbyaddr', return_value=("hostname.local", [], [])) as mock_gethost:
+                    await health_checker_instance.check_dns("192.168.1.1")
+                    await health_checker_instance.check_dns("192.168.1.1")
+                    assert mock_gethost.call_count == 1
+                    
+                    health_checker_instance.clear_cache()
+                    await health_checker_instance.check_dns("192.168.1.1")
+                    assert mock_gethost.call_count == 2
 
 
 class TestCheckPort:
@@ -146,15 +188,33 @@ class TestScanCommonPorts:
     
     async def test_scan_returns_open_ports(self, health_checker_instance):
         """Should return only open ports"""
-        async def mock_check_port(ip, port):
+        async def mock_connect(ip, port, timeout):
             return PortCheckResult(port=port, open=port in [80, 443], service="HTTP" if port == 80 else "HTTPS")
         
-        health_checker_instance.check_port = mock_check_port
+        health_checker_instance._port_scanner.connect = mock_connect
         
         result = await health_checker_instance.scan_common_ports("192.168.1.1")
         
         assert len(result) == 2
         assert all(p.open for p in result)
+    
+    async def test_scan_uses_cached_rtt(self, health_checker_instance, sample_device_metrics):
+        """Connect timeouts should adapt to the device's last measured latency"""
+        timeouts = []
+        
+        async def mock_connect(ip, port, timeout):
+            timeouts.append(timeout)
+            return PortCheckResult(port=port, open=False)
+        
+        health_checker_instance._port_scanner.connect = mock_connect
+        health_checker_instance._metrics_cache["192.168.1.1"] = sample_device_metrics.model_copy(
+            update={"ping": PingResult(success=True, packet_loss_percent=0.0, avg_latency_ms=100.0)}
+        )
+        
+        await health_checker_instance.scan_ports("192.168.1.1", ports=[22])
+        await health_checker_instance.scan_ports("192.168.1.2", ports=[22])
+        
+        assert timeouts == [0.4, 2.0]
 
 
 class TestCheckDeviceHealth:
@@ -165,7 +225,7 @@ class TestCheckDeviceHealth:
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         health_checker_instance.check_dns = AsyncMock(return_value=mock_dns_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health("192.168.1.1")
             
             assert metrics.status == HealthStatus.HEALTHY
@@ -176,7 +236,7 @@ class TestCheckDeviceHealth:
         """Should report unhealthy status for failed ping"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health(
                 "192.168.1.1",
                 include_dns=False
@@ -184,7 +244,25 @@ class TestCheckDeviceHealth:
             
             assert metrics.status == HealthStatus.UNHEALTHY
             assert metrics.consecutive_failures == 1
-    
+
+    async def test_publishes_state_changes(self, health_checker_instance, mock_ping_success, mock_ping_failure):
+        """Only checks that change the device's state should reach the change feed"""
+        feed = health_checker_instance.change_feed
+
+        with patch('app.services.health_checker.notification_reporter'):
+            health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
+            await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
+            await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
+            health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
+            await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
+
+        events = feed.events_since(feed.format_cursor(0))
+        assert [(e.seq, e.reachable) for e in events] == [(1, True), (2, False)]
+
+        health_checker_instance.clear_cache()
+        assert feed.snapshot() == []
+        assert feed.events_since(feed.format_cursor(2))[0].type == "removed"
+
     async def test_degraded_high_packet_loss(self, health_checker_instance):
         """Should report degraded for high packet loss"""
         ping = PingResult(
@@ -195,7 +273,7 @@ class TestCheckDeviceHealth:
         )
         health_checker_instance.ping_host = AsyncMock(return_value=ping)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health(
                 "192.168.1.1",
                 include_dns=False
@@ -213,7 +291,7 @@ class TestCheckDeviceHealth:
         )
         health_checker_instance.ping_host = AsyncMock(return_value=ping)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health(
                 "192.168.1.1",
                 include_dns=False
@@ -224,11 +302,11 @@ class TestCheckDeviceHealth:
     async def test_includes_ports_when_requested(self, health_checker_instance, mock_ping_success):
         """Should scan ports when requested"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
-        health_checker_instance.scan_common_ports = AsyncMock(return_value=[
+        health_checker_instance.scan_ports = AsyncMock(return_value=[
             PortCheckResult(port=80, open=True, service="HTTP")
         ])
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             metrics = await health_checker_instance.check_device_health(
                 "192.168.1.1",
                 include_ports=True,
@@ -236,13 +314,13 @@ class TestCheckDeviceHealth:
             )
             
             assert len(metrics.open_ports) == 1
-            health_checker_instance.scan_common_ports.assert_called_once()
+            health_checker_instance.scan_ports.assert_called_once_with("192.168.1.1", rtt_ms=25.5)
     
     async def test_caches_metrics(self, health_checker_instance, mock_ping_success):
         """Should cache metrics after check"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             await health_checker_instance.check_device_health(
                 "192.168.1.1",
                 include_dns=False
@@ -251,6 +329,42 @@ class TestCheckDeviceHealth:
             cached = health_checker_instance.get_cached_metrics("192.168.1.1")
             assert cached is not None
             assert cached.ip == "192.168.1.1"
+    
+    async def test_history_attached_on_read_only(self, health_checker_instance, mock_ping_success):
+        """Background checks skip building the timeline; cache reads attach it"""
+        health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
+        
+        with patch('app.services.health_checker.notification_reporter'):
+            result = await health_checker_instance.check_device_health(
+                "192.168.1.1", include_dns=False, history=HistoryMode.NONE
+            )
+        
+        assert result.check_history == []
+        assert health_checker_instance._metrics_cache["192.168.1.1"].check_history == []
+        assert len(health_checker_instance.get_cached_metrics("192.168.1.1").check_history) == 1
+        assert len(health_checker_instance.get_all_cached_metrics()["192.168.1.1"].check_history) == 1
+    
+    def test_history_projection_modes(self, health_checker_instance, make_history_ring):
+        """none omits the timeline, downsampled returns buckets instead of raw checks"""
+        now = datetime.utcnow()
+        health_checker_instance._metrics_cache["192.168.1.1"] = DeviceMetrics(
+            ip="192.168.1.1", status=HealthStatus.HEALTHY, last_check=now
+        )
+        health_checker_instance._history["192.168.1.1"] = make_history_ring(
+            [(now - timedelta(seconds=i), i % 4 != 0, 10.0) for i in range(8, 0, -1)]
+        )
+        
+        bare = health_checker_instance.get_cached_metrics("192.168.1.1", history=HistoryMode.NONE)
+        assert bare.check_history == []
+        assert bare.history_buckets is None
+        
+        downsampled = health_checker_instance.get_cached_metrics(
+            "192.168.1.1", history=HistoryMode.DOWNSAMPLED, history_bucket="1h"
+        )
+        assert downsampled.check_history == []
+        assert sum(b.checks for b in downsampled.history_buckets) == 8
+        assert sum(b.passed for b in downsampled.history_buckets) == 6
+        assert downsampled.history_buckets[-1].avg_latency_ms == 10.0
 
 
 class TestCheckMultipleDevices:
@@ -260,7 +374,7 @@ class TestCheckMultipleDevices:
         """Should check multiple devices in parallel"""
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             results = await health_checker_instance.check_multiple_devices(
                 ips=["192.168.1.1", "192.168.1.2", "192.168.1.3"],
                 include_dns=False
@@ -271,7 +385,7 @@ class TestCheckMultipleDevices:
     
     async def test_handles_exceptions(self, health_checker_instance):
         """Should handle exceptions for individual devices"""
-        async def mock_check(ip, include_ports, include_dns):
+        async def mock_check(ip, include_ports, include_dns, history=HistoryMode.FULL, history_bucket="5m", shared_probe=False):
             if ip == "192.168.1.2":
                 raise RuntimeError("Check failed")
             return DeviceMetrics(
@@ -292,6 +406,152 @@ class TestCheckMultipleDevices:
         assert results["192.168.1.2"].error_message is not None
 
 
+class TestOnDemandChecks:
+    """Tests for max-age reuse and single-flight on-demand checks"""
+    
+    async def test_fresh_cache_is_served_without_probing(self, health_checker_instance, mock_ping_success):
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=mock_ping_success)
+        await checker.check_device_health("192.168.1.1", include_dns=False)
+        
+        metrics = await checker.get_device_health("192.168.1.1", include_dns=False, max_age_seconds=60)
+        
+        assert checker.ping_host.await_count == 1
+        assert metrics.ip == "192.168.1.1"
+    
+    async def test_stale_or_incomplete_cache_is_probed(self, health_checker_instance, mock_ping_success):
+        """Too-old metrics, or metrics missing requested DNS, need a fresh check"""
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=mock_ping_success)
+        checker.check_dns = AsyncMock(return_value=DnsResult(success=True))
+        await checker.check_device_health("192.168.1.1", include_dns=False)
+        checker._metrics_cache["192.168.1.1"].last_check -= timedelta(seconds=30)
+        
+        await checker.get_device_health("192.168.1.1", include_dns=False, max_age_seconds=10)
+        await checker.get_device_health("192.168.1.1", include_dns=True, max_age_seconds=60)
+        
+        assert checker.ping_host.await_count == 3
+    
+    async def test_concurrent_checks_share_one_probe(self, health_checker_instance, mock_ping_success):
+        checker = health_checker_instance
+        release = asyncio.Event()
+        
+        async def slow_ping(ip):
+            await release.wait()
+            return mock_ping_success
+        
+        checker.ping_host = AsyncMock(side_effect=slow_ping)
+        checker.check_dns = AsyncMock(return_value=DnsResult(success=True))
+        waiters = [
+            asyncio.ensure_future(checker.get_device_health("192.168.1.1", include_dns=True)),
+            asyncio.ensure_future(checker.get_device_health("192.168.1.1", include_dns=False)),
+            asyncio.ensure_future(checker.check_multiple_devices(["192.168.1.1"], include_dns=False)),
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        
+        # The DNS-less requests joined the check that includes DNS
+        assert checker.ping_host.await_count == 1
+        assert results[1].dns is not None
+        assert results[2]["192.168.1.1"].last_check == results[0].last_check
+    
+    async def test_batch_mixes_cached_and_probed(self, health_checker_instance, mock_ping_success):
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=mock_ping_success)
+        await checker.check_device_health("192.168.1.1", include_dns=False)
+        
+        results = await checker.check_multiple_devices(
+            ["192.168.1.1", "192.168.1.2"], include_dns=False, max_age_seconds=60
+        )
+        
+        assert set(results) == {"192.168.1.1", "192.168.1.2"}
+        assert [c.args[0] for c in checker.ping_host.await_args_list] == ["192.168.1.1", "192.168.1.2"]
+
+    
+    async def test_stream_yields_cached_first_then_each_probe(self, health_checker_instance, mock_ping_success):
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=mock_ping_success)
+        await checker.check_device_health("192.168.1.1", include_dns=False)
+        checker._scheduler.configure(max_concurrency=2)
+        ips = ["192.168.1.1"] + [f"10.0.0.{i}" for i in range(1, 21)] + ["10.0.0.1"]
+        
+        results = [
+            item async for item in checker.stream_device_checks(ips, include_dns=False, max_age_seconds=60)
+        ]
+        
+        assert results[0][0].ip == "192.168.1.1" and results[0][1] is True
+        assert sorted(m.ip for m, _ in results[1:]) == sorted(f"10.0.0.{i}" for i in range(1, 21))
+        assert not any(cached for _, cached in results[1:])
+        assert checker.ping_host.await_count == 21
+
+
+
+class TestFastPathPings:
+    """Tests for single-echo monitoring pings with escalation"""
+    
+    def _checker(self, checker, latencies, **config):
+        """Checker whose pings return the given echo latencies in order (None = lost)"""
+        replies = iter(latencies)
+        
+        async def ping(ip, count=3, timeout=2.0):
+            rtts = [next(replies) for _ in range(count)]
+            received = [rtt for rtt in rtts if rtt is not None]
+            return build_ping_result(received, transmitted=count, received=len(received))
+        
+        checker.set_monitoring_config(MonitoringConfig(dedupe_probes=False, fast_path=True, **config))
+        checker.ping_host = AsyncMock(side_effect=ping)
+        return checker
+    
+    async def _monitor(self, checker, times=1):
+        for _ in range(times):
+            metrics = await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+        return metrics
+    
+    async def test_stable_device_gets_one_echo(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [10.0] * 10, fast_path_stable_checks=2)
+        
+        await self._monitor(checker, 2)
+        metrics = await self._monitor(checker)
+        
+        counts = [call.kwargs.get("count", 3) for call in checker.ping_host.await_args_list]
+        assert counts == [3, 3, 1]
+        assert metrics.ping.fast_path is True and metrics.ping.probes_sent == 1
+        assert metrics.ping.escalated is False
+    
+    async def test_lost_echo_escalates_and_counts_the_loss(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [10.0] * 6 + [None, 10.0, 10.0, 10.0], fast_path_stable_checks=2)
+        await self._monitor(checker, 2)
+        
+        metrics = await self._monitor(checker)
+        
+        assert metrics.ping.escalated is True
+        assert metrics.ping.probes_sent == 4
+        assert metrics.ping.packet_loss_percent == 25.0
+        assert metrics.status == HealthStatus.HEALTHY
+    
+    async def test_slow_echo_escalates(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [10.0] * 6 + [80.0, 12.0, 11.0, 13.0], fast_path_stable_checks=2)
+        await self._monitor(checker, 2)
+        
+        metrics = await self._monitor(checker)
+        
+        assert metrics.ping.escalated is True
+        assert checker.ping_host.await_count == 4
+    
+    async def test_fast_path_is_configurable_per_network(self, health_checker_instance):
+        checker = self._checker(
+            health_checker_instance, [10.0] * 20, fast_path_stable_checks=1, fast_path_networks={"lab": False}
+        )
+        checker.register_devices({"192.168.1.10": "lab"})
+        
+        with patch('app.services.health_checker.notification_reporter'):
+            await self._monitor(checker, 3)
+            on_demand = await checker.check_device_health("192.168.1.10", include_dns=False)
+        
+        assert all(call.kwargs.get("count", 3) == 3 for call in checker.ping_host.await_args_list)
+        assert on_demand.ping.fast_path is False
+
 class TestCacheOperations:
     """Tests for cache operations"""
     
@@ -308,16 +568,51 @@ class TestCacheOperations:
         
         assert "192.168.1.1" in result
     
-    def test_clear_cache(self, health_checker_instance, sample_device_metrics):
+    def test_clear_cache(self, health_checker_instance, sample_device_metrics, make_history_ring):
         """Should clear all caches"""
         health_checker_instance._metrics_cache["192.168.1.1"] = sample_device_metrics
-        health_checker_instance._history["192.168.1.1"] = deque()
+        health_checker_instance._history["192.168.1.1"] = make_history_ring([])
         
         health_checker_instance.clear_cache()
         
         assert health_checker_instance._metrics_cache == {}
         assert health_checker_instance._history == {}
 
+    async def test_cached_metrics_delta(self, health_checker_instance, mock_ping_success, mock_ping_failure):
+        """Deltas should return only devices whose state changed or that were removed after the cursor"""
+        health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
+        
+        with patch('app.services.health_checker.notification_reporter'), \
+             patch('app.services.change_feed.CHANGE_JOURNAL_REFRESH_SECONDS', 1e9):
+            await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
+            await health_checker_instance.check_device_health("192.168.1.2", include_dns=False)
+            
+            initial = health_checker_instance.get_cached_metrics_delta("0")
+            assert initial.full is True
+            assert set(initial.devices) == {"192.168.1.1", "192.168.1.2"}
+            
+            # A check with the same outcome within the refresh period is not a change
+            await health_checker_instance.check_device_health("192.168.1.2", include_dns=False)
+            steady = health_checker_instance.get_cached_metrics_delta(initial.cursor)
+            assert steady.devices == {} and steady.cursor == initial.cursor
+            
+            health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
+            await health_checker_instance.check_device_health("192.168.1.2", include_dns=False)
+            delta = health_checker_instance.get_cached_metrics_delta(initial.cursor, history=HistoryMode.NONE)
+        
+        assert delta.full is False
+        assert list(delta.devices) == ["192.168.1.2"]
+        assert delta.devices["192.168.1.2"].check_history == []
+        assert delta.removed == []
+        
+        unchanged = health_checker_instance.get_cached_metrics_delta(delta.cursor)
+        assert unchanged.devices == {} and unchanged.cursor == delta.cursor
+        
+        health_checker_instance.clear_cache()
+        cleared = health_checker_instance.get_cached_metrics_delta(delta.cursor)
+        assert cleared.full is False
+        assert sorted(cleared.removed) == ["192.168.1.1", "192.168.1.2"]
+
 
 class TestHistoricalStats:
     """Tests for historical statistics"""
@@ -338,10 +633,10 @@ class TestHistoricalStats:
         assert passed == 0
         assert failed == 0
     
-    def test_calculate_stats_with_data(self, health_checker_instance):
+    def test_calculate_stats_with_data(self, health_checker_instance, make_history_ring):
         """Should calculate correct statistics"""
         now = datetime.utcnow()
-        health_checker_instance._history["192.168.1.1"] = deque([
+        health_checker_instance._history["192.168.1.1"] = make_history_ring([
             (now, True, 20.0),
             (now, True, 25.0),
             (now, False, None),
@@ -355,10 +650,10 @@ class TestHistoricalStats:
         assert passed == 3
         assert failed == 1
     
-    def test_get_check_history(self, health_checker_instance):
+    def test_get_check_history(self, health_checker_instance, make_history_ring):
         """Should return check history entries"""
         now = datetime.utcnow()
-        health_checker_instance._history["192.168.1.1"] = deque([
+        health_checker_instance._history["192.168.1.1"] = make_history_ring([
             (now, True, 20.0),
             (now, True, 25.0),
         ])
@@ -578,6 +873,31 @@ class TestMonitoringDevices:
         assert "192.168.1.10" in devices
         assert "192.168.1.20" in devices
 
+    def test_replace_network_devices_is_network_scoped(self, health_checker_instance):
+        """Replacing one network's devices should leave other networks monitored"""
+        health_checker_instance.replace_network_devices("net-a", ["192.168.1.1", "192.168.1.2"])
+        health_checker_instance.replace_network_devices("net-b", ["10.0.0.1"])
+        health_checker_instance._wheel_dirty = False
+
+        diff = health_checker_instance.replace_network_devices("net-a", ["192.168.1.2", "192.168.1.3"])
+
+        assert diff.added == ["192.168.1.3"]
+        assert diff.removed == ["192.168.1.1"]
+        assert health_checker_instance._wheel_dirty is True
+        assert sorted(health_checker_instance.get_monitored_devices()) == ["10.0.0.1", "192.168.1.2", "192.168.1.3"]
+        assert health_checker_instance._monitored_devices["10.0.0.1"] == "net-b"
+        assert health_checker_instance.get_monitored_networks() == {"net-a": 2, "net-b": 1}
+
+    def test_unchanged_registration_keeps_wheel(self, health_checker_instance):
+        """Re-registering the same devices shouldn't force a wheel resync"""
+        health_checker_instance.replace_network_devices("net-a", ["192.168.1.1"])
+        health_checker_instance._wheel_dirty = False
+
+        diff = health_checker_instance.replace_network_devices("net-a", ["192.168.1.1"])
+
+        assert diff.added == [] and diff.removed == []
+        assert health_checker_instance._wheel_dirty is False
+
 
 class TestMonitoringConfig:
     """Tests for monitoring configuration"""
@@ -649,7 +969,7 @@ class TestMonitoringLifecycle:
         health_checker_instance.register_devices({"192.168.1.1": "network-uuid-1"})
         health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
         
-        with patch('app.services.health_checker.report_health_check', new_callable=AsyncMock):
+        with patch('app.services.health_checker.notification_reporter'):
             await health_checker_instance._perform_monitoring_check()
             
             assert health_checker_instance._last_check_time is not None
@@ -663,6 +983,276 @@ class TestMonitoringLifecycle:
         
         # Should not have updated last check time
         assert health_checker_instance._last_check_time is None
+        assert health_checker_instance.get_monitoring_status().skipped_cycles == 1
+
+    async def test_perform_monitoring_check_records_cycle_metrics(self, health_checker_instance, mock_ping_success):
+        """Should expose cycle duration and overruns through the status"""
+        health_checker_instance.register_devices({"192.168.1.1": "network-uuid-1"})
+        health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_success)
+        health_checker_instance._monitoring_config.check_interval_seconds = 0
+
+        with patch('app.services.health_checker.notification_reporter'):
+            await health_checker_instance._perform_monitoring_check()
+
+        status = health_checker_instance.get_monitoring_status()
+        assert status.last_cycle_duration_seconds is not None
+        assert status.overrun_count == 1
+        assert status.queue_depth == 0
+        assert status.max_concurrent_checks == 64
+
+    def test_probe_priority(self, health_checker_instance, sample_gateway_test_ips):
+        """Gateways first, then devices that are not healthy"""
+        from app.services.probe_scheduler import PRIORITY_GATEWAY, PRIORITY_FLAGGED, PRIORITY_NORMAL
+        health_checker_instance.set_gateway_test_ips("192.168.1.1", sample_gateway_test_ips)
+        health_checker_instance._metrics_cache["192.168.1.5"] = DeviceMetrics(
+            ip="192.168.1.5",
+            status=HealthStatus.UNHEALTHY,
+            last_check=datetime.utcnow(),
+            consecutive_failures=2,
+        )
+
+        assert health_checker_instance._probe_priority("192.168.1.1") == PRIORITY_GATEWAY
+        assert health_checker_instance._probe_priority("192.168.1.5") == PRIORITY_FLAGGED
+        assert health_checker_instance._probe_priority("192.168.1.9") == PRIORITY_NORMAL
+
+
+class TestStaggeredScheduling:
+    """Tests for timing-wheel scheduling and adaptive intervals"""
+    
+    @pytest.fixture(autouse=True)
+    def staggered_adaptive(self, health_checker_instance):
+        """Both are opt-in; the default is burst scheduling at a fixed interval"""
+        health_checker_instance.set_monitoring_config(
+            MonitoringConfig(scheduling_mode="staggered", adaptive_intervals=True)
+        )
+    
+    def _cache_status(self, checker, ip, status):
+        checker._metrics_cache[ip] = DeviceMetrics(ip=ip, status=status, last_check=datetime.utcnow())
+    
+    def test_sync_wheel_spreads_devices(self, health_checker_instance):
+        """New devices should be spread evenly over one interval"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0, now=0.0)
+        checker.register_devices({f"192.168.1.{i}": "net" for i in range(1, 31)})
+        
+        checker._sync_wheel()
+        
+        assert len(checker._wheel) == 30
+        assert checker._wheel_dirty is False
+        # One device per second across the 30 second interval
+        assert all(len(checker._wheel.advance(float(t))) == 1 for t in range(1, 31))
+    
+    def test_sync_wheel_removes_unmonitored(self, health_checker_instance):
+        """Unregistered devices should leave the wheel"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0, now=0.0)
+        checker.register_devices({"192.168.1.1": "net", "192.168.1.2": "net"})
+        checker._sync_wheel()
+        
+        checker.unregister_devices(["192.168.1.1"])
+        checker._sync_wheel()
+        
+        assert ("device", "192.168.1.1") not in checker._wheel
+        assert ("device", "192.168.1.2") in checker._wheel
+    
+    def test_interval_for_unknown_device(self, health_checker_instance):
+        """Devices without data use the base interval"""
+        assert health_checker_instance._next_probe_interval("192.168.1.9") == 30
+    
+    def test_interval_fast_reprobe_when_failing(self, health_checker_instance):
+        """Failing or degraded devices are re-probed quickly"""
+        self._cache_status(health_checker_instance, "192.168.1.9", HealthStatus.UNHEALTHY)
+        assert health_checker_instance._next_probe_interval("192.168.1.9") == 10
+        
+        self._cache_status(health_checker_instance, "192.168.1.9", HealthStatus.DEGRADED)
+        assert health_checker_instance._next_probe_interval("192.168.1.9") == 10
+    
+    def test_interval_backs_off_when_stable(self, health_checker_instance):
+        """Stable devices back off exponentially up to the maximum"""
+        checker = health_checker_instance
+        self._cache_status(checker, "192.168.1.9", HealthStatus.HEALTHY)
+        
+        checker._stable_streaks["192.168.1.9"] = 4
+        assert checker._next_probe_interval("192.168.1.9") == 30
+        checker._stable_streaks["192.168.1.9"] = 5
+        assert checker._next_probe_interval("192.168.1.9") == 60
+        checker._stable_streaks["192.168.1.9"] = 6
+        assert checker._next_probe_interval("192.168.1.9") == 120
+        checker._stable_streaks["192.168.1.9"] = 500
+        assert checker._next_probe_interval("192.168.1.9") == 300
+    
+    def test_interval_critical_roles_pinned(self, health_checker_instance):
+        """Critical roles stay on the critical interval even when stable"""
+        checker = health_checker_instance
+        checker.set_device_roles({"192.168.1.254": "Firewall"})
+        self._cache_status(checker, "192.168.1.254", HealthStatus.HEALTHY)
+        checker._stable_streaks["192.168.1.254"] = 100
+        
+        assert checker._next_probe_interval("192.168.1.254") == 15
+    
+    def test_interval_not_adaptive(self, health_checker_instance):
+        """Adaptive intervals can be turned off"""
+        checker = health_checker_instance
+        checker.set_monitoring_config(MonitoringConfig(adaptive_intervals=False))
+        self._cache_status(checker, "192.168.1.9", HealthStatus.UNHEALTHY)
+        
+        assert checker._next_probe_interval("192.168.1.9") == 30
+    
+    async def test_dispatch_reschedules_after_probe(self, health_checker_instance):
+        """A due device is probed and put back on the wheel with its next interval"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0)
+        checker.register_devices({"192.168.1.9": "net"})
+        unhealthy = DeviceMetrics(ip="192.168.1.9", status=HealthStatus.UNHEALTHY, last_check=datetime.utcnow())
+        
+        async def fake_check(ip, include_ports, include_dns, history=HistoryMode.FULL, history_bucket="5m", shared_probe=False):
+            checker._metrics_cache[ip] = unhealthy
+            return unhealthy
+        
+        checker.check_device_health = fake_check
+        checker._dispatch_staggered_probe(("device", "192.168.1.9"))
+        assert ("device", "192.168.1.9") in checker._staggered_in_flight
+        
+        await asyncio.sleep(0.01)
+        
+        assert checker._staggered_in_flight == set()
+        assert ("device", "192.168.1.9") in checker._wheel
+        assert checker._stable_streaks["192.168.1.9"] == 0
+        assert checker._last_check_time is not None
+    
+    def _done(self, result=None, error=None, cancelled=False):
+        future = asyncio.get_running_loop().create_future()
+        if cancelled:
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+        return future
+
+    async def test_dispatch_skips_removed_targets(self, health_checker_instance):
+        """Targets removed or disabled before they came due are not probed"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0)
+        checker.set_gateway_test_ips("192.168.1.1", [GatewayTestIP(ip="8.8.8.8")])
+        checker._gateway_test_ips["192.168.1.1"].enabled = False
+        checker._scheduler.submit = MagicMock()
+
+        checker._dispatch_staggered_probe(("device", "192.168.1.9"))
+        checker._dispatch_staggered_probe(("gateway", "192.168.1.1"))
+        checker._dispatch_staggered_probe(("gateway", "192.168.1.2"))
+
+        checker._scheduler.submit.assert_not_called()
+        assert checker._staggered_in_flight == set()
+
+    async def test_gateway_dispatch_reschedules_on_base_interval(self, health_checker_instance):
+        """Gateway test IP checks go back on the wheel one check interval later"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0, now=0.0)
+        checker.set_gateway_test_ips("192.168.1.1", [GatewayTestIP(ip="8.8.8.8")])
+        checker._scheduler.submit = MagicMock(return_value=self._done())
+
+        checker._dispatch_staggered_probe(("gateway", "192.168.1.1"))
+        await asyncio.sleep(0)
+
+        checker._scheduler.submit.assert_called_once()
+        assert checker._wheel.advance(29.0) == []
+        assert checker._wheel.advance(30.0) == [("gateway", "192.168.1.1")]
+
+    async def test_probe_done_edge_cases(self, health_checker_instance):
+        """Cancelled, failed, removed and restarted-wheel completions"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        wheel = checker._wheel = TimingWheel(tick_seconds=1.0)
+        checker.register_devices({"192.168.1.9": "net"})
+        key = ("device", "192.168.1.9")
+        checker._stable_streaks["192.168.1.9"] = 3
+
+        checker._on_staggered_probe_done(key, wheel, self._done(cancelled=True))
+        assert key not in wheel and checker._stable_streaks["192.168.1.9"] == 3
+
+        checker._on_staggered_probe_done(key, wheel, self._done(error=RuntimeError("boom")))
+        assert key in wheel and checker._stable_streaks["192.168.1.9"] == 0
+        wheel.cancel(key)
+
+        checker._wheel = TimingWheel(tick_seconds=1.0)
+        checker._wheel_dirty = False
+        checker._on_staggered_probe_done(key, wheel, self._done())
+        assert key not in wheel and checker._wheel_dirty is True
+
+        checker.unregister_devices(["192.168.1.9"])
+        checker._on_staggered_probe_done(key, checker._wheel, self._done())
+        assert key not in checker._wheel and "192.168.1.9" not in checker._stable_streaks
+
+    async def test_probe_done_respects_shard_ownership(self, health_checker_instance):
+        """A target that moved to another shard is not rescheduled here"""
+        from app.services.timing_wheel import TimingWheel
+        checker = health_checker_instance
+        checker._wheel = TimingWheel(tick_seconds=1.0)
+        checker.register_devices({"192.168.1.9": "net"})
+        checker.owns_target = lambda ip: False
+
+        checker._on_staggered_probe_done(("device", "192.168.1.9"), checker._wheel, self._done())
+
+        assert len(checker._wheel) == 0
+
+    async def test_staggered_loop_dispatches_due_targets(self, health_checker_instance):
+        """The monitoring loop syncs the wheel and dispatches what comes due"""
+        checker = health_checker_instance
+        checker.register_devices({"192.168.1.9": "net"})
+        dispatched = []
+        checker._dispatch_staggered_probe = dispatched.append
+
+        with patch("app.services.health_checker.WHEEL_TICK_SECONDS", 0.01), \
+                patch("app.services.health_checker.TimingWheel") as wheel_cls:
+            wheel_cls.return_value.advance.return_value = [("device", "192.168.1.9")]
+            task = asyncio.create_task(checker._monitoring_loop())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await task
+
+        assert dispatched and dispatched[0] == ("device", "192.168.1.9")
+        assert checker._wheel_dirty is False
+        assert checker._next_check_time is not None
+
+    async def test_staggered_loop_recovers_from_errors(self, health_checker_instance):
+        """An error in one tick is logged and the loop keeps going"""
+        checker = health_checker_instance
+        checker._sync_wheel = MagicMock(side_effect=[RuntimeError("boom"), None])
+        sleeps = AsyncMock(side_effect=[None, asyncio.CancelledError])
+
+        with patch("app.services.health_checker.asyncio.sleep", sleeps):
+            await checker._staggered_monitoring_loop()
+
+        assert checker._sync_wheel.call_count == 2
+        assert sleeps.await_args_list[0].args == (5,)
+
+    async def test_burst_loop_checks_every_interval(self, health_checker_instance):
+        """Burst mode checks all devices at once on a fixed cadence"""
+        checker = health_checker_instance
+        checker.set_monitoring_config(MonitoringConfig(scheduling_mode="burst"))
+        checker.register_devices({"192.168.1.9": "net"})
+        checker._perform_monitoring_check = AsyncMock(side_effect=[RuntimeError("boom"), None])
+
+        sleeps = AsyncMock(side_effect=[None, asyncio.CancelledError])
+        with patch("app.services.health_checker.asyncio.sleep", sleeps):
+            await checker._monitoring_loop()
+
+        assert checker._perform_monitoring_check.await_count == 2
+        assert checker._wheel is None
+        assert sleeps.await_args_list[0].args == (5,)
+
+    async def test_staggered_mode_status(self, health_checker_instance):
+        """Status should report the scheduling mode"""
+        status = health_checker_instance.get_monitoring_status()
+        
+        assert status.scheduling_mode == "staggered"
+        assert status.scheduled_devices == 0
 
 
 class TestDataPersistence:
@@ -716,3 +1306,55 @@ class TestDataPersistence:
                 
                 assert (tmp_path / "speed.json").exists()
 
+
+
+class TestStateSnapshot:
+    """Tests for warm-restart snapshots of history and cached metrics"""
+    
+    async def test_snapshot_restores_into_new_instance(self, health_checker_instance, mock_ping_failure, tmp_path):
+        """History, cached metrics and failure counters should survive a restart"""
+        health_checker_instance.ping_host = AsyncMock(return_value=mock_ping_failure)
+        with patch('app.services.health_checker.notification_reporter'):
+            for _ in range(3):
+                await health_checker_instance.check_device_health("192.168.1.1", include_dns=False)
+        health_checker_instance._record_test_ip_check("192.168.1.1", "8.8.8.8", True, 12.0)
+        
+        assert await health_checker_instance.save_state_snapshot() is True
+        
+        from app.services.health_checker import HealthChecker
+        restored = HealthChecker()
+        
+        metrics = restored.get_cached_metrics("192.168.1.1")
+        assert metrics.consecutive_failures == 3
+        assert metrics.status == HealthStatus.UNHEALTHY
+        assert len(metrics.check_history) == 3
+        assert restored._calculate_historical_stats("192.168.1.1") == (0.0, None, 0, 3)
+        assert restored._calculate_test_ip_historical_stats("192.168.1.1", "8.8.8.8")[2] == 1
+    
+    async def test_snapshot_skipped_when_unchanged(self, health_checker_instance, tmp_path):
+        """No write should happen if nothing was recorded since the last snapshot"""
+        health_checker_instance._record_check("192.168.1.1", True, 5.0)
+        
+        assert await health_checker_instance.save_state_snapshot() is True
+        assert await health_checker_instance.save_state_snapshot() is False
+    
+    def test_corrupt_snapshot_ignored(self, tmp_path):
+        """A corrupt snapshot should be logged and start with empty state"""
+        (tmp_path / "health_state.bin").write_bytes(b"CGHS garbage")
+        
+        from app.services.health_checker import HealthChecker
+        with patch('app.services.health_checker.STATE_SNAPSHOT_FILE', tmp_path / "health_state.bin"):
+            checker = HealthChecker()
+        
+        assert checker._history == {}
+        assert checker._metrics_cache == {}
+    
+    async def test_stop_writes_final_snapshot(self, health_checker_instance, tmp_path):
+        """Stopping snapshots should flush pending state"""
+        health_checker_instance.start_state_snapshots()
+        health_checker_instance._record_check("192.168.1.1", True, 5.0)
+        
+        await health_checker_instance.stop_state_snapshots()
+        
+        assert (tmp_path / "health_state.bin").exists()
+        assert health_checker_instance._snapshot_task is None
@@ -1,21 +1,25 @@
 """
 Unit tests for health router endpoints.
 """
+import json
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 from fastapi import FastAPI
 
 from app.routers.health import router
 from app.models import (
+    CachedMetricsDelta,
     DeviceMetrics,
     HealthStatus,
+    HistoryMode,
     PingResult,
     DnsResult,
     PortCheckResult,
     MonitoringConfig,
     MonitoringStatus,
+    NetworkDevicesDiff,
     GatewayTestIPConfig,
     GatewayTestIP,
     GatewayTestIPsResponse,
@@ -69,7 +73,7 @@ class TestCheckSingleDevice:
     def test_check_device_success(self, client, sample_metrics):
         """Should return device metrics"""
         with patch('app.routers.health.health_checker') as mock_checker:
-            mock_checker.check_device_health = AsyncMock(return_value=sample_metrics)
+            mock_checker.get_device_health = AsyncMock(return_value=sample_metrics)
             
             response = client.get("/api/health/check/192.168.1.1")
             
@@ -81,21 +85,60 @@ class TestCheckSingleDevice:
     def test_check_device_with_ports(self, client, sample_metrics):
         """Should pass include_ports parameter"""
         with patch('app.routers.health.health_checker') as mock_checker:
-            mock_checker.check_device_health = AsyncMock(return_value=sample_metrics)
+            mock_checker.get_device_health = AsyncMock(return_value=sample_metrics)
             
             response = client.get("/api/health/check/192.168.1.1?include_ports=true")
             
             assert response.status_code == 200
-            mock_checker.check_device_health.assert_called_once_with(
+            mock_checker.get_device_health.assert_called_once_with(
                 ip="192.168.1.1",
                 include_ports=True,
-                include_dns=True
+                include_dns=True,
+                history=HistoryMode.FULL,
+                history_bucket="5m",
+                max_age_seconds=None
             )
     
+    def test_check_device_history_projection(self, client, sample_metrics):
+        """Should pass history mode and bucket size through"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_device_health = AsyncMock(return_value=sample_metrics)
+            
+            response = client.get("/api/health/check/192.168.1.1?history=downsampled&bucket=1h")
+            
+            assert response.status_code == 200
+            assert mock_checker.get_device_health.call_args.kwargs["history"] == HistoryMode.DOWNSAMPLED
+            assert mock_checker.get_device_health.call_args.kwargs["history_bucket"] == "1h"
+    
+    def test_check_device_freshness_headers(self, client, sample_metrics):
+        """Should pass max_age_seconds through and report the data's age"""
+        sample_metrics.last_check = datetime.utcnow() - timedelta(seconds=12)
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_device_health = AsyncMock(return_value=sample_metrics)
+            
+            response = client.get("/api/health/check/192.168.1.1?max_age_seconds=30")
+            uncached = client.get("/api/health/check/192.168.1.1")
+            
+            assert mock_checker.get_device_health.call_args_list[0].kwargs["max_age_seconds"] == 30
+            assert response.headers["Age"] == "12"
+            assert response.headers["Cache-Control"] == "private, max-age=18"
+            assert uncached.headers["Cache-Control"] == "private, no-cache"
+    
+    def test_check_device_rejects_negative_max_age(self, client):
+        response = client.get("/api/health/check/192.168.1.1?max_age_seconds=-1")
+        
+        assert response.status_code == 422
+    
+    def test_check_device_invalid_bucket(self, client):
+        """Should reject unsupported bucket sizes"""
+        response = client.get("/api/health/check/192.168.1.1?history=downsampled&bucket=7m")
+        
+        assert response.status_code == 422
+    
     def test_check_device_error(self, client):
         """Should return 500 on error"""
         with patch('app.routers.health.health_checker') as mock_checker:
-            mock_checker.check_device_health = AsyncMock(side_effect=Exception("Check failed"))
+            mock_checker.get_device_health = AsyncMock(side_effect=Exception("Check failed"))
             
             response = client.get("/api/health/check/192.168.1.1")
             
@@ -122,6 +165,23 @@ class TestCheckMultipleDevices:
             assert "devices" in data
             assert len(data["devices"]) == 2
     
+    def test_batch_check_max_age(self, client, sample_metrics):
+        """Should forward max_age_seconds and report the oldest result's age"""
+        old = sample_metrics.model_copy(update={"last_check": datetime.utcnow() - timedelta(seconds=40)})
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.check_multiple_devices = AsyncMock(
+                return_value={"192.168.1.1": sample_metrics, "192.168.1.2": old}
+            )
+            
+            response = client.post(
+                "/api/health/check/batch",
+                json={"ips": ["192.168.1.1", "192.168.1.2"], "max_age_seconds": 60}
+            )
+            
+            assert mock_checker.check_multiple_devices.call_args.kwargs["max_age_seconds"] == 60
+            assert response.headers["Age"] == "40"
+            assert response.headers["Cache-Control"] == "private, max-age=20"
+    
     def test_batch_check_empty_ips(self, client):
         """Should return 400 for empty IPs"""
         response = client.post(
@@ -155,6 +215,74 @@ class TestCheckMultipleDevices:
             assert response.status_code == 500
 
 
+class TestStreamDeviceChecks:
+    """Tests for POST /api/health/check/stream"""
+    
+    @staticmethod
+    def _results(*items):
+        async def stream(**kwargs):
+            for item in items:
+                yield item
+        return stream
+    
+    def test_ndjson_records_and_summary(self, client, sample_metrics):
+        unhealthy = sample_metrics.model_copy(update={"ip": "192.168.1.2", "status": HealthStatus.UNHEALTHY})
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.stream_device_checks = MagicMock(
+                side_effect=self._results((sample_metrics, True), (unhealthy, False))
+            )
+            
+            response = client.post(
+                "/api/health/check/stream",
+                json={"ips": ["192.168.1.1", "192.168.1.2", "192.168.1.2"], "history": "none"}
+            )
+        
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["type"] for r in records] == ["device", "device", "summary"]
+        assert records[0]["cached"] is True and records[1]["device"]["ip"] == "192.168.1.2"
+        summary = records[-1]
+        assert summary["requested"] == 2 and summary["completed"] == 2 and summary["from_cache"] == 1
+        assert summary["by_status"]["unhealthy"] == 1 and summary["by_status"]["unknown"] == 0
+        assert mock_checker.stream_device_checks.call_args.kwargs["history"] == HistoryMode.NONE
+    
+    def test_sse_format(self, client, sample_metrics):
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.stream_device_checks = MagicMock(side_effect=self._results((sample_metrics, False)))
+            
+            response = client.post("/api/health/check/stream?format=sse", json={"ips": ["192.168.1.1"]})
+        
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line for line in response.text.splitlines() if line.startswith("event: ")]
+        assert events == ["event: device", "event: summary"]
+    
+    def test_accepts_more_than_the_batch_limit(self, client, sample_metrics):
+        ips = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.stream_device_checks = MagicMock(side_effect=self._results())
+            
+            response = client.post("/api/health/check/stream", json={"ips": ips})
+        
+        assert response.status_code == 200
+        assert json.loads(response.text)["requested"] == 1000
+    
+    def test_history_omitted_by_default(self, client, sample_metrics):
+        """Streaming sweeps default to no history; it can still be requested"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.stream_device_checks = MagicMock(side_effect=self._results())
+            
+            client.post("/api/health/check/stream", json={"ips": ["192.168.1.1"]})
+            client.post("/api/health/check/stream", json={"ips": ["192.168.1.1"], "history": "downsampled"})
+        
+        modes = [c.kwargs["history"] for c in mock_checker.stream_device_checks.call_args_list]
+        assert modes == [HistoryMode.NONE, HistoryMode.DOWNSAMPLED]
+    
+    def test_empty_ips(self, client):
+        response = client.post("/api/health/check/stream", json={"ips": []})
+        
+        assert response.status_code == 400
+
+
 class TestCachedMetrics:
     """Tests for cached metrics endpoints"""
     
@@ -187,6 +315,42 @@ class TestCachedMetrics:
             
             assert response.status_code == 200
     
+    def test_get_all_cached_metrics_without_history(self, client, sample_metrics):
+        """Should forward history=none to the checker"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_all_cached_metrics = MagicMock(
+                return_value={"192.168.1.1": sample_metrics}
+            )
+            
+            response = client.get("/api/health/cached?history=none")
+            
+            assert response.status_code == 200
+            mock_checker.get_all_cached_metrics.assert_called_once_with(
+                history=HistoryMode.NONE, history_bucket="5m"
+            )
+    
+    def test_get_all_cached_metrics_delta(self, client, sample_metrics):
+        """Should return a delta when a cursor is given"""
+        delta = CachedMetricsDelta(
+            cursor="abc:7",
+            devices={"192.168.1.1": sample_metrics},
+            removed=["192.168.1.9"],
+        )
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_cached_metrics_delta = MagicMock(return_value=delta)
+            
+            response = client.get("/api/health/cached?since=abc:3&history=none")
+            
+            assert response.status_code == 200
+            body = response.json()
+            assert body["cursor"] == "abc:7"
+            assert body["full"] is False
+            assert list(body["devices"]) == ["192.168.1.1"]
+            assert body["removed"] == ["192.168.1.9"]
+            mock_checker.get_cached_metrics_delta.assert_called_once_with(
+                "abc:3", history=HistoryMode.NONE, history_bucket="5m"
+            )
+    
     def test_clear_cache(self, client):
         """Should clear the cache"""
         with patch('app.routers.health.health_checker') as mock_checker:
@@ -243,7 +407,7 @@ class TestPortScan:
         ]
         
         with patch('app.routers.health.health_checker') as mock_checker:
-            mock_checker.scan_common_ports = AsyncMock(return_value=open_ports)
+            mock_checker.scan_ports = AsyncMock(return_value=open_ports)
             
             response = client.get("/api/health/ports/192.168.1.1")
             
@@ -255,11 +419,29 @@ class TestPortScan:
     def test_scan_ports_error(self, client):
         """Should return 500 on error"""
         with patch('app.routers.health.health_checker') as mock_checker:
-            mock_checker.scan_common_ports = AsyncMock(side_effect=Exception("Scan failed"))
+            mock_checker.scan_ports = AsyncMock(side_effect=Exception("Scan failed"))
             
             response = client.get("/api/health/ports/192.168.1.1")
             
             assert response.status_code == 500
+    
+    def test_scan_ports_custom_set(self, client):
+        """Should parse port sets and ranges and honour refresh"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.scan_ports = AsyncMock(return_value=[])
+            
+            response = client.get("/api/health/ports/192.168.1.1?ports=22,8000-8002&refresh=true")
+            
+            assert response.status_code == 200
+            mock_checker.scan_ports.assert_called_once_with(
+                "192.168.1.1", ports=[22, 8000, 8001, 8002], use_cache=False
+            )
+    
+    def test_scan_ports_invalid_spec(self, client):
+        """Should reject malformed port specifications"""
+        response = client.get("/api/health/ports/192.168.1.1?ports=70000")
+        
+        assert response.status_code == 400
 
 
 class TestDnsCheck:
@@ -297,10 +479,12 @@ class TestMonitoringDevices:
     """Tests for monitoring device endpoints"""
     
     def test_register_devices(self, client):
-        """Should register devices for monitoring"""
+        """Should replace the network's devices and sync only the changes"""
+        diff = NetworkDevicesDiff(network_id="network-uuid-42", added=["192.168.1.2"], removed=["192.168.1.7"], total=2)
         with patch('app.routers.health.health_checker') as mock_checker, \
-             patch('app.routers.health.sync_devices_with_notification_service', new_callable=AsyncMock) as mock_sync:
-            mock_checker.set_monitored_devices = MagicMock()
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock) as mock_sync:
+            mock_checker.replace_network_devices = MagicMock(return_value=diff)
+            mock_checker.get_monitored_devices = MagicMock(return_value=["192.168.1.1", "192.168.1.2"])
             mock_sync.return_value = True
             
             response = client.post(
@@ -312,7 +496,32 @@ class TestMonitoringDevices:
             data = response.json()
             assert data["message"] == "Registered 2 devices for monitoring"
             assert data["network_id"] == "network-uuid-42"
-            mock_sync.assert_called_once_with(["192.168.1.1", "192.168.1.2"], network_id="network-uuid-42")
+            assert data["added"] == ["192.168.1.2"]
+            assert data["removed"] == ["192.168.1.7"]
+            mock_checker.replace_network_devices.assert_called_once_with(
+                "network-uuid-42", ["192.168.1.1", "192.168.1.2"]
+            )
+            mock_sync.assert_called_once_with(
+                "network-uuid-42",
+                ["192.168.1.2"],
+                ["192.168.1.7"],
+                current_devices=["192.168.1.1", "192.168.1.2"],
+            )
+    
+    def test_register_devices_with_roles(self, client):
+        """Should pass device roles through for scheduling policy"""
+        with patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock):
+            mock_checker.replace_network_devices = MagicMock(
+                return_value=NetworkDevicesDiff(network_id="network-uuid-42", added=["192.168.1.1"], total=1)
+            )
+            response = client.post(
+                "/api/health/monitoring/devices",
+                json={"ips": ["192.168.1.1"], "network_id": "network-uuid-42", "roles": {"192.168.1.1": "gateway"}}
+            )
+            
+            assert response.status_code == 200
+            mock_checker.set_device_roles.assert_called_once_with({"192.168.1.1": "gateway"})
     
     def test_get_monitored_devices(self, client):
         """Should return monitored devices"""
@@ -325,17 +534,106 @@ class TestMonitoringDevices:
             assert response.json()["devices"] == ["192.168.1.1"]
     
     def test_clear_monitored_devices(self, client):
-        """Should clear monitored devices"""
+        """Should clear every network and sync each network's removals"""
+        diffs = [
+            NetworkDevicesDiff(network_id="net-a", removed=["192.168.1.1"]),
+            NetworkDevicesDiff(network_id="net-b", removed=["10.0.0.1"]),
+        ]
         with patch('app.routers.health.health_checker') as mock_checker, \
-             patch('app.routers.health.sync_devices_with_notification_service', new_callable=AsyncMock) as mock_sync:
-            mock_checker.set_monitored_devices = MagicMock()
-            mock_sync.return_value = False  # No network_id means it returns False
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock) as mock_sync:
+            mock_checker.clear_monitored_devices = MagicMock(return_value=diffs)
+            mock_checker.get_monitored_devices = MagicMock(return_value=[])
             
             response = client.delete("/api/health/monitoring/devices")
             
             assert response.status_code == 200
-            mock_checker.set_monitored_devices.assert_called_once_with({})
-            mock_sync.assert_called_once_with([])
+            mock_checker.clear_monitored_devices.assert_called_once_with()
+            assert [c.args[0] for c in mock_sync.call_args_list] == ["net-a", "net-b"]
+    
+    def test_patch_network_devices(self, client):
+        """Should apply adds and removes to one network and return the net change"""
+        with patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock) as mock_sync:
+            mock_checker.remove_network_devices = MagicMock(
+                return_value=NetworkDevicesDiff(network_id="net-a", removed=["192.168.1.1", "192.168.1.2"], total=0)
+            )
+            mock_checker.add_network_devices = MagicMock(
+                return_value=NetworkDevicesDiff(network_id="net-a", added=["192.168.1.2", "192.168.1.3"], total=2)
+            )
+            mock_checker.get_monitored_devices = MagicMock(return_value=["192.168.1.2", "192.168.1.3"])
+            
+            response = client.patch(
+                "/api/health/monitoring/networks/net-a/devices",
+                json={"add": ["192.168.1.2", "192.168.1.3"], "remove": ["192.168.1.1", "192.168.1.2"]}
+            )
+            
+            assert response.status_code == 200
+            data = response.json()
+            assert data["added"] == ["192.168.1.3"]
+            assert data["removed"] == ["192.168.1.1"]
+            assert data["total"] == 2
+            assert mock_sync.call_args.args == ("net-a", ["192.168.1.3"], ["192.168.1.1"])
+    
+    def test_get_network_devices(self, client):
+        """Should list one network's devices"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_monitored_devices = MagicMock(return_value=["10.0.0.1"])
+            
+            response = client.get("/api/health/monitoring/networks/net-b/devices")
+            
+            assert response.status_code == 200
+            assert response.json() == {"network_id": "net-b", "devices": ["10.0.0.1"]}
+            mock_checker.get_monitored_devices.assert_called_once_with("net-b")
+    
+    def test_add_and_replace_network_devices(self, client):
+        """POST adds to a network and PUT replaces it; both sync the diff and pass roles through"""
+        with patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock) as mock_sync:
+            mock_checker.add_network_devices = MagicMock(
+                return_value=NetworkDevicesDiff(network_id="net-a", added=["10.0.0.2"], total=2)
+            )
+            mock_checker.replace_network_devices = MagicMock(
+                return_value=NetworkDevicesDiff(network_id="net-a", added=["10.0.0.3"], removed=["10.0.0.1"], total=2)
+            )
+            mock_checker.get_monitored_devices = MagicMock(return_value=["10.0.0.2", "10.0.0.3"])
+            body = {"ips": ["10.0.0.2"], "roles": {"10.0.0.2": "gateway"}}
+            
+            added = client.post("/api/health/monitoring/networks/net-a/devices", json=body)
+            replaced = client.put("/api/health/monitoring/networks/net-a/devices", json={"ips": ["10.0.0.2", "10.0.0.3"]})
+            
+            assert added.json()["added"] == ["10.0.0.2"]
+            assert replaced.json()["removed"] == ["10.0.0.1"]
+            mock_checker.set_device_roles.assert_called_once_with({"10.0.0.2": "gateway"})
+            assert [c.args for c in mock_sync.call_args_list] == [
+                ("net-a", ["10.0.0.2"], []),
+                ("net-a", ["10.0.0.3"], ["10.0.0.1"]),
+            ]
+    
+    def test_clear_network_devices(self, client):
+        """DELETE clears one network; an unknown network is an empty diff"""
+        with patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.sync_device_changes_with_notification_service', new_callable=AsyncMock):
+            mock_checker.clear_monitored_devices = MagicMock(side_effect=[
+                [NetworkDevicesDiff(network_id="net-a", removed=["10.0.0.1"])],
+                [],
+            ])
+            mock_checker.get_monitored_devices = MagicMock(return_value=[])
+            
+            cleared = client.delete("/api/health/monitoring/networks/net-a/devices")
+            unknown = client.delete("/api/health/monitoring/networks/net-x/devices")
+            
+            assert cleared.json()["removed"] == ["10.0.0.1"]
+            assert unknown.json() == {"network_id": "net-x", "added": [], "removed": [], "total": 0}
+            mock_checker.clear_monitored_devices.assert_called_with("net-x")
+    
+    def test_get_monitored_networks(self, client):
+        """Should report the device count per network"""
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_monitored_networks = MagicMock(return_value={"net-a": 2})
+            
+            response = client.get("/api/health/monitoring/networks")
+            
+            assert response.json() == {"networks": {"net-a": 2}}
 
 
 class TestMonitoringConfig:
@@ -366,6 +664,26 @@ class TestMonitoringConfig:
             )
             
             assert response.status_code == 200
+    
+    def test_set_monitoring_config_partial_update(self, client):
+        """Fields missing from the body should keep their current values"""
+        current = MonitoringConfig(max_interval_seconds=900, critical_roles=["gateway"])
+        
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.set_monitoring_config = MagicMock()
+            mock_checker.get_monitoring_config = MagicMock(return_value=current)
+            
+            response = client.post(
+                "/api/health/monitoring/config",
+                json={"check_interval_seconds": 60, "scheduling_mode": "burst"}
+            )
+            
+            assert response.status_code == 200
+            applied = mock_checker.set_monitoring_config.call_args[0][0]
+            assert applied.check_interval_seconds == 60
+            assert applied.scheduling_mode == "burst"
+            assert applied.max_interval_seconds == 900
+            assert applied.critical_roles == ["gateway"]
 
 
 class TestMonitoringStatus:
@@ -0,0 +1,235 @@
+"""
+Unit tests for the ring-buffer history store.
+"""
+from datetime import datetime
+
+import pytest
+
+from app.services.history_store import BucketSeries, HistoryRing, from_epoch, to_epoch
+
+
+class TestEpochConversion:
+    """Tests for datetime <-> epoch helpers"""
+
+    def test_round_trip(self):
+        """Naive UTC datetimes should survive a round trip"""
+        now = datetime(2024, 1, 15, 10, 30, 0, 250000)
+
+        assert from_epoch(to_epoch(now)) == now
+
+
+class TestHistoryRing:
+    """Tests for appending, eviction and rolling statistics"""
+
+    def test_empty_stats(self):
+        """An empty ring has no statistics"""
+        assert HistoryRing(4).stats(1000.0) == (None, None, 0, 0)
+
+    def test_running_totals(self):
+        """Stats should come from running totals"""
+        ring = HistoryRing(8)
+        ring.append(100.0, True, 20.0)
+        ring.append(101.0, False, None)
+        ring.append(102.0, True, 30.0)
+        ring.append(103.0, True, 10.0)
+
+        uptime, avg_latency, passed, failed = ring.stats(104.0)
+
+        assert uptime == 75.0
+        assert avg_latency == 20.0
+        assert passed == 3
+        assert failed == 1
+
+    def test_wraparound_evicts_oldest(self):
+        """A full ring should overwrite its oldest entry but keep counting it in the window"""
+        ring = HistoryRing(3)
+        ring.append(1.0, False, None)
+        ring.append(2.0, True, 10.0)
+        ring.append(3.0, True, 20.0)
+        ring.append(4.0, True, 30.0)
+
+        assert len(ring) == 3
+        assert [ts for ts, _, _ in ring.entries()] == [2.0, 3.0, 4.0]
+        assert ring.stats(5.0) == (75.0, 20.0, 3, 1)
+
+    def test_fast_interval_covers_whole_window(self):
+        """Checks every 10s overrun a 1440 entry ring; stats still span 24h, then become exact again"""
+        ring = HistoryRing(1440)
+        for i in range(8640):
+            ring.append(i * 10.0, i % 4 != 0, 5.0 if i % 4 else None)
+
+        assert len(ring) == 1440
+        assert ring.stats(86390.0) == (75.0, 5.0, 6480, 2160)
+
+        # Once the last evicted check (at 71990s) leaves the window the ring holds it all
+        assert ring.stats(71990.0 + 86400) == (75.0, 5.0, 1080, 360)
+
+    def test_window_expiry(self):
+        """Entries older than the window drop out of the statistics"""
+        ring = HistoryRing(10, window_seconds=60)
+        ring.append(0.0, False, None)
+        ring.append(30.0, True, 10.0)
+        ring.append(90.0, True, 30.0)
+
+        assert ring.stats(100.0) == (100.0, 30.0, 1, 0)
+        assert len(ring) == 1
+
+    def test_success_bits_independent(self):
+        """Success flags packed into the bitset must not bleed into each other"""
+        ring = HistoryRing(20)
+        pattern = [i % 3 == 0 for i in range(20)]
+        for i, success in enumerate(pattern):
+            ring.append(float(i), success, None)
+
+        assert [success for _, success, _ in ring.entries()] == pattern
+
+    def test_entries_since_and_missing_latency(self):
+        """entries() filters by time and reports missing latency as None"""
+        ring = HistoryRing(4)
+        ring.append(10.0, False, None)
+        ring.append(20.0, True, 5.5)
+
+        assert list(ring.entries(since=10.0)) == [(20.0, True, 5.5)]
+        assert list(ring.entries())[0] == (10.0, False, None)
+        assert ring.last() == (20.0, True, 5.5)
+
+    def test_long_run_sum_stays_accurate(self):
+        """Running latency sum should not drift over many wraparounds"""
+        ring = HistoryRing(50, window_seconds=50)
+        for i in range(5000):
+            ring.append(float(i), True, 0.1 * (i % 7))
+
+        expected = [0.1 * (i % 7) for i in range(4951, 5000)]
+        _, avg_latency, _, _ = ring.stats(5000.0)
+
+        assert abs(avg_latency - sum(expected) / len(expected)) < 1e-5
+
+
+    def test_success_streak(self):
+        """Should count trailing successes up to the limit, across wrap-around"""
+        ring = HistoryRing(4)
+        assert ring.success_streak(3) == 0
+        for i, success in enumerate([True, False, True, True, True, True]):
+            ring.append(float(i), success, 1.0 if success else None)
+
+        assert ring.success_streak(3) == 3
+        assert ring.success_streak(10) == 4
+        ring.append(6.0, False, None)
+        assert ring.success_streak(3) == 0
+
+class TestBucketSeries:
+    """Tests for the precomputed downsampled buckets"""
+
+    def test_base_buckets(self):
+        """Checks are aggregated per 5 minute bucket"""
+        ring = HistoryRing(16)
+        ring.append(0.0, True, 10.0)
+        ring.append(100.0, False, None)
+        ring.append(310.0, True, 30.0)
+
+        assert ring.buckets(400.0) == [(0, 2, 1, 10.0), (300, 1, 1, 30.0)]
+
+    def test_coarser_buckets_aggregate_base(self):
+        """Hourly buckets combine the 5 minute aggregates"""
+        ring = HistoryRing(16)
+        for i in range(6):
+            ring.append(i * 600.0, i % 2 == 0, 20.0)
+        ring.append(3700.0, True, 40.0)
+
+        assert ring.buckets(4000.0, 3600) == [(0, 6, 3, 20.0), (3600, 1, 1, 40.0)]
+
+    def test_buckets_survive_ring_eviction(self):
+        """Bucket totals cover the window even when the raw ring has wrapped"""
+        ring = HistoryRing(4)
+        for i in range(10):
+            ring.append(float(i), True, 1.0)
+
+        assert len(ring) == 4
+        assert ring.buckets(10.0) == [(0, 10, 10, 1.0)]
+
+    def test_stale_buckets_drop_out(self):
+        """Buckets older than the window are not served and their slots are reused"""
+        ring = HistoryRing(16, window_seconds=600)
+        ring.append(0.0, False, None)
+        ring.append(650.0, True, 5.0)
+
+        assert ring.buckets(700.0) == [(600, 1, 1, 5.0)]
+
+        ring.append(900.0, True, 5.0)  # Reuses the slot of bucket 0
+        assert ring.buckets(900.0) == [(600, 1, 1, 5.0), (900, 1, 1, 5.0)]
+
+    def test_running_totals_follow_the_window(self):
+        """totals() matches the served buckets as they expire, across copy and reload"""
+        series = BucketSeries(window_seconds=1800)  # 6 buckets
+        for i in range(40):
+            series.add(i * 100.0, i % 3 != 0, float(i))
+            now = i * 100.0 + 50.0
+            buckets = series.buckets(now, 300)
+            passed, failed, latency_sum, latency_count = series.totals(now)
+            assert passed == sum(b[2] for b in buckets)
+            assert passed + failed == sum(b[1] for b in buckets)
+            assert latency_count == passed + failed
+            assert latency_sum == sum(float(j) for j in range(i + 1) if j // 3 >= i // 3 - 5)
+
+        restored, _ = BucketSeries.load(memoryview(series.dump()))
+        for copy in (series.copy(), restored):
+            assert copy.totals(3950.0) == series.totals(3950.0)
+            assert copy.totals(10000.0) == (0, 0, 0.0, 0)
+
+    def test_out_of_window_append_ignored(self):
+        """A check older than the window must not overwrite a live bucket's slot"""
+        series = BucketSeries(window_seconds=1800)
+        series.add(3000.0, True, 1.0)
+        series.add(0.0, False, None)  # Same slot as bucket 3000, six buckets older
+
+        assert series.totals(3000.0) == (1, 0, 1.0, 1)
+        assert series.buckets(3000.0, 300) == [(3000, 1, 1, 1.0)]
+
+
+class TestHistoryRingSerialization:
+    """Tests for dump/load used by warm-restart snapshots"""
+
+    def test_round_trip_after_wraparound(self):
+        """A wrapped ring should restore entries, totals and buckets"""
+        ring = HistoryRing(5)
+        for i in range(8):
+            ring.append(float(i * 60), i % 3 != 0, None if i == 4 else float(i))
+
+        restored = HistoryRing.load(ring.dump())
+
+        assert list(restored.entries()) == list(ring.entries())
+        assert restored.stats(500.0) == ring.stats(500.0)
+        assert restored.buckets(500.0) == ring.buckets(500.0)
+        assert restored.capacity == 5
+
+    def test_restored_ring_keeps_appending(self):
+        """Running totals should be rebuilt so later appends stay correct"""
+        ring = HistoryRing(3, window_seconds=3)
+        ring.append(1.0, True, 10.0)
+        restored = HistoryRing.load(ring.dump())
+        for i in range(2, 6):
+            restored.append(float(i), False, None)
+
+        assert restored.stats(6.0) == (0.0, None, 0, 2)
+
+    def test_copy_is_detached(self):
+        """A copy should dump like the original and not see later appends"""
+        ring = HistoryRing(3)
+        for i in range(4):
+            ring.append(float(i * 60), i != 2, float(i))
+        snapshot = ring.copy()
+        expected = ring.dump()
+
+        ring.append(300.0, False, None)
+
+        assert snapshot.dump() == expected
+        assert len(snapshot) == 3 and snapshot.last() == (180.0, True, 3.0)
+        assert snapshot.buckets(400.0) != ring.buckets(400.0)
+
+    def test_truncated_data_rejected(self):
+        """Short input should raise rather than produce a corrupt ring"""
+        data = HistoryRing(4).dump()
+
+        with pytest.raises(ValueError):
+            HistoryRing.load(data[:-10])
+
@@ -0,0 +1,244 @@
+"""
+Unit tests for the native ICMP engine.
+"""
+import asyncio
+import struct
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.services.icmp_engine import (
+    IcmpEngine,
+    IcmpUnavailableError,
+    ICMP_ECHO_REPLY,
+    build_echo_request,
+    build_ping_result,
+    combine_ping_results,
+    icmp_checksum,
+    is_ipv4_address,
+    parse_echo_reply,
+)
+
+
+def make_reply(ident: int, seq: int, with_ip_header: bool = False) -> bytes:
+    """Build an echo reply, optionally prefixed with a minimal IPv4 header"""
+    packet = struct.pack("!BBHHH", ICMP_ECHO_REPLY, 0, 0, ident, seq) + b"payload!"
+    if with_ip_header:
+        packet = bytes([0x45]) + b"\x00" * 19 + packet
+    return packet
+
+
+class TestPacketHelpers:
+    """Tests for ICMP packet encoding and decoding"""
+
+    def test_echo_request_checksum_verifies(self):
+        """A packet including its checksum should sum to zero"""
+        packet = build_echo_request(0x1234, 7)
+
+        assert packet[0] == 8
+        assert icmp_checksum(packet) == 0
+
+    def test_parse_reply_without_ip_header(self):
+        """Should parse a bare ICMP echo reply"""
+        assert parse_echo_reply(make_reply(42, 9)) == (42, 9)
+
+    def test_parse_reply_strips_ip_header(self):
+        """Should strip the IPv4 header delivered by raw sockets"""
+        assert parse_echo_reply(make_reply(42, 9, with_ip_header=True)) == (42, 9)
+
+    def test_parse_ignores_non_reply(self):
+        """Should ignore echo requests and truncated packets"""
+        assert parse_echo_reply(build_echo_request(1, 1)) is None
+        assert parse_echo_reply(b"\x00\x00") is None
+
+    def test_is_ipv4_address(self):
+        """Only literal IPv4 addresses are handled by the engine"""
+        assert is_ipv4_address("192.168.1.1") is True
+        assert is_ipv4_address("fe80::1") is False
+        assert is_ipv4_address("router.local") is False
+
+
+class TestBuildPingResult:
+    """Tests for ping statistics"""
+
+    def test_all_received(self):
+        """Should compute min/avg/max/jitter with no loss"""
+        result = build_ping_result([10.0, 20.0, 15.0], transmitted=3, received=3)
+
+        assert result.success is True
+        assert result.min_latency_ms == 10.0
+        assert result.max_latency_ms == 20.0
+        assert result.avg_latency_ms == 15.0
+        assert result.jitter_ms == 7.5
+        assert result.packet_loss_percent == 0.0
+
+    def test_partial_loss(self):
+        """Should report loss from transmitted vs received"""
+        result = build_ping_result([10.0], transmitted=4, received=1)
+
+        assert result.success is True
+        assert result.packet_loss_percent == 75.0
+        assert result.jitter_ms == 0.0
+
+    def test_no_replies(self):
+        """Should report total failure"""
+        result = build_ping_result([], transmitted=3, received=0)
+
+        assert result.success is False
+        assert result.packet_loss_percent == 100.0
+
+
+    def test_combined_loss_counts_every_echo(self):
+        """A lost fast-path echo followed by a clean burst is 25% loss over 4 echoes"""
+        lost = build_ping_result([], transmitted=1, received=0)
+        burst = build_ping_result([10.0, 20.0, 30.0], transmitted=3, received=3)
+
+        result = combine_ping_results([(lost, 1), (burst, 3)])
+
+        assert result.success is True
+        assert result.probes_sent == 4
+        assert result.packet_loss_percent == 25.0
+        assert result.avg_latency_ms == 20.0
+        assert (result.min_latency_ms, result.max_latency_ms) == (10.0, 30.0)
+
+    def test_combined_latency_is_weighted_by_replies(self):
+        slow = build_ping_result([90.0], transmitted=1, received=1)
+        burst = build_ping_result([10.0, 10.0, 10.0], transmitted=3, received=3)
+
+        result = combine_ping_results([(slow, 1), (burst, 3)])
+
+        assert result.avg_latency_ms == 30.0
+        assert result.packet_loss_percent == 0.0
+        assert combine_ping_results([(build_ping_result([], 1, 0), 1)]).success is False
+
+class TestIcmpEngine:
+    """Tests for reply matching and socket fallback"""
+
+    async def test_handle_packet_resolves_pending(self):
+        """A reply should resolve the future for its (source, seq)"""
+        engine = IcmpEngine()
+        future = asyncio.get_running_loop().create_future()
+        engine._pending[("10.0.0.1", 5)] = future
+
+        engine._handle_packet(make_reply(999, 5), "10.0.0.1", 123.0)
+
+        assert future.result() == 123.0
+
+    async def test_handle_packet_ignores_other_source(self):
+        """Replies from a different host must not match"""
+        engine = IcmpEngine()
+        future = asyncio.get_running_loop().create_future()
+        engine._pending[("10.0.0.1", 5)] = future
+
+        engine._handle_packet(make_reply(999, 5), "10.0.0.2", 123.0)
+
+        assert not future.done()
+
+    async def test_raw_mode_checks_identifier(self):
+        """Raw sockets see every reply, so foreign identifiers are ignored"""
+        engine = IcmpEngine()
+        engine._raw = True
+        future = asyncio.get_running_loop().create_future()
+        engine._pending[("10.0.0.1", 5)] = future
+
+        engine._handle_packet(make_reply((engine._ident + 1) & 0xFFFF, 5, True), "10.0.0.1", 1.0)
+        assert not future.done()
+
+        engine._handle_packet(make_reply(engine._ident, 5, True), "10.0.0.1", 1.0)
+        assert future.done()
+
+    def test_falls_back_to_raw_socket(self):
+        """Should open a single raw socket when datagram ICMP is not permitted"""
+        import socket
+        raw_sock = MagicMock()
+
+        def fake_socket(family, kind, proto):
+            if kind == socket.SOCK_DGRAM:
+                raise PermissionError("not permitted")
+            return raw_sock
+
+        engine = IcmpEngine(socket_count=3)
+        with patch('socket.socket', side_effect=fake_socket):
+            engine._open_sockets()
+
+        assert engine.mode == "raw"
+        assert engine._sockets == [raw_sock]
+
+    def test_unavailable_when_no_socket(self):
+        """Should report unavailable when neither socket type can be opened"""
+        engine = IcmpEngine()
+        with patch('socket.socket', side_effect=PermissionError("denied")):
+            with pytest.raises(IcmpUnavailableError):
+                engine._open_sockets()
+            assert engine.is_available() is False
+
+    async def test_ping_counts_lost_echoes(self):
+        """Echoes without a reply within the timeout count as lost"""
+        engine = IcmpEngine(probe_interval=0)
+        answered = iter([True, False])
+        sock = MagicMock()
+
+        def fake_sendto(packet, addr):
+            seq = struct.unpack("!H", packet[6:8])[0]
+            if next(answered):
+                asyncio.get_running_loop().call_soon(
+                    engine._handle_packet, make_reply(0, seq), addr[0], time.perf_counter()
+                )
+
+        sock.sendto.side_effect = fake_sendto
+        engine._sockets = [sock]
+        engine._ensure_open = MagicMock()
+
+        result = await engine.ping("10.0.0.1", count=2, timeout=0.05)
+
+        assert result.success is True
+        assert result.packet_loss_percent == 50.0
+        assert engine._pending == {}
+
+    async def test_readers_attach_once_per_loop_and_detach_on_close(self):
+        """Sockets are opened once per event loop and their readers removed on close"""
+        import socket
+        sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(2)]
+        for sock in sockets:
+            sock.bind(("127.0.0.1", 0))
+        engine = IcmpEngine(socket_count=2)
+        with patch('socket.socket', side_effect=sockets):
+            engine._ensure_open()
+            engine._ensure_open()  # Already open on this loop
+
+        assert engine.mode == "dgram"
+        pending = asyncio.get_running_loop().create_future()
+        engine._pending[("127.0.0.1", 7)] = pending
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            sender.sendto(make_reply(0, 7), sockets[1].getsockname())
+            assert await asyncio.wait_for(pending, 1) > 0
+
+        engine.close()
+        assert engine.mode is None
+        assert all(sock.fileno() == -1 for sock in sockets)
+
+    def test_drains_until_the_socket_would_block(self):
+        """Every queued reply is handled; receive errors stop the drain"""
+        engine = IcmpEngine()
+        engine._handle_packet = MagicMock()
+        sock = MagicMock()
+        sock.recvfrom.side_effect = [(b"a", ("10.0.0.1", 0)), (b"b", ("10.0.0.2", 0)), BlockingIOError()]
+
+        engine._on_readable(sock)
+
+        assert [c.args[:2] for c in engine._handle_packet.call_args_list] == [(b"a", "10.0.0.1"), (b"b", "10.0.0.2")]
+        sock.recvfrom.side_effect = OSError("network down")
+        engine._on_readable(sock)
+        assert engine._handle_packet.call_count == 2
+
+    def test_availability_probe_closes_its_sockets(self):
+        """Checking availability should not leave sockets open"""
+        sock = MagicMock()
+        engine = IcmpEngine(socket_count=1)
+        with patch('socket.socket', return_value=sock) as mock_socket:
+            assert engine.is_available() is True
+            assert engine.is_available() is True  # Cached
+
+        mock_socket.assert_called_once()
+        sock.close.assert_called_once()
+        assert engine.mode is None
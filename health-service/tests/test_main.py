@@ -2,7 +2,7 @@
 Unit tests for the main FastAPI application.
 """
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 from app.main import create_app, app
@@ -37,6 +37,8 @@ class TestRootEndpoint:
         with patch('app.main.health_checker') as mock_checker:
             mock_checker.start_monitoring = MagicMock()
             mock_checker.stop_monitoring = MagicMock()
+            mock_checker.stop_sharding = AsyncMock()
+            mock_checker.stop_state_snapshots = AsyncMock()
             
             test_app = create_app()
             client = TestClient(test_app)
@@ -58,6 +60,8 @@ class TestHealthzEndpoint:
         with patch('app.main.health_checker') as mock_checker:
             mock_checker.start_monitoring = MagicMock()
             mock_checker.stop_monitoring = MagicMock()
+            mock_checker.stop_sharding = AsyncMock()
+            mock_checker.stop_state_snapshots = AsyncMock()
             
             test_app = create_app()
             client = TestClient(test_app)
@@ -97,6 +101,8 @@ class TestLifespan:
         with patch('app.main.health_checker') as mock_checker:
             mock_checker.start_monitoring = MagicMock()
             mock_checker.stop_monitoring = MagicMock()
+            mock_checker.stop_sharding = AsyncMock()
+            mock_checker.stop_state_snapshots = AsyncMock()
             
             test_app = create_app()
             
@@ -108,6 +114,8 @@ class TestLifespan:
         with patch('app.main.health_checker') as mock_checker:
             mock_checker.start_monitoring = MagicMock()
             mock_checker.stop_monitoring = MagicMock()
+            mock_checker.stop_sharding = AsyncMock()
+            mock_checker.stop_state_snapshots = AsyncMock()
             
             test_app = create_app()
             
@@ -115,6 +123,21 @@ class TestLifespan:
                 pass
             
             mock_checker.stop_monitoring.assert_called_once()
+    
+    def test_lifespan_flushes_state_snapshot(self):
+        """Should start snapshots on startup and write a final one on shutdown"""
+        with patch('app.main.health_checker') as mock_checker:
+            mock_checker.start_monitoring = MagicMock()
+            mock_checker.stop_monitoring = MagicMock()
+            mock_checker.stop_sharding = AsyncMock()
+            mock_checker.stop_state_snapshots = AsyncMock()
+            
+            test_app = create_app()
+            
+            with TestClient(test_app):
+                mock_checker.start_state_snapshots.assert_called_once()
+            
+            mock_checker.stop_state_snapshots.assert_awaited_once()
 
 
 class TestGlobalAppInstance:
@@ -178,6 +178,8 @@ class TestMonitoringConfig:
         assert config.enabled is True
         assert config.check_interval_seconds == 30
         assert config.include_dns is True
+        assert config.scheduling_mode == "burst"
+        assert config.adaptive_intervals is False
     
     def test_monitoring_config_custom(self):
         """Should accept custom values"""
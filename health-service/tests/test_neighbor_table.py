@@ -0,0 +1,166 @@
+"""
+Unit tests for passive liveness from the kernel neighbor table.
+"""
+import socket
+import struct
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.models import MonitoringConfig, PingResult
+from app.services.neighbor_table import (
+    NDA_CACHEINFO,
+    NDA_DST,
+    NDA_LLADDR,
+    NLMSG_DONE,
+    NLMSG_ERROR,
+    NUD_FAILED,
+    NUD_PERMANENT,
+    NUD_REACHABLE,
+    NUD_STALE,
+    RTM_NEWNEIGH,
+    NeighborEntry,
+    NeighborTable,
+    parse_neighbor_messages,
+)
+
+
+def attr(attr_type, value):
+    length = 4 + len(value)
+    return struct.pack("=HH", length, attr_type) + value + b"\x00" * ((4 - length % 4) % 4)
+
+
+def neighbor_message(ip, state, confirmed_ticks=None, mac=b"\x02\x00\x00\x00\x00\x01"):
+    family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+    payload = struct.pack("=BxxxiHBB", family, 2, state, 0, 0)
+    payload += attr(NDA_DST, socket.inet_pton(family, ip)) + attr(NDA_LLADDR, mac)
+    if confirmed_ticks is not None:
+        payload += attr(NDA_CACHEINFO, struct.pack("=LLLL", confirmed_ticks, 0, 0, 1))
+    return struct.pack("=LHHLL", 16 + len(payload), RTM_NEWNEIGH, 2, 1, 0) + payload
+
+
+def done_message():
+    return struct.pack("=LHHLL", 20, NLMSG_DONE, 2, 1, 0) + b"\x00" * 4
+
+
+def ping_ok(latency=5.0):
+    return PingResult(success=True, latency_ms=latency, avg_latency_ms=latency, packet_loss_percent=0.0)
+
+
+class TestParseNeighborMessages:
+    """Tests for decoding an RTM_GETNEIGH dump"""
+
+    def test_entries_and_done(self):
+        data = (
+            neighbor_message("192.168.1.10", NUD_REACHABLE, confirmed_ticks=250)
+            + neighbor_message("fe80::1", NUD_STALE)
+            + done_message()
+        )
+
+        entries, done = parse_neighbor_messages(data, clock_ticks=100)
+
+        assert done is True
+        assert entries[0] == NeighborEntry(
+            ip="192.168.1.10", state=NUD_REACHABLE, ifindex=2, mac="02:00:00:00:00:01", confirmed_age_seconds=2.5
+        )
+        assert entries[1].ip == "fe80::1" and entries[1].confirmed_age_seconds is None
+
+    def test_partial_dump_is_not_done(self):
+        entries, done = parse_neighbor_messages(neighbor_message("10.0.0.1", NUD_STALE, 10))
+
+        assert len(entries) == 1 and done is False
+
+    def test_error_message_raises(self):
+        error = struct.pack("=LHHLL", 20, NLMSG_ERROR, 0, 1, 0) + struct.pack("=i", -1)
+
+        with pytest.raises(OSError):
+            parse_neighbor_messages(error)
+
+    def test_malformed_messages_are_skipped(self):
+        """Entries without an address, bad attribute lengths and bad message lengths end parsing cleanly"""
+        no_dst = struct.pack("=BxxxiHBB", socket.AF_INET, 2, NUD_STALE, 0, 0) + attr(NDA_LLADDR, b"\x02" * 6)
+        bad_attr = struct.pack("=BxxxiHBB", socket.AF_INET, 2, NUD_STALE, 0, 0) + struct.pack("=HH", 2, NDA_DST)
+        data = b"".join(
+            struct.pack("=LHHLL", 16 + len(payload), RTM_NEWNEIGH, 2, 1, 0) + payload
+            for payload in (no_dst, bad_attr)
+        ) + struct.pack("=LHHLL", 4, RTM_NEWNEIGH, 2, 1, 0)
+
+        assert parse_neighbor_messages(data) == ([], False)
+
+
+class TestNeighborTable:
+    """Tests for the cached liveness view"""
+
+    def test_liveness_uses_confirmation_age(self):
+        table = NeighborTable(reader=lambda: [
+            NeighborEntry("10.0.0.1", NUD_STALE, 2, confirmed_age_seconds=5),
+            NeighborEntry("10.0.0.2", NUD_STALE, 2, confirmed_age_seconds=500),
+            NeighborEntry("10.0.0.3", NUD_FAILED, 2, confirmed_age_seconds=1),
+            NeighborEntry("10.0.0.4", NUD_PERMANENT, 2, confirmed_age_seconds=1),
+            NeighborEntry("10.0.0.5", NUD_REACHABLE, 2),
+        ])
+
+        alive = [ip for ip in (f"10.0.0.{i}" for i in range(1, 7)) if table.is_alive(ip, 30)]
+
+        assert alive == ["10.0.0.1", "10.0.0.5"]
+
+    def test_reads_are_cached_and_failures_disable_the_table(self):
+        reader = MagicMock(return_value=[])
+        table = NeighborTable(refresh_seconds=60, reader=reader)
+        table.lookup("10.0.0.1")
+        table.lookup("10.0.0.2")
+        assert reader.call_count == 1
+
+        broken = NeighborTable(reader=MagicMock(side_effect=OSError("no netlink")))
+        assert broken.is_alive("10.0.0.1", 30) is False
+        assert broken.available is False
+
+
+class TestPassiveLiveness:
+    """Tests for monitoring checks answered by the neighbor table"""
+
+    def _checker(self, checker, entries):
+        checker.set_monitoring_config(MonitoringConfig(passive_liveness=True, dedupe_probes=False))
+        checker._neighbors = NeighborTable(reader=lambda: entries)
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+        return checker
+
+    async def test_recently_confirmed_device_is_not_pinged(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [
+            NeighborEntry("192.168.1.10", NUD_REACHABLE, 2, confirmed_age_seconds=3),
+        ])
+
+        await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+        metrics = await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+
+        assert checker.ping_host.await_count == 1
+        assert metrics.ping.source == "neighbor"
+        assert metrics.ping.avg_latency_ms == 5.0
+        assert metrics.checks_passed_24h == 2
+        assert checker.get_monitoring_status().passive_checks == 1
+
+    async def test_stale_unknown_and_on_demand_targets_are_pinged(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [
+            NeighborEntry("192.168.1.10", NUD_STALE, 2, confirmed_age_seconds=600),
+        ])
+
+        for _ in range(2):
+            await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+            await checker.check_device_health("8.8.8.8", include_dns=False, shared_probe=True)
+        checker._neighbors = NeighborTable(reader=lambda: [
+            NeighborEntry("192.168.1.10", NUD_REACHABLE, 2, confirmed_age_seconds=1),
+        ])
+        await checker.check_device_health("192.168.1.10", include_dns=False)
+
+        assert checker.ping_host.await_count == 5
+
+    async def test_devices_are_still_pinged_every_probe_interval(self, health_checker_instance):
+        checker = self._checker(health_checker_instance, [
+            NeighborEntry("192.168.1.10", NUD_REACHABLE, 2, confirmed_age_seconds=1),
+        ])
+        await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+
+        with patch('app.services.health_checker.time.monotonic', return_value=10**9):
+            await checker.check_device_health("192.168.1.10", include_dns=False, shared_probe=True)
+
+        assert checker.ping_host.await_count == 2
@@ -2,220 +2,158 @@
 Unit tests for notification_reporter service.
 """
 import pytest
-from unittest.mock import patch, AsyncMock
+import asyncio
+from unittest.mock import patch, AsyncMock, MagicMock
 import httpx
 
 from app.services.notification_reporter import (
-    report_health_check,
-    report_health_checks_batch,
     clear_state_tracking,
+    sync_device_changes_with_notification_service,
     sync_devices_with_notification_service,
+    NotificationReporter,
     _previous_states,
 )
 
 
-class TestReportHealthCheck:
-    """Tests for report_health_check function"""
+def make_pooled_client(status_codes):
+    """Persistent client mock whose post() returns the given status codes in turn"""
+    responses = []
+    for code in status_codes:
+        response = MagicMock()
+        response.status_code = code
+        response.text = ""
+        responses.append(response)
+    client = MagicMock()
+    client.post = AsyncMock(side_effect=responses)
+    client.aclose = AsyncMock()
+    return client
+
+
+def make_idle_reporter(client=None, **kwargs):
+    """Reporter bound to the running loop with its background flusher held off, so tests flush explicitly"""
+    reporter = NotificationReporter(**kwargs)
+    reporter._client = client
+    reporter._loop = asyncio.get_running_loop()
+    reporter._wakeup = asyncio.Event()
+    reporter._flush_task = reporter._loop.create_future()
+    return reporter
+
+
+class TestNotificationReporter:
+    """Tests for the batched notification reporter"""
     
     def setup_method(self):
         """Clear state before each test"""
         clear_state_tracking()
     
-    async def test_report_success(self):
-        """Should report successfully"""
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
-        mock_response.text = ""
+    async def test_batches_results_into_one_request(self):
+        """Results from a cycle should be delivered in one bulk request"""
+        client = make_pooled_client([200])
+        reporter = make_idle_reporter(client, batch_size=100)
         
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
+        for i in range(3):
+            assert reporter.enqueue(f"192.168.1.{i}", True, network_id="net-1", latency_ms=5.0)
+        assert await reporter.flush() is True
         
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            result = await report_health_check(
-                device_ip="192.168.1.1",
-                success=True,
-                network_id="network-uuid-1",  # Required for actual reporting
-                latency_ms=25.0,
-                packet_loss=0.0,
-                device_name="router"
-            )
-            
-            assert result is True
-            mock_client.post.assert_called_once()
+        client.post.assert_called_once()
+        url = client.post.call_args.args[0]
+        results = client.post.call_args.kwargs["json"]["results"]
+        assert url.endswith("/api/notifications/process-health-checks")
+        assert [r["device_ip"] for r in results] == ["192.168.1.0", "192.168.1.1", "192.168.1.2"]
+        assert reporter.get_stats()["delivered"] == 3
     
-    async def test_report_with_previous_state(self):
-        """Should include previous state when available"""
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
+    async def test_previous_state_tracked_in_order(self):
+        """Queued results should carry the state transition at enqueue time"""
+        reporter = make_idle_reporter()
         
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
+        reporter.enqueue("192.168.1.1", True, network_id="net-1")
+        reporter.enqueue("192.168.1.1", False, network_id="net-1")
         
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            # First call establishes state (needs network_id to actually POST)
-            await report_health_check(device_ip="192.168.1.1", success=True, network_id="network-uuid-1")
-            
-            # Second call should include previous state
-            await report_health_check(device_ip="192.168.1.1", success=False, network_id="network-uuid-1")
-            
-            # Check that second call had previous_state
-            call_args = mock_client.post.call_args_list[1]
-            params = call_args.kwargs.get('params', {})
-            assert params.get('previous_state') == 'online'
+        assert "previous_state" not in reporter._buffer[0]
+        assert reporter._buffer[1]["previous_state"] == "online"
     
-    async def test_report_non_200_response(self):
-        """Should return False for non-200 response"""
-        mock_response = AsyncMock()
-        mock_response.status_code = 500
-        mock_response.text = "Internal error"
+    async def test_skips_without_network_id(self):
+        """Results without a network are tracked but not queued"""
+        reporter = NotificationReporter()
         
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
-        
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            result = await report_health_check(
-                device_ip="192.168.1.1",
-                success=True,
-                network_id="network-uuid-1"
-            )
-            
-            assert result is False
+        assert reporter.enqueue("192.168.1.1", True) is False
+        assert reporter.queue_depth == 0
+        assert _previous_states["192.168.1.1"] == "online"
     
-    async def test_report_connect_error(self):
-        """Should handle connection error"""
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    async def test_failed_batch_resent_with_same_id(self):
+        """Retryable failures should resend the same batch under the same batch_id"""
+        client = make_pooled_client([200, 503, 200, 200])
+        reporter = make_idle_reporter(client, batch_size=2, flush_interval=1.0)
+        for i in range(4):
+            reporter.enqueue(f"10.0.0.{i}", True, network_id="net-1")
         
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            result = await report_health_check(
-                device_ip="192.168.1.1",
-                success=True,
-                network_id="network-uuid-1"
-            )
-            
-            assert result is False
-    
-    async def test_report_generic_exception(self):
-        """Should handle generic exception"""
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(side_effect=Exception("Unknown error"))
+        assert await reporter.flush() is False
         
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            result = await report_health_check(
-                device_ip="192.168.1.1",
-                success=True,
-                network_id="network-uuid-1"
-            )
-            
-            assert result is False
-    
-    async def test_report_with_optional_params(self):
-        """Should send only provided optional params"""
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
+        assert reporter.queue_depth == 2
+        assert reporter.get_stats()["consecutive_failures"] == 1
+        assert reporter._backoff_delay() == 1.0
         
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
+        # Results queued meanwhile go out after the held-back batch
+        reporter.enqueue("10.0.0.9", True, network_id="net-1")
+        assert await reporter.flush() is True
         
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            await report_health_check(
-                device_ip="192.168.1.1",
-                success=True,
-                network_id="network-uuid-1",  # Required for actual reporting
-                latency_ms=25.0
-                # Not providing packet_loss or device_name
-            )
-            
-            call_args = mock_client.post.call_args
-            params = call_args.kwargs.get('params', {})
-            
-            assert 'latency_ms' in params
-            assert 'packet_loss' not in params
-            assert 'device_name' not in params
-    
-    async def test_report_without_network_id(self):
-        """Should return False without network_id (skips reporting)"""
-        # No mock needed since it should return early
-        result = await report_health_check(
-            device_ip="192.168.1.1",
-            success=True
-            # No network_id
-        )
+        bodies = [c.kwargs["json"] for c in client.post.call_args_list]
+        assert [[r["device_ip"] for r in b["results"]] for b in bodies] == [
+            ["10.0.0.0", "10.0.0.1"],
+            ["10.0.0.2", "10.0.0.3"],
+            ["10.0.0.2", "10.0.0.3"],
+            ["10.0.0.9"],
+        ]
+        assert bodies[1]["batch_id"] == bodies[2]["batch_id"]
+        assert len({b["batch_id"] for b in bodies}) == 3
+        assert reporter.get_stats() == {"queued": 0, "delivered": 5, "dropped": 0, "consecutive_failures": 0}
         
-        assert result is False
-
-
-class TestReportHealthChecksBatch:
-    """Tests for report_health_checks_batch function"""
+        reporter._consecutive_failures = 20
+        assert reporter._backoff_delay() == 60.0
     
-    def setup_method(self):
-        """Clear state before each test"""
-        clear_state_tracking()
+    async def test_connect_error_retried(self):
+        """Transport errors should be retried rather than dropped"""
+        client = make_pooled_client([])
+        client.post = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+        reporter = make_idle_reporter(client)
+        reporter.enqueue("10.0.0.1", True, network_id="net-1")
+        
+        assert await reporter.flush() is False
+        assert reporter.queue_depth == 1
     
-    async def test_batch_report_all_success(self):
-        """Should report all checks in batch (mocking at report_health_check level)"""
-        # Mock report_health_check to return True for all calls
-        with patch('app.services.notification_reporter.report_health_check', new_callable=AsyncMock) as mock_report:
-            mock_report.return_value = True
-            
-            results = {
-                "192.168.1.1": (True, 25.0, 0.0, "device1"),
-                "192.168.1.2": (True, 30.0, 0.0, "device2"),
-                "192.168.1.3": (False, None, 1.0, "device3"),
-            }
-            
-            # Note: report_health_checks_batch calls report_health_check
-            # but doesn't pass network_id, so we mock at that level
-            count = await report_health_checks_batch(results)
-            
-            assert count == 3
-            assert mock_report.call_count == 3
+    async def test_client_error_dropped(self):
+        """Non-retryable rejections should not block the queue"""
+        reporter = make_idle_reporter(make_pooled_client([422]))
+        reporter.enqueue("10.0.0.1", True, network_id="net-1")
+        
+        assert await reporter.flush() is True
+        assert reporter.queue_depth == 0
+        assert reporter.get_stats()["dropped"] == 1
     
-    async def test_batch_report_some_failures(self):
-        """Should count successful reports"""
-        call_count = 0
-        
-        async def mock_report(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            # Second call fails
-            return call_count != 2
-        
-        with patch('app.services.notification_reporter.report_health_check', side_effect=mock_report):
-            results = {
-                "192.168.1.1": (True, 25.0, 0.0, "device1"),
-                "192.168.1.2": (True, 30.0, 0.0, "device2"),
-                "192.168.1.3": (True, 20.0, 0.0, "device3"),
-            }
-            
-            count = await report_health_checks_batch(results)
-            
-            assert count == 2  # 1 failed
+    async def test_buffer_capped(self):
+        """The oldest results are dropped once the buffer is full"""
+        reporter = make_idle_reporter(batch_size=2, max_buffer=3)
+        for i in range(5):
+            reporter.enqueue(f"10.0.0.{i}", True, network_id="net-1")
+        
+        assert [r["device_ip"] for r in reporter._buffer] == ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
+        assert reporter.get_stats()["dropped"] == 2
     
-    async def test_batch_without_network_id_returns_zero(self):
-        """Should return 0 when no network_id is passed (current behavior)"""
-        # Don't mock - just verify actual behavior
-        results = {
-            "192.168.1.1": (True, 25.0, 0.0, "device1"),
-            "192.168.1.2": (True, 30.0, 0.0, "device2"),
-        }
-        
-        count = await report_health_checks_batch(results)
-        
-        # Without network_id, report_health_check returns False for all
-        assert count == 0
+    async def test_full_batch_flushes_immediately(self):
+        """Reaching the batch size should wake the flusher without waiting for the interval"""
+        reporter = NotificationReporter(batch_size=2, flush_interval=30)
+        client = make_pooled_client([200])
+        
+        with patch('httpx.AsyncClient', return_value=client):
+            reporter.enqueue("10.0.0.1", True, network_id="net-1")
+            reporter.enqueue("10.0.0.2", True, network_id="net-1")
+            for _ in range(10):
+                await asyncio.sleep(0)
+        
+        client.post.assert_called_once()
+        assert reporter.queue_depth == 0
+        await reporter.close()
+        client.aclose.assert_awaited_once()
 
 
 class TestClearStateTracking:
@@ -223,24 +161,11 @@ class TestClearStateTracking:
     
     async def test_clear_state(self):
         """Should clear all tracked states"""
-        # First establish some state
-        mock_response = AsyncMock()
-        mock_response.status_code = 200
+        make_idle_reporter().enqueue("192.168.1.1", True, network_id="network-uuid-1")
+        assert _previous_states
         
-        mock_client = AsyncMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
-        
-        with patch('httpx.AsyncClient', return_value=mock_client):
-            # Need network_id to actually execute the code that sets _previous_states
-            await report_health_check(device_ip="192.168.1.1", success=True, network_id="network-uuid-1")
-        
-        # Clear state
         clear_state_tracking()
         
-        # Import and check the global state
-        from app.services.notification_reporter import _previous_states
         assert len(_previous_states) == 0
 
 
@@ -343,3 +268,82 @@ class TestSyncDevicesWithNotificationService:
             assert call_args.kwargs.get('json') == []
             assert call_args.kwargs.get('params') == {"network_id": 42}
 
+
+class TestSyncDeviceChanges:
+    """Tests for sync_device_changes_with_notification_service function"""
+    
+    def setup_method(self):
+        clear_state_tracking()
+    
+    def make_client(self, *status_codes):
+        mock_client = AsyncMock()
+        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client.__aexit__ = AsyncMock(return_value=None)
+        mock_client.post = AsyncMock(side_effect=[MagicMock(status_code=code, text="") for code in status_codes])
+        return mock_client
+    
+    async def test_sends_only_changes(self):
+        """Should post the added and removed devices to the incremental endpoint"""
+        mock_client = self.make_client(200)
+        
+        with patch('httpx.AsyncClient', return_value=mock_client):
+            result = await sync_device_changes_with_notification_service(
+                "net-1", ["192.168.1.5"], ["192.168.1.9"], current_devices=["192.168.1.1", "192.168.1.5"]
+            )
+        
+        assert result is True
+        call_args = mock_client.post.call_args
+        assert call_args.args[0].endswith("/ml/sync-devices/changes")
+        assert call_args.kwargs["json"] == {"added": ["192.168.1.5"], "removed": ["192.168.1.9"]}
+        assert call_args.kwargs["params"] == {"network_id": "net-1"}
+    
+    async def test_no_changes_skips_request(self):
+        """Should not call the notification service when nothing changed"""
+        with patch('httpx.AsyncClient') as mock_client_class:
+            result = await sync_device_changes_with_notification_service("net-1", [], [])
+        
+        assert result is True
+        mock_client_class.assert_not_called()
+    
+    async def test_falls_back_to_full_sync(self):
+        """Should send the full device list if the incremental endpoint is missing"""
+        mock_client = self.make_client(404, 200)
+        
+        with patch('httpx.AsyncClient', return_value=mock_client):
+            result = await sync_device_changes_with_notification_service(
+                "net-1", ["192.168.1.5"], [], current_devices=["192.168.1.1", "192.168.1.5"]
+            )
+        
+        assert result is True
+        last_call = mock_client.post.call_args
+        assert last_call.args[0].endswith("/ml/sync-devices")
+        assert last_call.kwargs["json"] == ["192.168.1.1", "192.168.1.5"]
+    
+    async def test_failed_send_resyncs_in_full_next_time(self):
+        """Changes the registry already applied must not be lost when the POST fails"""
+        mock_client = self.make_client(503, 500, 200)
+        devices = ["192.168.1.1", "192.168.1.5"]
+        
+        with patch('httpx.AsyncClient', return_value=mock_client):
+            failed = await sync_device_changes_with_notification_service("net-1", ["192.168.1.5"], [], current_devices=devices)
+            # A repeat registration has an empty diff, but the network is still out of sync
+            still_failing = await sync_device_changes_with_notification_service("net-1", [], [], current_devices=devices)
+            resynced = await sync_device_changes_with_notification_service("net-1", [], [], current_devices=devices)
+            in_sync = await sync_device_changes_with_notification_service("net-1", [], [], current_devices=devices)
+        
+        assert (failed, still_failing, resynced, in_sync) == (False, False, True, True)
+        assert mock_client.post.await_count == 3
+        assert [c.args[0].rsplit("/", 1)[-1] for c in mock_client.post.call_args_list] == [
+            "changes", "sync-devices", "sync-devices"
+        ]
+        assert mock_client.post.call_args.kwargs["json"] == devices
+    
+    async def test_unreachable_service_marks_only_that_network(self):
+        """Other networks keep sending incremental changes"""
+        mock_client = self.make_client(200)
+        
+        with patch('httpx.AsyncClient', side_effect=[httpx.ConnectError("refused"), mock_client]):
+            assert await sync_device_changes_with_notification_service("net-1", ["10.0.0.1"], [], current_devices=[]) is False
+            assert await sync_device_changes_with_notification_service("net-2", ["10.0.0.2"], [], current_devices=["10.0.0.2"]) is True
+        
+        assert mock_client.post.call_args.args[0].endswith("/ml/sync-devices/changes")
@@ -0,0 +1,140 @@
+"""
+Unit tests for the port scan engine.
+"""
+import asyncio
+import socket
+
+import pytest
+
+from app.models import PortCheckResult
+from app.services.port_scanner import (
+    PORT_SETS,
+    PortScanner,
+    connect_timeout,
+    parse_port_spec,
+)
+
+
+def make_counting_connect(open_ports=(), delay=0.0):
+    """connect() stub that records calls and peak concurrency"""
+    state = {"calls": [], "active": 0, "peak": 0}
+
+    async def connect(ip, port, timeout):
+        state["calls"].append((ip, port, timeout))
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(delay)
+        state["active"] -= 1
+        return PortCheckResult(port=port, open=port in open_ports)
+
+    return connect, state
+
+
+class TestParsePortSpec:
+    """Tests for port set and range parsing"""
+
+    def test_named_set(self):
+        assert parse_port_spec("top100") == PORT_SETS["top100"]
+        assert len(PORT_SETS["top100"]) == 100
+
+    def test_list_and_ranges(self):
+        """Ranges expand in order and duplicates are dropped"""
+        assert parse_port_spec("22, 80,8000-8002,80") == [22, 80, 8000, 8001, 8002]
+
+    def test_mixed_with_named_set(self):
+        assert parse_port_spec("quick,9100")[-1] == 9100
+
+    @pytest.mark.parametrize("spec", ["", "0", "65536", "90-80", "http", "1-65535"])
+    def test_invalid(self, spec):
+        with pytest.raises(ValueError):
+            parse_port_spec(spec)
+
+
+class TestConnectTimeout:
+    """Tests for RTT-adaptive timeouts"""
+
+    def test_unknown_rtt_uses_maximum(self):
+        assert connect_timeout(None) == 2.0
+
+    def test_scales_and_clamps(self):
+        assert connect_timeout(1.0) == 0.2
+        assert connect_timeout(100.0) == 0.4
+        assert connect_timeout(5000.0) == 2.0
+
+
+class TestPortScanner:
+    """Tests for scanning, the global limit and the result cache"""
+
+    async def test_returns_open_ports_in_requested_order(self):
+        scanner = PortScanner()
+        scanner.connect, _ = make_counting_connect(open_ports={443, 22})
+
+        result = await scanner.scan("10.0.0.1", [443, 80, 22])
+
+        assert [r.port for r in result] == [443, 22]
+
+    async def test_global_in_flight_limit(self):
+        """Concurrent scans of different devices share one connect limit"""
+        scanner = PortScanner(max_in_flight=5)
+        scanner.connect, state = make_counting_connect(delay=0.01)
+
+        await asyncio.gather(*(scanner.scan(f"10.0.0.{i}", list(range(1, 21))) for i in range(4)))
+
+        assert len(state["calls"]) == 80
+        assert state["peak"] <= 5
+
+    async def test_cached_results_reused_for_subsets(self):
+        """A scan covered by a recent scan should not reconnect"""
+        scanner = PortScanner(cache_ttl_seconds=60)
+        scanner.connect, state = make_counting_connect(open_ports={80})
+
+        await scanner.scan("10.0.0.1", [22, 80, 443])
+        result = await scanner.scan("10.0.0.1", [80, 443])
+
+        assert [r.port for r in result] == [80]
+        assert len(state["calls"]) == 3
+
+    async def test_refresh_bypasses_cache(self):
+        scanner = PortScanner(cache_ttl_seconds=60)
+        scanner.connect, state = make_counting_connect()
+
+        await scanner.scan("10.0.0.1", [22])
+        await scanner.scan("10.0.0.1", [22], use_cache=False)
+
+        assert len(state["calls"]) == 2
+
+    async def test_identical_scans_coalesced(self):
+        """Concurrent identical scans share one set of connects"""
+        scanner = PortScanner(cache_ttl_seconds=0)
+        scanner.connect, state = make_counting_connect(delay=0.01)
+
+        await asyncio.gather(*(scanner.scan("10.0.0.1", [22, 80]) for _ in range(5)))
+
+        assert len(state["calls"]) == 2
+
+    async def test_rtt_sets_timeout(self):
+        scanner = PortScanner()
+        scanner.connect, state = make_counting_connect()
+
+        await scanner.scan("10.0.0.1", [22], rtt_ms=100.0)
+
+        assert state["calls"][0][2] == 0.4
+
+    async def test_real_connect_open_and_closed(self):
+        """Non-blocking connect should detect a listening and a closed loopback port"""
+        server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        open_port = server.sockets[0].getsockname()[1]
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+        probe.close()
+
+        try:
+            scanner = PortScanner()
+            result = await scanner.scan("127.0.0.1", [open_port, closed_port], rtt_ms=1.0)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        assert [r.port for r in result] == [open_port]
+        assert result[0].response_time_ms is not None
@@ -0,0 +1,148 @@
+"""
+Unit tests for shared monitoring probes.
+"""
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from app.models import GatewayTestIP, MonitoringConfig, PingResult
+from app.services.probe_cache import SharedProbeCache
+
+
+def ping_ok(latency=5.0):
+    return PingResult(success=True, latency_ms=latency, avg_latency_ms=latency, packet_loss_percent=0.0)
+
+
+class TestSharedProbeCache:
+    """Tests for the shared ping cache"""
+
+    async def test_concurrent_probes_join_one_ping(self):
+        release = asyncio.Event()
+
+        async def slow_ping(ip):
+            await release.wait()
+            return ping_ok()
+
+        ping = AsyncMock(side_effect=slow_ping)
+        cache = SharedProbeCache()
+        waiters = [asyncio.ensure_future(cache.probe("8.8.8.8", ping, 10)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert ping.await_count == 1
+        assert all(r is results[0] for r in results)
+        assert cache.get_stats()["shared"] == 2
+
+    async def test_results_are_reused_within_the_window_only(self):
+        ping = AsyncMock(return_value=ping_ok())
+        cache = SharedProbeCache()
+
+        await cache.probe("1.1.1.1", ping, 10)
+        await cache.probe("1.1.1.1", ping, 10)
+        assert ping.await_count == 1
+
+        with patch('app.services.probe_cache.time.monotonic', return_value=10**9):
+            await cache.probe("1.1.1.1", ping, 10)
+        assert ping.await_count == 2
+
+    async def test_zero_window_never_reuses(self):
+        ping = AsyncMock(return_value=ping_ok())
+        cache = SharedProbeCache()
+
+        await cache.probe("1.1.1.1", ping, 0)
+        await cache.probe("1.1.1.1", ping, 0)
+
+        assert ping.await_count == 2
+
+    async def test_cache_is_bounded(self):
+        cache = SharedProbeCache(max_entries=4)
+        ping = AsyncMock(return_value=ping_ok())
+        for i in range(6):
+            await cache.probe(f"10.0.0.{i}", ping, 10)
+
+        assert cache.get_stats()["cached"] <= 4
+
+
+class TestDeduplicatedMonitoring:
+    """Tests for probe sharing across monitoring consumers"""
+
+    async def test_shared_test_ip_is_pinged_once_per_cycle(self, health_checker_instance):
+        """A test IP on two gateways that is also a monitored device gets one ping"""
+        checker = health_checker_instance
+        checker.set_monitoring_config(MonitoringConfig(scheduling_mode="burst", include_dns=False))
+        checker.register_devices({"8.8.8.8": "net", "192.168.1.1": "net"})
+        for gateway in ("192.168.1.1", "10.0.0.1"):
+            checker.set_gateway_test_ips(gateway, [GatewayTestIP(ip="8.8.8.8", label="Google")])
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        with patch('app.services.health_checker.notification_reporter'):
+            await checker._perform_monitoring_check()
+
+        pinged = [call.args[0] for call in checker.ping_host.await_args_list]
+        assert sorted(pinged) == ["192.168.1.1", "8.8.8.8"]
+        # Every consumer got the result: device metrics, both gateways and their histories
+        assert checker.get_cached_metrics("8.8.8.8") is not None
+        for gateway in ("192.168.1.1", "10.0.0.1"):
+            assert checker.get_cached_test_ip_metrics(gateway).test_ips[0].checks_passed_24h == 1
+        assert checker.get_monitoring_status().shared_probes == 2
+
+    async def test_on_demand_checks_always_ping(self, health_checker_instance):
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        await checker.check_device_health("8.8.8.8", include_dns=False, shared_probe=True)
+        await checker.check_device_health("8.8.8.8", include_dns=False)
+
+        assert checker.ping_host.await_count == 2
+
+    async def test_dedupe_can_be_disabled(self, health_checker_instance):
+        checker = health_checker_instance
+        checker.set_monitoring_config(MonitoringConfig(dedupe_probes=False))
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        await checker.check_device_health("8.8.8.8", include_dns=False, shared_probe=True)
+        await checker.check_test_ip("192.168.1.1", "8.8.8.8", shared_probe=True)
+
+        assert checker.ping_host.await_count == 2
+
+    async def test_staggered_gateways_share_test_ip_across_the_cycle(self, health_checker_instance):
+        """Gateways probed at different points of a staggered cycle reuse one ping per cycle"""
+        checker = health_checker_instance
+        checker.set_monitoring_config(MonitoringConfig(
+            scheduling_mode="staggered", check_interval_seconds=60, include_dns=False,
+        ))
+        for gateway in ("192.168.1.1", "10.0.0.1"):
+            checker.set_gateway_test_ips(gateway, [GatewayTestIP(ip="8.8.8.8", label="Google")])
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        with patch('app.services.probe_cache.time.monotonic') as monotonic:
+            for now, gateway in [(0.0, "192.168.1.1"), (40.0, "10.0.0.1"), (60.0, "192.168.1.1"), (100.0, "10.0.0.1")]:
+                monotonic.return_value = now
+                await checker.check_gateway_test_ips(gateway, shared_probe=True)
+
+        assert checker.ping_host.await_count == 2
+
+    async def test_clear_cache_forgets_shared_probes(self, health_checker_instance):
+        checker = health_checker_instance
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        await checker.check_test_ip("192.168.1.1", "8.8.8.8", shared_probe=True)
+        checker.clear_cache()
+        await checker.check_test_ip("10.0.0.1", "8.8.8.8", shared_probe=True)
+
+        assert checker.ping_host.await_count == 2
+
+    async def test_monitoring_test_ip_checks_skip_history(self, health_checker_instance):
+        """Cached test IP metrics hold only the ring stats; history is attached when read"""
+        checker = health_checker_instance
+        checker.set_gateway_test_ips("192.168.1.1", [GatewayTestIP(ip="8.8.8.8")])
+        checker.ping_host = AsyncMock(return_value=ping_ok())
+
+        monitored = await checker.check_gateway_test_ips("192.168.1.1", shared_probe=True, include_history=False)
+        on_demand = await checker.check_gateway_test_ips("192.168.1.1")
+
+        assert monitored.test_ips[0].check_history == []
+        assert len(on_demand.test_ips[0].check_history) == 2
+        assert checker._test_ip_metrics_cache["192.168.1.1"]["8.8.8.8"].check_history == []
+        cached = checker.get_cached_test_ip_metrics("192.168.1.1").test_ips[0]
+        assert (cached.checks_passed_24h, len(cached.check_history)) == (2, 2)
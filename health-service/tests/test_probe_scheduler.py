@@ -0,0 +1,213 @@
+"""
+Unit tests for the probe scheduler.
+"""
+import asyncio
+import pytest
+
+from app.services.probe_scheduler import (
+    ProbeScheduler,
+    PRIORITY_GATEWAY,
+    PRIORITY_FLAGGED,
+    PRIORITY_NORMAL,
+    subnet_key,
+)
+
+
+class TestSubnetKey:
+    """Tests for subnet grouping"""
+
+    def test_groups_ipv4_by_prefix(self):
+        """Addresses in the same /24 share a key"""
+        assert subnet_key("192.168.1.10") == subnet_key("192.168.1.200")
+        assert subnet_key("192.168.1.10") != subnet_key("192.168.2.10")
+
+    def test_custom_prefix(self):
+        """Should honour the configured prefix length"""
+        assert subnet_key("10.1.2.3", 16) == "10.1.0.0/16"
+
+    def test_hostname_is_its_own_group(self):
+        """Non-IP targets fall back to their own key"""
+        assert subnet_key("router.local") == "router.local"
+
+
+class TestProbeScheduler:
+    """Tests for concurrency, ordering and rate limiting"""
+
+    async def test_results_in_input_order(self):
+        """Should return results in the order probes were given"""
+        scheduler = ProbeScheduler(max_concurrency=2)
+
+        async def probe(value, delay):
+            await asyncio.sleep(delay)
+            return value
+
+        results = await scheduler.run([
+            ("10.0.0.1", lambda: probe("a", 0.02), PRIORITY_NORMAL),
+            ("10.0.0.2", lambda: probe("b", 0.0), PRIORITY_NORMAL),
+            ("10.0.0.3", lambda: probe("c", 0.01), PRIORITY_NORMAL),
+        ])
+
+        assert results == ["a", "b", "c"]
+
+    async def test_respects_concurrency_cap(self):
+        """Never runs more than max_concurrency probes at once"""
+        scheduler = ProbeScheduler(max_concurrency=3)
+        running = 0
+        peak = 0
+
+        async def probe():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await scheduler.run([(f"10.0.{i}.1", probe, PRIORITY_NORMAL) for i in range(20)])
+
+        assert peak == 3
+        assert scheduler.in_flight == 0
+        assert scheduler.queue_depth == 0
+        assert scheduler.completed == 20
+
+    async def test_priority_order(self):
+        """Gateways run before flagged devices, which run before the rest"""
+        scheduler = ProbeScheduler(max_concurrency=1)
+        order = []
+
+        def probe(name):
+            async def run():
+                order.append(name)
+            return run
+
+        await scheduler.run([
+            ("10.0.0.3", probe("normal"), PRIORITY_NORMAL),
+            ("10.0.0.2", probe("flagged"), PRIORITY_FLAGGED),
+            ("10.0.0.1", probe("gateway"), PRIORITY_GATEWAY),
+        ])
+
+        assert order == ["gateway", "flagged", "normal"]
+
+    async def test_exceptions_returned_in_place(self):
+        """A failing probe should not affect the others"""
+        scheduler = ProbeScheduler()
+
+        async def ok():
+            return 1
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        results = await scheduler.run([
+            ("10.0.0.1", ok, PRIORITY_NORMAL),
+            ("10.0.0.2", fail, PRIORITY_NORMAL),
+        ])
+
+        assert results[0] == 1
+        assert isinstance(results[1], RuntimeError)
+
+    async def test_subnet_rate_limit(self):
+        """Probes in one subnet are spread out, other subnets are not held back"""
+        scheduler = ProbeScheduler(max_concurrency=10, subnet_rate_per_second=50)
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def probe(name):
+            async def run():
+                started[name] = loop.time()
+            return run
+
+        start = loop.time()
+        await scheduler.run(
+            [(f"10.0.0.{i}", probe(f"a{i}"), PRIORITY_NORMAL) for i in range(53)]
+            + [("10.0.1.1", probe("b"), PRIORITY_NORMAL)]
+        )
+
+        # Burst of 50 tokens, then 50/s for the remaining 3
+        assert started["a52"] - start >= 0.04
+        assert started["b"] - start < 0.04
+
+    async def test_rate_limited_probes_wait_in_a_side_queue(self):
+        """A subnet out of tokens keeps its probes off the main queue until its timer fires"""
+        scheduler = ProbeScheduler(max_concurrency=10, subnet_rate_per_second=1)
+        loop = asyncio.get_running_loop()
+        started = []
+
+        def probe(name):
+            async def run():
+                started.append(name)
+            return run
+
+        limited = [scheduler.submit(f"10.0.0.{i}", probe(f"a{i}")) for i in range(20)]
+        others = [scheduler.submit(f"10.0.{i}.1", probe(f"b{i}")) for i in range(1, 6)]
+        await asyncio.gather(*others)
+
+        # One token per second: a0 ran, the rest are parked behind the subnet's timer
+        assert started[0] == "a0" and sorted(started[1:]) == [f"b{i}" for i in range(1, 6)]
+        assert scheduler._queue == [] and len(scheduler._held["10.0.0.0/24"]) == 19
+        assert scheduler.queue_depth == 19
+
+        # A higher-priority probe for the subnet joins its side queue and runs first
+        cancelled = scheduler.submit("10.0.0.99", probe("skipped"), PRIORITY_GATEWAY)
+        cancelled.cancel()
+        urgent = scheduler.submit("10.0.0.98", probe("urgent"), PRIORITY_FLAGGED)
+        scheduler.configure(subnet_rate_per_second=100)
+        await asyncio.gather(urgent, *limited)
+
+        assert started[6] == "urgent" and "skipped" not in started
+        assert scheduler._held == {} and scheduler._wakeups == {}
+
+    async def test_configure_updates_limits(self):
+        """Should apply new limits"""
+        scheduler = ProbeScheduler(max_concurrency=4)
+        scheduler.configure(max_concurrency=0)
+
+        assert scheduler.max_concurrency == 1
+
+    async def test_as_completed_yields_in_completion_order(self):
+        """Fast probes should come out before slow ones, with at most `window` queued"""
+        scheduler = ProbeScheduler(max_concurrency=10)
+        finished = []
+
+        def probe(name, delay):
+            async def run():
+                await asyncio.sleep(delay)
+                finished.append(name)
+                if name == "bad":
+                    raise RuntimeError("boom")
+                return name
+            return run
+
+        def probes():
+            yield "10.0.0.1", probe("slow", 0.05), PRIORITY_NORMAL
+            yield "10.0.0.2", probe("fast", 0), PRIORITY_NORMAL
+            # The third probe is only pulled once one of the first two is done
+            assert finished == ["fast"]
+            yield "10.0.0.3", probe("bad", 0), PRIORITY_NORMAL
+
+        results = [item async for item in scheduler.as_completed(probes(), window=2)]
+
+        assert [ip for ip, _ in results] == ["10.0.0.2", "10.0.0.3", "10.0.0.1"]
+        assert isinstance(results[1][1], RuntimeError)
+        assert results[2][1] == "slow"
+
+    async def test_closing_as_completed_drops_queued_probes(self):
+        scheduler = ProbeScheduler(max_concurrency=1)
+        started = []
+
+        def probe(name):
+            async def run():
+                started.append(name)
+                await asyncio.sleep(0)
+                return name
+            return run
+
+        stream = scheduler.as_completed(
+            [(f"10.0.0.{i}", probe(i), PRIORITY_NORMAL) for i in range(5)], window=3
+        )
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.01)
+
+        # Probes still queued when the stream closed never start
+        assert started == [0, 1]
+        assert all(probe.future.cancelled() for probe in scheduler._queue)
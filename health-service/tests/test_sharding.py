@@ -0,0 +1,697 @@
+"""
+Unit tests for sharded monitoring across workers.
+"""
+import asyncio
+import json
+import socket
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models import CachedMetricsDelta, DeviceMetrics, HealthStatus, MonitoringConfig, MonitoringStatus
+from app.routers.health import _merged_change_stream, _peer_change_messages, router
+from app.services.change_feed import ChangeFeed
+from app.services import sharding
+from app.services.sharding import (
+    FileLeaseStore,
+    HashRing,
+    ShardCoordinator,
+    build_shard_coordinator,
+    decode_shard_cursor,
+    encode_shard_cursor,
+    peer_request,
+)
+
+
+def make_metrics(ip):
+    return DeviceMetrics(ip=ip, status=HealthStatus.HEALTHY, last_check=datetime.utcnow())
+
+
+def parse_sse(chunk):
+    """Split one SSE message into (event, id, data)"""
+    fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+    return fields["event"], fields.get("id"), json.loads(fields["data"])
+
+
+def coordinator_with_peer(tmp_path, worker_id="w1", peer_id="w2"):
+    """Coordinator whose ring already contains one peer"""
+    shard = ShardCoordinator(FileLeaseStore(tmp_path), worker_id, f"http://{worker_id}")
+    shard._apply_membership({worker_id: f"http://{worker_id}", peer_id: f"http://{peer_id}"})
+    return shard
+
+
+class TestHashRing:
+    """Tests for consistent hashing"""
+
+    def test_every_key_has_one_owner(self):
+        """Keys should spread over all workers"""
+        ring = HashRing(["w1", "w2", "w3"])
+        owners = [ring.owner(f"10.0.{i // 256}.{i % 256}") for i in range(3000)]
+
+        counts = {w: owners.count(w) for w in ("w1", "w2", "w3")}
+        assert all(count > 600 for count in counts.values())
+        assert HashRing().owner("10.0.0.1") is None
+
+    def test_adding_a_worker_moves_few_keys(self):
+        """Only keys claimed by the new worker should change owner"""
+        keys = [f"10.0.{i // 256}.{i % 256}" for i in range(3000)]
+        before = HashRing(["w1", "w2", "w3"])
+        after = HashRing(["w1", "w2", "w3", "w4"])
+
+        moved = [k for k in keys if before.owner(k) != after.owner(k)]
+
+        assert all(after.owner(k) == "w4" for k in moved)
+        assert len(moved) < len(keys) / 2
+
+
+class TestFileLeaseStore:
+    """Tests for file-backed worker leases"""
+
+    def test_renew_list_and_release(self, tmp_path):
+        store = FileLeaseStore(tmp_path / "shards")
+        store.renew("w1", "http://w1", 30)
+        store.renew("w2", "http://w2", 30)
+
+        assert store.live_workers() == {"w1": "http://w1", "w2": "http://w2"}
+
+        store.release("w1")
+        store.release("w1")  # Releasing twice is harmless
+        assert store.live_workers() == {"w2": "http://w2"}
+
+    def test_expired_leases_are_dropped(self, tmp_path):
+        """A worker that stopped renewing should disappear and its file be cleaned up"""
+        store = FileLeaseStore(tmp_path)
+        store.renew("dead", "http://dead", -1)
+
+        assert store.live_workers() == {}
+        assert list(tmp_path.glob("*.lease")) == []
+
+
+class TestShardCursor:
+    """Tests for merged delta cursors"""
+
+    def test_round_trip_and_garbage(self):
+        cursors = {"w1": "abc:7", "w2": "def:3"}
+
+        assert decode_shard_cursor(encode_shard_cursor(cursors)) == cursors
+        assert decode_shard_cursor("0") == {}
+        assert decode_shard_cursor("not base64!") == {}
+        assert decode_shard_cursor(None) == {}
+
+
+class TestShardCoordinator:
+    """Tests for lease-driven membership"""
+
+    async def test_workers_partition_targets(self, tmp_path):
+        """Two workers sharing a lease directory should split the targets between them"""
+        store = FileLeaseStore(tmp_path)
+        w1 = ShardCoordinator(store, "w1", "http://w1")
+        w2 = ShardCoordinator(store, "w2", "http://w2")
+        rebalances = []
+        w1.add_rebalance_listener(lambda: rebalances.append("w1"))
+
+        await w1.refresh()
+        await w2.refresh()
+        await w1.refresh()
+
+        assert rebalances == ["w1"]  # Only the join of w2 changed w1's ring
+        assert w1.peers() == {"w2": "http://w2"}
+        ips = [f"192.168.1.{i}" for i in range(1, 255)]
+        for ip in ips:
+            assert w1.owns(ip) != w2.owns(ip)
+        assert any(w1.owns(ip) for ip in ips) and any(w2.owns(ip) for ip in ips)
+
+    async def test_leaving_worker_hands_back_targets(self, tmp_path):
+        """After a peer releases its lease every target should come back"""
+        store = FileLeaseStore(tmp_path)
+        w1 = ShardCoordinator(store, "w1", "http://w1")
+        w2 = ShardCoordinator(store, "w2", "http://w2")
+        await w2.refresh()
+        await w1.refresh()
+
+        await w2.stop()
+        assert await w1.refresh() is True
+
+        assert all(w1.owns(f"10.0.0.{i}") for i in range(1, 50))
+        assert w1.get_status()["rebalances"] == 2
+
+    async def test_expired_peer_lease_rebalances(self, tmp_path):
+        """A peer that stops renewing should drop out once its lease expires"""
+        store = FileLeaseStore(tmp_path)
+        w1 = ShardCoordinator(store, "w1", "http://w1")
+        store.renew("w2", "http://w2", 30)
+        await w1.refresh()
+        rebalances = []
+        w1.add_rebalance_listener(lambda: rebalances.append(w1.members()))
+
+        store.renew("w2", "http://w2", -1)
+        assert await w1.refresh() is True
+
+        assert rebalances == [{"w1": "http://w1"}]
+        assert w1.peers() == {} and w1.peer_url("w2") is None and w1.peer_url("w1") is None
+
+    async def test_lease_loop_renews_until_stopped(self, tmp_path):
+        """The loop should keep renewing through errors and release the lease on stop"""
+        store = FileLeaseStore(tmp_path)
+        w1 = ShardCoordinator(store, "w1", "http://w1/", lease_ttl_seconds=0.03)
+        calls = []
+        real_refresh = w1.refresh
+
+        async def refresh():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OSError("lease directory unavailable")
+            return await real_refresh()
+
+        with patch.object(w1, "refresh", refresh):
+            w1.start()
+            task = w1._task
+            w1.start()  # Already running
+            assert w1._task is task
+            while len(calls) < 3:
+                await asyncio.sleep(0.01)
+            assert FileLeaseStore(tmp_path).live_workers() == {"w1": "http://w1"}
+            await w1.stop()
+
+        await asyncio.sleep(0)
+        assert task.cancelled() or task.done()
+        assert store.live_workers() == {}
+        status = w1.get_status()
+        assert status["advertise_url"] == "http://w1" and status["last_renewal"] is not None
+        assert status["workers"] == {"w1": "http://w1"}
+
+    async def test_release_failure_is_logged(self, tmp_path):
+        store = MagicMock()
+        store.release.side_effect = OSError("read-only")
+        w1 = ShardCoordinator(store, "w1")
+
+        await w1.stop()  # Never started; release errors are swallowed
+
+        store.release.assert_called_once_with("w1")
+        assert w1.get_status()["advertise_url"] is None
+
+
+class TestBuildShardCoordinator:
+    """Tests for HEALTH_SHARD_MODE handling"""
+
+    @pytest.mark.parametrize("mode", ["", "off", "redis"])
+    def test_disabled_or_unknown_mode(self, mode):
+        with patch.object(sharding, "SHARD_MODE", mode):
+            assert build_shard_coordinator() is None
+
+    def test_file_mode(self, tmp_path):
+        with patch.object(sharding, "SHARD_MODE", "file"), \
+             patch.object(sharding, "SHARD_DIR", tmp_path), \
+             patch.object(sharding, "SHARD_WORKER_ID", ""), \
+             patch.object(sharding, "SHARD_ADVERTISE_URL", ""):
+            shard = build_shard_coordinator()
+
+        # Hostname alone, so a restarted worker keeps its id and snapshot
+        assert shard.worker_id == socket.gethostname()
+        assert shard.advertise_url == "" and shard.peers() == {}
+
+
+class TestPeerRequest:
+    """Tests for calls between workers"""
+
+    async def test_sends_local_and_returns_json(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(201, json={"ok": True})
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            result = await peer_request(client, "http://w2", "POST", "/api/x", params={"a": "1"}, json_body=[1])
+
+        assert result == (201, {"ok": True})
+        assert dict(requests[0].url.params) == {"a": "1", "local": "true"}
+        assert json.loads(requests[0].content) == [1]
+
+    async def test_non_json_body(self):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(502, text="<html>"))) as client:
+            assert await peer_request(client, "http://w2", "GET", "/api/x") == (502, None)
+
+    async def test_transport_error_is_status_zero(self):
+        def handler(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            assert await peer_request(client, "http://w2", "GET", "/api/x") == (0, None)
+
+
+class TestShardedHealthChecker:
+    """Tests for the checker's share of the monitored targets"""
+
+    def test_wheel_only_holds_owned_targets(self, health_checker_instance, tmp_path):
+        checker = health_checker_instance
+        checker._shard = coordinator_with_peer(tmp_path)
+        ips = [f"192.168.1.{i}" for i in range(1, 41)]
+        checker.replace_network_devices("net", ips)
+
+        targets = {ip for kind, ip in checker._wheel_targets() if kind == "device"}
+
+        assert targets == {ip for ip in ips if checker._shard.owns(ip)}
+        assert 0 < len(targets) < len(ips)
+        status = checker.get_shard_status()
+        assert status["owned_devices"] == len(targets)
+        assert status["monitored_devices"] == len(ips)
+
+    def test_rebalance_marks_wheel_dirty(self, health_checker_instance, tmp_path):
+        checker = health_checker_instance
+        shard = ShardCoordinator(FileLeaseStore(tmp_path), "w1", "http://w1")
+        checker._shard = shard
+        checker.replace_network_devices("net", ["10.0.0.1"])
+        shard.add_rebalance_listener(checker._on_shard_rebalance)
+        checker._wheel_dirty = False
+
+        shard._apply_membership({"w1": "http://w1", "w2": ""})
+
+        assert checker._wheel_dirty is True
+
+    def test_registry_export_import(self, health_checker_instance):
+        """A joining worker should be able to adopt a peer's registry"""
+        from app.models import GatewayTestIP
+        source = health_checker_instance
+        source.replace_network_devices("net-a", ["10.0.0.1", "10.0.0.2"])
+        source.set_device_roles({"10.0.0.1": "gateway"})
+        source.set_gateway_test_ips("10.0.0.1", [GatewayTestIP(ip="8.8.8.8", label="Google")])
+        exported = source.export_registry()
+
+        source.clear_monitored_devices()
+        source._device_roles.clear()
+        source._gateway_test_ips.clear()
+        source.import_registry(exported)
+
+        assert source.get_monitored_devices("net-a") == ["10.0.0.1", "10.0.0.2"]
+        assert source._device_roles == {"10.0.0.1": "gateway"}
+        assert source.get_gateway_test_ips("10.0.0.1").test_ips[0].ip == "8.8.8.8"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return TestClient(app)
+
+
+class TestShardedReads:
+    """Tests for reads merged across workers"""
+
+    def test_cached_merges_peer_metrics(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        local_ip = next(f"10.0.0.{i}" for i in range(1, 255) if shard.owns(f"10.0.0.{i}"))
+        peer_ip = next(f"10.0.0.{i}" for i in range(1, 255) if not shard.owns(f"10.0.0.{i}"))
+        peer_body = {peer_ip: make_metrics(peer_ip).model_dump(mode="json")}
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, peer_body))) as mock_peer:
+            mock_checker.get_all_cached_metrics.return_value = {local_ip: make_metrics(local_ip)}
+            response = client.get("/api/health/cached?history=none")
+
+        assert response.status_code == 200
+        assert set(response.json()) == {local_ip, peer_ip}
+        assert mock_peer.call_args.args[1] == "http://w2"
+
+    def test_delta_packs_one_cursor_per_worker(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        peer_delta = {"cursor": "p:5", "full": False, "devices": {}, "removed": ["10.9.9.9"]}
+        local_delta = CachedMetricsDelta(cursor="l:3", full=False)
+        since = encode_shard_cursor({"w1": "l:1", "w2": "p:1"})
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, peer_delta))) as mock_peer:
+            mock_checker.get_cached_metrics_delta.return_value = local_delta
+            response = client.get("/api/health/cached", params={"since": since})
+
+        data = response.json()
+        assert data["full"] is False
+        assert data["removed"] == ["10.9.9.9"]
+        assert decode_shard_cursor(data["cursor"]) == {"w1": "l:3", "w2": "p:5"}
+        assert mock_peer.call_args.kwargs["params"]["since"] == "p:1"
+        assert mock_checker.get_cached_metrics_delta.call_args.args[0] == "l:1"
+
+    def test_unknown_cursor_is_full_from_every_worker(self, client, tmp_path):
+        """A cursor from another ring layout should resync every worker"""
+        shard = coordinator_with_peer(tmp_path)
+        peer_delta = {"cursor": "p:5", "full": True, "devices": {}, "removed": []}
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, peer_delta))) as mock_peer:
+            mock_checker.get_cached_metrics_delta.return_value = CachedMetricsDelta(cursor="l:3", full=True)
+            response = client.get("/api/health/cached", params={"since": encode_shard_cursor({"w1": "l:1"})})
+
+        assert response.json()["full"] is True
+        assert mock_peer.call_args.kwargs["params"]["since"] == "0"
+        assert mock_checker.get_cached_metrics_delta.call_args.args[0] == "0"
+
+    def test_registration_is_copied_to_peers(self, client, tmp_path):
+        """Registry changes go to every peer with local=true, and only once to notifications"""
+        shard = coordinator_with_peer(tmp_path)
+        diff = MagicMock(network_id="net", added=["10.0.0.1"], removed=[])
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, {}))) as mock_peer, \
+             patch('app.routers.health.sync_device_changes_with_notification_service', AsyncMock()) as mock_sync:
+            mock_checker.replace_network_devices.return_value = diff
+            response = client.post(
+                "/api/health/monitoring/devices", json={"ips": ["10.0.0.1"], "network_id": "net"}
+            )
+            local_response = client.post(
+                "/api/health/monitoring/devices?local=true", json={"ips": ["10.0.0.1"], "network_id": "net"}
+            )
+
+        assert response.status_code == 200 and local_response.status_code == 200
+        mock_peer.assert_awaited_once()
+        args = mock_peer.call_args
+        assert args.args[1:4] == ("http://w2", "POST", "/api/health/monitoring/devices")
+        assert args.kwargs["json_body"] == {"ips": ["10.0.0.1"], "network_id": "net"}
+        mock_sync.assert_awaited_once()
+
+    def test_peer_resync_refetches_every_worker_in_full(self, client, tmp_path):
+        """If one worker can't serve the delta, the merged response is full from all of them"""
+        shard = coordinator_with_peer(tmp_path)
+        peer_delta = {"cursor": "p:9", "full": True, "devices": {}, "removed": []}
+        local_deltas = [CachedMetricsDelta(cursor="l:3", full=False), CachedMetricsDelta(cursor="l:4", full=True)]
+        since = encode_shard_cursor({"w1": "l:1", "w2": "p:1"})
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, peer_delta))) as mock_peer:
+            mock_checker.get_cached_metrics_delta.side_effect = local_deltas
+            data = client.get("/api/health/cached", params={"since": since}).json()
+
+        assert data["full"] is True
+        assert decode_shard_cursor(data["cursor"]) == {"w1": "l:4", "w2": "p:9"}
+        assert [c.args[0] for c in mock_checker.get_cached_metrics_delta.call_args_list] == ["l:1", "0"]
+        mock_peer.assert_awaited_once()
+
+    def test_unreachable_peer_in_delta_restarts_its_cursor(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(0, None))):
+            mock_checker.get_cached_metrics_delta.return_value = CachedMetricsDelta(cursor="l:3", full=True)
+            data = client.get("/api/health/cached", params={"since": "0"}).json()
+
+        assert data["full"] is True
+        assert decode_shard_cursor(data["cursor"]) == {"w1": "l:3", "w2": "0"}
+
+    def test_single_device_read_goes_to_its_owner(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        peer_ip = next(f"10.0.0.{i}" for i in range(1, 255) if not shard.owns(f"10.0.0.{i}"))
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request',
+                   AsyncMock(side_effect=[(200, make_metrics(peer_ip).model_dump(mode="json")), (0, None)])):
+            mock_checker.get_cached_metrics.return_value = None
+            owned = client.get(f"/api/health/cached/{peer_ip}")
+            unreachable = client.get(f"/api/health/cached/{peer_ip}")
+
+        assert owned.status_code == 200 and owned.json()["ip"] == peer_ip
+        assert unreachable.status_code == 404  # Falls back to our (empty) cache
+        mock_checker.get_cached_metrics.assert_called_once()
+
+    def test_gateway_reads_merge_and_forward(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        peer_gw = next(f"10.0.0.{i}" for i in range(1, 255) if not shard.owns(f"10.0.0.{i}"))
+        cached = {"gateway_ip": peer_gw, "test_ips": [], "last_check": None}
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request',
+                   AsyncMock(side_effect=[(200, {peer_gw: {"test_ips": []}}), (200, cached)])):
+            mock_checker.get_all_gateway_test_ips.return_value = {}
+            merged = client.get("/api/health/gateway/test-ips/all/metrics").json()
+            forwarded = client.get(f"/api/health/gateway/{peer_gw}/test-ips/cached").json()
+
+        assert merged == {peer_gw: {"test_ips": []}}
+        assert forwarded["gateway_ip"] == peer_gw
+        mock_checker.get_cached_test_ip_metrics.assert_not_called()
+
+    def test_peer_failure_during_fan_out_is_logged(self, client, tmp_path, caplog):
+        """A peer that rejects or misses a registry change shouldn't fail the request"""
+        shard = coordinator_with_peer(tmp_path)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(side_effect=[(0, None), (500, None)])), \
+             patch('app.routers.health.sync_device_changes_with_notification_service', AsyncMock()):
+            mock_checker.remove_gateway_test_ips.return_value = True
+            mock_checker.clear_monitored_devices.return_value = []
+            removed = client.delete("/api/health/gateway/10.0.0.1/test-ips")
+            cleared = client.delete("/api/health/monitoring/devices")
+
+        assert removed.status_code == 200 and cleared.status_code == 200
+        warnings = [r.message for r in caplog.records if "Shard peer w2 rejected" in r.message]
+        assert warnings == [
+            "Shard peer w2 rejected DELETE /api/health/gateway/10.0.0.1/test-ips (0)",
+            "Shard peer w2 rejected DELETE /api/health/monitoring/devices (500)",
+        ]
+
+
+def peer_messages(*messages, hold=True):
+    """Stand-in for a peer's parsed change stream"""
+    async def fake(url, cursor):
+        fake.cursors.append(cursor)
+        for message in messages if not fake.cursors[1:] else messages[:1]:
+            yield message
+        if hold:
+            await asyncio.Event().wait()
+    fake.cursors = []
+    return fake
+
+
+def peer_snapshot(*ips, cursor="p:1"):
+    devices = [{"ip": ip, "seq": 1, "status": "healthy"} for ip in ips]
+    return "snapshot", json.dumps({"cursor": cursor, "devices": devices}), cursor
+
+
+class TestShardedChanges:
+    """Tests for the change stream merged across workers"""
+
+    async def test_snapshots_merge_then_changes_pass_through(self, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        feed = ChangeFeed()
+        feed.observe(make_metrics("10.0.0.1"))
+        change = "change", json.dumps({"seq": 2, "ip": "10.0.0.2", "status": "unhealthy"}), "p:2"
+        fake_peer = peer_messages(peer_snapshot("10.0.0.2"), change)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health._peer_change_messages', fake_peer):
+            mock_checker.change_feed = feed
+            stream = _merged_change_stream(None)
+            try:
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                assert event == "snapshot"
+                assert sorted(d["ip"] for d in data["devices"]) == ["10.0.0.1", "10.0.0.2"]
+                assert decode_shard_cursor(event_id) == {"w1": feed.cursor, "w2": "p:1"}
+
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                assert (event, data["ip"]) == ("change", "10.0.0.2")
+                assert decode_shard_cursor(event_id)["w2"] == "p:2"
+            finally:
+                await stream.aclose()
+
+        assert fake_peer.cursors == [None]
+        assert feed.get_stats()["subscribers"] == 0
+
+    async def test_peer_resync_on_resume_restarts_every_worker(self, tmp_path):
+        """A peer that can't replay forces one merged snapshot from all workers"""
+        shard = coordinator_with_peer(tmp_path)
+        feed = ChangeFeed()
+        feed.observe(make_metrics("10.0.0.1"))
+        fake_peer = peer_messages(peer_snapshot("10.0.0.2", cursor="p:9"))
+        since = encode_shard_cursor({"w1": feed.cursor, "w2": "p:1"})
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health._peer_change_messages', fake_peer):
+            mock_checker.change_feed = feed
+            stream = _merged_change_stream(since)
+            try:
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+            finally:
+                await stream.aclose()
+
+        assert event == "snapshot"
+        assert sorted(d["ip"] for d in data["devices"]) == ["10.0.0.1", "10.0.0.2"]
+        assert decode_shard_cursor(event_id) == {"w1": feed.cursor, "w2": "p:9"}
+        assert fake_peer.cursors == ["p:1"]
+
+    async def test_departed_peer_is_dropped_from_the_snapshot(self, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        feed = ChangeFeed()
+        fake_peer = peer_messages(peer_snapshot("10.0.0.2"), hold=False)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health._peer_change_messages', fake_peer):
+            mock_checker.change_feed = feed
+            stream = _merged_change_stream(None)
+            try:
+                first = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                second = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+            finally:
+                await stream.aclose()
+
+        assert [d["ip"] for d in first[2]["devices"]] == ["10.0.0.2"]
+        assert second[0] == "snapshot" and second[2]["devices"] == []
+        assert set(decode_shard_cursor(second[1])) == {"w1"}
+
+    async def test_joining_peer_and_removals_are_merged(self, tmp_path):
+        """A peer that joins mid-stream is read from a keepalive tick; removals drop devices"""
+        shard = ShardCoordinator(FileLeaseStore(tmp_path), "w1", "http://w1")
+        feed = ChangeFeed()
+        removed = "change", json.dumps({"seq": 2, "ip": "10.0.0.2", "type": "removed"}), "p:2"
+        fake_peer = peer_messages(peer_snapshot("10.0.0.2"), ("change", "not json", "p:1"), removed)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health._peer_change_messages', fake_peer), \
+             patch('app.routers.health.CHANGE_STREAM_KEEPALIVE_SECONDS', 0.01):
+            mock_checker.change_feed = feed
+            stream = _merged_change_stream(None)
+            try:
+                assert parse_sse(await asyncio.wait_for(stream.__anext__(), 1))[2]["devices"] == []
+                shard._apply_membership({"w1": "http://w1", "w2": "http://w2"})
+                while (message := await asyncio.wait_for(stream.__anext__(), 1)).startswith(":"):
+                    pass
+                event, event_id, data = parse_sse(message)
+                assert event == "snapshot" and [d["ip"] for d in data["devices"]] == ["10.0.0.2"]
+
+                event, event_id, data = parse_sse(await asyncio.wait_for(stream.__anext__(), 1))
+                assert (event, data["type"]) == ("change", "removed")
+                assert decode_shard_cursor(event_id) == {"w1": feed.cursor, "w2": "p:2"}
+            finally:
+                await stream.aclose()
+
+    async def test_peer_stream_is_parsed_from_sse(self):
+        body = (
+            ": keepalive\n\n"
+            "id: p:1\nevent: snapshot\ndata: {\"cursor\": \"p:1\", \"devices\": []}\n\n"
+            "id: p:2\nevent: change\ndata: {\"ip\": \"10.0.0.2\"}\n\n"
+        )
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, text=body)
+
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_peer_client.return_value = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            messages = [m async for m in _peer_change_messages("http://w2", "p:0")]
+
+        assert messages == [
+            ("snapshot", '{"cursor": "p:1", "devices": []}', "p:1"),
+            ("change", '{"ip": "10.0.0.2"}', "p:2"),
+        ]
+        assert requests[0].url.params["since"] == "p:0" and requests[0].url.params["local"] == "true"
+
+    async def test_refused_peer_stream_ends(self):
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.get_peer_client.return_value = httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda request: httpx.Response(503))
+            )
+            assert [m async for m in _peer_change_messages("http://w2", None)] == []
+
+
+class TestShardedMonitoring:
+    """Tests for monitoring config and status across workers"""
+
+    def test_config_update_reaches_peers(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, {}))) as mock_peer:
+            mock_checker.get_monitoring_config.return_value = MonitoringConfig()
+            response = client.post("/api/health/monitoring/config", json={"check_interval_seconds": 60})
+
+        assert response.status_code == 200
+        assert mock_peer.call_args.args[1:4] == ("http://w2", "POST", "/api/health/monitoring/config")
+        assert mock_peer.call_args.kwargs["json_body"] == {"check_interval_seconds": 60}
+
+    def test_cache_clear_reaches_peers(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, {}))) as mock_peer:
+            response = client.delete("/api/health/cache")
+
+        assert response.status_code == 200
+        mock_checker.clear_cache.assert_called_once()
+        assert mock_peer.call_args.args[1:4] == ("http://w2", "DELETE", "/api/health/cache")
+
+    def test_check_now_runs_on_every_worker(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(200, {}))) as mock_peer:
+            mock_checker.get_monitored_devices.return_value = ["10.0.0.1"]
+            mock_checker._perform_monitoring_check = AsyncMock()
+            response = client.post("/api/health/monitoring/check-now")
+
+        assert response.status_code == 200
+        mock_checker._perform_monitoring_check.assert_awaited_once()
+        assert mock_peer.call_args.args[1:4] == ("http://w2", "POST", "/api/health/monitoring/check-now")
+
+    def test_status_sums_worker_counters(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        now = datetime.utcnow()
+        local = MonitoringStatus(
+            enabled=True, check_interval_seconds=30, include_dns=True, monitored_devices=["10.0.0.1", "10.0.0.2"],
+            last_check=now - timedelta(seconds=10), next_check=now + timedelta(seconds=20),
+            queue_depth=2, in_flight_checks=1, owned_devices=1, shard_worker_id="w1", shard_workers=2,
+        )
+        peer = local.model_copy(update={
+            "last_check": now, "next_check": now + timedelta(seconds=5), "queue_depth": 3,
+            "last_cycle_duration_seconds": 1.5, "owned_devices": 1, "shard_worker_id": "w2",
+        })
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request',
+                   AsyncMock(return_value=(200, peer.model_dump(mode="json")))):
+            mock_checker.get_monitoring_status.return_value = local
+            data = client.get("/api/health/monitoring/status").json()
+
+        assert (data["queue_depth"], data["in_flight_checks"], data["owned_devices"]) == (5, 2, 2)
+        assert data["last_check"] == now.isoformat() and data["last_cycle_duration_seconds"] == 1.5
+        assert data["next_check"] == (now + timedelta(seconds=5)).isoformat()
+        assert data["shard_worker_id"] == "w1"
+
+    def test_unreachable_peer_leaves_local_status(self, client, tmp_path):
+        shard = coordinator_with_peer(tmp_path)
+        local = MonitoringStatus(enabled=True, check_interval_seconds=30, include_dns=True,
+                                 monitored_devices=[], queue_depth=2, owned_devices=4)
+
+        with patch('app.routers.health.shard_coordinator', shard), \
+             patch('app.routers.health.health_checker') as mock_checker, \
+             patch('app.routers.health.peer_request', AsyncMock(return_value=(0, None))):
+            mock_checker.get_monitoring_status.return_value = local
+            data = client.get("/api/health/monitoring/status").json()
+
+        assert (data["queue_depth"], data["owned_devices"]) == (2, 4)
+
+    def test_shared_json_is_replaced_atomically(self, health_checker_instance, tmp_path):
+        from app.models import GatewayTestIP
+        with patch('app.services.health_checker.GATEWAY_TEST_IPS_FILE', tmp_path / "gateway_test_ips.json"):
+            health_checker_instance.set_gateway_test_ips("10.0.0.1", [GatewayTestIP(ip="1.1.1.1")])
+
+        saved = json.loads((tmp_path / "gateway_test_ips.json").read_text())
+        assert saved["10.0.0.1"]["test_ips"] == [{"ip": "1.1.1.1", "label": None}]
+        assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
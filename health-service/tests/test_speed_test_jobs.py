@@ -0,0 +1,180 @@
+"""
+Unit tests for the speed test job queue.
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+from app.models import SpeedTestJobStatus, SpeedTestResult
+from app.routers.health import _speed_test_job_stream
+from app.services.speed_test_jobs import SpeedTestJobManager
+
+
+def ok_result(download=100.0):
+    return SpeedTestResult(success=True, timestamp=datetime.utcnow(), download_mbps=download)
+
+
+class BlockingRunner:
+    """Runner that reports each phase and waits until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, gateway_ip, report):
+        self.calls.append(gateway_ip)
+        report("server_selection", 1.0)
+        report("download", 1.0)
+        self.release.wait(5)
+        report("upload", 1.0)
+        return ok_result()
+
+
+class TestSpeedTestJobManager:
+    """Tests for single-flight speed test jobs"""
+
+    async def test_duplicate_requests_share_one_run(self):
+        runner = BlockingRunner()
+        manager = SpeedTestJobManager(runner)
+
+        first = manager.submit("192.168.1.1")
+        second = manager.submit("192.168.1.1")
+        assert first.job_id == second.job_id
+        assert first.attached_requests == 2
+
+        runner.release.set()
+        results = await asyncio.gather(manager.wait(first.job_id), manager.wait(second.job_id))
+
+        assert runner.calls == ["192.168.1.1"]
+        assert results[0] is results[1]
+        assert manager.get(first.job_id).status == SpeedTestJobStatus.COMPLETED
+        # Once finished, a new request starts a new test
+        runner.release.set()
+        assert manager.submit("192.168.1.1").job_id != first.job_id
+        manager.shutdown()
+
+    async def test_other_gateways_queue_behind_the_executor(self):
+        """With one executor slot, a second gateway's test waits its turn"""
+        runner = BlockingRunner()
+        manager = SpeedTestJobManager(runner, max_concurrent=1)
+
+        first = manager.submit("192.168.1.1")
+        second = manager.submit("10.0.0.1")
+        await asyncio.sleep(0.05)
+
+        assert first.status == SpeedTestJobStatus.RUNNING
+        assert second.status == SpeedTestJobStatus.QUEUED
+        assert manager.get_stats()["queued"] == 1
+
+        runner.release.set()
+        await manager.wait(second.job_id)
+        assert runner.calls == ["192.168.1.1", "10.0.0.1"]
+        manager.shutdown()
+
+    async def test_subscribers_see_phases_in_order(self):
+        runner = BlockingRunner()
+        manager = SpeedTestJobManager(runner)
+        job = manager.submit(None)
+        queue = manager.subscribe(job.job_id)
+
+        runner.release.set()
+        await manager.wait(job.job_id)
+
+        updates = []
+        while not queue.empty():
+            updates.append(queue.get_nowait())
+        assert [u.phase for u in updates] == ["queued", "server_selection", "download", "upload", "done"]
+        assert [u.progress for u in updates] == sorted(u.progress for u in updates)
+        assert updates[-1].status == SpeedTestJobStatus.COMPLETED
+        assert updates[-1].result.download_mbps == 100.0
+        manager.shutdown()
+
+    async def test_runner_errors_fail_the_job(self):
+        stored = []
+
+        def runner(gateway_ip, report):
+            raise RuntimeError("no servers")
+
+        manager = SpeedTestJobManager(runner, on_result=lambda gw, r: stored.append((gw, r)))
+        result = await manager.run("192.168.1.1")
+
+        assert result.success is False
+        assert result.error_message == "no servers"
+        assert manager.list_jobs()[0].status == SpeedTestJobStatus.FAILED
+        assert stored == [("192.168.1.1", result)]
+        manager.shutdown()
+
+    async def test_finished_jobs_are_pruned(self):
+        manager = SpeedTestJobManager(lambda gw, report: ok_result(), max_finished_jobs=2)
+        for gateway in ("a", "b", "c"):
+            await manager.run(gateway)
+
+        assert [job.gateway_ip for job in manager.list_jobs()] == ["c", "b"]
+        assert manager.subscribe("missing") is None
+        assert await manager.wait("missing") is None
+        manager.shutdown()
+
+
+class TestSpeedTestJobStream:
+    """Tests for the SSE progress stream"""
+
+    async def test_stream_ends_with_complete_event(self):
+        runner = BlockingRunner()
+        manager = SpeedTestJobManager(runner)
+        job = manager.submit("192.168.1.1")
+        queue = manager.subscribe(job.job_id)
+
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.speed_tests = manager
+            stream = _speed_test_job_stream(job.job_id, queue)
+            first = await stream.__anext__()
+            runner.release.set()
+            rest = [chunk async for chunk in stream]
+
+        events = [dict(line.split(": ", 1) for line in chunk.strip().split("\n")) for chunk in [first, *rest]]
+        assert events[0]["event"] == "progress"
+        assert events[-1]["event"] == "complete"
+        assert json.loads(events[-1]["data"])["result"]["success"] is True
+        assert {json.loads(e["data"])["phase"] for e in events[:-1]} >= {"download", "upload"}
+        manager.shutdown()
+
+    async def test_stream_of_pruned_job_sends_error(self):
+        """A job dropped after subscribing should end the stream with an error event"""
+        manager = SpeedTestJobManager(lambda gw, report: ok_result(), max_finished_jobs=0)
+        job = manager.submit("192.168.1.1")
+        queue = manager.subscribe(job.job_id)
+        await manager.wait(job.job_id)
+        assert manager.get(job.job_id) is None
+
+        with patch('app.routers.health.health_checker') as mock_checker:
+            mock_checker.speed_tests = manager
+            chunks = [chunk async for chunk in _speed_test_job_stream(job.job_id, queue)]
+
+        assert len(chunks) == 1
+        fields = dict(line.split(": ", 1) for line in chunks[0].strip().split("\n"))
+        assert fields["event"] == "error"
+        assert json.loads(fields["data"]) == {"detail": "Speed test job not found"}
+        manager.shutdown()
+
+
+class TestHealthCheckerSpeedTest:
+    """Tests for speed tests run through the checker"""
+
+    async def test_concurrent_requests_run_one_test(self, health_checker_instance):
+        mock_speedtest = MagicMock()
+        mock_speedtest.return_value.results.dict.return_value = {
+            'download': 50_000_000, 'upload': 10_000_000, 'ping': 12.0, 'server': {}, 'client': {},
+        }
+
+        with patch('speedtest.Speedtest', mock_speedtest):
+            results = await asyncio.gather(
+                health_checker_instance.run_speed_test("192.168.1.1"),
+                health_checker_instance.run_speed_test("192.168.1.1"),
+            )
+
+        assert mock_speedtest.call_count == 1
+        assert results[0].download_mbps == 50.0
+        assert health_checker_instance.get_last_speed_test("192.168.1.1") == results[0]
+        health_checker_instance.speed_tests.shutdown()
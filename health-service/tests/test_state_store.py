@@ -0,0 +1,90 @@
+"""
+Unit tests for the binary state snapshot format.
+"""
+import struct
+import zlib
+
+import pytest
+
+from app.services.state_store import (
+    RECORD_DEVICE_HISTORY,
+    RECORD_DEVICE_METRICS,
+    SnapshotError,
+    decode_snapshot,
+    encode_snapshot,
+    read_snapshot,
+    write_snapshot,
+)
+
+
+def resigned(body):
+    """Snapshot with a valid checksum over an arbitrary body"""
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+class TestSnapshotEncoding:
+    """Tests for encoding and decoding records"""
+
+    def test_round_trip(self):
+        """Records should decode exactly as written"""
+        records = [
+            (RECORD_DEVICE_HISTORY, "192.168.1.1", b"\x00\x01\x02"),
+            (RECORD_DEVICE_METRICS, "192.168.1.2", b'{"ip": "192.168.1.2"}'),
+            (RECORD_DEVICE_HISTORY, "fe80::1", b""),
+        ]
+
+        written_at, decoded = decode_snapshot(encode_snapshot(records, written_at=1234.5))
+
+        assert written_at == 1234.5
+        assert decoded == records
+
+    def test_corruption_detected(self):
+        """A flipped byte should fail the checksum"""
+        data = bytearray(encode_snapshot([(RECORD_DEVICE_HISTORY, "10.0.0.1", b"abcdef")]))
+        data[20] ^= 0xFF
+
+        with pytest.raises(SnapshotError):
+            decode_snapshot(bytes(data))
+
+    def test_truncation_detected(self):
+        """A partially written file should be rejected"""
+        data = encode_snapshot([(RECORD_DEVICE_HISTORY, "10.0.0.1", b"abcdef")])
+
+        with pytest.raises(SnapshotError):
+            decode_snapshot(data[:10])
+        with pytest.raises(SnapshotError):
+            decode_snapshot(data[:-3])
+
+    def test_wrong_magic(self):
+        """Other files should not be mistaken for snapshots"""
+        with pytest.raises(SnapshotError):
+            decode_snapshot(b"{}" * 20)
+
+    @pytest.mark.parametrize("body,message", [
+        (struct.pack("<4sHdI", b"JSON", 1, 0.0, 0), "Not a health state snapshot"),
+        (struct.pack("<4sHdI", b"CGHS", 99, 0.0, 0), "Unsupported snapshot version 99"),
+        (struct.pack("<4sHdI", b"CGHS", 1, 0.0, 1) + b"\x01", "record header is truncated"),
+        (struct.pack("<4sHdI", b"CGHS", 1, 0.0, 1) + struct.pack("<BHI", 1, 8, 100) + b"10.0.0.1", "record is truncated"),
+    ])
+    def test_malformed_body_with_valid_checksum(self, body, message):
+        """Structural errors should be caught even when the checksum matches"""
+        with pytest.raises(SnapshotError, match=message):
+            decode_snapshot(resigned(body))
+
+
+class TestSnapshotFiles:
+    """Tests for atomic writes and reads"""
+
+    def test_write_and_read(self, tmp_path):
+        """Snapshots written to disk should read back, with no temp file left behind"""
+        path = tmp_path / "state" / "health_state.bin"
+        write_snapshot(path, encode_snapshot([(RECORD_DEVICE_HISTORY, "10.0.0.1", b"x")]))
+
+        _, records = read_snapshot(path)
+
+        assert records == [(RECORD_DEVICE_HISTORY, "10.0.0.1", b"x")]
+        assert list(path.parent.iterdir()) == [path]
+
+    def test_missing_file(self, tmp_path):
+        """A missing snapshot reads as None"""
+        assert read_snapshot(tmp_path / "missing.bin") is None
@@ -0,0 +1,68 @@
+"""
+Unit tests for the timing wheel.
+"""
+from app.services.timing_wheel import TimingWheel
+
+
+class TestTimingWheel:
+    """Tests for scheduling, cancelling and advancing"""
+
+    def test_fires_after_delay(self):
+        """A key should come due once its delay has elapsed"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, now=0.0)
+        wheel.schedule("a", 3)
+
+        assert wheel.advance(2.0) == []
+        assert wheel.advance(3.0) == ["a"]
+        assert "a" not in wheel
+
+    def test_minimum_one_tick(self):
+        """Zero delays still wait for the next tick"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, now=0.0)
+        wheel.schedule("a", 0)
+
+        assert wheel.advance(0.5) == []
+        assert wheel.advance(1.0) == ["a"]
+
+    def test_delay_longer_than_revolution(self):
+        """Delays beyond one revolution use round counters"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=4, now=0.0)
+        wheel.schedule("a", 10)
+
+        assert wheel.advance(9.0) == []
+        assert wheel.advance(10.0) == ["a"]
+
+    def test_full_revolution(self):
+        """A delay of exactly one revolution fires on the same slot"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=4, now=0.0)
+        wheel.schedule("a", 4)
+
+        assert wheel.advance(3.0) == []
+        assert wheel.advance(4.0) == ["a"]
+
+    def test_reschedule_replaces(self):
+        """Scheduling an existing key moves it"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, now=0.0)
+        wheel.schedule("a", 2)
+        wheel.schedule("a", 5)
+
+        assert len(wheel) == 1
+        assert wheel.advance(4.0) == []
+        assert wheel.advance(5.0) == ["a"]
+
+    def test_cancel(self):
+        """Cancelled keys never fire"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, now=0.0)
+        wheel.schedule("a", 1)
+
+        assert wheel.cancel("a") is True
+        assert wheel.cancel("a") is False
+        assert wheel.advance(5.0) == []
+
+    def test_catches_up_missed_ticks(self):
+        """A late advance returns everything that came due in between"""
+        wheel = TimingWheel(tick_seconds=1.0, slots=8, now=0.0)
+        for i in range(1, 6):
+            wheel.schedule(f"k{i}", i)
+
+        assert sorted(wheel.advance(5.5)) == ["k1", "k2", "k3", "k4", "k5"]
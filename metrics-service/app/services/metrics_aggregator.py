@@ -92,6 +92,9 @@ class MetricsAggregator:
         # Multi-tenant: store snapshots per network_id (None key for legacy single-network mode)
         self._snapshots: Dict[Optional[str], NetworkTopologySnapshot] = {}
         self._last_speed_test: Dict[str, SpeedTestMetrics] = {}  # gateway_ip -> last speed test
+        # Local mirror of the health service's cached metrics, kept current with cursor deltas
+        self._health_mirror: Dict[str, Any] = {}
+        self._health_cursor: Optional[str] = None
     
     @property
     def _last_snapshot(self) -> Optional[NetworkTopologySnapshot]:
@@ -198,12 +201,22 @@ class MetricsAggregator:
             return None
     
     async def _fetch_health_metrics(self) -> Dict[str, Any]:
-        """Fetch all cached health metrics from the health service."""
+        """
+        Fetch all cached health metrics from the health service.
+        
+        Only devices whose state changed since the previous poll, or that are
+        due their periodic refresh (at least once a minute), are downloaded
+        with downsampled history; they are applied to a local mirror, which is
+        returned.
+        """
         try:
             async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{HEALTH_SERVICE_URL}/api/health/cached")
+                response = await client.get(
+                    f"{HEALTH_SERVICE_URL}/api/health/cached",
+                    params={"since": self._health_cursor or "0", "history": "downsampled"},
+                )
                 if response.status_code == 200:
-                    return response.json()
+                    return self._apply_health_delta(response.json())
                 return {}
         except httpx.ConnectError:
             logger.warning("Health service unavailable - cannot fetch health metrics")
@@ -212,6 +225,23 @@ class MetricsAggregator:
             logger.error(f"Failed to fetch health metrics: {e}")
             return {}
     
+    def _apply_health_delta(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a /cached?since= response to the health mirror and return a copy of it"""
+        if "cursor" not in data:
+            # Health service without delta support returned the full map
+            self._health_mirror = dict(data)
+            self._health_cursor = None
+            return dict(self._health_mirror)
+        
+        if data.get("full"):
+            self._health_mirror = dict(data.get("devices", {}))
+        else:
+            self._health_mirror.update(data.get("devices", {}))
+            for ip in data.get("removed", []):
+                self._health_mirror.pop(ip, None)
+        self._health_cursor = data["cursor"]
+        return dict(self._health_mirror)
+    
     async def _fetch_gateway_test_ips(self) -> Dict[str, Any]:
         """Fetch all gateway test IP metrics (with status) from health service."""
         try:
@@ -321,17 +351,24 @@ class MetricsAggregator:
         )
     
     def _transform_check_history(self, history_data: List[Dict]) -> List[CheckHistoryEntry]:
-        """Transform check history from health service."""
+        """Transform check history (raw checks or downsampled buckets) from health service."""
         result = []
         for entry in history_data or []:
             try:
                 timestamp = entry.get("timestamp")
                 if isinstance(timestamp, str):
                     timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+                if "checks" in entry:
+                    # A bucket counts as a success only if every check in it passed
+                    success = entry.get("passed", 0) == entry["checks"]
+                    latency_ms = entry.get("avg_latency_ms")
+                else:
+                    success = entry.get("success", False)
+                    latency_ms = entry.get("latency_ms")
                 result.append(CheckHistoryEntry(
                     timestamp=timestamp,
-                    success=entry.get("success", False),
-                    latency_ms=entry.get("latency_ms"),
+                    success=success,
+                    latency_ms=latency_ms,
                 ))
             except Exception as e:
                 logger.debug(f"Failed to parse history entry: {e}")
@@ -565,7 +602,9 @@ class MetricsAggregator:
             dns=self._transform_dns_metrics(health_data.get("dns")),
             open_ports=open_ports,
             uptime=self._transform_uptime_metrics(health_data) if health_data else None,
-            check_history=self._transform_check_history(health_data.get("check_history", [])),
+            check_history=self._transform_check_history(
+                health_data.get("check_history") or health_data.get("history_buckets") or []
+            ),
             notes=node_data.get("notes"),
             created_at=created_at,
             updated_at=updated_at,
@@ -133,9 +133,38 @@ class TestDataFetching:
             )
             
             metrics = await metrics_aggregator_instance._fetch_health_metrics()
-            
+
             assert metrics == {}
-    
+
+    async def test_fetch_health_metrics_applies_deltas(self, metrics_aggregator_instance):
+        """Should keep a mirror current from cursor deltas"""
+        full = MagicMock(status_code=200)
+        full.json.return_value = {
+            "cursor": "abc:2",
+            "full": True,
+            "devices": {"192.168.1.1": {"status": "healthy"}, "192.168.1.2": {"status": "healthy"}},
+            "removed": [],
+        }
+        delta = MagicMock(status_code=200)
+        delta.json.return_value = {
+            "cursor": "abc:4",
+            "full": False,
+            "devices": {"192.168.1.1": {"status": "unhealthy"}},
+            "removed": ["192.168.1.2"],
+        }
+
+        with patch('httpx.AsyncClient') as mock_client:
+            mock_get = AsyncMock(side_effect=[full, delta])
+            mock_client.return_value.__aenter__.return_value.get = mock_get
+
+            first = await metrics_aggregator_instance._fetch_health_metrics()
+            second = await metrics_aggregator_instance._fetch_health_metrics()
+
+        assert set(first) == {"192.168.1.1", "192.168.1.2"}
+        assert second == {"192.168.1.1": {"status": "unhealthy"}}
+        assert mock_get.call_args_list[0][1]["params"] == {"since": "0", "history": "downsampled"}
+        assert mock_get.call_args_list[1][1]["params"] == {"since": "abc:2", "history": "downsampled"}
+
     async def test_fetch_gateway_test_ips_success(self, metrics_aggregator_instance, sample_gateway_test_ips):
         """Should fetch gateway test IPs"""
         mock_response = MagicMock()
@@ -286,6 +315,19 @@ class TestDataTransformation:
         assert len(result) == 2
         assert result[0].success is True
     
+    def test_transform_check_history_buckets(self, metrics_aggregator_instance):
+        """Should turn downsampled buckets into entries that pass only if every check passed"""
+        buckets = [
+            {"timestamp": "2024-01-01T00:00:00Z", "checks": 10, "passed": 10, "uptime_percent": 100.0,
+             "avg_latency_ms": 4.5},
+            {"timestamp": "2024-01-01T00:05:00Z", "checks": 10, "passed": 9, "uptime_percent": 90.0},
+        ]
+        
+        result = metrics_aggregator_instance._transform_check_history(buckets)
+        
+        assert [entry.success for entry in result] == [True, False]
+        assert result[0].latency_ms == 4.5
+    
     def test_transform_check_history_empty(self, metrics_aggregator_instance):
         """Should handle empty history"""
         result = metrics_aggregator_instance._transform_check_history([])
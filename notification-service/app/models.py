@@ -448,6 +448,36 @@ class TestNotificationResponse(BaseModel):
     error: Optional[str] = None
 
 
+class HealthCheckReport(BaseModel):
+    """A single health check result reported by the health service"""
+    device_ip: str
+    success: bool
+    network_id: str
+    latency_ms: Optional[float] = None
+    packet_loss: Optional[float] = None
+    device_name: Optional[str] = None
+    previous_state: Optional[str] = None
+
+
+class HealthCheckBatchRequest(BaseModel):
+    """A batch of health check results, processed in order"""
+    results: List[HealthCheckReport]
+    batch_id: Optional[str] = None  # Set by the sender so retries can be deduplicated
+
+
+class DeviceSyncChanges(BaseModel):
+    """Devices added to and removed from a network since the last sync"""
+    added: List[str] = []
+    removed: List[str] = []
+
+
+class HealthCheckBatchResponse(BaseModel):
+    """Result of processing a health check batch"""
+    success: bool = True
+    processed: int
+    events_created: int
+
+
 class NotificationStatsResponse(BaseModel):
     """Statistics about notifications"""
     total_sent_24h: int = 0
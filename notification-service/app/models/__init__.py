@@ -36,6 +36,8 @@ if os.path.exists(_models_py_path):
         'NetworkEvent', 'NotificationRecord',
         'NotificationHistoryResponse', 'NotificationStatsResponse',
         'TestNotificationRequest', 'TestNotificationResponse',
+        'HealthCheckReport', 'HealthCheckBatchRequest', 'HealthCheckBatchResponse',
+        'DeviceSyncChanges',
         'DiscordBotInfo', 'DiscordGuild', 'DiscordChannel',
         'DiscordGuildsResponse', 'DiscordChannelsResponse',
         'AnomalyType', 'DeviceBaseline', 'AnomalyDetectionResult',
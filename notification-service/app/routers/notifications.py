@@ -4,8 +4,9 @@ API router for notification service endpoints.
 
 import uuid
 import logging
-from typing import Optional, List
-from fastapi import APIRouter, HTTPException, Query, Header, Request, Depends
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+from fastapi import APIRouter, HTTPException, Query, Header, Request, Depends, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from datetime import datetime
@@ -30,6 +31,9 @@ from ..models import (
     ScheduledBroadcastCreate,
     ScheduledBroadcastUpdate,
     ScheduledBroadcastResponse,
+    HealthCheckBatchRequest,
+    HealthCheckBatchResponse,
+    DeviceSyncChanges,
     get_default_priority_for_type,
 )
 from ..services.notification_manager import notification_manager
@@ -38,12 +42,17 @@ from ..services.email_service import is_email_configured
 from ..services.anomaly_detector import anomaly_detector
 from ..services.network_anomaly_detector import network_anomaly_detector_manager
 from ..services.version_checker import version_checker
-from ..database import get_db
+from ..database import get_db, async_session_maker
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Responses of recently processed health check batches, by batch_id, so a
+# batch the health service retries after a timeout isn't applied twice
+PROCESSED_BATCH_HISTORY = 1024
+_processed_batches: "OrderedDict[str, HealthCheckBatchResponse]" = OrderedDict()
+
 
 # ==================== Preferences (per-network) ====================
 
@@ -255,6 +264,27 @@ async def sync_current_devices(
     }
 
 
+@router.post("/ml/sync-devices/changes")
+async def sync_device_changes(
+    changes: DeviceSyncChanges,
+    network_id: str = Query(..., description="Network ID (UUID) these devices belong to"),
+):
+    """
+    Apply devices added to and removed from a network.
+    
+    Incremental counterpart of /ml/sync-devices, used by the health service
+    so each registration only sends what changed.
+    """
+    detector = network_anomaly_detector_manager.get_detector(network_id)
+    detector.update_current_devices(changes.added, changes.removed)
+    return {
+        "success": True,
+        "added": len(changes.added),
+        "removed": len(changes.removed),
+        "network_id": network_id,
+    }
+
+
 # ==================== Health Check Processing ====================
 
 @router.post("/process-health-check")
@@ -283,9 +313,6 @@ async def process_health_check(
         device_name: Optional device name
         previous_state: Optional previous state (online/offline)
     """
-    # Use per-network anomaly detector
-    from ..services.network_anomaly_detector import network_anomaly_detector_manager
-    
     # Process health check with per-network detector
     event = network_anomaly_detector_manager.process_health_check(
         network_id=network_id,
@@ -299,34 +326,102 @@ async def process_health_check(
     
     # If event created, dispatch to network users
     if event:
-        event.network_id = network_id
-        logger.info(f"Network event created for network {network_id}: {event.event_type.value} - {event.title}")
+        await _dispatch_health_event(db, network_id, event)
+    
+    return {"success": True, "event_created": event is not None}
+
+
+@router.post("/process-health-checks", response_model=HealthCheckBatchResponse)
+async def process_health_checks(
+    batch: HealthCheckBatchRequest,
+    background_tasks: BackgroundTasks,
+):
+    """
+    Process a batch of health check results from the health service.
+    
+    Equivalent to calling /process-health-check once per result, in order,
+    but in a single request. Results are applied to the detectors before the
+    response is sent; the resulting notifications are dispatched afterwards,
+    sharing network member lookups across the batch.
+    
+    A batch that carries a batch_id is applied at most once: a retry of a
+    recently processed batch gets the original response back.
+    """
+    if batch.batch_id is not None and batch.batch_id in _processed_batches:
+        logger.debug(f"Health check batch {batch.batch_id} already processed")
+        return _processed_batches[batch.batch_id]
+    
+    events = []
+    for report in batch.results:
+        event = network_anomaly_detector_manager.process_health_check(
+            network_id=report.network_id,
+            device_ip=report.device_ip,
+            success=report.success,
+            latency_ms=report.latency_ms,
+            packet_loss=report.packet_loss,
+            device_name=report.device_name,
+            previous_state=report.previous_state,
+        )
+        if event:
+            events.append((report.network_id, event))
+    
+    if events:
+        background_tasks.add_task(_dispatch_health_events, events)
+    
+    response = HealthCheckBatchResponse(processed=len(batch.results), events_created=len(events))
+    if batch.batch_id is not None:
+        _processed_batches[batch.batch_id] = response
+        while len(_processed_batches) > PROCESSED_BATCH_HISTORY:
+            _processed_batches.popitem(last=False)
+    return response
+
+
+async def _dispatch_health_events(events: List[Tuple[str, NetworkEvent]]) -> None:
+    """Dispatch the events of a health check batch in order, on a session of their own"""
+    user_ids_cache: dict = {}
+    async with async_session_maker() as db:
+        for network_id, event in events:
+            await _dispatch_health_event(db, network_id, event, user_ids_cache)
+
+
+async def _dispatch_health_event(
+    db: AsyncSession,
+    network_id: str,
+    event: NetworkEvent,
+    user_ids_cache: Optional[dict] = None,
+) -> None:
+    """Dispatch a health check event to the members of its network"""
+    event.network_id = network_id
+    logger.info(f"Network event created for network {network_id}: {event.event_type.value} - {event.title}")
+    
+    # Get network member user IDs from database and dispatch
+    try:
+        from ..services.user_preferences import user_preferences_service
+        from ..services.notification_dispatch import notification_dispatch_service
         
-        # Get network member user IDs from database and dispatch
-        try:
-            from ..services.user_preferences import user_preferences_service
-            from ..services.notification_dispatch import notification_dispatch_service
-            
+        if user_ids_cache is not None and network_id in user_ids_cache:
+            user_ids = user_ids_cache[network_id]
+        else:
             user_ids = await user_preferences_service.get_network_member_user_ids(db, network_id)
+            if user_ids_cache is not None:
+                user_ids_cache[network_id] = user_ids
+        
+        if user_ids:
+            # Dispatch to all network users
+            results = await notification_dispatch_service.send_to_network_users(
+                db=db,
+                network_id=network_id,
+                user_ids=user_ids,
+                event=event,
+                scheduled_at=None,
+            )
             
-            if user_ids:
-                # Dispatch to all network users
-                results = await notification_dispatch_service.send_to_network_users(
-                    db=db,
-                    network_id=network_id,
-                    user_ids=user_ids,
-                    event=event,
-                    scheduled_at=None,
-                )
-                
-                successful = sum(1 for r in results.values() if any(rec.success for rec in r))
-                logger.info(f"Dispatched notification to {successful}/{len(user_ids)} users in network {network_id}")
-            else:
-                logger.warning(f"No users found for network {network_id}")
-        except Exception as e:
-            logger.error(f"Failed to dispatch notification for network {network_id}: {e}", exc_info=True)
-    
-    return {"success": True, "event_created": event is not None}
+            successful = sum(1 for r in results.values() if any(rec.success for rec in r))
+            logger.info(f"Dispatched notification to {successful}/{len(user_ids)} users in network {network_id}")
+        else:
+            logger.warning(f"No users found for network {network_id}")
+    except Exception as e:
+        logger.error(f"Failed to dispatch notification for network {network_id}: {e}", exc_info=True)
 
 
 @router.post("/networks/{network_id}/send-notification")
@@ -545,6 +545,11 @@ class NetworkAnomalyDetector:
     def sync_current_devices(self, device_ips: list):
         """Sync the list of devices currently in this network"""
         self._current_devices = set(device_ips)
+    
+    def update_current_devices(self, added: list, removed: list):
+        """Apply an incremental change to the devices currently in this network"""
+        self._current_devices.difference_update(removed)
+        self._current_devices.update(added)
 
 
 class NetworkAnomalyDetectorManager:
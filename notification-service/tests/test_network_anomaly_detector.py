@@ -202,6 +202,14 @@ class TestNetworkAnomalyDetectorBaselines:
         detector.sync_current_devices(["192.168.1.1", "192.168.1.2"])
         
         assert len(detector._current_devices) == 2
+    
+    def test_update_current_devices(self, detector):
+        """Should apply added and removed devices to the current set"""
+        detector.sync_current_devices(["192.168.1.1", "192.168.1.2"])
+        
+        detector.update_current_devices(["192.168.1.3"], ["192.168.1.1", "192.168.1.99"])
+        
+        assert detector._current_devices == {"192.168.1.2", "192.168.1.3"}
 
 
 class TestNetworkAnomalyDetectorPersistence:
@@ -346,6 +346,24 @@ class TestMLAnomalyEndpoints:
             assert data["success"] is True
             assert data["devices_synced"] == 3
             mock_detector.sync_current_devices.assert_called_once_with(device_ips)
+    
+    def test_sync_device_changes(self, test_client):
+        """Should apply incremental device changes for ML tracking"""
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm:
+            mock_detector = MagicMock()
+            mock_nadm.get_detector.return_value = mock_detector
+            
+            response = test_client.post(
+                "/api/notifications/ml/sync-devices/changes?network_id=network_uuid_123",
+                json={"added": ["192.168.1.4"], "removed": ["192.168.1.1"]}
+            )
+            
+            assert response.status_code == 200
+            data = response.json()
+            assert data["added"] == 1
+            assert data["removed"] == 1
+            mock_nadm.get_detector.assert_called_once_with("network_uuid_123")
+            mock_detector.update_current_devices.assert_called_once_with(["192.168.1.4"], ["192.168.1.1"])
 
 
 class TestHealthCheckProcessing:
@@ -367,6 +385,106 @@ class TestHealthCheckProcessing:
             )
             
             assert response.status_code == 200
+    
+    def test_process_health_checks_batch(self, test_client):
+        """Should process every result in a batch, in order"""
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm:
+            mock_nadm.process_health_check.return_value = None
+            
+            response = test_client.post(
+                "/api/notifications/process-health-checks",
+                json={"results": [
+                    {"device_ip": "192.168.1.1", "success": True, "network_id": "net-1", "latency_ms": 5.0},
+                    {"device_ip": "192.168.1.2", "success": False, "network_id": "net-1", "previous_state": "online"},
+                ]}
+            )
+            
+            assert response.status_code == 200
+            assert response.json() == {"success": True, "processed": 2, "events_created": 0}
+            calls = mock_nadm.process_health_check.call_args_list
+            assert [c.kwargs["device_ip"] for c in calls] == ["192.168.1.1", "192.168.1.2"]
+            assert calls[1].kwargs["previous_state"] == "online"
+    
+    def test_process_health_checks_batch_dispatches_events(self, test_client):
+        """Events from a batch should be dispatched, looking up network members once"""
+        event = NetworkEvent(
+            event_type=NotificationType.DEVICE_OFFLINE,
+            priority=NotificationPriority.HIGH,
+            title="Device offline",
+            message="192.168.1.2 went offline",
+        )
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm, \
+             patch('app.services.user_preferences.user_preferences_service') as mock_prefs, \
+             patch('app.services.notification_dispatch.notification_dispatch_service') as mock_dispatch:
+            mock_nadm.process_health_check.side_effect = lambda **kwargs: event.model_copy()
+            mock_prefs.get_network_member_user_ids = AsyncMock(return_value=["user-1"])
+            mock_dispatch.send_to_network_users = AsyncMock(return_value={})
+            
+            response = test_client.post(
+                "/api/notifications/process-health-checks",
+                json={"results": [
+                    {"device_ip": "192.168.1.2", "success": False, "network_id": "net-1"},
+                    {"device_ip": "192.168.1.3", "success": False, "network_id": "net-1"},
+                ]}
+            )
+            
+            assert response.status_code == 200
+            assert response.json()["events_created"] == 2
+            assert mock_dispatch.send_to_network_users.await_count == 2
+            mock_prefs.get_network_member_user_ids.assert_awaited_once()
+    
+    def test_process_health_checks_retried_batch_applied_once(self, test_client):
+        """A retried batch_id should get the original response without reprocessing"""
+        batch_id = str(uuid4())
+        body = {"batch_id": batch_id, "results": [
+            {"device_ip": "192.168.1.1", "success": True, "network_id": "net-1"},
+        ]}
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm:
+            mock_nadm.process_health_check.return_value = None
+
+            first = test_client.post("/api/notifications/process-health-checks", json=body)
+            retry = test_client.post("/api/notifications/process-health-checks", json=body)
+
+            assert first.status_code == retry.status_code == 200
+            assert retry.json() == first.json() == {"success": True, "processed": 1, "events_created": 0}
+            assert mock_nadm.process_health_check.call_count == 1
+
+    def test_process_health_checks_without_batch_id_not_deduplicated(self, test_client):
+        """Batches from older senders carry no batch_id and are always processed"""
+        body = {"results": [{"device_ip": "192.168.1.1", "success": True, "network_id": "net-1"}]}
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm:
+            mock_nadm.process_health_check.return_value = None
+
+            test_client.post("/api/notifications/process-health-checks", json=body)
+            test_client.post("/api/notifications/process-health-checks", json=body)
+
+            assert mock_nadm.process_health_check.call_count == 2
+
+    def test_processed_batch_history_bounded(self, test_client):
+        """Only the most recent batch ids are remembered"""
+        from app.routers import notifications as notifications_router
+
+        with patch('app.routers.notifications.network_anomaly_detector_manager') as mock_nadm, \
+             patch.object(notifications_router, 'PROCESSED_BATCH_HISTORY', 2):
+            mock_nadm.process_health_check.return_value = None
+            batch_ids = [str(uuid4()) for _ in range(3)]
+            for batch_id in batch_ids:
+                test_client.post(
+                    "/api/notifications/process-health-checks",
+                    json={"batch_id": batch_id, "results": []},
+                )
+
+            assert batch_ids[0] not in notifications_router._processed_batches
+            assert list(notifications_router._processed_batches)[-2:] == batch_ids[1:]
+
+    def test_process_health_checks_batch_validation(self, test_client):
+        """Should reject malformed batches"""
+        response = test_client.post(
+            "/api/notifications/process-health-checks",
+            json={"results": [{"device_ip": "192.168.1.1"}]}
+        )
+        
+        assert response.status_code == 422
 
 
 class TestManualNotificationEndpoints: